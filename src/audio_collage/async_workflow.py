@@ -0,0 +1,124 @@
+import asyncio
+import dataclasses
+import logging
+import os
+import threading
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from .collager_config import CollagerConfig
+from .workflow import CollageJob
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+class AsyncCollager:
+    """
+    Runs collage jobs from an event loop without blocking it.
+
+    Jobs run the steps of workflow.CollageJob, so they treat the config just
+    as create_collage_from_files does. Loading and saving run in the
+    executor, and collaging runs there too but under a semaphore that limits
+    how many CPU-heavy stages run at once. Cancelling a job, or letting it
+    time out, stops it at the next selection step. The executor must run jobs
+    in threads of this process, since the job is stopped through a
+    threading.Event.
+
+    An executor the collager creates itself is shut down by close, on leaving
+    the collager as an async context manager, or once the collager is
+    garbage collected. One passed in is left to the caller.
+    """
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        executor: Optional[Executor] = None
+    ):
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.executor = executor or ThreadPoolExecutor()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._finalizer: Optional[weakref.finalize] = None
+        if executor is None:
+            self._finalizer = weakref.finalize(self, self.executor.shutdown, wait=False)
+
+    def close(self) -> None:
+        """
+        Shuts down the executor if the collager created it, once running jobs finish.
+        """
+        if self._finalizer:
+            self._finalizer.detach()
+            self._finalizer = None
+            self.executor.shutdown(wait=True)
+
+    async def __aenter__(self) -> "AsyncCollager":
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        # Shutting down waits for running jobs, so it mustn't block the loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def create_collage_from_files(
+        self,
+        config: CollagerConfig,
+        timeout: Optional[float] = None
+    ) -> None:
+        """
+        Creates a collage from the files in the config and saves it to the outpath.
+
+        Args:
+            config (CollagerConfig): The collage parameters.
+            timeout (float, optional): Seconds after which the job is cancelled. Defaults to no limit.
+
+        Raises:
+            asyncio.TimeoutError: If the job takes longer than the timeout.
+        """
+        cancel_event = threading.Event()
+        config = dataclasses.replace(config, cancel_event=cancel_event)
+        await asyncio.wait_for(self._create_collage_from_files(config), timeout)
+
+    async def _create_collage_from_files(self, config: CollagerConfig) -> None:
+        job = CollageJob(config)
+        if await self._run(config, job.copy_cached):
+            return
+        sample_audio, target_audio = await self._run(config, job.load)
+
+        async with self.semaphore:
+            output_audio = await self._run(config, job.collage, sample_audio, target_audio)
+
+        await self._run(config, job.save, output_audio)
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created on first use so that it belongs to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _run(self, config: CollagerConfig, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, fn, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Ask the job to stop, and wait for it so that the executor and
+            # semaphore are only freed once it has
+            if config.cancel_event:
+                config.cancel_event.set()
+            try:
+                await future
+            except Exception:
+                pass
+            raise
+
+_default_collagers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncCollager]" = weakref.WeakKeyDictionary()
+
+async def acreate_collage(config: CollagerConfig, timeout: Optional[float] = None) -> None:
+    """
+    Creates a collage from the files in the config without blocking the event loop.
+    Jobs started this way share one concurrency limit per event loop.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _default_collagers:
+        _default_collagers[loop] = AsyncCollager()
+    await _default_collagers[loop].create_collage_from_files(config, timeout=timeout)
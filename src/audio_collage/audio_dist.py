@@ -1,6 +1,5 @@
 import numpy as np
 from numpy.linalg import norm
-from dtw import accelerated_dtw as dtw
 
 from .audio_segment import AudioSegment
 
@@ -54,6 +53,8 @@ class AudioDist:
 
     @staticmethod
     def dist(mfcc1: np.ndarray, mfcc2: np.ndarray) -> float:
+        # dtw pulls in scipy, so it is only imported once needed
+        from dtw import accelerated_dtw as dtw
         distance, _cost, _acc_cost, _path = dtw(
             mfcc1.T,
             mfcc2.T,
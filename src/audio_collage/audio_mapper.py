@@ -1,16 +1,23 @@
-from typing import Callable, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
+import numpy as np
 
 from .audio_dist import AudioDist
 from .audio_segment import AudioSegment
 from .collager_config import CollagerConfig
 from .collage_progress_state import CollageProgressState
+from .features import FrameFeatures, IntegralFeatures
+from .library import SampleLibrary
+from .plan import PlanEntry, SelectionPlan
 from .search.index_collection import SearchIndexCollection
+from .search.reduction import FeatureReducer
+from . import telemetry
 from .util import Util
 
-CACHE_DIR = '.cache'
-
 class AudioMapper:
+    class CancelledError(Exception):
+        pass
+
     def __init__(
         self,
         sample_audio: AudioSegment,
@@ -23,48 +30,84 @@ class AudioMapper:
         self.indices: SearchIndexCollection = SearchIndexCollection(distance_fn)
         self.distance_fn = distance_fn
         self.config = config
+        self.plan: Optional[SelectionPlan] = None
+        # Speculative search results, keyed by target pointer
+        self._lookahead_results: Dict[int, Tuple[AudioSegment, float, int]] = {}
 
-    def map_audio(self) -> List[AudioSegment]:
+    def map_audio(self, start: int = 0, end: Optional[int] = None) -> List[AudioSegment]:
         """
         Maps the target audio to the source audio using the specified windows.
         
+        The selection is also recorded as a plan, see select().
+
+        Args:
+            start (int, optional): Frame of the target to start mapping from. Defaults to the start.
+            end (int, optional): Frame of the target to stop mapping at. Defaults to the end.
+                Snippets are still matched against the target past the end, but the
+                last snippet is cut short so that a snippet starting at the end follows it.
+
         Returns:
             List[AudioSegment]: List of selected snippets.
         """
-        self._chop()
+        if not self.indices.indices:
+            self._chop()
         selected_snippets: List[AudioSegment] = []
+        self.plan = SelectionPlan(
+            sources=[self.source.path or ''],
+            sample_rate=self.source.sample_rate,
+            overlap_ms=self.config.declick_ms,
+        )
 
         target_sr: int = self.target.sample_rate
         n_frames: int = self.target.timeseries.size
-        pointer: int = 0
+        end = n_frames if end is None else min(end, n_frames)
+        overlap_frames = int((self.config.declick_ms / 1000) * target_sr)
+        pointer: int = start
+        self._lookahead_results = {}
 
         if self.config.progress_callback:
             self.config.progress_callback(CollageProgressState(
                 CollageProgressState.Task.SELECTING,
                 starting=True,
                 current_step=0,
-                total_steps=n_frames,
+                total_steps=end - start,
                 message="Selecting samples"
             ))
-        while pointer < n_frames:
-            target_ts = self.target.timeseries[pointer:]
-            target_chunk = AudioSegment(target_ts, target_sr)
+        with telemetry.span('select', start=start, end=end) as select_span:
+            while pointer < end:
+                self._check_cancelled()
+                if self.config.lookahead:
+                    best_snippet, best_dist, best_n_frames = self._search_ahead(pointer, end, overlap_frames)
+                else:
+                    target_ts = self.target.timeseries[pointer:]
+                    target_chunk = AudioSegment(target_ts, target_sr, offset_frames=pointer)
 
-            best_snippet, best_dist, best_n_frames = self._search(target_chunk)
+                    best_snippet, best_dist, best_n_frames = self._search(target_chunk)
 
-            if best_snippet:
-                selected_snippets.append(best_snippet)
-            else:
-                break
+                if best_snippet and end < n_frames and pointer + best_n_frames - overlap_frames > end:
+                    best_snippet = best_snippet.trim(end - pointer + overlap_frames)
+                    best_n_frames = best_snippet.n_samples()
 
-            advance = best_n_frames - int((self.config.declick_ms / 1000) * target_sr)
-            pointer += advance
-            if self.config.progress_callback:
-                self.config.progress_callback(CollageProgressState(
-                    CollageProgressState.Task.SELECTING,
-                    advance=advance,
-                ))
+                if best_snippet:
+                    selected_snippets.append(best_snippet)
+                    self.plan.entries.append(PlanEntry(
+                        source_id=0,
+                        offset_frames=best_snippet.offset_frames or 0,
+                        n_frames=best_snippet.n_samples(),
+                        distance=float(best_dist),
+                        target_offset=pointer,
+                    ))
+                else:
+                    break
 
+                advance = best_n_frames - overlap_frames
+                pointer += advance
+                if self.config.progress_callback:
+                    self.config.progress_callback(CollageProgressState(
+                        CollageProgressState.Task.SELECTING,
+                        advance=advance,
+                    ))
+            select_span.items = len(selected_snippets)
 
         if self.config.progress_callback:
             self.config.progress_callback(CollageProgressState(
@@ -75,11 +118,40 @@ class AudioMapper:
 
         return selected_snippets
 
+    def select(self, start: int = 0, end: Optional[int] = None) -> SelectionPlan:
+        """
+        Maps the target audio to the source audio, returning only the plan of
+        which source spans were selected rather than copies of their audio.
+        See map_audio() for the start and end frames.
+
+        Returns:
+            SelectionPlan: The selected source spans, in target order.
+        """
+        self.map_audio(start, end)
+        return self.plan
+
+    def build_indices(self) -> SearchIndexCollection:
+        """
+        Chops and indexes the source audio without mapping the target.
+
+        Returns:
+            SearchIndexCollection: The indices of the source audio.
+        """
+        self._chop()
+        return self.indices
+
     def _chop(self) -> None:
         windows = self.config.windows
         windows = [i + self.config.declick_ms for i in windows]
 
         if self.config.progress_callback:
+            self.config.progress_callback(CollageProgressState(
+                CollageProgressState.Task.INDEXING,
+                starting=True,
+                current_step=0,
+                total_steps=len(windows),
+                message=f"Indexing {len(windows)} windows"
+            ))
             self.config.progress_callback(CollageProgressState(
                 CollageProgressState.Task.CHOPPING,
                 starting=True,
@@ -88,29 +160,170 @@ class AudioMapper:
                 message=f"Chopping {len(windows)} windows"
             ))
 
-        for window in windows:
-            sample_group: List[AudioSegment] = Util.chop_audio(
+        if self.config.search_mode == CollagerConfig.SearchMode.sliding:
+            self._index_sliding(windows)
+            return
+
+        mean_mfcc = self.distance_fn is AudioDist.mean_mfcc_dist
+        source_mfcc = None
+        if self.config.pca_components or (mean_mfcc and self.config.integral_mfcc):
+            source_mfcc = self._source_mfcc()
+        if self.config.pca_components:
+            self.indices.reducer = FeatureReducer.load_or_fit(
                 self.source,
-                window,
-                step_ms=self.config.step_ms,
-                step_factor=self.config.step_factor
+                self.config.pca_components,
+                source_mfcc=source_mfcc
             )
 
-            self._index(sample_group, window)
+        integral_mfcc = None
+        if mean_mfcc and self.config.integral_mfcc:
+            # mean MFCCs of every chop come from one pass over the source
+            integral_mfcc = IntegralFeatures(source_mfcc)
+
+        library = None
+        if self.config.library_path:
+            library = SampleLibrary(self.config.library_path)
+            source_hash = self.source.hash()
+
+        try:
+            for i, window in enumerate(windows):
+                self._check_cancelled()
+                if library:
+                    step_frames = Util.step_frames(
+                        window,
+                        self.source.sample_rate,
+                        step_ms=self.config.step_ms,
+                        step_factor=self.config.step_factor
+                    )
+                    if library.has_chops(source_hash, window, step_frames):
+                        sample_group = library.load_segments(self.source, window, step_frames)
+                    else:
+                        sample_group = self._chop_window(window)
+                        library.ingest(self.source, window, step_frames, sample_group)
+                else:
+                    sample_group = self._chop_window(window)
+
+                with telemetry.span('featurise', items=len(sample_group), window=window):
+                    if integral_mfcc:
+                        integral_mfcc.fill_mfcc_means(sample_group)
+                    elif mean_mfcc:
+                        FrameFeatures.fill_mfcc_means(sample_group)
+                    if self.indices.reducer:
+                        self.indices.reducer.reduce(sample_group)
+                self._report_indexing(i)
+                self._index(sample_group, window)
+                if self.config.progress_callback:
+                    self.config.progress_callback(CollageProgressState(
+                        CollageProgressState.Task.CHOPPING,
+                        current_step=len(sample_group),
+                    ))
+        finally:
+            if library:
+                library.close()
+        self._complete_indexing(len(windows))
+
+    def _index_sliding(self, windows: List[int]) -> None:
+        source_mfcc = self._source_mfcc()
+        if self.config.pca_components:
+            self.indices.reducer = FeatureReducer.load_or_fit(
+                self.source,
+                self.config.pca_components,
+                source_mfcc=source_mfcc
+            )
+        for i, window in enumerate(windows):
+            self._report_indexing(i)
+            self.indices.add_sliding_index(self.source, window, source_mfcc=source_mfcc)
             if self.config.progress_callback:
                 self.config.progress_callback(CollageProgressState(
                     CollageProgressState.Task.CHOPPING,
-                    current_step=len(sample_group),
+                    current_step=i + 1,
                 ))
+        self._complete_indexing(len(windows))
+
+    def _source_mfcc(self) -> np.ndarray:
+        with telemetry.span('featurise', items=self.source.n_samples()):
+            return FrameFeatures.mfcc(self.source)
+
+    def _report_indexing(self, n_indexed: int) -> None:
+        # Reported just before each index is built, and followed by a chopping
+        # update once it is, so listeners can tell indexing from chopping
+        if self.config.progress_callback:
+            self.config.progress_callback(CollageProgressState(
+                CollageProgressState.Task.INDEXING,
+                current_step=n_indexed,
+            ))
+
+    def _complete_indexing(self, n_windows: int) -> None:
         if self.config.progress_callback:
             self.config.progress_callback(CollageProgressState(
                 CollageProgressState.Task.CHOPPING,
                 completed=True,
-                current_step=len(windows),
+                current_step=n_windows,
+            ))
+            self.config.progress_callback(CollageProgressState(
+                CollageProgressState.Task.INDEXING,
+                completed=True,
+                current_step=n_windows,
             ))
 
+    def _chop_window(self, window: int) -> List[AudioSegment]:
+        return Util.chop_audio(
+            self.source,
+            window,
+            step_ms=self.config.step_ms,
+            step_factor=self.config.step_factor
+        )
+
+    def _check_cancelled(self) -> None:
+        if self.config.cancel_event and self.config.cancel_event.is_set():
+            raise AudioMapper.CancelledError("Collage was cancelled")
+
     def _search(self, query_audio: AudioSegment) -> Tuple[AudioSegment, float, int]:
         return self.indices.find_best_match(query_audio)
 
+    def _search_ahead(
+        self,
+        pointer: int,
+        end: int,
+        overlap_frames: int
+    ) -> Tuple[AudioSegment, float, int]:
+        """
+        Returns the best match at the pointer, searching on a miss for every
+        pointer the selection could reach in the next config.lookahead steps
+        too, in one batch. Matches depend only on the pointer, so whichever
+        branch is taken, its results are the same as searching one at a time.
+        """
+        if pointer not in self._lookahead_results:
+            pointers = self._lookahead_pointers(pointer, end, overlap_frames)
+            queries = [
+                AudioSegment(self.target.timeseries[p:], self.target.sample_rate, offset_frames=p)
+                for p in pointers
+            ]
+            self._lookahead_results = dict(zip(pointers, self.indices.find_best_matches(queries)))
+        return self._lookahead_results[pointer]
+
+    def _lookahead_pointers(self, pointer: int, end: int, overlap_frames: int) -> List[int]:
+        sample_rate = self.target.sample_rate
+        advances = sorted({
+            int((window / 1000) * sample_rate) - overlap_frames
+            for window in self.indices.indices
+        })
+        advances = [advance for advance in advances if advance > 0]
+
+        # The frontier is capped at the beam width, keeping the nearest
+        # pointers, so the batch grows linearly with the lookahead
+        pointers = [pointer]
+        seen = {pointer}
+        frontier = [pointer]
+        for _ in range(self.config.lookahead):
+            frontier = sorted({p + advance for p in frontier for advance in advances if p + advance < end})
+            frontier = frontier[:self.config.beam_width]
+            pointers.extend(p for p in frontier if p not in seen)
+            seen.update(frontier)
+        return pointers
+
     def _index(self, samples: List[AudioSegment], window: int) -> None:
-        self.indices.add_index(samples, window)
+        if self.config.search_mode == CollagerConfig.SearchMode.brute:
+            self.indices.add_brute_force_index(samples, window)
+        else:
+            self.indices.add_index(samples, window)
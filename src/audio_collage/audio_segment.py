@@ -1,10 +1,12 @@
 from dataclasses import dataclass, field
 import hashlib
-import librosa
+import os
 import numpy as np
 import soundfile as sf
 from typing import List, Optional
 
+from . import telemetry
+
 @dataclass
 class AudioSegment:
     timeseries: np.ndarray
@@ -17,15 +19,23 @@ class AudioSegment:
 
     @staticmethod
     def from_file(path: str) -> "AudioSegment":
-        timeseries, sample_rate = librosa.load(path)
+        # librosa pulls in numba and scipy, so it is only imported once needed
+        import librosa
+        with telemetry.span('load', path=path) as load_span:
+            timeseries, sample_rate = librosa.load(path)
+            load_span.items = len(timeseries)
+        telemetry.count('bytes_read', os.path.getsize(path))
         return AudioSegment(timeseries, sample_rate, path=path)
 
     def to_file(self, path: str) -> None:
         sf.write(path, self.timeseries, self.sample_rate, format='wav')
+        telemetry.count('bytes_written', os.path.getsize(path))
 
     @property
     def mfcc(self) -> np.ndarray:
         if self._mfcc is None:
+            import librosa
+            telemetry.count('segment_features')
             self._mfcc = librosa.feature.mfcc(
                 y=self.timeseries,
                 sr=self.sample_rate,
@@ -42,6 +52,7 @@ class AudioSegment:
     @property
     def chroma_stft(self) -> np.ndarray:
         if self._chroma_stft is None:
+            import librosa
             self._chroma_stft = librosa.feature.chroma_stft(
                 y=self.timeseries,
                 sr=self.sample_rate,
@@ -82,7 +93,9 @@ class AudioSegment:
         else:
             return AudioSegment(
                 timeseries=self.timeseries[:n_samples],
-                sample_rate=self.sample_rate
+                sample_rate=self.sample_rate,
+                path=self.path,
+                offset_frames=self.offset_frames
             )
 
     def pad(
@@ -0,0 +1,75 @@
+import dataclasses
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..audio_segment import AudioSegment
+from ..collager import Collager
+from ..collager_config import CollagerConfig
+from .runner import empty_cache
+
+logger = logging.getLogger(__name__)
+
+def query_offsets(target: AudioSegment, n_queries: int) -> List[int]:
+    """
+    Returns evenly spaced frames of the target to search from.
+    """
+    n_queries = max(1, min(n_queries, target.n_samples()))
+    return [int(offset) for offset in np.linspace(0, target.n_samples(), n_queries, endpoint=False)]
+
+def compare_backends(
+    sample_audio: AudioSegment,
+    target_audio: AudioSegment,
+    config: CollagerConfig,
+    search_modes: Optional[List[CollagerConfig.SearchMode]] = None,
+    n_queries: int = 50
+) -> List[Dict[str, Any]]:
+    """
+    Builds indices of the sample with each search mode and searches them from
+    the same target frames, reporting for each mode and window how many
+    distance evaluations the index made and how long it took.
+
+    Indices are built cold, with an empty temporary cache, so that none are
+    loaded from earlier builds.
+
+    Returns:
+        List[Dict[str, Any]]: One row per mode and window, with the index
+            stats, the build and search time of the whole mode, its queries per
+            second and the mean distance of its best matches.
+    """
+    search_modes = search_modes or list(CollagerConfig.SearchMode)
+    offsets = query_offsets(target_audio, n_queries)
+    rows: List[Dict[str, Any]] = []
+
+    for search_mode in search_modes:
+        mode_config = dataclasses.replace(config, search_mode=search_mode, progress_callback=None)
+        logger.info(f"Building {search_mode} indices")
+        with empty_cache('audio-collage-backends-'):
+            start = time.perf_counter()
+            indices = Collager.build_indices(sample_audio, mode_config)
+            build_seconds = time.perf_counter() - start
+
+        queries = [
+            AudioSegment(target_audio.timeseries[offset:], target_audio.sample_rate, offset_frames=offset)
+            for offset in offsets
+        ]
+        logger.info(f"Searching {search_mode} indices from {len(queries)} target frames")
+        start = time.perf_counter()
+        matches = indices.search_windows(queries)
+        search_seconds = time.perf_counter() - start
+
+        for stats in indices.stats():
+            window_distances = [
+                match[stats.window][1] for match in matches if stats.window in match
+            ]
+            rows.append(dict(
+                stats.to_dict(),
+                search_mode=str(search_mode),
+                mode_build_seconds=build_seconds,
+                mode_search_seconds=search_seconds,
+                queries_per_second=len(queries) / search_seconds if search_seconds else float('inf'),
+                mean_distance=float(np.mean(window_distances)) if window_distances else None,
+            ))
+    return rows
@@ -0,0 +1,57 @@
+from typing import Dict
+
+import numpy as np
+
+from ..audio_segment import AudioSegment
+
+SAMPLE_RATE = 22050
+
+# Corpus sizes in seconds
+SIZES: Dict[str, float] = {
+    'tiny': 2,
+    'small': 10,
+    'medium': 60,
+    'large': 600,
+    'hour': 3600,
+}
+
+def synthetic_audio(
+    seconds: float,
+    sample_rate: int = SAMPLE_RATE,
+    seed: int = 0,
+    note_ms: int = 125
+) -> AudioSegment:
+    """
+    Generates deterministic audio of the given length, a sequence of decaying
+    tones with harmonics and noise bursts, so that features vary from window
+    to window as they would in music. The same seed always gives the same audio.
+    """
+    rng = np.random.default_rng(seed)
+    n_frames = int(seconds * sample_rate)
+    note_frames = max(1, int((note_ms / 1000) * sample_rate))
+    n_notes = -(-n_frames // note_frames)
+
+    t = np.arange(note_frames) / sample_rate
+    envelope = np.exp(-t * 12)
+    timeseries = np.empty(n_notes * note_frames, dtype=np.float32)
+    # Generate in chunks of notes to bound memory for long corpora
+    chunk_notes = 256
+    for start in range(0, n_notes, chunk_notes):
+        n = min(chunk_notes, n_notes - start)
+        freqs = rng.uniform(55, 1760, (n, 1))
+        phases = 2 * np.pi * freqs * t
+        notes = np.sin(phases) + 0.5 * np.sin(2 * phases) + 0.25 * np.sin(3 * phases)
+        noise = rng.uniform(0, 0.5, (n, 1)) * rng.standard_normal((n, note_frames))
+        amplitude = rng.uniform(0.1, 0.5, (n, 1))
+        chunk = amplitude * envelope * (notes + noise)
+        timeseries[start * note_frames:(start + n) * note_frames] = chunk.ravel()
+
+    return AudioSegment(np.clip(timeseries[:n_frames], -1, 1), sample_rate)
+
+def corpus(size: str, seed: int = 0, sample_rate: int = SAMPLE_RATE) -> AudioSegment:
+    """
+    Returns the synthetic audio for a named corpus size.
+    """
+    if size not in SIZES:
+        raise ValueError(f"Unknown corpus size '{size}'. Choose from {', '.join(SIZES)}")
+    return synthetic_audio(SIZES[size], sample_rate=sample_rate, seed=seed)
@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+# Dependencies that take long to import, and that the CLI only imports once a
+# command needs them
+HEAVY_MODULES = ('librosa', 'numba', 'scipy', 'sklearn', 'dtw', 'vptree')
+# Budget for the cumulative import time of the CLI module
+IMPORT_BUDGET_SECONDS = 0.6
+
+@dataclass
+class ImportProfile:
+    """
+    The import times reported by python -X importtime for one module.
+    """
+    module: str
+    # Cumulative import time of the module, including its imports
+    seconds: float
+    # Cumulative import time of every module imported, by name
+    modules: Dict[str, float] = field(default_factory=dict)
+
+    def heavy_modules(self) -> List[str]:
+        """
+        Returns the heavy dependencies that were imported.
+        """
+        imported = {name.split('.')[0] for name in self.modules}
+        return [name for name in HEAVY_MODULES if name in imported]
+
+def profile_import(module: str, python: str = sys.executable) -> ImportProfile:
+    """
+    Imports a module in a fresh interpreter with python -X importtime and
+    parses its report.
+    """
+    env = dict(os.environ)
+    # Import this copy of the package, wherever the interpreter is run from
+    package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True
+    )
+
+    modules: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _self, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative) / 1e6
+    return ImportProfile(module=module, seconds=modules.get(module, 0.), modules=modules)
+
+def check_import_budget(
+    module: str = 'audio_collage.cli',
+    budget: float = IMPORT_BUDGET_SECONDS,
+    repeats: int = 3
+) -> List[str]:
+    """
+    Returns the ways in which importing the module breaks its budget: any heavy
+    dependency imported, or the fastest of several imports taking too long.
+    """
+    profiles = [profile_import(module) for _ in range(repeats)]
+    fastest = min(profiles, key=lambda profile: profile.seconds)
+    problems = [f"{module} imports {name}" for name in fastest.heavy_modules()]
+    if fastest.seconds > budget:
+        slowest = sorted(fastest.modules.items(), key=lambda item: item[1], reverse=True)[1:6]
+        problems.append(
+            f"{module} takes {fastest.seconds:.3f}s to import, over the {budget:.3f}s budget. Slowest imports: "
+            + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in slowest)
+        )
+    return problems
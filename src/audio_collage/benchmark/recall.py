@@ -0,0 +1,191 @@
+import dataclasses
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from ..audio_dist import AudioDist
+from ..audio_segment import AudioSegment
+from ..collager import Collager
+from ..collager_config import CollagerConfig
+from ..features import FrameFeatures
+from ..search.index_collection import SearchIndexCollection
+from ..sweep import expand_grid
+from ..util import Util
+from .backends import query_offsets
+from .runner import empty_cache
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RecallResult:
+    """
+    Accuracy and speed of one search configuration at one window size,
+    measured against the exact nearest chops.
+    """
+    params: Dict[str, Any]
+    window: int
+    queries: int
+    k: int
+    # Fraction of queries whose match is as close as the exact nearest chop
+    recall_at_1: float
+    # Fraction of queries whose match is as close as the k-th nearest chop
+    recall_at_k: float
+    # Mean of the distance to the match over the distance to the nearest chop
+    distance_ratio: float
+    queries_per_second: float
+    build_seconds: float
+
+    @property
+    def label(self) -> str:
+        return ", ".join(f"{name}={value}" for name, value in self.params.items())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+class GroundTruth:
+    """
+    The exact distances from each query to every chop of the sample at one
+    window size, found by brute force with the reference distance function.
+    """
+    def __init__(
+        self,
+        window: int,
+        window_frames: int,
+        chops: List[AudioSegment],
+        queries: List[AudioSegment],
+        distance_fn: Callable[[AudioSegment, AudioSegment], float]
+    ):
+        self.window = window
+        self.window_frames = window_frames
+        self.queries = queries
+        self.distance_fn = distance_fn
+        # Exact distances keyed by query and chop offset, so returned chops need no re-evaluation
+        self.distances: List[Dict[int, float]] = [
+            {chop.offset_frames or 0: distance_fn(query, chop) for chop in chops}
+            for query in queries
+        ]
+        self.sorted_distances: List[np.ndarray] = [
+            np.sort(np.fromiter(distances.values(), dtype=float)) for distances in self.distances
+        ]
+
+    def distance(self, i: int, match: AudioSegment, source: AudioSegment) -> float:
+        """
+        Returns the exact distance from query i to a match from the source.
+        """
+        offset = match.offset_frames or 0
+        if offset in self.distances[i] and match.n_samples() == self.window_frames:
+            return self.distances[i][offset]
+        # Matches need not be chops, and their features may have been reduced
+        fresh = AudioSegment(
+            source.timeseries[offset:offset + self.window_frames],
+            source.sample_rate,
+            offset_frames=offset
+        )
+        return self.distance_fn(self.queries[i], fresh)
+
+    def kth_distance(self, i: int, k: int) -> float:
+        distances = self.sorted_distances[i]
+        return float(distances[min(k, distances.size) - 1])
+
+def evaluate_recall(
+    sample_audio: AudioSegment,
+    target_audio: AudioSegment,
+    config: CollagerConfig,
+    grid: Optional[Dict[str, List[Any]]] = None,
+    n_queries: int = 50,
+    k: int = 10
+) -> List[RecallResult]:
+    """
+    Measures how close the matches of each search configuration are to the
+    exact nearest neighbours of evenly spaced target queries.
+
+    The ground truth is every chop of the sample made with the base config's
+    step, compared with each query by brute force using the base config's
+    distance function. Each config of the grid is then built cold and
+    searched from the same queries, and its matches are re-scored with the
+    reference distance function. A match counts towards recall@k if it is at
+    least as close as the k-th nearest chop, so configurations that search
+    offsets between chops, such as sliding search, are scored fairly.
+
+    Args:
+        config (CollagerConfig): The base config, giving the reference distance function.
+        grid (Dict[str, List[Any]], optional): Values of parameters to vary, as
+            for sweeps. Defaults to every search mode.
+    """
+    grid = grid or {'search_mode': [str(mode) for mode in CollagerConfig.SearchMode]}
+    configs = expand_grid(config, grid)
+    distance_fn = Collager.resolve_distance_fn(config.distance_fn)
+    sample_rate = sample_audio.sample_rate
+
+    windows = sorted({window for swept in configs for window in swept.windows})
+    max_window_frames = max(int((window / 1000) * sample_rate) for window in windows)
+    if target_audio.n_samples() < max_window_frames:
+        raise ValueError("The target must be at least as long as the longest window")
+    offsets = query_offsets(
+        AudioSegment(target_audio.timeseries[:target_audio.n_samples() - max_window_frames + 1], sample_rate),
+        n_queries
+    )
+
+    logger.info(f"Finding the exact nearest chops of {len(offsets)} queries")
+    ground_truth: Dict[int, GroundTruth] = {}
+    for window in windows:
+        # Indices are keyed by the chop length, which includes the declick margin
+        window += config.declick_ms
+        window_frames = int((window / 1000) * sample_rate)
+        chops = Util.chop_audio(sample_audio, window, step_ms=config.step_ms, step_factor=config.step_factor)
+        if distance_fn is AudioDist.mean_mfcc_dist:
+            FrameFeatures.fill_mfcc_means(chops)
+        queries = [
+            AudioSegment(target_audio.timeseries[offset:offset + window_frames], sample_rate)
+            for offset in offsets
+        ]
+        ground_truth[window] = GroundTruth(window, window_frames, chops, queries, distance_fn)
+
+    results: List[RecallResult] = []
+    for swept in configs:
+        params = {name: getattr(swept, name) for name in grid}
+        logger.info(f"Searching with {', '.join(f'{name}={value}' for name, value in params.items())}")
+        start = time.perf_counter()
+        indices = _build_cold(sample_audio, dataclasses.replace(swept, progress_callback=None))
+        build_seconds = time.perf_counter() - start
+
+        queries = [
+            AudioSegment(target_audio.timeseries[offset:], sample_rate, offset_frames=offset)
+            for offset in offsets
+        ]
+        start = time.perf_counter()
+        matches = indices.search_windows(queries)
+        search_seconds = time.perf_counter() - start
+
+        for window in sorted(indices.indices):
+            truth = ground_truth[window]
+            hits_at_1, hits_at_k, ratios = 0, 0, []
+            for i, query_matches in enumerate(matches):
+                dist = truth.distance(i, query_matches[window][0], sample_audio)
+                nearest = truth.kth_distance(i, 1)
+                # A small tolerance so that ties with the exact neighbour count as hits
+                hits_at_1 += dist <= nearest + 1e-9 * max(1., abs(nearest))
+                kth = truth.kth_distance(i, k)
+                hits_at_k += dist <= kth + 1e-9 * max(1., abs(kth))
+                if nearest > 0:
+                    ratios.append(dist / nearest)
+            results.append(RecallResult(
+                params=params,
+                window=window,
+                queries=len(offsets),
+                k=k,
+                recall_at_1=hits_at_1 / len(offsets),
+                recall_at_k=hits_at_k / len(offsets),
+                distance_ratio=float(np.mean(ratios)) if ratios else 1.,
+                queries_per_second=len(offsets) / search_seconds if search_seconds else float('inf'),
+                build_seconds=build_seconds,
+            ))
+    return results
+
+def _build_cold(sample_audio: AudioSegment, config: CollagerConfig) -> SearchIndexCollection:
+    # Build with an empty cache, so no index is loaded from earlier builds
+    with empty_cache('audio-collage-recall-'):
+        return Collager.build_indices(sample_audio, config)
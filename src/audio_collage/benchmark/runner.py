@@ -0,0 +1,329 @@
+import contextlib
+import dataclasses
+import json
+import logging
+import platform
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ..audio_segment import AudioSegment
+from ..cache_manager import CacheManager, using_cache
+from ..collager import Collager
+from ..collager_config import CollagerConfig
+from ..util import Util
+from .corpus import SIZES, corpus
+from .imports import profile_import
+
+logger = logging.getLogger(__name__)
+
+REPORT_VERSION = 1
+
+@dataclass
+class StageResult:
+    """
+    Timing and peak memory of one pipeline stage with one set of parameters.
+    """
+    stage: str
+    params: Dict[str, Any]
+    # Fastest of the repeats, which is least affected by other load
+    seconds: float
+    mean_seconds: float
+    peak_bytes: int
+    repeats: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.stage} {json.dumps(self.params, sort_keys=True)}"
+
+@dataclass
+class Regression:
+    """
+    A stage that got slower or used more memory than in the baseline.
+    """
+    key: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float('inf')
+
+    def __str__(self) -> str:
+        return f"{self.key}: {self.metric} {self.baseline:.4g} -> {self.current:.4g} ({self.ratio:.2f}x)"
+
+@dataclass
+class BenchmarkReport:
+    results: List[StageResult] = field(default_factory=list)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'version': REPORT_VERSION,
+            'metadata': self.metadata,
+            'results': [dataclasses.asdict(result) for result in self.results],
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "BenchmarkReport":
+        if data.get('version') != REPORT_VERSION:
+            raise ValueError(f"Unsupported benchmark report version: {data.get('version')}")
+        return BenchmarkReport(
+            results=[StageResult(**result) for result in data['results']],
+            metadata=data.get('metadata', {}),
+        )
+
+    def to_file(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @staticmethod
+    def from_file(path: str) -> "BenchmarkReport":
+        with open(path) as f:
+            return BenchmarkReport.from_dict(json.load(f))
+
+    def compare(
+        self,
+        baseline: "BenchmarkReport",
+        tolerance: float = 0.25,
+        min_seconds: float = 0.001
+    ) -> List[Regression]:
+        """
+        Returns the stages that are more than tolerance slower, or use more
+        than tolerance more peak memory, than in the baseline. Stages missing
+        from the baseline, and timings under min_seconds, which are mostly
+        noise, are not compared.
+        """
+        baseline_results = {result.key: result for result in baseline.results}
+        regressions = []
+        for result in self.results:
+            previous = baseline_results.get(result.key)
+            if previous is None:
+                continue
+            if result.seconds >= min_seconds and result.seconds > previous.seconds * (1 + tolerance):
+                regressions.append(Regression(result.key, 'seconds', previous.seconds, result.seconds))
+            if result.peak_bytes > previous.peak_bytes * (1 + tolerance):
+                regressions.append(Regression(result.key, 'peak_bytes', previous.peak_bytes, result.peak_bytes))
+        return regressions
+
+def measure(fn: Callable[[], Any], repeats: int = 3, warmup: int = 1) -> Tuple[float, float, int]:
+    """
+    Times repeated calls of fn, then calls it once more while tracing memory
+    allocations, as tracing slows it down. Warm-up calls, which pay for lazy
+    imports and JIT compilation, are not timed.
+
+    Returns:
+        Tuple[float, float, int]: The fastest and mean time in seconds, and
+            the peak memory allocated during a call in bytes.
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline_bytes, _ = tracemalloc.get_traced_memory()
+    fn()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    if not tracing:
+        tracemalloc.stop()
+    return min(times), float(np.mean(times)), peak_bytes - baseline_bytes
+
+class BenchmarkRunner:
+    """
+    Benchmarks each stage of the collage pipeline on synthetic corpora, across
+    source and target lengths, numbers of windows and chop steps.
+
+    Stages:
+        chop: Util.chop_audio of the source with each window and step.
+        features: MFCCs of the whole source.
+        distance: Each distance function between two windows.
+        index: Collager.build_indices of the source, including chopping and features.
+        search: SearchIndexCollection.find_best_matches for queries from the target.
+        concatenate: Util.concatenate_audio of snippets covering the target.
+        import: Importing the CLI in a fresh interpreter, including its startup.
+    """
+    STAGES = ('chop', 'features', 'distance', 'index', 'search', 'concatenate', 'import')
+
+    def __init__(
+        self,
+        sizes: Optional[List[str]] = None,
+        windows: Optional[List[int]] = None,
+        step_factors: Optional[List[float]] = None,
+        distance_fn: CollagerConfig.DistanceFn = CollagerConfig.DistanceFn.fast_mfcc,
+        search_modes: Optional[List[CollagerConfig.SearchMode]] = None,
+        stages: Optional[List[str]] = None,
+        repeats: int = 3,
+        n_queries: int = 20,
+        distance_calls: int = 20
+    ):
+        self.sizes = sizes or ['tiny', 'small']
+        self.windows = windows or [400, 200, 100, 50]
+        self.step_factors = step_factors or [0.5]
+        self.distance_fn = distance_fn
+        self.search_modes = search_modes or list(CollagerConfig.SearchMode)
+        self.stages = stages or list(BenchmarkRunner.STAGES)
+        self.repeats = repeats
+        self.n_queries = n_queries
+        self.distance_calls = distance_calls
+
+        for size in self.sizes:
+            if size not in SIZES:
+                raise ValueError(f"Unknown corpus size '{size}'. Choose from {', '.join(SIZES)}")
+        for stage in self.stages:
+            if stage not in BenchmarkRunner.STAGES:
+                raise ValueError(f"Unknown stage '{stage}'. Choose from {', '.join(BenchmarkRunner.STAGES)}")
+
+    def run(self) -> BenchmarkReport:
+        report = BenchmarkReport(metadata={
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'repeats': self.repeats,
+        })
+        # Indices are built with an empty cache to benchmark cold builds
+        with empty_cache('audio-collage-benchmark-'):
+            for stage in self.stages:
+                for params, fn in getattr(self, f'_{stage}_cases')():
+                    logger.info(f"Benchmarking {stage} {params}")
+                    seconds, mean_seconds, peak_bytes = measure(fn, self.repeats)
+                    report.results.append(StageResult(
+                        stage=stage,
+                        params=params,
+                        seconds=seconds,
+                        mean_seconds=mean_seconds,
+                        peak_bytes=peak_bytes,
+                        repeats=self.repeats,
+                    ))
+        return report
+
+    def _window_sets(self) -> List[List[int]]:
+        # Growing numbers of the longest windows
+        counts = sorted({1, len(self.windows)})
+        return [self.windows[:n] for n in counts]
+
+    def _config(self, windows: List[int], step_factor: float, search_mode: CollagerConfig.SearchMode) -> CollagerConfig:
+        return CollagerConfig(
+            windows=windows,
+            step_factor=step_factor,
+            distance_fn=self.distance_fn,
+            search_mode=search_mode,
+        )
+
+    def _chop_cases(self) -> Iterator[Tuple[Dict[str, Any], Callable[[], Any]]]:
+        for size in self.sizes:
+            source = corpus(size, seed=1)
+            for window in self.windows:
+                for step_factor in self.step_factors:
+                    params = {'source': size, 'window': window, 'step_factor': step_factor}
+                    yield params, lambda s=source, w=window, f=step_factor: Util.chop_audio(s, w, step_factor=f)
+
+    def _features_cases(self) -> Iterator[Tuple[Dict[str, Any], Callable[[], Any]]]:
+        for size in self.sizes:
+            source = corpus(size, seed=1)
+            # Features are cached on segments, so compute them on a fresh one
+            yield {'source': size}, lambda s=source: AudioSegment(s.timeseries, s.sample_rate).mfcc
+
+    def _distance_cases(self) -> Iterator[Tuple[Dict[str, Any], Callable[[], Any]]]:
+        source = corpus('tiny', seed=1)
+        for distance_fn in CollagerConfig.DistanceFn:
+            fn = Collager.resolve_distance_fn(distance_fn)
+            for window in self.windows:
+                n_frames = int((window / 1000) * source.sample_rate)
+                a = AudioSegment(source.timeseries[:n_frames], source.sample_rate)
+                b = AudioSegment(source.timeseries[n_frames:2 * n_frames], source.sample_rate)
+                # Searches compare segments with cached features
+                fn(a, b)
+                params = {'distance_fn': distance_fn.value, 'window': window, 'calls': self.distance_calls}
+                yield params, lambda f=fn, a=a, b=b: [f(a, b) for _ in range(self.distance_calls)]
+
+    def _index_cases(self) -> Iterator[Tuple[Dict[str, Any], Callable[[], Any]]]:
+        for size in self.sizes:
+            source = corpus(size, seed=1)
+            for windows in self._window_sets():
+                for step_factor in self.step_factors:
+                    for search_mode in self.search_modes:
+                        config = self._config(windows, step_factor, search_mode)
+                        params = {
+                            'source': size,
+                            'n_windows': len(windows),
+                            'step_factor': step_factor,
+                            'search_mode': search_mode.value,
+                        }
+                        yield params, lambda s=source, c=config: self._build_cold(s, c)
+
+    def _search_cases(self) -> Iterator[Tuple[Dict[str, Any], Callable[[], Any]]]:
+        target = corpus('small', seed=2)
+        step = max(1, (target.n_samples() - 1) // self.n_queries)
+        queries = [
+            AudioSegment(target.timeseries[offset:], target.sample_rate, offset_frames=offset)
+            for offset in range(0, step * self.n_queries, step)
+        ]
+        for size in self.sizes:
+            source = corpus(size, seed=1)
+            for windows in self._window_sets():
+                for step_factor in self.step_factors:
+                    for search_mode in self.search_modes:
+                        indices = self._build_cold(source, self._config(windows, step_factor, search_mode))
+                        params = {
+                            'source': size,
+                            'n_windows': len(windows),
+                            'step_factor': step_factor,
+                            'search_mode': search_mode.value,
+                            'queries': len(queries),
+                        }
+                        # Queries are copied so that their features are computed every time
+                        yield params, lambda i=indices: i.find_best_matches([
+                            AudioSegment(q.timeseries, q.sample_rate, offset_frames=q.offset_frames)
+                            for q in queries
+                        ])
+
+    def _concatenate_cases(self) -> Iterator[Tuple[Dict[str, Any], Callable[[], Any]]]:
+        declick_ms = 20
+        for size in self.sizes:
+            target = corpus(size, seed=2)
+            for window in self.windows:
+                step_ms = window - declick_ms
+                if step_ms <= 0:
+                    continue
+                snippets = Util.chop_audio(target, window, step_ms=step_ms)
+                params = {'target': size, 'window': window, 'declick_ms': declick_ms}
+                yield params, lambda s=snippets, sr=target.sample_rate: Util.concatenate_audio(
+                    s,
+                    declick_fn=CollagerConfig.DeclickFn.sigmoid,
+                    declick_ms=declick_ms,
+                    sample_rate=sr
+                )
+
+    def _import_cases(self) -> Iterator[Tuple[Dict[str, Any], Callable[[], Any]]]:
+        module = 'audio_collage.cli'
+        yield {'module': module}, lambda: profile_import(module)
+
+    @staticmethod
+    def _build_cold(source: AudioSegment, config: CollagerConfig) -> Any:
+        # A fresh segment, so no features are reused from earlier builds
+        source = AudioSegment(source.timeseries, source.sample_rate)
+        with empty_cache('audio-collage-index-'):
+            return Collager.build_indices(source, config)
+
+@contextlib.contextmanager
+def empty_cache(prefix: str) -> Iterator[CacheManager]:
+    """
+    Makes a temporary cache the default, so no index or reducer is loaded
+    from earlier builds. The cache is deleted on exit.
+    """
+    with tempfile.TemporaryDirectory(prefix=prefix) as cache_dir, using_cache(CacheManager(cache_dir)) as cache:
+        yield cache
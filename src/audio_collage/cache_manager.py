@@ -0,0 +1,271 @@
+import contextlib
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where keys are not locked
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = '.cache'
+DEFAULT_MAX_BYTES = 4 << 30
+# Bumped whenever the format of cached entries changes, so that entries
+# written by other versions are ignored and pruned
+CACHE_VERSION = 1
+# Entries written to the top of the cache directory before it was versioned
+LEGACY_SUFFIXES = ('.vptree', '.pca')
+# Temporary files older than this are left over from writers that died
+STALE_TMP_SECONDS = 3600
+
+@dataclass
+class CacheStats:
+    cache_dir: str
+    max_bytes: int
+    n_entries: int = 0
+    nbytes: int = 0
+    # Entries of other cache versions, which prune removes
+    n_stale: int = 0
+    stale_bytes: int = 0
+    # Number and total size of entries by file suffix
+    kinds: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.cache_dir}: {self.n_entries} entries, "
+            f"{self.nbytes / 1024 / 1024:.1f}MB of {self.max_bytes / 1024 / 1024:.1f}MB"
+        ]
+        for kind, (count, nbytes) in sorted(self.kinds.items()):
+            lines.append(f"  {kind}: {count} entries, {nbytes / 1024 / 1024:.1f}MB")
+        if self.n_stale:
+            lines.append(f"  stale: {self.n_stale} entries, {self.stale_bytes / 1024 / 1024:.1f}MB")
+        return "\n".join(lines)
+
+class CacheManager:
+    """
+    A directory of cached indices and feature reducers, shared by concurrent
+    jobs.
+
+    Entries are written to a temporary file and renamed into place, so
+    readers never see a partial entry. Building an entry holds a lock on its
+    key, so that jobs needing the same entry wait for one of them to build it
+    instead of all building it. Entries live under a directory for the cache
+    version, and once the cache grows past its budget the least recently
+    used entries are evicted.
+    """
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or os.getenv('AUDIO_COLLAGE_CACHE_DIR') or DEFAULT_CACHE_DIR
+        if max_bytes is None:
+            max_mb = os.getenv('AUDIO_COLLAGE_CACHE_MB')
+            max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+        self.max_bytes = max_bytes
+
+    @property
+    def entries_dir(self) -> str:
+        return os.path.join(self.cache_dir, f"v{CACHE_VERSION}")
+
+    @property
+    def locks_dir(self) -> str:
+        return os.path.join(self.cache_dir, 'locks')
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.entries_dir, key)
+
+    @contextlib.contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        """
+        Holds an exclusive lock on the key, waiting for any other holder.
+        """
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.locks_dir, exist_ok=True)
+        fd = os.open(os.path.join(self.locks_dir, key + '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def get(self, key: str, load_fn: Callable[[str], object]) -> Optional[object]:
+        """
+        Loads the entry for the key with load_fn, returning None if there is
+        none or it can't be loaded, in which case it is removed.
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            value = load_fn(path)
+        except Exception as e:
+            logger.warning(f"Could not load cache file {path}. It will be rebuilt. Error: {e}")
+            self._remove(path)
+            return None
+        self._touch(path)
+        return value
+
+    def put(self, key: str, write_fn: Callable[[str], None]) -> int:
+        """
+        Writes the entry for the key with write_fn, then evicts entries until
+        the cache is within budget.
+
+        Returns:
+            int: The size of the entry in bytes.
+        """
+        os.makedirs(self.entries_dir, exist_ok=True)
+        path = self.path(key)
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.entries_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        nbytes = os.path.getsize(path)
+        self.prune(keep=path)
+        return nbytes
+
+    def stats(self) -> CacheStats:
+        stats = CacheStats(cache_dir=self.cache_dir, max_bytes=self.max_bytes)
+        for _mtime, path, size in self._entries():
+            kind = os.path.splitext(path)[1] or 'other'
+            count, nbytes = stats.kinds.get(kind, (0, 0))
+            stats.kinds[kind] = (count + 1, nbytes + size)
+            stats.n_entries += 1
+            stats.nbytes += size
+        for _path, size in self._stale_entries():
+            stats.n_stale += 1
+            stats.stale_bytes += size
+        return stats
+
+    def prune(self, max_bytes: Optional[int] = None, keep: Optional[str] = None) -> List[str]:
+        """
+        Removes entries of other cache versions and abandoned temporary files,
+        then the least recently used entries until the cache is within budget.
+
+        Args:
+            max_bytes (int, optional): Budget to prune to. Defaults to the cache's budget.
+            keep (str, optional): Path of an entry never to evict, such as one just written.
+
+        Returns:
+            List[str]: Paths of the removed files.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = []
+        for path, _size in self._stale_entries():
+            self._remove(path)
+            removed.append(path)
+
+        entries = sorted(self._entries())
+        total = sum(size for _mtime, _path, size in entries)
+        for _mtime, path, size in entries:
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            logger.info(f"Evicting cached entry {path}")
+            self._remove(path)
+            removed.append(path)
+            total -= size
+        return removed
+
+    def _entries(self) -> List[Tuple[int, str, int]]:
+        if not os.path.isdir(self.entries_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.entries_dir):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.entries_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, path, stat.st_size))
+        return entries
+
+    def _stale_entries(self) -> List[Tuple[str, int]]:
+        stale = []
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if name.endswith(LEGACY_SUFFIXES) and os.path.isfile(path):
+                    stale.append(path)
+                elif name.startswith('v') and name[1:].isdigit() and name != f"v{CACHE_VERSION}":
+                    stale.extend(
+                        os.path.join(path, entry) for entry in os.listdir(path)
+                    )
+        if os.path.isdir(self.entries_dir):
+            now = time.time()
+            for name in os.listdir(self.entries_dir):
+                path = os.path.join(self.entries_dir, name)
+                if name.endswith('.tmp') and now - self._mtime(path) > STALE_TMP_SECONDS:
+                    stale.append(path)
+
+        sizes = []
+        for path in stale:
+            try:
+                sizes.append((path, os.path.getsize(path)))
+            except FileNotFoundError:
+                continue
+        return sizes
+
+    @staticmethod
+    def _mtime(path: str) -> float:
+        try:
+            return os.path.getmtime(path)
+        except FileNotFoundError:
+            return time.time()
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        # Modification times order entries for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+_default_cache: Optional[CacheManager] = None
+
+def default_cache() -> CacheManager:
+    """
+    Returns the cache used by indices and reducers not given one, which is
+    configured by the AUDIO_COLLAGE_CACHE_DIR and AUDIO_COLLAGE_CACHE_MB
+    environment variables unless set with set_default_cache.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = CacheManager()
+    return _default_cache
+
+def set_default_cache(cache: Optional[CacheManager]) -> None:
+    global _default_cache
+    _default_cache = cache
+
+@contextlib.contextmanager
+def using_cache(cache: CacheManager) -> Iterator[CacheManager]:
+    """
+    Makes the cache the default for the duration of the context.
+    """
+    global _default_cache
+    previous = _default_cache
+    _default_cache = cache
+    try:
+        yield cache
+    finally:
+        _default_cache = previous
@@ -1,30 +1,56 @@
 #!/usr/bin/python
 
+import contextlib
+import json
 import logging
 import os
 import typer
-from typing import Any, List
+from typing import Any, List, Optional
+from rich.console import Console
 from rich.logging import RichHandler
+from rich.table import Table
 
+from .benchmark.corpus import SIZES
+from .benchmark.runner import BenchmarkReport, BenchmarkRunner
+from .cache_manager import CacheManager, set_default_cache
 from .cli_progress import CLIProgress
 from .collager_config import CollagerConfig
+from .job_queue import DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, JobQueue
+from .profiling import Profiler, profile_job
+from .telemetry import Telemetry
 from . import workflow
+from .server import CollageService, create_server
 
 DeclickFn = CollagerConfig.DeclickFn
 DistanceFn = CollagerConfig.DistanceFn
+SearchMode = CollagerConfig.SearchMode
+SelectionMode = CollagerConfig.SelectionMode
+ProfileStage = Profiler.Stage
 
 
 app = typer.Typer()
+cache_app = typer.Typer(help="Inspect and manage the cache of indices and feature reducers.")
+app.add_typer(cache_app, name="cache")
+queue_app = typer.Typer(help="Submit collage jobs to a queue on a shared filesystem, for worker commands to run.")
+app.add_typer(queue_app, name="queue")
 
-def setup_logging(log_level: str = "INFO"):
+def setup_logging(log_level: str = "INFO", stderr: bool = False):
     log_level = log_level.upper()
     logging.basicConfig(
         level=log_level,
         format="%(message)s",
         datefmt="[%X]",
-        handlers=[RichHandler(rich_tracebacks=True, show_path=False)]
+        handlers=[RichHandler(rich_tracebacks=True, show_path=False, console=Console(stderr=stderr))]
     )
 
+def use_cache(cache_dir: Optional[str], max_mb: Optional[float]) -> CacheManager:
+    cache = CacheManager(
+        cache_dir,
+        max_bytes=int(max_mb * 1024 * 1024) if max_mb is not None else None
+    )
+    set_default_cache(cache)
+    return cache
+
 def comma_separated_ints(value: Any) -> List[int]:
     return value if isinstance(value, list) else [int(x) for x in value.split(',')]
 
@@ -33,6 +59,8 @@ def collage(
     target_file: str = typer.Option(..., "--target", "-t", help="Path of file to be replicated."),
     sample_file: str = typer.Option(..., "--sample", "-s", help="Path of file to be sampled."),
     outpath: str = typer.Option('./collage.wav', "--outpath", "-o", help="Path of output file."),
+    plan_outpath: str = typer.Option(None, "--plan-out", help="Path to save the selection plan to, for rendering again with the render command."),
+    incremental: bool = typer.Option(False, "--incremental", help="Only map the parts of the target that changed since the plan at --plan-out was made."),
     step_ms: int = typer.Option(None, "--step-ms", help="Step size of sample chops in milliseconds"),
     step_factor: float = typer.Option(None, "--step-factor", help="Step size of sample chops as a factor of window size"),
     declick_fn: DeclickFn = typer.Option(..., "--declick-fn", "-f", help="Declicking function."),
@@ -56,6 +84,68 @@ def collage(
         - mean_mfcc: distance of mean mfccs. Fastest but least accurate.
         """
     ),
+    integral_mfcc: bool = typer.Option(
+        False,
+        "--integral-mfcc",
+        help="With mean_mfcc, take the mean MFCCs of chops from frames of the whole sample. Faster to index but less accurate."
+    ),
+    search_mode: SearchMode = typer.Option(
+        SearchMode.index,
+        "--search-mode",
+        help="""How to search the sample audio.
+        Options are:
+        - index (default): nearest neighbour search over chops of the sample.
+        - sliding: euclidean distance of mfccs at every offset of the sample, ignoring the distance function and step.
+        - brute: compares every chop of the sample with the target. Exact but slow.
+        """
+    ),
+    pca_components: int = typer.Option(
+        None,
+        "--pca-components",
+        help="Number of principal components of the MFCCs to search over. Uses all of them by default."
+    ),
+    library_path: str = typer.Option(
+        None,
+        "--library",
+        help="Path of a SQLite sample library to store and reuse sample chops and features."
+    ),
+    n_partitions: int = typer.Option(
+        1,
+        "--partitions",
+        "-j",
+        help="Number of partitions of the target to map in parallel processes."
+    ),
+    selection_mode: SelectionMode = typer.Option(
+        SelectionMode.greedy,
+        "--selection",
+        help="""How to select snippets.
+        Options are:
+        - greedy (default): the best match at each step.
+        - beam: beam search for the lowest distance over the whole target.
+        """
+    ),
+    beam_width: int = typer.Option(8, "--beam-width", help="Number of partial selections kept by beam selection."),
+    time_budget: float = typer.Option(None, "--time-budget", help="Seconds after which beam selection finishes greedily."),
+    compare_greedy: bool = typer.Option(False, "--compare-greedy", help="Also select greedily and log how beam selection compares."),
+    lookahead: int = typer.Option(
+        0,
+        "--lookahead",
+        help="Number of selection steps to search ahead for in each batch of queries, for batch-friendly search modes."
+    ),
+    pcm_cache_dir: str = typer.Option(
+        None,
+        "--pcm-cache",
+        help="Directory in which to cache decoded audio for faster reloading."
+    ),
+    result_cache_dir: str = typer.Option(
+        None,
+        "--result-cache",
+        help="Directory in which to cache collages, so repeating a job with the same inputs and parameters is instant."
+    ),
+    profile_path: str = typer.Option(None, "--profile", help="Path to save a cProfile .prof file of the job to, along with a callgrind file for KCachegrind."),
+    profile_stage: ProfileStage = typer.Option(None, "--profile-stage", help="Only profile this stage of the job."),
+    telemetry_path: str = typer.Option(None, "--telemetry", help="Path to save stage timings and counters to, in the Prometheus text format if it ends in .prom and as JSON lines otherwise."),
+    telemetry_labels: List[str] = typer.Option(None, "--telemetry-label", help="A key=value label for Prometheus metrics. May be given several times."),
     log_level: str = typer.Option(
         None,
         "--log-level",
@@ -71,20 +161,222 @@ def collage(
     setup_logging(level)
 
     progress = CLIProgress()
+    telemetry = Telemetry()
+
+    with (telemetry.activate() if telemetry_path else contextlib.nullcontext()), \
+            profile_job(profile_path, profile_stage, progress.update) as progress_callback:
+        config = CollagerConfig(
+            target_file=target_file,
+            sample_file=sample_file,
+            outpath=outpath,
+            plan_outpath=plan_outpath,
+            incremental=incremental,
+            step_ms=step_ms,
+            step_factor=step_factor,
+            declick_fn=declick_fn,
+            declick_ms=declick_ms,
+            distance_fn=distance_fn,
+            integral_mfcc=integral_mfcc,
+            windows=windows,
+            search_mode=search_mode,
+            pca_components=pca_components,
+            library_path=library_path,
+            selection_mode=selection_mode,
+            beam_width=beam_width,
+            time_budget=time_budget,
+            compare_greedy=compare_greedy,
+            n_partitions=n_partitions,
+            lookahead=lookahead,
+            pcm_cache_dir=pcm_cache_dir,
+            result_cache_dir=result_cache_dir,
+            progress_callback=progress_callback
+        )
+        workflow.create_collage_from_files(config)
+
+    if telemetry_path:
+        labels = dict(label.partition('=')[::2] for label in telemetry_labels or [])
+        telemetry.write(telemetry_path, labels=labels)
+
+@app.command()
+def render(
+    plan_path: str = typer.Option(..., "--plan", "-p", help="Path of a selection plan saved by collage --plan-out."),
+    outpath: str = typer.Option('./collage.wav', "--outpath", "-o", help="Path of output file."),
+    sample_file: str = typer.Option(None, "--sample", "-s", help="Path of the sampled file. Defaults to the path recorded in the plan."),
+    declick_fn: DeclickFn = typer.Option(DeclickFn.sigmoid, "--declick-fn", "-f", help="Declicking function."),
+    declick_ms: int = typer.Option(0, "--declick-ms", "-d", help="Declick interval in milliseconds."),
+    sample_rate: int = typer.Option(None, "--sample-rate", "-r", help="Sample rate of the output. Defaults to that of the plan."),
+    pcm_cache_dir: str = typer.Option(None, "--pcm-cache", help="Directory in which to cache decoded audio for faster reloading.")
+) -> None:
+    """
+    Render a saved selection plan to audio without searching the sample again.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    workflow.render_from_files(
+        plan_path,
+        outpath,
+        sample_file=sample_file,
+        declick_fn=declick_fn,
+        declick_ms=declick_ms,
+        sample_rate=sample_rate,
+        pcm_cache_dir=pcm_cache_dir
+    )
+
+@app.command()
+def stream(
+    sample_file: str = typer.Option(..., "--sample", "-s", help="Path of file to be sampled."),
+    input_path: str = typer.Option('-', "--input", "-i", help="Path of the target. Reads raw mono 32-bit float PCM from stdin if '-'."),
+    outpath: str = typer.Option('-', "--outpath", "-o", help="Path of output file. Writes raw mono 32-bit float PCM to stdout if '-'."),
+    block_ms: int = typer.Option(50, "--block-ms", help="Length of the blocks the target is read in, in milliseconds."),
+    step_ms: int = typer.Option(None, "--step-ms", help="Step size of sample chops in milliseconds"),
+    step_factor: float = typer.Option(None, "--step-factor", help="Step size of sample chops as a factor of window size"),
+    declick_fn: DeclickFn = typer.Option(DeclickFn.sigmoid, "--declick-fn", "-f", help="Declicking function."),
+    declick_ms: int = typer.Option(0, "--declick-ms", "-d", help="Declick interval in milliseconds."),
+    windows: str = typer.Option(
+        "200,100,50",
+        "--windows",
+        "-w",
+        callback=comma_separated_ints,
+        help="List of window sizes (in ms) to use when sampling. The longest window sets the latency."
+    ),
+    distance_fn: DistanceFn = typer.Option(DistanceFn.mfcc, "--distance-fn", "-e", help="Distance function to use when selecting samples."),
+    search_mode: SearchMode = typer.Option(SearchMode.index, "--search-mode", help="How to search the sample audio."),
+    pca_components: int = typer.Option(None, "--pca-components", help="Number of principal components of the MFCCs to search over."),
+    pcm_cache_dir: str = typer.Option(None, "--pcm-cache", help="Directory in which to cache decoded audio for faster reloading.")
+) -> None:
+    """
+    Collage a target as it streams in, with latency bounded by the longest window.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    # Keep stdout free for audio
+    setup_logging(level, stderr=True)
 
     config = CollagerConfig(
-        target_file=target_file,
         sample_file=sample_file,
-        outpath=outpath,
         step_ms=step_ms,
         step_factor=step_factor,
         declick_fn=declick_fn,
         declick_ms=declick_ms,
         distance_fn=distance_fn,
         windows=windows,
-        progress_callback=progress.update
+        search_mode=search_mode,
+        pca_components=pca_components,
+        pcm_cache_dir=pcm_cache_dir
+    )
+    workflow.stream_from_files(config, input_path, outpath, block_ms=block_ms)
+
+@app.command()
+def batch(
+    sample_file: str = typer.Option(..., "--sample", "-s", help="Path of file to be sampled."),
+    target_files: List[str] = typer.Option(None, "--target", "-t", help="Path of a file to be replicated. May be given several times."),
+    manifest: str = typer.Option(None, "--manifest", "-m", help="Path of a file listing one target per line, optionally followed by a comma and an output path."),
+    outdir: str = typer.Option('.', "--outdir", "-o", help="Directory of output files for targets without an output path."),
+    workers: int = typer.Option(None, "--workers", "-j", help="Number of worker processes. Defaults to the number of CPUs."),
+    step_ms: int = typer.Option(None, "--step-ms", help="Step size of sample chops in milliseconds"),
+    step_factor: float = typer.Option(None, "--step-factor", help="Step size of sample chops as a factor of window size"),
+    declick_fn: DeclickFn = typer.Option(..., "--declick-fn", "-f", help="Declicking function."),
+    declick_ms: int = typer.Option(0, "--declick-ms", "-d", help="Declick interval in milliseconds."),
+    windows: str = typer.Option(
+        "500,200,100,50",
+        "--windows",
+        "-w",
+        callback=comma_separated_ints,
+        help="List of window sizes (in ms) to use when sampling."
+    ),
+    distance_fn: DistanceFn = typer.Option(DistanceFn.mfcc, "--distance-fn", "-e", help="Distance function to use when selecting samples."),
+    search_mode: SearchMode = typer.Option(SearchMode.index, "--search-mode", help="How to search the sample audio."),
+    pca_components: int = typer.Option(None, "--pca-components", help="Number of principal components of the MFCCs to search over."),
+    library_path: str = typer.Option(None, "--library", help="Path of a SQLite sample library to store and reuse sample chops and features."),
+    pcm_cache_dir: str = typer.Option(None, "--pcm-cache", help="Directory in which to cache decoded audio for faster reloading.")
+) -> None:
+    """
+    Create collages of many targets using snippets from one sample file,
+    chopping and indexing the sample only once.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    targets = [(t, workflow.batch_outpath(t, outdir)) for t in target_files or []]
+    if manifest:
+        targets += workflow.read_batch_manifest(manifest, outdir)
+    if not targets:
+        raise typer.BadParameter("No targets given. Use --target or --manifest.")
+    try:
+        workflow.check_batch_outpaths(targets)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+    config = CollagerConfig(
+        sample_file=sample_file,
+        step_ms=step_ms,
+        step_factor=step_factor,
+        declick_fn=declick_fn,
+        declick_ms=declick_ms,
+        distance_fn=distance_fn,
+        windows=windows,
+        search_mode=search_mode,
+        pca_components=pca_components,
+        library_path=library_path,
+        pcm_cache_dir=pcm_cache_dir
+    )
+    workflow.create_collages_from_files(config, targets, max_workers=workers)
+
+@app.command()
+def sweep(
+    target_file: str = typer.Option(..., "--target", "-t", help="Path of file to be replicated."),
+    sample_file: str = typer.Option(..., "--sample", "-s", help="Path of file to be sampled."),
+    grid_path: str = typer.Option(..., "--grid", "-g", help="Path of a JSON file mapping collage parameters to lists of values to sweep over."),
+    outdir: str = typer.Option('./sweep', "--outdir", "-o", help="Directory of output files."),
+    workers: int = typer.Option(None, "--workers", "-j", help="Number of worker processes. Defaults to the number of CPUs."),
+    pcm_cache_dir: str = typer.Option(None, "--pcm-cache", help="Directory in which to cache decoded audio for faster reloading.")
+) -> None:
+    """
+    Create a collage for every combination of parameters in a grid, sharing
+    chopping, feature and index work between them.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    with open(grid_path) as f:
+        grid = json.load(f)
+
+    config = CollagerConfig(
+        target_file=target_file,
+        sample_file=sample_file,
+        pcm_cache_dir=pcm_cache_dir
+    )
+    workflow.sweep_from_files(config, grid, outdir, max_workers=workers)
+
+@app.command()
+def ingest(
+    sample_file: str = typer.Option(..., "--sample", "-s", help="Path of file to be sampled."),
+    library_path: str = typer.Option(..., "--library", help="Path of the SQLite sample library."),
+    step_ms: int = typer.Option(None, "--step-ms", help="Step size of sample chops in milliseconds"),
+    step_factor: float = typer.Option(None, "--step-factor", help="Step size of sample chops as a factor of window size"),
+    windows: str = typer.Option(
+        "500,200,100,50",
+        "--windows",
+        "-w",
+        callback=comma_separated_ints,
+        help="List of window sizes (in ms) to chop the sample into."
+    ),
+    declick_ms: int = typer.Option(0, "--declick-ms", "-d", help="Declick interval in milliseconds of the collages the library is for."),
+) -> None:
+    """
+    Chop a sample and store the chops and their features in a sample library.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    workflow.ingest_sample_file(
+        sample_file,
+        library_path,
+        windows,
+        step_ms=step_ms,
+        step_factor=step_factor,
+        declick_ms=declick_ms
     )
-    workflow.create_collage_from_files(config)
 
 @app.command()
 def chop(
@@ -92,7 +384,9 @@ def chop(
     step_ms: int = typer.Option(None, "--step-ms", help="Step size of sample chops in milliseconds"),
     step_factor: float = typer.Option(None, "--step-factor", help="Step size of sample chops as a factor of window size"),
     input_filepath: str = typer.Option(..., "--file", "-f", help="Path of file to be chopped."),
-    outdir: str = typer.Option(..., "--outdir", "-o", help="Path of directory to write snippets.")
+    outdir: str = typer.Option(..., "--outdir", "-o", help="Path of directory to write snippets."),
+    profile_path: str = typer.Option(None, "--profile", help="Path to save a cProfile .prof file of the job to, along with a callgrind file for KCachegrind."),
+    profile_stage: ProfileStage = typer.Option(None, "--profile-stage", help="Only profile this stage of the job.")
 ) -> None:
     """
     Chop up a .wav file
@@ -101,17 +395,352 @@ def chop(
     setup_logging(level)
     progress = CLIProgress()
 
-    workflow.chop_and_write_from_file(
-        input_filepath,
-        outdir,
-        chop_length,
+    with profile_job(profile_path, profile_stage, progress.update) as progress_callback:
+        workflow.chop_and_write_from_file(
+            input_filepath,
+            outdir,
+            chop_length,
+            step_ms=step_ms,
+            step_factor=step_factor,
+            progress_callback=progress_callback
+        )
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", "--host", help="Host to listen on."),
+    port: int = typer.Option(8765, "--port", "-p", help="Port to listen on."),
+    socket_path: str = typer.Option(None, "--socket", help="Path of a Unix socket to listen on instead of a port."),
+    max_memory_mb: int = typer.Option(1024, "--max-memory-mb", help="Memory budget for indices kept between jobs, in megabytes."),
+    result_cache_dir: str = typer.Option(None, "--result-cache", help="Directory in which to cache collages, so repeated jobs are served without collaging again."),
+    result_cache_mb: int = typer.Option(1024, "--result-cache-mb", help="Disk budget for the result cache, in megabytes.")
+) -> None:
+    """
+    Run a daemon that keeps sample indices in memory between collage jobs.
+    Jobs are POSTed to /collage as JSON collage parameters.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    service = CollageService(
+        max_memory_mb * 1024 * 1024,
+        result_cache_dir=result_cache_dir,
+        result_cache_bytes=result_cache_mb * 1024 * 1024
+    )
+    server = create_server(service, host=host, port=port, socket_path=socket_path)
+    logging.info(f"Serving collage jobs on {socket_path or f'http://{host}:{port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+@app.command()
+def benchmark(
+    sizes: str = typer.Option("tiny,small", "--sizes", help=f"Comma separated corpus sizes to benchmark, of {', '.join(SIZES)}."),
+    stages: str = typer.Option(",".join(BenchmarkRunner.STAGES), "--stages", help="Comma separated pipeline stages to benchmark."),
+    windows: str = typer.Option(
+        "400,200,100,50",
+        "--windows",
+        "-w",
+        callback=comma_separated_ints,
+        help="List of window sizes (in ms) to benchmark."
+    ),
+    step_factors: str = typer.Option("0.5", "--step-factors", help="Comma separated chop steps as factors of window size."),
+    distance_fn: DistanceFn = typer.Option(DistanceFn.fast_mfcc, "--distance-fn", "-e", help="Distance function of benchmarked indices."),
+    repeats: int = typer.Option(3, "--repeats", "-r", help="Number of timed runs of each benchmark."),
+    outpath: str = typer.Option(None, "--outpath", "-o", help="Path to save the results to as JSON."),
+    baseline_path: str = typer.Option(None, "--baseline", "-b", help="Path of saved results to compare against."),
+    tolerance: float = typer.Option(0.25, "--tolerance", help="Fraction by which a stage may be slower or use more memory than the baseline.")
+) -> None:
+    """
+    Benchmark each stage of the pipeline on synthetic audio. Exits with an
+    error if any stage regressed against the baseline.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    runner = BenchmarkRunner(
+        sizes=sizes.split(','),
+        windows=windows,
+        step_factors=[float(x) for x in step_factors.split(',')],
+        distance_fn=distance_fn,
+        stages=stages.split(','),
+        repeats=repeats
+    )
+    report = runner.run()
+    for result in report.results:
+        logging.info(f"{result.key}: {result.seconds:.4f}s, {result.peak_bytes / 1024 / 1024:.1f}MB peak")
+    if outpath:
+        report.to_file(outpath)
+        logging.info(f"Saved results to '{outpath}'")
+
+    if baseline_path:
+        regressions = report.compare(BenchmarkReport.from_file(baseline_path), tolerance=tolerance)
+        for regression in regressions:
+            logging.warning(f"Regression in {regression}")
+        if regressions:
+            raise typer.Exit(code=1)
+        logging.info("No regressions against the baseline")
+
+@app.command("compare-backends")
+def compare_backends(
+    target_file: str = typer.Option(..., "--target", "-t", help="Path to the target audio file."),
+    sample_file: str = typer.Option(..., "--sample", "-s", help="Path to the sample audio file."),
+    windows: str = typer.Option(
+        "400,200,100,50",
+        "--windows",
+        "-w",
+        callback=comma_separated_ints,
+        help="List of window sizes (in ms) to index."
+    ),
+    distance_fn: DistanceFn = typer.Option(DistanceFn.fast_mfcc, "--distance-fn", "-e", help="Distance function of the indices."),
+    step_factor: float = typer.Option(0.5, "--step-factor", help="Chop step as a factor of window size."),
+    search_modes: str = typer.Option(",".join(SearchMode), "--modes", help="Comma separated search modes to compare."),
+    n_queries: int = typer.Option(50, "--queries", "-q", help="Number of target frames to search from."),
+    outpath: str = typer.Option(None, "--outpath", "-o", help="Path to save the comparison to as JSON.")
+) -> None:
+    """
+    Compare how many distance evaluations and how much time each search mode
+    takes to build indices of the sample and search them from the target.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    config = CollagerConfig(
+        target_file=target_file,
+        sample_file=sample_file,
+        windows=windows,
+        distance_fn=distance_fn,
+        step_factor=step_factor,
+    )
+    workflow.compare_backends_from_files(
+        config,
+        [SearchMode(mode) for mode in search_modes.split(',')],
+        n_queries=n_queries,
+        outpath=outpath
+    )
+
+@app.command()
+def recall(
+    target_file: str = typer.Option(..., "--target", "-t", help="Path to the target audio file."),
+    sample_file: str = typer.Option(..., "--sample", "-s", help="Path to the sample audio file."),
+    windows: str = typer.Option(
+        "400,200,100,50",
+        "--windows",
+        "-w",
+        callback=comma_separated_ints,
+        help="List of window sizes (in ms) to index."
+    ),
+    distance_fn: DistanceFn = typer.Option(DistanceFn.mfcc, "--distance-fn", "-e", help="Reference distance function for the exact nearest neighbours."),
+    step_factor: float = typer.Option(0.5, "--step-factor", help="Chop step as a factor of window size."),
+    grid_path: str = typer.Option(None, "--grid", "-g", help="Path of a JSON file mapping collage parameters to lists of values to compare. Defaults to every search mode."),
+    n_queries: int = typer.Option(50, "--queries", "-q", help="Number of target frames to search from."),
+    k: int = typer.Option(10, "-k", help="Number of exact nearest neighbours a match may be among to count towards recall@k."),
+    outpath: str = typer.Option(None, "--outpath", "-o", help="Path to save the results to as JSON.")
+) -> None:
+    """
+    Measure the recall and speed of search configurations against the exact
+    nearest neighbours of target frames, found by brute force.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    grid = None
+    if grid_path:
+        with open(grid_path) as f:
+            grid = json.load(f)
+
+    config = CollagerConfig(
+        target_file=target_file,
+        sample_file=sample_file,
+        windows=windows,
+        distance_fn=distance_fn,
+        step_factor=step_factor,
+    )
+    results = workflow.recall_from_files(config, grid, n_queries=n_queries, k=k, outpath=outpath)
+
+    table = Table(title=f"Recall against {distance_fn} nearest neighbours")
+    table.add_column("Configuration", overflow="fold")
+    for column in ["Window", "Recall@1", f"Recall@{k}", "Distance ratio", "Queries/s"]:
+        table.add_column(column, justify="right")
+    for result in results:
+        table.add_row(
+            result.label,
+            f"{result.window}ms",
+            f"{result.recall_at_1:.3f}",
+            f"{result.recall_at_k:.3f}",
+            f"{result.distance_ratio:.3f}",
+            f"{result.queries_per_second:.1f}",
+        )
+    Console().print(table)
+
+@cache_app.command("stats")
+def cache_stats(
+    cache_dir: str = typer.Option(None, "--cache-dir", help="Cache directory. Defaults to $AUDIO_COLLAGE_CACHE_DIR or .cache."),
+    max_mb: float = typer.Option(None, "--max-mb", help="Cache budget in megabytes. Defaults to $AUDIO_COLLAGE_CACHE_MB or 4096.")
+) -> None:
+    """
+    Show the size of the cache and of each kind of entry in it.
+    """
+    cache = use_cache(cache_dir, max_mb)
+    typer.echo(str(cache.stats()))
+
+@cache_app.command("prune")
+def cache_prune(
+    cache_dir: str = typer.Option(None, "--cache-dir", help="Cache directory. Defaults to $AUDIO_COLLAGE_CACHE_DIR or .cache."),
+    max_mb: float = typer.Option(None, "--max-mb", help="Size in megabytes to prune the cache to. Defaults to $AUDIO_COLLAGE_CACHE_MB or 4096.")
+) -> None:
+    """
+    Remove entries of other cache versions, then the least recently used
+    entries until the cache is within budget.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    cache = use_cache(cache_dir, max_mb)
+    removed = cache.prune()
+    logging.info(f"Removed {len(removed)} files")
+    typer.echo(str(cache.stats()))
+
+@cache_app.command("warm")
+def cache_warm(
+    sample_files: List[str] = typer.Option(..., "--sample", "-s", help="Path of a sample audio file to index. May be given more than once."),
+    windows: str = typer.Option(
+        "800,400,200,100,50",
+        "--windows",
+        "-w",
+        callback=comma_separated_ints,
+        help="List of window sizes (in ms) to index."
+    ),
+    distance_fn: DistanceFn = typer.Option(DistanceFn.mfcc, "--distance-fn", "-e", help="Distance function of the indices."),
+    step_ms: int = typer.Option(None, "--step-ms", help="Step size of sample chops in milliseconds"),
+    step_factor: float = typer.Option(None, "--step-factor", help="Step size of sample chops as a factor of window size"),
+    declick_ms: int = typer.Option(0, "--declick-ms", "-d", help="Declick interval of the collages the indices are for, which lengthens windows."),
+    pca_components: int = typer.Option(None, "--pca-components", help="Number of principal components of the MFCCs to index."),
+    cache_dir: str = typer.Option(None, "--cache-dir", help="Cache directory. Defaults to $AUDIO_COLLAGE_CACHE_DIR or .cache."),
+    max_mb: float = typer.Option(None, "--max-mb", help="Cache budget in megabytes. Defaults to $AUDIO_COLLAGE_CACHE_MB or 4096.")
+) -> None:
+    """
+    Build and cache the indices of sample files ahead of the collage jobs
+    that will use them.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    use_cache(cache_dir, max_mb)
+    config = CollagerConfig(
+        windows=windows,
+        distance_fn=distance_fn,
+        step_ms=step_ms,
+        step_factor=step_factor,
+        declick_ms=declick_ms,
+        pca_components=pca_components,
+    )
+    workflow.warm_cache_from_files(config, sample_files)
+
+@queue_app.command("submit")
+def queue_submit(
+    queue_dir: str = typer.Option(..., "--queue", "-q", help="Queue directory, on a filesystem shared with the workers."),
+    sample_file: str = typer.Option(..., "--sample", "-s", help="Path of file to be sampled."),
+    target_files: List[str] = typer.Option(None, "--target", "-t", help="Path of a file to be replicated. May be given several times."),
+    manifest: str = typer.Option(None, "--manifest", "-m", help="Path of a file listing one target per line, optionally followed by a comma and an output path."),
+    outdir: str = typer.Option('.', "--outdir", "-o", help="Directory of output files for targets without an output path."),
+    step_ms: int = typer.Option(None, "--step-ms", help="Step size of sample chops in milliseconds"),
+    step_factor: float = typer.Option(None, "--step-factor", help="Step size of sample chops as a factor of window size"),
+    declick_fn: DeclickFn = typer.Option(..., "--declick-fn", "-f", help="Declicking function."),
+    declick_ms: int = typer.Option(0, "--declick-ms", "-d", help="Declick interval in milliseconds."),
+    windows: str = typer.Option(
+        "500,200,100,50",
+        "--windows",
+        "-w",
+        callback=comma_separated_ints,
+        help="List of window sizes (in ms) to use when sampling."
+    ),
+    distance_fn: DistanceFn = typer.Option(DistanceFn.mfcc, "--distance-fn", "-e", help="Distance function to use when selecting samples."),
+    search_mode: SearchMode = typer.Option(SearchMode.index, "--search-mode", help="How to search the sample audio."),
+    pca_components: int = typer.Option(None, "--pca-components", help="Number of principal components of the MFCCs to search over."),
+    pcm_cache_dir: str = typer.Option(None, "--pcm-cache", help="Directory in which to cache decoded audio, on a filesystem shared with the workers.")
+) -> None:
+    """
+    Queue a collage job for each of many targets, using snippets from one
+    sample file.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    targets = [(t, workflow.batch_outpath(t, outdir)) for t in target_files or []]
+    if manifest:
+        targets += workflow.read_batch_manifest(manifest, outdir)
+    if not targets:
+        raise typer.BadParameter("No targets given. Use --target or --manifest.")
+    try:
+        workflow.check_batch_outpaths(targets)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+    config = CollagerConfig(
+        sample_file=sample_file,
         step_ms=step_ms,
         step_factor=step_factor,
-        progress_callback=progress.update
+        declick_fn=declick_fn,
+        declick_ms=declick_ms,
+        distance_fn=distance_fn,
+        windows=windows,
+        search_mode=search_mode,
+        pca_components=pca_components,
+        pcm_cache_dir=os.path.abspath(pcm_cache_dir) if pcm_cache_dir else None
+    )
+    workflow.submit_collages_to_queue(config, targets, queue_dir)
+
+@queue_app.command("status")
+def queue_status(
+    queue_dir: str = typer.Option(..., "--queue", "-q", help="Queue directory."),
+    show_failed: bool = typer.Option(False, "--failed", help="List failed jobs and their errors.")
+) -> None:
+    """
+    Show the number of jobs in each state.
+    """
+    queue = JobQueue(queue_dir)
+    typer.echo(str(queue.status()))
+    if show_failed:
+        for job in queue.jobs(JobQueue.State.failed):
+            typer.echo(f"{job.job_id} {job.params.get('target_file')}: {job.errors[-1] if job.errors else ''}")
+
+@app.command()
+def worker(
+    queue_dir: str = typer.Option(..., "--queue", "-q", help="Queue directory, on a filesystem shared with the other workers."),
+    processes: int = typer.Option(1, "--processes", "-j", help="Number of worker processes to run on this machine."),
+    lease_seconds: float = typer.Option(DEFAULT_LEASE_SECONDS, "--lease-seconds", help="Seconds without a heartbeat after which a job is returned to the queue."),
+    max_attempts: int = typer.Option(DEFAULT_MAX_ATTEMPTS, "--max-attempts", help="Number of times a job is tried before it is marked failed."),
+    max_jobs: int = typer.Option(None, "--max-jobs", help="Number of jobs after which each worker process exits. Defaults to draining the queue."),
+    cache_dir: str = typer.Option(None, "--cache-dir", help="Index cache directory, shared with the other workers. Defaults to $AUDIO_COLLAGE_CACHE_DIR or .cache."),
+    max_mb: float = typer.Option(None, "--max-mb", help="Cache budget in megabytes. Defaults to $AUDIO_COLLAGE_CACHE_MB or 4096.")
+) -> None:
+    """
+    Run queued collage jobs until the queue is drained. Workers on several
+    machines sharing the queue and cache directories can run at once.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO")
+    setup_logging(level)
+
+    cache = use_cache(cache_dir, max_mb)
+    completed = workflow.run_queue_workers(
+        queue_dir,
+        processes=processes,
+        lease_seconds=lease_seconds,
+        max_attempts=max_attempts,
+        max_jobs=max_jobs,
+        cache_dir=cache.cache_dir,
+        max_bytes=cache.max_bytes
     )
+    logging.info(f"Completed {completed} jobs")
 
 @app.command()
-def example() -> None:
+def example(
+    profile_path: str = typer.Option(None, "--profile", help="Path to save a cProfile .prof file of the job to, along with a callgrind file for KCachegrind."),
+    profile_stage: ProfileStage = typer.Option(None, "--profile-stage", help="Only profile this stage of the job.")
+) -> None:
     """
     Create an example collage using Amen Brother and Zimba Ku breakbeats.
     """
@@ -119,19 +748,20 @@ def example() -> None:
     setup_logging(level)
     progress = CLIProgress()
 
-    config = CollagerConfig(
-        target_file='./docs/audio/breaks/amen_brother.wav',
-        sample_file='./docs/audio/breaks/black_heat__zimba_ku.wav',
-        outpath='./collage.wav',
-        step_ms=None,
-        step_factor=0.5,
-        declick_fn=DeclickFn.sigmoid,
-        declick_ms=15,
-        distance_fn=DistanceFn.fast_mfcc,
-        windows=[800, 400, 200, 100],
-        progress_callback=progress.update
-    )
-    workflow.create_collage_from_files(config)
+    with profile_job(profile_path, profile_stage, progress.update) as progress_callback:
+        config = CollagerConfig(
+            target_file='./docs/audio/breaks/amen_brother.wav',
+            sample_file='./docs/audio/breaks/black_heat__zimba_ku.wav',
+            outpath='./collage.wav',
+            step_ms=None,
+            step_factor=0.5,
+            declick_fn=DeclickFn.sigmoid,
+            declick_ms=15,
+            distance_fn=DistanceFn.fast_mfcc,
+            windows=[800, 400, 200, 100],
+            progress_callback=progress_callback
+        )
+        workflow.create_collage_from_files(config)
 
 if __name__ == "__main__":
     app()
@@ -3,50 +3,57 @@ from .audio_dist import AudioDist
 from .audio_mapper import AudioMapper
 from .audio_segment import AudioSegment
 from .collager_config import CollagerConfig
+from .incremental import TargetAnalysis, update_plan
+from .partition import map_partitioned, split_points
+from .plan import SelectionPlan
+from .segmentation import BeamSelector, compare_with_greedy
 
-from typing import Dict, Callable
+from .search.index_collection import SearchIndexCollection
+
+import logging
+import numpy as np
+from typing import Dict, Callable, Optional
+
+logger = logging.getLogger(__name__)
 
 class Collager:
     @staticmethod
     def create_collage(
         target_audio: AudioSegment,
         sample_audio: AudioSegment,
-        config: CollagerConfig
+        config: CollagerConfig,
+        indices: Optional[SearchIndexCollection] = None
     ) -> AudioSegment:
         """
         This is the core logic for creating a collage.
+
+        Prebuilt indices of the sample audio for the same config may be passed
+        in, in which case the sample audio is not chopped or indexed again.
         """
         declick_fn = config.declick_fn
-        declick_ms = config.declick_ms
-        distance_fn = config.distance_fn
-
-        default_dc_ms = {
-            'sigmoid': 20,
-            'linear': 70,
-        }
-        if declick_fn:
-            declick_ms = declick_ms or default_dc_ms[declick_fn]
-        else:
-            declick_ms = 0
+        declick_ms = Collager.resolve_declick_ms(declick_fn, config.declick_ms)
 
-        dist_fn_map: Dict[str, Callable[[AudioSegment, AudioSegment], float]] = {
-            'mfcc': AudioDist.mfcc_dist,
-            'fast_mfcc': AudioDist.fast_mfcc_dist,
-            'mean_mfcc': AudioDist.mean_mfcc_dist,
-            'mfcc_cosine': AudioDist.mfcc_cosine_dist,
-        }
-        selected_distance_fn = dist_fn_map.get(distance_fn.value)
-        if not selected_distance_fn:
-            raise ValueError(f'Invalid distance function: {distance_fn}')
+        if config.n_partitions > 1 or config.selection_mode == CollagerConfig.SelectionMode.beam:
+            plan = Collager.create_plan(target_audio, sample_audio, config, indices=indices)
+            return Collager.render(
+                plan,
+                sample_audio,
+                declick_fn=declick_fn,
+                declick_ms=config.declick_ms,
+                progress_callback=config.progress_callback
+            )
 
         mapper = AudioMapper(
             sample_audio,
             target_audio,
-            distance_fn=selected_distance_fn,
+            distance_fn=Collager.resolve_distance_fn(config.distance_fn),
             config=config
         )
+        if indices is not None:
+            mapper.indices = indices
 
         selected_snippets = mapper.map_audio()
+        mapper.indices.log_stats()
 
         output_audio = Util.concatenate_audio(
             selected_snippets,
@@ -58,3 +65,182 @@ class Collager:
 
         return output_audio
 
+    @staticmethod
+    def create_plan(
+        target_audio: AudioSegment,
+        sample_audio: AudioSegment,
+        config: CollagerConfig,
+        indices: Optional[SearchIndexCollection] = None,
+        previous_plan: Optional[SelectionPlan] = None
+    ) -> SelectionPlan:
+        """
+        Selects the snippets of the sample audio that make up a collage of the
+        target audio, without rendering them.
+
+        If the plan made for a previous version of the target with the same
+        sample and config is given, only the parts of the target that have
+        changed are mapped again.
+        """
+        mapper = AudioMapper(
+            sample_audio,
+            target_audio,
+            distance_fn=Collager.resolve_distance_fn(config.distance_fn),
+            config=config
+        )
+        if indices is not None:
+            mapper.indices = indices
+
+        source_hash = sample_audio.hash()
+        params = config.canonical_params()
+        analysis = TargetAnalysis.analyse(target_audio)
+
+        plan = None
+        if previous_plan is not None:
+            if (
+                previous_plan.source_hashes == [source_hash]
+                and previous_plan.sample_rate == sample_audio.sample_rate
+                and previous_plan.metadata.get('params') == params
+            ):
+                margin_ms = max(config.windows) + config.declick_ms
+                plan = update_plan(
+                    mapper,
+                    previous_plan,
+                    analysis,
+                    margin_frames=int((margin_ms / 1000) * target_audio.sample_rate)
+                )
+            else:
+                logger.info("Previous plan was made with another sample or config, mapping the whole target")
+
+        if plan is None and config.selection_mode == CollagerConfig.SelectionMode.beam:
+            if config.compare_greedy:
+                comparison = compare_with_greedy(mapper, config.beam_width, config.time_budget)
+                plan = comparison.pop('plan')
+                plan.metadata['comparison'] = comparison
+                logger.info(
+                    f"Beam search mean distance {comparison['beam']['distance']:.4f} "
+                    f"in {comparison['beam']['seconds']:.2f}s, greedy "
+                    f"{comparison['greedy']['distance']:.4f} in {comparison['greedy']['seconds']:.2f}s"
+                )
+            else:
+                plan = BeamSelector(
+                    mapper,
+                    beam_width=config.beam_width,
+                    time_budget=config.time_budget
+                ).select()
+        if plan is None and config.n_partitions > 1:
+            search_ms = max(config.windows) + config.declick_ms
+            plan = map_partitioned(
+                mapper,
+                split_points(
+                    target_audio,
+                    config.n_partitions,
+                    search_frames=int((search_ms / 1000) * target_audio.sample_rate)
+                ),
+                max_workers=config.n_partitions
+            )
+        if plan is None:
+            plan = mapper.select()
+        mapper.indices.log_stats()
+        plan.source_hashes = [source_hash]
+        plan.metadata['params'] = params
+        plan.metadata['target'] = analysis.to_dict()
+        return plan
+
+    @staticmethod
+    def render(
+        plan: SelectionPlan,
+        sample_audio: AudioSegment,
+        declick_fn: Optional[CollagerConfig.DeclickFn] = CollagerConfig.DeclickFn.sigmoid,
+        declick_ms: int = 0,
+        sample_rate: Optional[int] = None,
+        progress_callback: Optional[Callable] = None
+    ) -> AudioSegment:
+        """
+        Renders a selection plan to audio, cutting its snippets from the sample audio.
+
+        Args:
+            plan (SelectionPlan): The snippets to render.
+            sample_audio (AudioSegment): The audio the plan was selected from.
+            declick_fn (DeclickFn, optional): Declicking function. No declicking if None.
+            declick_ms (int, optional): Declick interval in milliseconds. Defaults to the declick function's default.
+            sample_rate (int, optional): Sample rate of the output. Defaults to the sample rate of the plan.
+        """
+        sample_rate = sample_rate or plan.sample_rate
+        declick_ms = Collager.resolve_declick_ms(declick_fn, declick_ms)
+
+        if plan.source_hashes and plan.source_hashes[0] and sample_audio.sample_rate == plan.sample_rate:
+            if sample_audio.hash() != plan.source_hashes[0]:
+                logger.warning("Sample audio differs from the audio the plan was selected from")
+
+        source_ts = sample_audio.timeseries
+        if sample_audio.sample_rate != sample_rate:
+            import librosa
+            source_ts = librosa.resample(
+                np.asarray(source_ts, dtype=float),
+                orig_sr=sample_audio.sample_rate,
+                target_sr=sample_rate
+            )
+        # Plan offsets and lengths are in frames at the plan's sample rate
+        scale = sample_rate / plan.sample_rate
+
+        snippets = []
+        for entry in plan.entries:
+            start = int(round(entry.offset_frames * scale))
+            end = start + int(round(entry.n_frames * scale))
+            snippets.append(AudioSegment(source_ts[start:end], sample_rate, offset_frames=start))
+
+        return Util.concatenate_audio(
+            snippets,
+            declick_fn=declick_fn,
+            declick_ms=declick_ms,
+            sample_rate=sample_rate,
+            progress_callback=progress_callback
+        )
+
+    @staticmethod
+    def resolve_declick_ms(
+        declick_fn: Optional[CollagerConfig.DeclickFn],
+        declick_ms: int
+    ) -> int:
+        """
+        Returns the declick interval, defaulting it for the declick function.
+        """
+        default_dc_ms = {
+            'sigmoid': 20,
+            'linear': 70,
+        }
+        if declick_fn:
+            return declick_ms or default_dc_ms[declick_fn]
+        return 0
+
+    @staticmethod
+    def build_indices(
+        sample_audio: AudioSegment,
+        config: CollagerConfig
+    ) -> SearchIndexCollection:
+        """
+        Chops and indexes the sample audio, so the indices can be shared by
+        several collages made with the same config.
+        """
+        mapper = AudioMapper(
+            sample_audio,
+            AudioSegment(np.array([]), sample_audio.sample_rate),
+            distance_fn=Collager.resolve_distance_fn(config.distance_fn),
+            config=config
+        )
+        return mapper.build_indices()
+
+    @staticmethod
+    def resolve_distance_fn(
+        distance_fn: CollagerConfig.DistanceFn
+    ) -> Callable[[AudioSegment, AudioSegment], float]:
+        dist_fn_map: Dict[str, Callable[[AudioSegment, AudioSegment], float]] = {
+            'mfcc': AudioDist.mfcc_dist,
+            'fast_mfcc': AudioDist.fast_mfcc_dist,
+            'mean_mfcc': AudioDist.mean_mfcc_dist,
+            'mfcc_cosine': AudioDist.mfcc_cosine_dist,
+        }
+        selected_distance_fn = dist_fn_map.get(distance_fn.value)
+        if not selected_distance_fn:
+            raise ValueError(f'Invalid distance function: {distance_fn}')
+        return selected_distance_fn
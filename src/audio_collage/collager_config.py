@@ -1,22 +1,79 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
+import threading
 from strenum import StrEnum
-from typing import List, Optional, Callable
+from typing import Any, Dict, List, Optional, Callable, Tuple
+
+from .features import N_MFCC
 
 @dataclass(frozen=True)
 class CollagerConfig:
     """A single object to hold all collage generation parameters."""
 
-    DeclickFn = StrEnum('Declickfn', {k: k for k in ['sigmoid', 'linear']})
-    DistanceFn = StrEnum('DistanceFn', {k: k for k in ['mfcc', 'fast_mfcc', 'mean_mfcc', 'mfcc_cosine']})
+    # module and qualname let configs be pickled to worker processes
+    DeclickFn = StrEnum(
+        'Declickfn',
+        {k: k for k in ['sigmoid', 'linear']},
+        module=__name__,
+        qualname='CollagerConfig.DeclickFn'
+    )
+    DistanceFn = StrEnum(
+        'DistanceFn',
+        {k: k for k in ['mfcc', 'fast_mfcc', 'mean_mfcc', 'mfcc_cosine']},
+        module=__name__,
+        qualname='CollagerConfig.DistanceFn'
+    )
+    SearchMode = StrEnum(
+        'SearchMode',
+        {k: k for k in ['index', 'sliding', 'brute']},
+        module=__name__,
+        qualname='CollagerConfig.SearchMode'
+    )
+    SelectionMode = StrEnum(
+        'SelectionMode',
+        {k: k for k in ['greedy', 'beam']},
+        module=__name__,
+        qualname='CollagerConfig.SelectionMode'
+    )
 
     # File paths
     target_file: Optional[str] = None
     sample_file: Optional[str] = None
     outpath: Optional[str] = None
+    # Where to save the selection plan, so it can be rendered again later
+    plan_outpath: Optional[str] = None
+    # Reuse the plan already at plan_outpath for the parts of the target that
+    # have not changed since it was made
+    incremental: bool = False
 
     # Collage parameters
     windows: List[int] = field(default_factory=lambda: [800, 400, 200, 100, 50])
     distance_fn: DistanceFn = DistanceFn.mfcc
+    # Whether mean_mfcc distances take the mean MFCCs of chops from frames of
+    # the whole source, which is faster but differs from the features of
+    # queries, computed on each chunk of the target alone, so matches are
+    # less accurate
+    integral_mfcc: bool = False
+    # 'sliding' matches euclidean MFCC distance at every source frame offset
+    # instead of searching chops, and ignores distance_fn and step parameters
+    # 'brute' compares every chop with every query, for exact results
+    search_mode: SearchMode = SearchMode.index
+    # Number of principal components of the MFCCs to search over, or None to use them all
+    pca_components: Optional[int] = None
+    # 'beam' searches for the selection with the lowest distance over the
+    # whole target, within the beam width and time budget in seconds, instead
+    # of picking the best match at each step. Beam selection is not partitioned.
+    selection_mode: SelectionMode = SelectionMode.greedy
+    beam_width: int = 8
+    time_budget: Optional[float] = None
+    # Also select greedily and record how the two compare in the plan
+    compare_greedy: bool = False
+    # Number of partitions of the target to map in parallel processes, split
+    # at quiet points
+    n_partitions: int = 1
+    # Number of selection steps to search ahead for in each batch of queries,
+    # or 0 to search one step at a time. At most beam_width pointers are
+    # searched ahead for at each step. Does not change the selection.
+    lookahead: int = 0
 
     # Declicking parameters
     declick_fn: Optional[DeclickFn] = DeclickFn.sigmoid
@@ -26,9 +83,113 @@ class CollagerConfig:
     step_ms: Optional[int] = None
     step_factor: Optional[float] = None
 
+    # Path of a SQLite sample library to read chops and features from
+    library_path: Optional[str] = None
+
+    # Directory to cache decoded audio in
+    pcm_cache_dir: Optional[str] = None
+
+    # Directory to cache the results of whole jobs in
+    result_cache_dir: Optional[str] = None
+
     # Progress callback
     progress_callback: Optional[Callable] = None
 
+    # When set, mapping stops at the next selection step
+    cancel_event: Optional[threading.Event] = None
+
+    # Parameters that locate inputs, outputs and caches, or only affect how a
+    # job runs, rather than what collage it makes
+    RUNTIME_PARAMS = (
+        'target_file',
+        'sample_file',
+        'outpath',
+        'plan_outpath',
+        'incremental',
+        'lookahead',
+        'compare_greedy',
+        'library_path',
+        'pcm_cache_dir',
+        'result_cache_dir',
+        'progress_callback',
+        'cancel_event',
+    )
+
     def __post_init__(self) -> None:
         if self.step_ms is not None and self.step_factor is not None:
             raise ValueError("Cannot specify both 'step_ms' and 'step_factor'.")
+        if self.incremental and not self.plan_outpath:
+            raise ValueError("Incremental collages need a 'plan_outpath' to keep the plan in.")
+        if self.pca_components is not None and not 0 < self.pca_components <= N_MFCC:
+            raise ValueError(
+                f"'pca_components' must be between 1 and the {N_MFCC} MFCC coefficients, "
+                f"got {self.pca_components}."
+            )
+
+    @staticmethod
+    def from_dict(params: Dict[str, Any]) -> "CollagerConfig":
+        """
+        Builds a config from plain values, such as parsed JSON.
+        """
+        known = {f.name for f in fields(CollagerConfig)}
+        unknown = set(params) - known
+        if unknown:
+            raise ValueError(f"Unknown config parameters: {', '.join(sorted(unknown))}")
+
+        params = dict(params)
+        enums = {
+            'declick_fn': CollagerConfig.DeclickFn,
+            'distance_fn': CollagerConfig.DistanceFn,
+            'search_mode': CollagerConfig.SearchMode,
+            'selection_mode': CollagerConfig.SelectionMode,
+        }
+        for name, enum in enums.items():
+            if params.get(name) is not None:
+                params[name] = enum(params[name])
+        if isinstance(params.get('windows'), str):
+            params['windows'] = [int(x) for x in params['windows'].split(',')]
+        return CollagerConfig(**params)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the parameters as plain values, such as for JSON, which
+        from_dict reads back. Callbacks and events are left out.
+        """
+        params: Dict[str, Any] = {}
+        for f in fields(self):
+            if f.name in ('progress_callback', 'cancel_event'):
+                continue
+            value = getattr(self, f.name)
+            if isinstance(value, StrEnum):
+                value = str(value)
+            elif isinstance(value, (list, tuple)):
+                value = list(value)
+            params[f.name] = value
+        return params
+
+    def canonical_params(self) -> Dict[str, Any]:
+        """
+        Returns the parameters that determine the collage made from given
+        inputs, as plain values that serialise the same way every time.
+        """
+        return {
+            name: value for name, value in self.to_dict().items()
+            if name not in CollagerConfig.RUNTIME_PARAMS
+        }
+
+    def index_key(self) -> Tuple:
+        """
+        Returns the parameters that determine the indices built from the sample audio.
+        """
+        return (
+            self.sample_file,
+            tuple(self.windows),
+            self.declick_ms,
+            self.step_ms,
+            self.step_factor,
+            str(self.distance_fn),
+            self.integral_mfcc,
+            str(self.search_mode),
+            self.pca_components,
+            self.library_path,
+        )
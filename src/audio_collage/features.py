@@ -0,0 +1,138 @@
+import numpy as np
+from typing import List
+
+from .audio_segment import AudioSegment
+
+HOP_LENGTH = 512
+N_FFT = 2048
+# Number of MFCC coefficients librosa computes by default, as every MFCC here is
+N_MFCC = 20
+# Number of segments whose MFCCs are computed in one call
+BATCH_SIZE = 256
+
+class FrameFeatures:
+    """
+    Frame-level features computed over a whole piece of audio in one pass,
+    on a fixed hop so that frames line up across different pieces of audio.
+    """
+    @staticmethod
+    def mfcc(audio: AudioSegment) -> np.ndarray:
+        # librosa is slow to import, so it is only imported once needed
+        import librosa
+        return librosa.feature.mfcc(
+            y=FrameFeatures._float_timeseries(audio),
+            sr=audio.sample_rate,
+            n_fft=N_FFT,
+            hop_length=HOP_LENGTH
+        )
+
+    @staticmethod
+    def mfcc_batch(audio_segments: List[AudioSegment], n_fft: int = N_FFT) -> np.ndarray:
+        """
+        Computes the MFCCs of several equal-length segments in one call.
+
+        Returns:
+            np.ndarray: MFCCs with shape (segments, coefficients, frames).
+        """
+        import librosa
+        return librosa.feature.mfcc(
+            y=np.stack([FrameFeatures._float_timeseries(audio) for audio in audio_segments]),
+            sr=audio_segments[0].sample_rate,
+            n_fft=n_fft,
+            hop_length=HOP_LENGTH
+        )
+
+    @staticmethod
+    def fill_mfcc_means(audio_segments: List[AudioSegment], batch_size: int = BATCH_SIZE) -> None:
+        """
+        Sets the mean MFCC of each segment, computing the MFCCs of equal-length
+        segments in batches. The means are those AudioSegment.mfcc_mean
+        computes for each segment alone, so they match the features of queries.
+        """
+        for n_samples in set(segment.n_samples() for segment in audio_segments):
+            group = [s for s in audio_segments if s.n_samples() == n_samples]
+            for start in range(0, len(group), batch_size):
+                batch = group[start:start + batch_size]
+                # AudioSegment.mfcc shortens the FFT to fit short segments
+                means = FrameFeatures.mfcc_batch(batch, n_fft=min(N_FFT, n_samples)).mean(axis=2)
+                for segment, mean in zip(batch, means):
+                    segment._mfcc_mean = mean
+
+    @staticmethod
+    def chroma_stft(audio: AudioSegment) -> np.ndarray:
+        import librosa
+        return librosa.feature.chroma_stft(
+            y=FrameFeatures._float_timeseries(audio),
+            sr=audio.sample_rate,
+            n_fft=N_FFT,
+            hop_length=HOP_LENGTH
+        )
+
+    @staticmethod
+    def _float_timeseries(audio: AudioSegment) -> np.ndarray:
+        timeseries = np.asarray(audio.timeseries)
+        if not np.issubdtype(timeseries.dtype, np.floating):
+            timeseries = timeseries.astype(float)
+        return timeseries
+
+    @staticmethod
+    def n_frames(n_samples: int) -> int:
+        """
+        Returns the number of feature frames computed for the given number of samples.
+        """
+        return 1 + n_samples // HOP_LENGTH
+
+
+class IntegralFeatures:
+    """
+    Cumulative sums of frame-level features over a whole source, so that the
+    mean feature of any span of the source is a single subtraction.
+    """
+    def __init__(self, frame_features: np.ndarray):
+        self.n_frames: int = frame_features.shape[1]
+        self.cumsum: np.ndarray = np.zeros((frame_features.shape[0], self.n_frames + 1))
+        self.cumsum[:, 1:] = np.cumsum(frame_features, axis=1)
+
+    @staticmethod
+    def from_mfcc(audio: AudioSegment) -> "IntegralFeatures":
+        return IntegralFeatures(FrameFeatures.mfcc(audio))
+
+    @staticmethod
+    def from_chroma_stft(audio: AudioSegment) -> "IntegralFeatures":
+        return IntegralFeatures(FrameFeatures.chroma_stft(audio))
+
+    def mean(self, offset_frames: int, n_samples: int) -> np.ndarray:
+        """
+        Returns the mean feature of the span of samples starting at the given offset.
+        """
+        return self.means(np.array([offset_frames]), n_samples)[0]
+
+    def means(self, offsets_frames: np.ndarray, n_samples: int) -> np.ndarray:
+        """
+        Returns the mean feature of equal-length spans of samples starting at each of the given offsets.
+
+        Args:
+            offsets_frames (np.ndarray): Offsets of the spans, in samples.
+            n_samples (int): Length of the spans, in samples.
+
+        Returns:
+            np.ndarray: One row of mean features per span.
+        """
+        starts = np.minimum(
+            np.round(np.asarray(offsets_frames) / HOP_LENGTH).astype(int),
+            self.n_frames - 1
+        )
+        ends = np.minimum(starts + FrameFeatures.n_frames(n_samples), self.n_frames)
+        return ((self.cumsum[:, ends] - self.cumsum[:, starts]) / (ends - starts)).T
+
+    def fill_mfcc_means(self, audio_segments: List[AudioSegment]) -> None:
+        """
+        Sets the mean MFCC of chops of the source from the cumulative sums, so
+        that it is not computed chop by chop. The means are approximate, since
+        frames at the edges of a chop see the source around it.
+        """
+        for n_samples in set(segment.n_samples() for segment in audio_segments):
+            group = [s for s in audio_segments if s.n_samples() == n_samples]
+            offsets = np.array([segment.offset_frames for segment in group])
+            for segment, mean in zip(group, self.means(offsets, n_samples)):
+                segment._mfcc_mean = mean
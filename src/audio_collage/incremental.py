@@ -0,0 +1,153 @@
+import hashlib
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .audio_mapper import AudioMapper
+from .audio_segment import AudioSegment
+from .plan import PlanEntry, SelectionPlan
+
+logger = logging.getLogger(__name__)
+
+BLOCK_FRAMES = 2048
+
+@dataclass
+class TargetAnalysis:
+    """
+    Hashes of fixed-size blocks of a target, aligned both to its start and to
+    its end, so that edits can be located in a later version of the target
+    even when the edit changes its length.
+    """
+    n_frames: int
+    digest: str = ''
+    block_frames: int = BLOCK_FRAMES
+    head_hashes: List[str] = field(default_factory=list)
+    tail_hashes: List[str] = field(default_factory=list)
+
+    @staticmethod
+    def analyse(target: AudioSegment, block_frames: int = BLOCK_FRAMES) -> "TargetAnalysis":
+        timeseries = np.ascontiguousarray(target.timeseries)
+        n_frames = timeseries.size
+        n_blocks = n_frames // block_frames
+        return TargetAnalysis(
+            n_frames=n_frames,
+            digest=TargetAnalysis._hash(timeseries),
+            block_frames=block_frames,
+            head_hashes=[
+                TargetAnalysis._hash(timeseries[i * block_frames:(i + 1) * block_frames])
+                for i in range(n_blocks)
+            ],
+            tail_hashes=[
+                TargetAnalysis._hash(timeseries[n_frames - (i + 1) * block_frames:n_frames - i * block_frames])
+                for i in range(n_blocks)
+            ],
+        )
+
+    @staticmethod
+    def _hash(block: np.ndarray) -> str:
+        return hashlib.blake2b(block.tobytes(), digest_size=8).hexdigest()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "TargetAnalysis":
+        return TargetAnalysis(**data)
+
+    def unchanged_frames(self, new: "TargetAnalysis") -> Tuple[int, int]:
+        """
+        Returns how many frames at the start and at the end of the new target
+        are the same as in this one. The two spans never overlap.
+        """
+        if new.block_frames != self.block_frames:
+            return 0, 0
+        head = _common_prefix(self.head_hashes, new.head_hashes) * self.block_frames
+        tail = _common_prefix(self.tail_hashes, new.tail_hashes) * self.block_frames
+        tail = max(0, min(tail, min(self.n_frames, new.n_frames) - head))
+        return head, tail
+
+def _common_prefix(a: List[str], b: List[str]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+def update_plan(
+    mapper: AudioMapper,
+    previous: SelectionPlan,
+    analysis: TargetAnalysis,
+    margin_frames: int
+) -> Optional[SelectionPlan]:
+    """
+    Updates the plan made for a previous version of the mapper's target,
+    reusing its entries where the target is unchanged and mapping only the
+    changed span between them.
+
+    The mapper selects greedily, so entries at the start of the target are
+    reused only if the target is unchanged for margin_frames past their end,
+    which covers every query made while selecting them when the margin is at
+    least the longest window. Entries at the end are reused from the first
+    one starting margin_frames into the unchanged end, and the changed span
+    is mapped up to that entry.
+
+    Returns:
+        Optional[SelectionPlan]: The updated plan, or None if the previous
+            plan has no analysis of its target.
+    """
+    if 'target' not in previous.metadata:
+        return None
+    old = TargetAnalysis.from_dict(previous.metadata['target'])
+    head, tail = old.unchanged_frames(analysis)
+    shift = analysis.n_frames - old.n_frames
+    entries = previous.entries
+
+    if old.digest == analysis.digest:
+        logger.info("Target is unchanged, reusing the whole plan")
+        return SelectionPlan(
+            sources=previous.sources,
+            sample_rate=previous.sample_rate,
+            overlap_ms=previous.overlap_ms,
+            entries=list(entries),
+        )
+
+    n_head = 0
+    while n_head < len(entries) and entries[n_head].target_offset + entries[n_head].n_frames + margin_frames <= head:
+        n_head += 1
+    start = entries[n_head].target_offset if n_head < len(entries) else 0
+
+    tail_start = old.n_frames - tail + margin_frames
+    n_tail_from = len(entries)
+    for i in range(n_head, len(entries)):
+        if entries[i].target_offset >= tail_start and entries[i].target_offset + shift >= start:
+            n_tail_from = i
+            break
+    end = entries[n_tail_from].target_offset + shift if n_tail_from < len(entries) else analysis.n_frames
+
+    logger.info(
+        f"Reusing {n_head} entries at the start and {len(entries) - n_tail_from} at the end, "
+        f"mapping frames {start} to {end}"
+    )
+    middle: List[PlanEntry] = []
+    if start < end:
+        middle = mapper.select(start, end).entries
+
+    tail_entries = [
+        PlanEntry(
+            source_id=entry.source_id,
+            offset_frames=entry.offset_frames,
+            n_frames=entry.n_frames,
+            distance=entry.distance,
+            target_offset=entry.target_offset + shift,
+        )
+        for entry in entries[n_tail_from:]
+    ]
+    return SelectionPlan(
+        sources=previous.sources,
+        sample_rate=previous.sample_rate,
+        overlap_ms=previous.overlap_ms,
+        entries=list(entries[:n_head]) + middle + tail_entries,
+    )
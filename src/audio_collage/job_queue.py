@@ -0,0 +1,387 @@
+import dataclasses
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from strenum import StrEnum
+
+from .collager_config import CollagerConfig
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 60.
+DEFAULT_MAX_ATTEMPTS = 3
+# Leases are renewed several times per lease, so a slow write doesn't lose a job
+HEARTBEATS_PER_LEASE = 4
+
+@dataclass
+class Job:
+    """
+    A collage job in the queue, stored as JSON.
+    """
+    job_id: str
+    # The job's config, as from CollagerConfig.to_dict
+    params: Dict[str, Any]
+    # Number of runs that failed or lost their lease
+    attempts: int = 0
+    errors: List[str] = field(default_factory=list)
+    # Worker that last claimed the job
+    worker: Optional[str] = None
+
+    @property
+    def config(self) -> CollagerConfig:
+        return CollagerConfig.from_dict(self.params)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Job":
+        return Job(**data)
+
+@dataclass
+class QueueStatus:
+    queue_dir: str
+    pending: int = 0
+    running: int = 0
+    done: int = 0
+    failed: int = 0
+
+    @property
+    def drained(self) -> bool:
+        return not (self.pending or self.running)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.queue_dir}: {self.pending} pending, {self.running} running, "
+            f"{self.done} done, {self.failed} failed"
+        )
+
+class JobQueue:
+    """
+    A queue of collage jobs in a directory, which workers on several machines
+    can drain through a shared filesystem without a broker.
+
+    Each job is a JSON file in the directory of its state. A worker claims a
+    job by renaming it from pending to running, which only one worker can do,
+    and holds a lease on it while it runs by touching a lease file. A job
+    whose lease has not been renewed for lease_seconds is taken to belong to
+    a worker that died, and goes back to pending. Jobs that fail or lose
+    their lease max_attempts times are moved to failed.
+
+    Lease ages are measured against the modification times of files in the
+    queue directory, rather than the worker's clock, so that the clocks of
+    the machines sharing the queue need not agree.
+    """
+    # module and qualname let states be pickled, like config enums
+    State = StrEnum(
+        'State',
+        {k: k for k in ['pending', 'running', 'done', 'failed']},
+        module=__name__,
+        qualname='JobQueue.State'
+    )
+
+    def __init__(
+        self,
+        queue_dir: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    ):
+        self.queue_dir = queue_dir
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        for name in [*JobQueue.State, 'leases', 'tmp']:
+            os.makedirs(os.path.join(queue_dir, name), exist_ok=True)
+
+    def path(self, state: State, job_id: str) -> str:
+        return os.path.join(self.queue_dir, state, job_id + '.json')
+
+    def lease_path(self, job_id: str) -> str:
+        return os.path.join(self.queue_dir, 'leases', job_id + '.lease')
+
+    def submit(self, config: CollagerConfig) -> str:
+        """
+        Adds a job to the queue, returning its ID. Jobs are claimed in the
+        order they were submitted.
+        """
+        if not (config.target_file and config.sample_file and config.outpath):
+            raise ValueError("Queued jobs need a target_file, sample_file and outpath")
+        job_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        job = Job(job_id=job_id, params=config.to_dict())
+        self._write(self.path(JobQueue.State.pending, job_id), job.to_dict())
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """
+        Claims the oldest pending job for the worker, returning None if there
+        are none left.
+        """
+        for job_id in self._job_ids(JobQueue.State.pending):
+            running_path = self.path(JobQueue.State.running, job_id)
+            try:
+                os.rename(self.path(JobQueue.State.pending, job_id), running_path)
+            except FileNotFoundError:
+                # Another worker claimed it first
+                continue
+            self._write(self.lease_path(job_id), {'worker': worker_id, 'host': socket.gethostname(), 'pid': os.getpid()})
+            job = Job.from_dict(self._read(running_path))
+            job.worker = worker_id
+            logger.info(f"Worker {worker_id} claimed job {job_id}")
+            return job
+        return None
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """
+        Renews the worker's lease on a job, returning False if the worker no
+        longer holds it.
+        """
+        if not self._holds_lease(job_id, worker_id):
+            return False
+        try:
+            os.utime(self.lease_path(job_id))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self, job: Job, worker_id: str) -> bool:
+        """
+        Marks a job the worker ran as done, returning False if the worker had
+        lost its lease, in which case the job was left to whoever holds it.
+        """
+        taken_path = self._take(job.job_id, worker_id)
+        if taken_path is None:
+            logger.warning(f"Worker {worker_id} lost its lease on job {job.job_id}")
+            return False
+        self._write(self.path(JobQueue.State.done, job.job_id), job.to_dict())
+        self._remove(self.lease_path(job.job_id))
+        self._remove(taken_path)
+        return True
+
+    def fail(self, job: Job, worker_id: str, error: str) -> None:
+        """
+        Returns a job the worker failed to run to the queue, or moves it to
+        failed once it has used all its attempts.
+        """
+        self._release(job.job_id, error, worker_id=worker_id)
+
+    def reap(self) -> List[str]:
+        """
+        Returns running jobs whose leases have expired to the queue.
+
+        Returns:
+            List[str]: IDs of the reaped jobs.
+        """
+        now = self._now()
+        reaped = []
+        for job_id in self._job_ids(JobQueue.State.running):
+            try:
+                renewed = os.stat(self.lease_path(job_id)).st_mtime
+            except FileNotFoundError:
+                # A job is renamed to running just before its lease is written
+                try:
+                    renewed = os.stat(self.path(JobQueue.State.running, job_id)).st_ctime
+                except FileNotFoundError:
+                    continue
+            if now - renewed > self.lease_seconds:
+                if self._release(job_id, f"Lease expired after {now - renewed:.0f}s"):
+                    reaped.append(job_id)
+
+        # Jobs left taken by a process that died while releasing them
+        tmp_dir = os.path.join(self.queue_dir, 'tmp')
+        for name in os.listdir(tmp_dir):
+            path = os.path.join(tmp_dir, name)
+            try:
+                if not name.endswith('.json') or now - os.stat(path).st_ctime <= self.lease_seconds:
+                    continue
+                job_id = name.split('.')[0]
+                os.rename(path, self.path(JobQueue.State.pending, job_id))
+            except FileNotFoundError:
+                continue
+            logger.warning(f"Job {job_id} was restored to the queue")
+            reaped.append(job_id)
+        return reaped
+
+    def status(self) -> QueueStatus:
+        status = QueueStatus(queue_dir=self.queue_dir)
+        for state in JobQueue.State:
+            setattr(status, state, len(self._job_ids(state)))
+        return status
+
+    def jobs(self, state: State) -> List[Job]:
+        jobs = []
+        for job_id in self._job_ids(state):
+            try:
+                jobs.append(Job.from_dict(self._read(self.path(state, job_id))))
+            except FileNotFoundError:
+                continue
+        return jobs
+
+    def _take(self, job_id: str, worker_id: Optional[str] = None) -> Optional[str]:
+        """
+        Takes a running job out of running, so that no other process can
+        complete, fail or reap it, returning its new path, or None if it is not
+        running. Given a worker, the job is only taken if the worker holds its
+        lease, which is checked again once the job is taken, since it may have
+        been reaped and claimed by another worker in between.
+        """
+        if worker_id is not None and not self._holds_lease(job_id, worker_id):
+            return None
+        running_path = self.path(JobQueue.State.running, job_id)
+        taken_path = os.path.join(self.queue_dir, 'tmp', f"{job_id}.{uuid.uuid4().hex[:8]}.json")
+        try:
+            os.rename(running_path, taken_path)
+        except FileNotFoundError:
+            return None
+        if worker_id is not None and not self._holds_lease(job_id, worker_id):
+            # It belongs to another worker now, so put it back
+            os.rename(taken_path, running_path)
+            return None
+        return taken_path
+
+    def _release(self, job_id: str, error: str, worker_id: Optional[str] = None) -> bool:
+        taken_path = self._take(job_id, worker_id)
+        if taken_path is None:
+            return False
+        job = Job.from_dict(self._read(taken_path))
+        job.attempts += 1
+        job.errors.append(error)
+        state = JobQueue.State.pending if job.attempts < self.max_attempts else JobQueue.State.failed
+        logger.warning(f"Job {job_id} {'will be retried' if state == JobQueue.State.pending else 'failed'}: {error}")
+        # Drop the old lease before the job can be claimed again
+        self._remove(self.lease_path(job_id))
+        self._write(self.path(state, job_id), job.to_dict())
+        self._remove(taken_path)
+        return True
+
+    def _holds_lease(self, job_id: str, worker_id: str) -> bool:
+        try:
+            return self._read(self.lease_path(job_id)).get('worker') == worker_id
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def _job_ids(self, state: State) -> List[str]:
+        return sorted(
+            name[:-len('.json')] for name in os.listdir(os.path.join(self.queue_dir, state))
+            if name.endswith('.json')
+        )
+
+    def _now(self) -> float:
+        # The time on the filesystem, which lease files are stamped with
+        clock_path = os.path.join(self.queue_dir, 'clock')
+        with open(clock_path, 'a'):
+            pass
+        os.utime(clock_path)
+        return os.stat(clock_path).st_mtime
+
+    def _write(self, path: str, data: Dict[str, Any]) -> None:
+        # Write to a temporary file first so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.queue_dir, 'tmp'), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _read(path: str) -> Dict[str, Any]:
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+class QueueWorker:
+    """
+    Claims and runs jobs from a queue until it is drained, renewing the lease
+    on each job from a background thread while it runs. If the lease is lost,
+    the job is cancelled, since another worker will run it again.
+    """
+    def __init__(
+        self,
+        queue: JobQueue,
+        run_fn: Optional[Callable[[CollagerConfig], None]] = None,
+        worker_id: Optional[str] = None,
+        poll_seconds: float = 1.
+    ):
+        self.queue = queue
+        self.run_fn = run_fn or run_collage_job
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+        self.poll_seconds = poll_seconds
+
+    def run(self, max_jobs: Optional[int] = None) -> int:
+        """
+        Runs jobs until none are pending or running, waiting on jobs running
+        elsewhere in case their workers die and they are returned to the queue.
+
+        Returns:
+            int: The number of jobs this worker completed.
+        """
+        completed = 0
+        while max_jobs is None or completed < max_jobs:
+            self.queue.reap()
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                if self.queue.status().drained:
+                    break
+                time.sleep(self.poll_seconds)
+                continue
+            completed += self.run_job(job)
+        logger.info(f"Worker {self.worker_id} completed {completed} jobs")
+        return completed
+
+    def run_job(self, job: Job) -> bool:
+        """
+        Runs a claimed job, returning whether it completed.
+        """
+        cancel_event = threading.Event()
+        stop_event = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job.job_id, cancel_event, stop_event), daemon=True)
+        heartbeat.start()
+        try:
+            self.run_fn(dataclasses.replace(job.config, cancel_event=cancel_event))
+        except Exception as e:
+            if cancel_event.is_set():
+                logger.warning(f"Worker {self.worker_id} abandoned job {job.job_id} after losing its lease")
+            else:
+                logger.exception(f"Job {job.job_id} failed")
+                self.queue.fail(job, self.worker_id, f"{type(e).__name__}: {e}")
+            return False
+        finally:
+            stop_event.set()
+            heartbeat.join()
+        return self.queue.complete(job, self.worker_id)
+
+    def _heartbeat(self, job_id: str, cancel_event: threading.Event, stop_event: threading.Event) -> None:
+        while not stop_event.wait(self.queue.lease_seconds / HEARTBEATS_PER_LEASE):
+            if not self.queue.heartbeat(job_id, self.worker_id):
+                cancel_event.set()
+                return
+
+def run_collage_job(config: CollagerConfig) -> None:
+    """
+    Runs a queued collage job with workflow.create_collage_from_files,
+    writing the collage to a temporary file that then replaces the output, so
+    that a job run twice never leaves a partial output.
+    """
+    from . import workflow
+
+    root, ext = os.path.splitext(config.outpath)
+    tmp_path = f"{root}.{uuid.uuid4().hex[:8]}.tmp{ext}"
+    try:
+        workflow.create_collage_from_files(dataclasses.replace(config, outpath=tmp_path))
+        os.replace(tmp_path, config.outpath)
+    finally:
+        JobQueue._remove(tmp_path)
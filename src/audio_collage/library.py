@@ -0,0 +1,153 @@
+import sqlite3
+from importlib import resources
+from typing import List, Tuple
+
+import caribou
+import numpy as np
+
+from .audio_segment import AudioSegment
+
+# The migrations ship with the package, so installed copies can migrate libraries too
+MIGRATIONS_DIR = str(resources.files(__package__) / 'migrations')
+
+class SampleLibrary:
+    """
+    Persistent, shareable store of chopped samples and their MFCC features,
+    backed by SQLite.
+
+    Chops are keyed by the hash of the audio they were cut from, the window
+    size and the step between chops, so any number of processes can read the
+    same library without re-chopping or re-featurising the source audio.
+    """
+    def __init__(self, db_path: str, migrations_path: str = MIGRATIONS_DIR):
+        caribou.upgrade(db_path, migrations_path)
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path, timeout=30)
+        # WAL lets readers carry on while another process is ingesting
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+    def has_chops(self, source_hash: str, window: int, step_frames: int) -> bool:
+        """
+        Returns True if chops for the given source, window and step have been ingested.
+        """
+        row = self.connection.execute(
+            """
+            SELECT 1 FROM samples
+            WHERE source_hash = ? AND window = ? AND step_frames = ?
+            LIMIT 1
+            """,
+            (source_hash, window, step_frames)
+        ).fetchone()
+        return row is not None
+
+    def ingest(
+        self,
+        source: AudioSegment,
+        window: int,
+        step_frames: int,
+        audio_segments: List[AudioSegment]
+    ) -> None:
+        """
+        Stores chops of the source audio along with their MFCCs, replacing any
+        chops previously stored for the same source, window and step.
+
+        Args:
+            source (AudioSegment): The audio the chops were cut from.
+            window (int): Window size of the chops in milliseconds.
+            step_frames (int): Number of frames between the starts of consecutive chops.
+            audio_segments (List[AudioSegment]): The chops, with offset_frames set.
+        """
+        source_hash = source.hash()
+        rows = []
+        for segment in audio_segments:
+            features = np.ascontiguousarray(segment.mfcc, dtype=np.float32)
+            rows.append((
+                source.path,
+                source.path,
+                source_hash,
+                window,
+                step_frames,
+                segment.offset_frames,
+                segment.n_samples(),
+                segment.sample_rate,
+                features.shape[0],
+                features.shape[1],
+                features.tobytes(),
+            ))
+
+        with self.connection:
+            self.connection.execute(
+                """
+                DELETE FROM samples
+                WHERE source_hash = ? AND window = ? AND step_frames = ?
+                """,
+                (source_hash, window, step_frames)
+            )
+            self.connection.executemany(
+                """
+                INSERT INTO samples (
+                    source, path, source_hash, window, step_frames, offset_frames,
+                    n_frames, sample_rate, feature_rows, feature_cols, features
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+
+    def load_features(
+        self,
+        source_hash: str,
+        window: int,
+        step_frames: int
+    ) -> Tuple[np.ndarray, np.ndarray, List[np.ndarray]]:
+        """
+        Loads stored features without touching any audio.
+
+        Returns:
+            A tuple containing:
+                - Offsets of the chops in the source, in frames
+                - Lengths of the chops, in frames
+                - The MFCC matrix of each chop
+        """
+        rows = self.connection.execute(
+            """
+            SELECT offset_frames, n_frames, feature_rows, feature_cols, features
+            FROM samples
+            WHERE source_hash = ? AND window = ? AND step_frames = ?
+            ORDER BY offset_frames
+            """,
+            (source_hash, window, step_frames)
+        ).fetchall()
+
+        offsets = np.array([row[0] for row in rows], dtype=int)
+        lengths = np.array([row[1] for row in rows], dtype=int)
+        features = [
+            np.frombuffer(blob, dtype=np.float32).reshape(n_rows, n_cols)
+            for _offset, _length, n_rows, n_cols, blob in rows
+        ]
+        return offsets, lengths, features
+
+    def load_segments(
+        self,
+        source: AudioSegment,
+        window: int,
+        step_frames: int
+    ) -> List[AudioSegment]:
+        """
+        Rebuilds the stored chops of the source audio as views on its timeseries,
+        with their MFCCs taken from the library rather than recomputed.
+        """
+        offsets, lengths, features = self.load_features(source.hash(), window, step_frames)
+        segments: List[AudioSegment] = []
+        for offset, length, mfcc in zip(offsets, lengths, features):
+            segment = AudioSegment(
+                source.timeseries[offset:offset + length],
+                source.sample_rate,
+                offset_frames=int(offset)
+            )
+            segment._mfcc = mfcc
+            segments.append(segment)
+        return segments
+
+    def close(self) -> None:
+        self.connection.close()
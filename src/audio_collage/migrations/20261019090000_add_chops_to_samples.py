@@ -0,0 +1,31 @@
+"""
+a caribou migration
+
+name: add_chops_to_samples 
+version: 20261019090000
+"""
+
+def upgrade(connection):
+    for column in [
+        'source_hash TEXT',
+        'window INTEGER',
+        'step_frames INTEGER',
+        'offset_frames INTEGER',
+        'n_frames INTEGER',
+        'sample_rate INTEGER',
+        'feature_rows INTEGER',
+        'feature_cols INTEGER',
+    ]:
+        connection.execute(f"ALTER TABLE samples ADD COLUMN {column}")
+    # features is declared TEXT, but sqlite keeps BLOB values as they are,
+    # so the packed float32 features can live in the existing column
+    connection.execute("""
+      CREATE INDEX samples_source_hash_window
+      ON samples (source_hash, window, step_frames)
+    """)
+    pass
+
+def downgrade(connection):
+    connection.execute('DROP INDEX samples_source_hash_window')
+    # TODO: sqlite has no simple column deletion support
+    pass
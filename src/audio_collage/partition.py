@@ -0,0 +1,114 @@
+import dataclasses
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from .audio_mapper import AudioMapper
+from .audio_segment import AudioSegment
+from .collager_config import CollagerConfig
+from .features import HOP_LENGTH
+from .plan import PlanEntry, SelectionPlan
+from .shared_arrays import SharedHandle, shared
+
+logger = logging.getLogger(__name__)
+
+def split_points(target: AudioSegment, n_partitions: int, search_frames: int) -> List[int]:
+    """
+    Picks the frames at which to split the target into partitions of roughly
+    equal length, choosing the quietest hop within search_frames of each
+    equal split so that boundaries tend to fall between sounds.
+
+    Returns:
+        List[int]: Increasing split frames, strictly inside the target.
+    """
+    timeseries = np.asarray(target.timeseries, dtype=float)
+    n_hops = timeseries.size // HOP_LENGTH
+    if n_partitions < 2 or n_hops < 2:
+        return []
+
+    energy = np.mean(timeseries[:n_hops * HOP_LENGTH].reshape(n_hops, HOP_LENGTH) ** 2, axis=1)
+    search_hops = max(1, search_frames // HOP_LENGTH)
+
+    points = set()
+    for i in range(1, n_partitions):
+        ideal = (i * timeseries.size // n_partitions) // HOP_LENGTH
+        lo = max(1, ideal - search_hops)
+        hi = min(n_hops, ideal + search_hops + 1)
+        if lo >= hi:
+            continue
+        points.add(int(lo + np.argmin(energy[lo:hi])) * HOP_LENGTH)
+    return sorted(points)
+
+def map_partitioned(
+    mapper: AudioMapper,
+    boundaries: List[int],
+    max_workers: Optional[int] = None
+) -> SelectionPlan:
+    """
+    Maps the partitions of the mapper's target between the given boundaries in
+    parallel and stitches their plans together.
+
+    Each partition is selected with AudioMapper.select, which cuts its last
+    snippet short so that the next partition starts exactly at the boundary.
+    Where a boundary is a frame that serial mapping would have started a
+    snippet at anyway, the stitched plan is identical to the serial one.
+
+    Args:
+        mapper (AudioMapper): The mapper, whose indices are built first if need be.
+            Its audio and indices are shared with the workers as by shared().
+        boundaries (List[int]): Increasing frames to split the target at.
+        max_workers (int, optional): Number of worker processes. Partitions are
+            mapped in this process if 1. Defaults to one per partition.
+    """
+    if not mapper.indices.indices:
+        mapper.build_indices()
+
+    n_frames = mapper.target.n_samples()
+    edges = [0] + [b for b in boundaries if 0 < b < n_frames] + [n_frames]
+    regions: List[Tuple[int, int]] = list(zip(edges[:-1], edges[1:]))
+    logger.info(f"Mapping {len(regions)} partitions of the target in parallel")
+
+    if max_workers == 1 or len(regions) == 1:
+        results = [mapper.select(start, end).entries for start, end in regions]
+    else:
+        context = None
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        with shared((mapper.source, mapper.target, mapper.indices), context) as handle, ProcessPoolExecutor(
+            max_workers=max_workers or len(regions),
+            mp_context=context,
+            initializer=_attach_partition_worker,
+            initargs=(handle, mapper.distance_fn, mapper.config)
+        ) as executor:
+            futures = [executor.submit(_select_partition, start, end) for start, end in regions]
+            results = [future.result() for future in futures]
+
+    entries: List[PlanEntry] = [entry for result in results for entry in result]
+    return SelectionPlan(
+        sources=[mapper.source.path or ''],
+        sample_rate=mapper.source.sample_rate,
+        overlap_ms=mapper.config.declick_ms,
+        entries=entries,
+    )
+
+_partition_mapper: Optional[AudioMapper] = None
+
+def _init_partition_worker(mapper: AudioMapper) -> None:
+    global _partition_mapper
+    # Progress callbacks can't be shared with worker processes
+    mapper.config = dataclasses.replace(mapper.config, progress_callback=None)
+    _partition_mapper = mapper
+
+def _attach_partition_worker(handle: SharedHandle, distance_fn: Callable, config: CollagerConfig) -> None:
+    source, target, indices = handle.load()
+    mapper = AudioMapper(source, target, distance_fn, config)
+    mapper.indices = indices
+    _init_partition_worker(mapper)
+
+def _select_partition(start: int, end: int) -> List[PlanEntry]:
+    if _partition_mapper is None:
+        raise RuntimeError("Partition worker has not been initialised")
+    return _partition_mapper.select(start, end).entries
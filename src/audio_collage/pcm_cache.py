@@ -0,0 +1,114 @@
+import hashlib
+import os
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from .audio_segment import AudioSegment
+from . import telemetry
+
+DEFAULT_SAMPLE_RATE = 22050
+
+class PCMCache:
+    """
+    Caches decoded, resampled mono PCM as .npy files so that later runs can
+    memory-map the audio instead of decoding it again.
+
+    Entries are keyed by the content hash and modification time of the
+    original file and the target sample rate.
+    """
+    def __init__(self, cache_dir: str, sample_rate: int = DEFAULT_SAMPLE_RATE):
+        self.cache_dir = cache_dir
+        self.sample_rate = sample_rate
+
+    def key(self, path: str) -> str:
+        """
+        Returns the cache key for an audio file.
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(str(os.stat(path).st_mtime_ns).encode())
+        digest.update(str(self.sample_rate).encode())
+        return digest.hexdigest()
+
+    def cache_path(self, path: str) -> str:
+        return os.path.join(self.cache_dir, f"{self.key(path)}.{self.sample_rate}.npy")
+
+    def decode(self, path: str) -> str:
+        """
+        Decodes an audio file into the cache unless it is already there.
+
+        Returns:
+            str: Path of the cached .npy file.
+        """
+        cache_path = self.cache_path(path)
+        if os.path.exists(cache_path):
+            telemetry.count('pcm_cache_hits')
+            return cache_path
+
+        telemetry.count('pcm_cache_misses')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # librosa is slow to import, so it is only imported once needed
+        import librosa
+        with telemetry.span('load', path=path) as load_span:
+            timeseries, _sample_rate = librosa.load(path, sr=self.sample_rate, mono=True)
+            load_span.items = len(timeseries)
+        telemetry.count('bytes_read', os.path.getsize(path))
+
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, timeseries)
+            os.replace(tmp_path, cache_path)
+            telemetry.count('bytes_written', timeseries.nbytes)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return cache_path
+
+    def load(self, path: str) -> AudioSegment:
+        """
+        Loads an audio file as a memory-mapped AudioSegment, decoding it first on a cache miss.
+        """
+        return self._open(path, self.decode(path))
+
+    def load_many(
+        self,
+        paths: List[str],
+        max_workers: Optional[int] = None,
+        use_processes: bool = False
+    ) -> List[AudioSegment]:
+        """
+        Loads several audio files, decoding any cache misses in parallel.
+
+        Args:
+            paths (List[str]): Paths of the audio files to load.
+            max_workers (int, optional): Size of the worker pool. Defaults to the executor's default.
+            use_processes (bool, optional): Decode in a process pool rather than a thread pool. Defaults to False.
+
+        Returns:
+            List[AudioSegment]: The loaded audio, in the same order as paths.
+        """
+        executor: Executor
+        if use_processes:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        with executor:
+            cache_paths = list(executor.map(self.decode, paths))
+
+        return [
+            self._open(path, cache_path)
+            for path, cache_path in zip(paths, cache_paths)
+        ]
+
+    def _open(self, path: str, cache_path: str) -> AudioSegment:
+        timeseries = np.load(cache_path, mmap_mode='r')
+        return AudioSegment(timeseries, self.sample_rate, path=path)
@@ -0,0 +1,78 @@
+import json
+from dataclasses import astuple, dataclass, field, fields
+from typing import Any, Dict, List, Optional
+
+PLAN_VERSION = 1
+
+@dataclass
+class PlanEntry:
+    """
+    A single selected snippet: which source it comes from, where, how long it
+    is, how well it matched and where in the target it was placed.
+    """
+    source_id: int
+    offset_frames: int
+    n_frames: int
+    distance: float
+    target_offset: int
+
+@dataclass
+class SelectionPlan:
+    """
+    An edit decision list produced by selection, which can be saved and
+    rendered to audio separately.
+    """
+    sources: List[str]
+    sample_rate: int
+    # Overlap between consecutive entries used when selecting, in milliseconds
+    overlap_ms: int = 0
+    entries: List[PlanEntry] = field(default_factory=list)
+    source_hashes: List[Optional[str]] = field(default_factory=list)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    def total_distance(self) -> float:
+        return sum(entry.distance for entry in self.entries)
+
+    def mean_distance(self) -> float:
+        """
+        Returns the distance of the entries averaged over the frames they cover.
+        """
+        n_frames = sum(entry.n_frames for entry in self.entries)
+        if not n_frames:
+            return 0.
+        return sum(entry.distance * entry.n_frames for entry in self.entries) / n_frames
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'version': PLAN_VERSION,
+            'sources': self.sources,
+            'source_hashes': self.source_hashes,
+            'sample_rate': self.sample_rate,
+            'overlap_ms': self.overlap_ms,
+            'columns': [f.name for f in fields(PlanEntry)],
+            'entries': [list(astuple(entry)) for entry in self.entries],
+            'metadata': self.metadata,
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "SelectionPlan":
+        if data.get('version') != PLAN_VERSION:
+            raise ValueError(f"Unsupported plan version: {data.get('version')}")
+        columns = data['columns']
+        return SelectionPlan(
+            sources=data['sources'],
+            source_hashes=data.get('source_hashes', []),
+            sample_rate=data['sample_rate'],
+            overlap_ms=data.get('overlap_ms', 0),
+            entries=[PlanEntry(**dict(zip(columns, row))) for row in data['entries']],
+            metadata=data.get('metadata', {}),
+        )
+
+    def to_file(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @staticmethod
+    def from_file(path: str) -> "SelectionPlan":
+        with open(path) as f:
+            return SelectionPlan.from_dict(json.load(f))
@@ -0,0 +1,123 @@
+import contextlib
+import cProfile
+import io
+import logging
+import os
+import pstats
+from typing import Callable, Iterator, Optional
+
+from strenum import StrEnum
+
+from .collage_progress_state import CollageProgressState
+
+logger = logging.getLogger(__name__)
+
+class Profiler:
+    """
+    Runs a job under cProfile, optionally only while one stage of it runs,
+    and saves the profile as a .prof file and a callgrind file for KCachegrind.
+
+    Stages are followed through progress callbacks. The active stage is the
+    task of the latest progress state, until a state marks it completed.
+    Work done in worker processes is not profiled.
+    """
+    # module and qualname let stages be pickled, like config enums
+    Stage = StrEnum(
+        'Stage',
+        {task.name.lower(): task.name.lower() for task in CollageProgressState.Task},
+        module=__name__,
+        qualname='Profiler.Stage'
+    )
+
+    def __init__(
+        self,
+        outpath: str,
+        stage: Optional[Stage] = None,
+        n_hotspots: int = 20
+    ):
+        self.outpath = outpath
+        self.task = CollageProgressState.Task[stage.upper()] if stage else None
+        self.n_hotspots = n_hotspots
+        self.profile = cProfile.Profile()
+        self._enabled = False
+
+    @property
+    def callgrind_path(self) -> str:
+        return os.path.splitext(self.outpath)[0] + '.callgrind'
+
+    def wrap(self, progress_callback: Optional[Callable] = None) -> Callable[[CollageProgressState], None]:
+        """
+        Returns a progress callback that switches profiling on and off as the
+        chosen stage starts and stops, and passes states on to progress_callback.
+        """
+        def callback(state: CollageProgressState) -> None:
+            # Progress reporting itself is never profiled
+            enabled = self._enabled
+            self._set_enabled(False)
+            if progress_callback:
+                progress_callback(state)
+            if self.task is not None:
+                enabled = state.task == self.task and not state.completed
+            self._set_enabled(enabled)
+        return callback
+
+    def __enter__(self) -> "Profiler":
+        if self.task is None:
+            self._set_enabled(True)
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._set_enabled(False)
+        try:
+            stats = pstats.Stats(self.profile)
+        except TypeError:
+            if self.task is None:
+                logger.warning("Nothing was profiled")
+            else:
+                logger.warning(f"Nothing was profiled, as the {self.task.name.lower()} stage never ran")
+            return
+        self.save(stats)
+        print(self.hotspots())
+
+    def save(self, stats: pstats.Stats) -> None:
+        stats.dump_stats(self.outpath)
+        logger.info(f"Saved profile to '{self.outpath}'")
+        try:
+            from pyprof2calltree import convert
+        except ImportError:
+            logger.warning("Install pyprof2calltree to also save a callgrind file")
+            return
+        convert(stats, self.callgrind_path)
+        logger.info(f"Saved callgrind file to '{self.callgrind_path}'")
+
+    def hotspots(self) -> str:
+        """
+        Returns the functions that took the most time, excluding their callees.
+        """
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.n_hotspots)
+        return stream.getvalue()
+
+    def _set_enabled(self, enabled: bool) -> None:
+        if enabled and not self._enabled:
+            self.profile.enable()
+        elif self._enabled and not enabled:
+            self.profile.disable()
+        self._enabled = enabled
+
+@contextlib.contextmanager
+def profile_job(
+    outpath: Optional[str],
+    stage: Optional[Profiler.Stage] = None,
+    progress_callback: Optional[Callable] = None
+) -> Iterator[Optional[Callable]]:
+    """
+    Profiles the body if outpath is given, yielding the progress callback the
+    job should report to.
+    """
+    if not outpath:
+        yield progress_callback
+        return
+    with Profiler(outpath, stage=stage) as profiler:
+        yield profiler.wrap(progress_callback)
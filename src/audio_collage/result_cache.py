@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .audio_segment import AudioSegment
+from .collager_config import CollagerConfig
+from .plan import SelectionPlan
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+class ResultCache:
+    """
+    Caches the selection plan, and optionally the rendered audio, of whole
+    collage jobs, so that repeating a job with the same inputs and parameters
+    does no work.
+
+    Entries are keyed by the content hashes of the target and sample files
+    and a hash of the config's collage parameters. Once the cache grows past
+    its budget, the least recently used entries are evicted.
+    """
+    PLAN_SUFFIX = '.plan.json'
+    AUDIO_SUFFIX = '.wav'
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        store_audio: bool = True
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.store_audio = store_audio
+        # Content hashes of input files, keyed by path, size and mtime
+        self._file_hashes: Dict[Tuple[str, int, int], str] = {}
+
+    def key(self, config: CollagerConfig) -> str:
+        """
+        Returns the cache key for the job described by the config.
+        """
+        if not (config.target_file and config.sample_file):
+            raise ValueError("Result cache keys need a target_file and sample_file")
+        digest = hashlib.sha256()
+        digest.update(self.file_hash(config.target_file).encode())
+        digest.update(self.file_hash(config.sample_file).encode())
+        digest.update(json.dumps(config.canonical_params(), sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def file_hash(self, path: str) -> str:
+        """
+        Returns the content hash of a file, reusing it while the file is unchanged.
+        """
+        stat = os.stat(path)
+        stat_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if stat_key not in self._file_hashes:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            self._file_hashes[stat_key] = digest.hexdigest()
+        return self._file_hashes[stat_key]
+
+    def plan_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ResultCache.PLAN_SUFFIX)
+
+    def audio_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ResultCache.AUDIO_SUFFIX)
+
+    def get_plan(self, key: str) -> Optional[SelectionPlan]:
+        """
+        Returns the cached plan for the key, or None on a miss.
+        """
+        path = self.plan_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            plan = SelectionPlan.from_file(path)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Could not load cached plan {path}. It will be rebuilt. Error: {e}")
+            return None
+        self._touch(path)
+        return plan
+
+    def get_audio_path(self, key: str) -> Optional[str]:
+        """
+        Returns the path of the cached audio for the key, or None on a miss.
+        """
+        path = self.audio_path(key)
+        if not os.path.exists(path):
+            return None
+        self._touch(path)
+        self._touch(self.plan_path(key))
+        return path
+
+    def put(self, key: str, plan: SelectionPlan, audio: Optional[AudioSegment] = None) -> None:
+        """
+        Stores a job's plan, and its audio if given and audio is being stored,
+        then evicts entries until the cache is within budget.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._write_atomic(self.plan_path(key), plan.to_file)
+        if audio is not None and self.store_audio:
+            self._write_atomic(self.audio_path(key), audio.to_file)
+        self.prune()
+
+    def nbytes(self) -> int:
+        return sum(size for _mtime, _path, size in self._entries())
+
+    def prune(self) -> None:
+        """
+        Removes the least recently used files until the cache is within budget.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _mtime, _path, size in entries)
+        for _mtime, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            logger.info(f"Evicting cached result {path}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _entries(self) -> List[Tuple[int, str, int]]:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith((ResultCache.PLAN_SUFFIX, ResultCache.AUDIO_SUFFIX)):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, path, stat.st_size))
+        return entries
+
+    def _touch(self, path: str) -> None:
+        # Modification times order entries for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _write_atomic(self, path: str, write_fn: Callable[[str], None]) -> None:
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
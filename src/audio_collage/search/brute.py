@@ -0,0 +1,54 @@
+from typing import Callable, List, Optional, Tuple
+
+from ..audio_segment import AudioSegment
+from .. import telemetry
+from .stats import CountingDistance, IndexStats
+
+class BruteForceIndex:
+    """
+    Compares each query with every chop, for exact results without any index
+    structure. A baseline for how much the other backends prune.
+    """
+    def __init__(self, window_size: int, distance_fn: Callable[[AudioSegment, AudioSegment], float]):
+        self.window_size = window_size
+        self.distance_fn = distance_fn
+        self.segments: Optional[List[AudioSegment]] = None
+        self.counter = CountingDistance(distance_fn)
+        self.stats = IndexStats(window=window_size)
+
+    def build(self, audio_segments: List[AudioSegment]) -> None:
+        if not audio_segments:
+            raise ValueError("Cannot build an index of no segments")
+        self.segments = list(audio_segments)
+        self.stats = IndexStats(window=self.window_size, size=len(self.segments))
+
+    def search(self, query_segment: AudioSegment) -> Tuple[float, AudioSegment]:
+        """
+        Returns the distance to and the chop closest to the query segment.
+        """
+        if self.segments is None:
+            raise RuntimeError("BruteForceIndex has not been built yet.")
+
+        self.counter.reset()
+        best_dist, best_segment = min(
+            ((self.counter(query_segment, segment), segment) for segment in self.segments),
+            key=lambda match: match[0]
+        )
+        self.stats.record_queries(1, self.counter.calls, self.counter.seconds)
+        telemetry.count('distance_calls', self.counter.calls)
+        telemetry.observe('distance_calls_per_query', self.counter.calls)
+        return best_dist, best_segment
+
+    def search_batch(self, query_segments: List[AudioSegment]) -> List[Tuple[float, AudioSegment]]:
+        return [self.search(query_segment) for query_segment in query_segments]
+
+    def nbytes(self) -> int:
+        """
+        Estimates the memory held by the chops and their features.
+        """
+        total = 0
+        for segment in self.segments or []:
+            for array in [segment.timeseries, segment._mfcc, segment._mfcc_mean, segment._chroma_stft]:
+                if array is not None:
+                    total += array.nbytes
+        return total
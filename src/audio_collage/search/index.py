@@ -1,34 +1,61 @@
 import hashlib
-import os
 import pickle
-from typing import List, Tuple, Callable
-from vptree import VPTree
+from typing import TYPE_CHECKING, List, Optional, Tuple, Callable
 
 from ..audio_segment import AudioSegment
+from ..cache_manager import CacheManager, default_cache
+from .. import telemetry
+from .stats import CountingDistance, IndexStats
 
-CACHE_DIR = '.cache'
+if TYPE_CHECKING:
+    from vptree import VPTree
 
 class SearchIndex:
     """
     Manages a single VP-tree search index for a specific window size and distance function,
     including building, searching, and caching.
     """
-    def __init__(self, window_size: int, distance_fn: Callable[[AudioSegment, AudioSegment], float]):
+    def __init__(
+        self,
+        window_size: int,
+        distance_fn: Callable[[AudioSegment, AudioSegment], float],
+        cache: Optional[CacheManager] = None
+    ):
         self.window_size = window_size
         self.distance_fn = distance_fn
-        self.tree: VPTree = None
+        # Defaults to the shared cache, which is looked up when building
+        self.cache = cache
+        self.tree: "VPTree" = None
+        # Counts the evaluations of distance_fn, which is what the tree calls
+        self.counter = CountingDistance(distance_fn)
+        self.stats = IndexStats(window=window_size)
 
     def build(self, audio_segments: List[AudioSegment]) -> None:
         """
         Builds the VP-tree index, loading from cache if available, otherwise
-        building from scratch and caching the result.
+        building from scratch and caching the result. Jobs building the same
+        index wait for the first to cache it rather than building it too.
         """
         hash = self.audio_segments_hash(audio_segments)
-        if self._load_from_cache(hash):
-            return
+        cache = self.cache or default_cache()
+        cache_key = self._cache_key(hash)
+        self.stats = IndexStats(window=self.window_size, size=len(audio_segments))
+        with telemetry.span('index_build', items=len(audio_segments), window=self.window_size) as index_span:
+            with cache.lock(cache_key):
+                if self._load_from_cache(cache, cache_key):
+                    index_span.name = 'index_load'
+                    # Only the root's distance function is called when searching
+                    self.tree.dist_fn = self.counter
+                    return
 
-        self.tree = VPTree(audio_segments, self.distance_fn)
-        self._save_to_cache(hash)
+                from vptree import VPTree
+                self.counter.reset()
+                self.tree = VPTree(audio_segments, self.counter)
+                self.stats.build_evaluations = self.counter.calls
+                self.stats.build_seconds = self.counter.seconds
+                telemetry.count('distance_calls', self.counter.calls)
+                self.counter.reset()
+                self._save_to_cache(cache, cache_key)
 
     def search(self, query_segment: AudioSegment) -> Tuple[float, AudioSegment]:
         """
@@ -36,48 +63,77 @@ class SearchIndex:
         """
         if not self.tree:
             raise RuntimeError("SearchIndex has not been built yet.")
-        
-        return self.tree.get_nearest_neighbor(query_segment)
 
-    def _get_cache_path(self, source_hash: str) -> str:
+        calls, seconds = self.counter.calls, self.counter.seconds
+        result = self.tree.get_nearest_neighbor(query_segment)
+        evaluations = self.counter.calls - calls
+        self.stats.record_queries(1, evaluations, self.counter.seconds - seconds)
+        telemetry.count('distance_calls', evaluations)
+        telemetry.observe('distance_calls_per_query', evaluations)
+        return result
+
+    def search_batch(self, query_segments: List[AudioSegment]) -> List[Tuple[float, AudioSegment]]:
+        """
+        Searches for the nearest neighbor of each of several query segments.
+        The tree is walked once per query, as VP-tree searches can't share work.
+        """
+        return [self.search(query_segment) for query_segment in query_segments]
+
+    def nbytes(self) -> int:
+        """
+        Estimates the memory held by the indexed segments and their features.
+        Segments that are views on the same audio are counted separately.
         """
-        Determines the file path for the cached index.
+        total = 0
+        nodes = [self.tree]
+        while nodes:
+            node = nodes.pop()
+            if node is None:
+                continue
+            segment = node.vp
+            for array in [segment.timeseries, segment._mfcc, segment._mfcc_mean, segment._chroma_stft]:
+                if array is not None:
+                    total += array.nbytes
+            nodes.extend([node.left, node.right])
+        return total
+
+    def _cache_key(self, source_hash: str) -> str:
+        """
+        Determines the cache key for the index.
         """
-        return os.path.join(
-            CACHE_DIR,
-            f"{source_hash}.{self.window_size}.{self.distance_fn.__name__}.vptree"
-        )
+        return f"{source_hash}.{self.window_size}.{self.distance_fn.__name__}.vptree"
 
-    def _load_from_cache(self, source_hash: str) -> bool:
+    def _load_from_cache(self, cache: CacheManager, cache_key: str) -> bool:
         """
         Loads the VP-tree from the cache if it exists and is valid.
         """
-        cache_path = self._get_cache_path(source_hash)
-        if not os.path.exists(cache_path):
-            return False
-        
-        try:
-            with open(cache_path, 'rb') as f:
-                tree = pickle.load(f)
-                if not isinstance(tree, VPTree):
-                    raise TypeError("Cached object is not a VPTree")
-                self.tree = tree
-                return True
-        except (pickle.UnpicklingError, EOFError, TypeError) as e:
-            print(f"Warning: Could not load cache file {cache_path}. It will be rebuilt. Error: {e}")
-            os.remove(cache_path)
+        tree = cache.get(cache_key, self._read_tree)
+        if tree is None:
+            telemetry.count('index_cache_misses')
             return False
+        self.tree = tree
+        telemetry.count('index_cache_hits')
+        return True
 
-    def _save_to_cache(self, source_hash: str) -> None:
+    @staticmethod
+    def _read_tree(path: str) -> "VPTree":
+        with open(path, 'rb') as f:
+            tree = pickle.load(f)
+            # Checked by interface, so that vptree is only imported by unpickling the tree
+            if not hasattr(tree, 'get_nearest_neighbor'):
+                raise TypeError("Cached object is not a VPTree")
+            telemetry.count('bytes_read', f.tell())
+        return tree
+
+    def _save_to_cache(self, cache: CacheManager, cache_key: str) -> None:
         """
         Saves the built VP-tree to the cache.
         """
-        if not os.path.exists(CACHE_DIR):
-            os.makedirs(CACHE_DIR)
-        
-        cache_path = self._get_cache_path(source_hash)
-        with open(cache_path, 'wb') as f:
-            pickle.dump(self.tree, f)
+        def write(path: str) -> None:
+            with open(path, 'wb') as f:
+                pickle.dump(self.tree, f)
+
+        telemetry.count('bytes_written', cache.put(cache_key, write))
 
     def audio_segments_hash(self, audio_segments: List[AudioSegment]) -> str:
         """
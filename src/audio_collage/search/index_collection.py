@@ -1,8 +1,23 @@
-from typing import Callable, Dict, List, Tuple
+import logging
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, Union
 import numpy as np
 
+from ..audio_dist import AudioDist
 from ..audio_segment import AudioSegment
+from ..features import FrameFeatures
+from .. import telemetry
+from .brute import BruteForceIndex
 from .index import SearchIndex
+from .sliding import SlidingSearchIndex
+from .stats import IndexStats
+
+if TYPE_CHECKING:
+    from .reduction import FeatureReducer
+
+logger = logging.getLogger(__name__)
+
+# Any of the indices a collection can hold, one per window
+AnyIndex = Union[SearchIndex, SlidingSearchIndex, BruteForceIndex]
 
 class SearchIndexCollection:
     """
@@ -10,11 +25,16 @@ class SearchIndexCollection:
     """
     def __init__(
         self,
-        distance_fn: Callable[[AudioSegment, AudioSegment], float]
+        distance_fn: Callable[[AudioSegment, AudioSegment], float],
+        reducer: Optional["FeatureReducer"] = None
     ):
         self.distance_fn = distance_fn
+        self.reducer = reducer
+        # Query chunks keyed by offset and length, so their features are
+        # reused by other collections searching the same target
+        self.query_cache: Optional[Dict[Tuple[int, int], AudioSegment]] = None
         AudioSegment(timeseries=np.arange(10), sample_rate=1000),
-        self.indices: Dict[int, SearchIndex] = {}
+        self.indices: Dict[int, AnyIndex] = {}
 
     def add_index(
         self,
@@ -28,6 +48,49 @@ class SearchIndexCollection:
         index.build(audio_segments)
         self.indices[window] = index
 
+    def add_brute_force_index(
+        self,
+        audio_segments: List[AudioSegment],
+        window: int,
+    ) -> None:
+        """
+        Initializes a brute force index over the chops for the specified window size.
+        """
+        index = BruteForceIndex(window, self.distance_fn)
+        index.build(audio_segments)
+        self.indices[window] = index
+
+    def add_sliding_index(
+        self,
+        source: AudioSegment,
+        window: int,
+        source_mfcc: Optional[np.ndarray] = None
+    ) -> None:
+        """
+        Initializes and builds a sliding search index over the whole source for the specified window size.
+        """
+        index = SlidingSearchIndex(window, reducer=self.reducer)
+        with telemetry.span('index_build', items=source.n_samples(), window=window, mode='sliding'):
+            index.build(source, source_mfcc=source_mfcc)
+        self.indices[window] = index
+
+    def nbytes(self) -> int:
+        """
+        Estimates the memory held by all indices in the collection.
+        """
+        return sum(index.nbytes() for index in self.indices.values())
+
+    def stats(self) -> List[IndexStats]:
+        """
+        Returns the distance evaluation counts of each index, by window size.
+        """
+        return [self.indices[window].stats for window in sorted(self.indices)]
+
+    def log_stats(self) -> None:
+        for stats in self.stats():
+            if stats.queries:
+                logger.info(str(stats))
+
     def find_best_match(
         self,
         query_segment: AudioSegment,
@@ -41,33 +104,100 @@ class SearchIndexCollection:
                 - Distance between the query segment and the best match
                 - Window size of the best matching segment
         """
-        best_overall_snippet: AudioSegment
-        best_overall_dist: float = float('inf')
-        best_overall_window: int = 0
+        return self.find_best_matches([query_segment])[0]
+
+    def find_best_matches(
+        self,
+        query_segments: List[AudioSegment],
+    ) -> List[Tuple[AudioSegment, float, int]]:
+        """
+        Finds the best matching segment for each of several queries, searching
+        each index once with the whole batch of queries.
+
+        Returns:
+            List[Tuple[AudioSegment, float, int]]: The result of find_best_match for each query.
+        """
+        return [
+            min(matches.values(), key=lambda match: match[1])
+            for matches in self.search_windows(query_segments)
+        ]
+
+    def search_windows(
+        self,
+        query_segments: List[AudioSegment],
+    ) -> List[Dict[int, Tuple[AudioSegment, float, int]]]:
+        """
+        Finds the best matching segment of every window size for each of several
+        queries, searching each index once with the whole batch of queries.
+
+        Returns:
+            List[Dict[int, Tuple[AudioSegment, float, int]]]: For each query, the
+                best match, its distance normalised by window length and the window
+                length in frames, keyed by window size.
+        """
+        query_segments = list(query_segments)
+        matches: List[Dict[int, Tuple[AudioSegment, float, int]]] = [{} for _ in query_segments]
+        telemetry.count('search_queries', len(query_segments))
 
-        target_sr = query_segment.sample_rate
         for window_size, index in self.indices.items():
-            padded = False
-            window_size_frames = int((window_size / 1000) * target_sr)
-            
-            # Ensure we don't read past the end of the timeseries
-            if len(query_segment.timeseries) < window_size_frames:
-                unpadded_frame_count = query_segment.timeseries.size
-                query_segment = query_segment.pad(window_size_frames)
-                padded = True
-
-            target_chunk = AudioSegment(
-                query_segment.timeseries[:window_size_frames],
-                target_sr,
-            )
-            dist, snippet = index.search(target_chunk)
-            normalized_dist = dist / window_size_frames
-
-            if normalized_dist < best_overall_dist:
-                if padded:
-                    snippet = snippet.trim(unpadded_frame_count)
-                best_overall_dist = normalized_dist
-                best_overall_snippet = snippet
-                best_overall_window = window_size_frames
-
-        return best_overall_snippet, best_overall_dist, best_overall_window
+            target_chunks = []
+            new_chunks: List[AudioSegment] = []
+            unpadded_frame_counts: List[Optional[int]] = []
+            for i, query_segment in enumerate(query_segments):
+                window_size_frames = int((window_size / 1000) * query_segment.sample_rate)
+                unpadded_frame_counts.append(None)
+
+                # Ensure we don't read past the end of the timeseries
+                if len(query_segment.timeseries) < window_size_frames:
+                    unpadded_frame_counts[i] = query_segment.timeseries.size
+                    query_segments[i] = query_segment = query_segment.pad(window_size_frames)
+
+                target_chunk, new = self._query_chunk(query_segment, window_size_frames)
+                target_chunks.append(target_chunk)
+                if new:
+                    new_chunks.append(target_chunk)
+
+            self._featurise(new_chunks, index)
+            results = index.search_batch(target_chunks)
+            for i, (dist, snippet) in enumerate(results):
+                window_size_frames = int((window_size / 1000) * query_segments[i].sample_rate)
+                if unpadded_frame_counts[i] is not None:
+                    snippet = snippet.trim(unpadded_frame_counts[i])
+                matches[i][window_size] = (snippet, dist / window_size_frames, window_size_frames)
+
+        return matches
+
+    def _query_chunk(
+        self,
+        query_segment: AudioSegment,
+        window_size_frames: int
+    ) -> Tuple[AudioSegment, bool]:
+        # Returns the chunk of the query to search with, and whether it is new
+        # rather than cached, and so still needs its features computing
+        cache_key = (query_segment.offset_frames, window_size_frames)
+        if self.query_cache is not None and query_segment.offset_frames is not None:
+            if cache_key in self.query_cache:
+                return self.query_cache[cache_key], False
+
+        target_chunk = AudioSegment(
+            query_segment.timeseries[:window_size_frames],
+            query_segment.sample_rate,
+        )
+        if self.query_cache is not None and query_segment.offset_frames is not None:
+            self.query_cache[cache_key] = target_chunk
+        return target_chunk, True
+
+    def _featurise(self, chunks: List[AudioSegment], index: AnyIndex) -> None:
+        # Computes the features of new query chunks for chop indices in
+        # batches, rather than one by one in their first distance evaluation.
+        # The sliding index featurises its queries itself.
+        if not chunks or not isinstance(index, (SearchIndex, BruteForceIndex)):
+            return
+        mean_mfcc = index.distance_fn is AudioDist.mean_mfcc_dist
+        if not (mean_mfcc or self.reducer):
+            return
+        with telemetry.span('featurise', items=len(chunks), window=index.window_size):
+            if mean_mfcc:
+                FrameFeatures.fill_mfcc_means(chunks)
+            if self.reducer:
+                self.reducer.reduce(chunks)
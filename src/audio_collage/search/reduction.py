@@ -0,0 +1,112 @@
+import logging
+import pickle
+from typing import TYPE_CHECKING, List, Optional
+
+import numpy as np
+
+from ..audio_segment import AudioSegment
+from ..cache_manager import CacheManager, default_cache
+from ..features import FrameFeatures
+
+if TYPE_CHECKING:
+    from sklearn.decomposition import PCA
+
+logger = logging.getLogger(__name__)
+
+class FeatureReducer:
+    """
+    Projects MFCC frames onto their leading principal components, so that
+    distances are computed over fewer dimensions.
+    """
+    def __init__(self, n_components: int):
+        self.n_components = n_components
+        self.pca: Optional["PCA"] = None
+
+    def fit(self, frames: np.ndarray) -> None:
+        """
+        Fits the projection to a bank of feature frames, one frame per column.
+        """
+        # scikit-learn is slow to import, so it is only imported once needed
+        from sklearn.decomposition import PCA
+        self.pca = PCA(n_components=self.n_components)
+        self.pca.fit(frames.T)
+
+    @property
+    def explained_variance(self) -> float:
+        """
+        Returns the fraction of the variance of the fitted frames that is kept.
+        """
+        if self.pca is None:
+            raise RuntimeError("FeatureReducer has not been fitted yet.")
+        return float(np.sum(self.pca.explained_variance_ratio_))
+
+    def transform(self, features: np.ndarray) -> np.ndarray:
+        """
+        Projects a feature matrix with one frame per column.
+        """
+        if self.pca is None:
+            raise RuntimeError("FeatureReducer has not been fitted yet.")
+        return self.pca.transform(features.T).T
+
+    def reduce(self, audio_segments: List[AudioSegment]) -> None:
+        """
+        Replaces the MFCCs of the given segments with their projections.
+        """
+        for segment in audio_segments:
+            self.reduce_segment(segment)
+
+    def reduce_segment(self, segment: AudioSegment) -> None:
+        if segment._mfcc is None and segment._mfcc_mean is not None:
+            # The projection is affine, so the mean of the projected frames
+            # is the projection of the mean frame
+            segment._mfcc_mean = self.transform(segment._mfcc_mean[:, np.newaxis])[:, 0]
+        else:
+            segment._mfcc = self.transform(segment.mfcc)
+            segment._mfcc_mean = None
+
+    @staticmethod
+    def load_or_fit(
+        source: AudioSegment,
+        n_components: int,
+        source_mfcc: Optional[np.ndarray] = None,
+        cache: Optional[CacheManager] = None
+    ) -> "FeatureReducer":
+        """
+        Loads the reducer fitted to the source from the cache, fitting and
+        caching it if it is not there.
+
+        Args:
+            source (AudioSegment): The audio whose feature frames the reducer is fitted to.
+            n_components (int): Number of dimensions to keep.
+            source_mfcc (np.ndarray, optional): Frame-level MFCCs of the source, if already computed.
+            cache (CacheManager, optional): Cache to keep the reducer in. Defaults to the shared cache.
+        """
+        cache = cache or default_cache()
+        cache_key = f"{source.hash()}.{n_components}.pca"
+
+        with cache.lock(cache_key):
+            reducer = cache.get(cache_key, FeatureReducer._read)
+            if reducer is None:
+                if source_mfcc is None:
+                    source_mfcc = FrameFeatures.mfcc(source)
+                reducer = FeatureReducer(n_components)
+                reducer.fit(source_mfcc)
+
+                def write(path: str) -> None:
+                    with open(path, 'wb') as f:
+                        pickle.dump(reducer, f)
+                cache.put(cache_key, write)
+
+        logger.info(
+            f"Reduced features to {n_components} dimensions, "
+            f"keeping {reducer.explained_variance:.1%} of variance"
+        )
+        return reducer
+
+    @staticmethod
+    def _read(path: str) -> "FeatureReducer":
+        with open(path, 'rb') as f:
+            reducer = pickle.load(f)
+        if not isinstance(reducer, FeatureReducer):
+            raise TypeError("Cached object is not a FeatureReducer")
+        return reducer
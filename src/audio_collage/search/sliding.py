@@ -0,0 +1,159 @@
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import time
+
+import numpy as np
+from numpy.fft import irfft, rfft
+
+from ..audio_segment import AudioSegment
+from .. import telemetry
+from .stats import IndexStats
+from ..features import FrameFeatures, HOP_LENGTH
+
+if TYPE_CHECKING:
+    from .reduction import FeatureReducer
+
+class SlidingSearchIndex:
+    """
+    Searches every frame offset of a source for the closest match to a query,
+    without chopping the source.
+
+    The squared euclidean distance between the query features Q and the source
+    features S at offset t expands to
+
+        ||S[t:t+m]||^2 - 2 * sum_j S[t+j] . Q[j] + ||Q||^2
+
+    The first term is a difference of prefix sums and the middle term is a
+    cross-correlation, which is computed for all offsets at once with an FFT.
+    """
+    def __init__(self, window_size: int, reducer: Optional["FeatureReducer"] = None):
+        self.window_size = window_size
+        self.reducer = reducer
+        self.source: Optional[AudioSegment] = None
+        self.window_frames: int = 0
+        self.n_query_frames: int = 0
+        self.n_offsets: int = 0
+        self.n_fft: int = 0
+        self._source_fft: Optional[np.ndarray] = None
+        self._window_energy: Optional[np.ndarray] = None
+        self.stats = IndexStats(window=window_size)
+
+    def build(self, source: AudioSegment, source_mfcc: Optional[np.ndarray] = None) -> None:
+        """
+        Precomputes the source terms of the distance expansion.
+
+        Args:
+            source (AudioSegment): The audio to search.
+            source_mfcc (np.ndarray, optional): Frame-level MFCCs of the source, if already computed.
+        """
+        if source_mfcc is None:
+            source_mfcc = FrameFeatures.mfcc(source)
+        if self.reducer:
+            source_mfcc = self.reducer.transform(source_mfcc)
+
+        self.source = source
+        self.window_frames = int((self.window_size / 1000) * source.sample_rate)
+        self.n_query_frames = FrameFeatures.n_frames(self.window_frames)
+
+        # Only offsets where a whole window of audio fits in the source are candidates
+        self.n_offsets = max(1, (source.n_samples() - self.window_frames) // HOP_LENGTH + 1)
+        self.stats = IndexStats(window=self.window_size, size=self.n_offsets)
+
+        n_source_frames = max(source_mfcc.shape[1], self.n_offsets + self.n_query_frames - 1)
+        features = np.zeros((source_mfcc.shape[0], n_source_frames))
+        features[:, :source_mfcc.shape[1]] = source_mfcc
+
+        energy = np.concatenate([[0.], np.cumsum(np.sum(features ** 2, axis=0))])
+        offsets = np.arange(self.n_offsets)
+        self._window_energy = energy[offsets + self.n_query_frames] - energy[offsets]
+
+        n_fft = n_source_frames + self.n_query_frames - 1
+        self.n_fft = 1 << (n_fft - 1).bit_length()
+        self._source_fft = rfft(features, n=self.n_fft, axis=1)
+
+    def search(self, query_segment: AudioSegment) -> Tuple[float, AudioSegment]:
+        """
+        Finds the source offset whose features are closest to the query segment.
+        """
+        if self.source is None:
+            raise RuntimeError("SlidingSearchIndex has not been built yet.")
+
+        query_mfcc = FrameFeatures.mfcc(query_segment)
+        if self.reducer:
+            query_mfcc = self.reducer.transform(query_mfcc)
+        start = time.perf_counter()
+        distances = self.distances(query_mfcc)
+        self._record(1, time.perf_counter() - start)
+        return self._best_match(distances)
+
+    def search_batch(self, query_segments: List[AudioSegment]) -> List[Tuple[float, AudioSegment]]:
+        """
+        Finds the closest source offset for each of several equal-length query
+        segments, computing their features and correlations in single batched calls.
+        """
+        if self.source is None:
+            raise RuntimeError("SlidingSearchIndex has not been built yet.")
+        if not query_segments:
+            return []
+
+        with telemetry.span('featurise', items=len(query_segments), window=self.window_size):
+            query_mfccs = FrameFeatures.mfcc_batch(query_segments)
+            if self.reducer:
+                query_mfccs = np.stack([self.reducer.transform(query_mfcc) for query_mfcc in query_mfccs])
+        start = time.perf_counter()
+        distances_batch = self.distances_batch(query_mfccs)
+        self._record(len(query_segments), time.perf_counter() - start)
+        return [self._best_match(distances) for distances in distances_batch]
+
+    def _record(self, n_queries: int, seconds: float) -> None:
+        # Every offset of the source is compared with every query
+        evaluations = self.n_offsets * n_queries
+        self.stats.record_queries(n_queries, evaluations, seconds)
+        telemetry.count('distance_calls', evaluations)
+        telemetry.observe('distance_calls_per_query', self.n_offsets, n_queries)
+
+    def _best_match(self, distances: np.ndarray) -> Tuple[float, AudioSegment]:
+        best_offset = int(np.argmin(distances))
+        offset_frames = best_offset * HOP_LENGTH
+
+        snippet = AudioSegment(
+            self.source.timeseries[offset_frames:offset_frames + self.window_frames],
+            self.source.sample_rate,
+            offset_frames=offset_frames
+        )
+        return float(distances[best_offset]), snippet
+
+    def nbytes(self) -> int:
+        """
+        Estimates the memory held by the precomputed source terms.
+        """
+        if self.source is None:
+            return 0
+        return self._source_fft.nbytes + self._window_energy.nbytes
+
+    def distances(self, query_mfcc: np.ndarray) -> np.ndarray:
+        """
+        Returns the euclidean distance between the query features and the source
+        features at every candidate offset.
+        """
+        return self.distances_batch(query_mfcc[np.newaxis])[0]
+
+    def distances_batch(self, query_mfccs: np.ndarray) -> np.ndarray:
+        """
+        Returns the distances of several queries at once, given their features
+        with shape (queries, coefficients, frames), as one row per query.
+        """
+        n_queries, n_coefficients, n_frames = query_mfccs.shape
+        queries = np.zeros((n_queries, n_coefficients, self.n_query_frames))
+        n_cols = min(n_frames, self.n_query_frames)
+        queries[:, :, :n_cols] = query_mfccs[:, :, :n_cols]
+
+        query_fft = rfft(queries, n=self.n_fft, axis=2)
+        correlation = irfft(
+            np.einsum('cf,qcf->qf', self._source_fft, np.conj(query_fft)),
+            n=self.n_fft,
+            axis=1
+        )[:, :self.n_offsets]
+
+        squared = self._window_energy - 2 * correlation + np.sum(queries ** 2, axis=(1, 2))[:, np.newaxis]
+        return np.sqrt(np.maximum(squared, 0.))
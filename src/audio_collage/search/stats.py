@@ -0,0 +1,98 @@
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict
+
+from ..audio_segment import AudioSegment
+
+# Guards the query counts of indices shared by jobs in several threads
+_stats_lock = threading.Lock()
+
+@dataclass
+class IndexStats:
+    """
+    Counts of the distance evaluations an index made while being built and
+    searched, and the time spent in them.
+    """
+    window: int
+    # Number of candidates the index searches over
+    size: int = 0
+    build_evaluations: int = 0
+    build_seconds: float = 0.
+    queries: int = 0
+    query_evaluations: int = 0
+    query_seconds: float = 0.
+
+    @property
+    def evaluations_per_query(self) -> float:
+        return self.query_evaluations / self.queries if self.queries else 0.
+
+    @property
+    def pruning_ratio(self) -> float:
+        """
+        Distance evaluations per query as a fraction of the index size. A
+        linear scan has a ratio of 1, and the lower the ratio the more of the
+        index a search skips.
+        """
+        return self.evaluations_per_query / self.size if self.size else 0.
+
+    def record_queries(self, queries: int, evaluations: int, seconds: float) -> None:
+        """
+        Adds the counts of a search, which may run at once with others.
+        """
+        with _stats_lock:
+            self.queries += queries
+            self.query_evaluations += evaluations
+            self.query_seconds += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(
+            asdict(self),
+            evaluations_per_query=self.evaluations_per_query,
+            pruning_ratio=self.pruning_ratio
+        )
+
+    def __str__(self) -> str:
+        return (
+            f"{self.window}ms window: {self.evaluations_per_query:.1f} distance evaluations per query "
+            f"over {self.size} candidates (pruning ratio {self.pruning_ratio:.3f}), "
+            f"{self.build_evaluations} to build"
+        )
+
+class CountingDistance:
+    """
+    Wraps a distance function, counting and timing its calls. Counts are kept
+    per thread, so that jobs searching a shared index at once each see only
+    their own calls. Instances can be pickled, along with the trees that hold
+    them, if the function can.
+    """
+    def __init__(self, distance_fn: Callable[[AudioSegment, AudioSegment], float]):
+        self.distance_fn = distance_fn
+        self._local = threading.local()
+
+    @property
+    def calls(self) -> int:
+        return getattr(self._local, 'calls', 0)
+
+    @property
+    def seconds(self) -> float:
+        return getattr(self._local, 'seconds', 0.)
+
+    def __call__(self, a: AudioSegment, b: AudioSegment) -> float:
+        start = time.perf_counter()
+        try:
+            return self.distance_fn(a, b)
+        finally:
+            self._local.seconds = self.seconds + time.perf_counter() - start
+            self._local.calls = self.calls + 1
+
+    def reset(self) -> None:
+        self._local.calls = 0
+        self._local.seconds = 0.
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {'distance_fn': self.distance_fn}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.distance_fn = state['distance_fn']
+        self._local = threading.local()
@@ -0,0 +1,189 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .audio_mapper import AudioMapper
+from .audio_segment import AudioSegment
+from .collage_progress_state import CollageProgressState
+from .plan import PlanEntry, SelectionPlan
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class BeamState:
+    """
+    A partial selection ending at a target pointer. Entries are kept as a
+    linked list of (entry, previous) pairs, so states share their history.
+    """
+    pointer: int
+    cost: float
+    history: Optional[Tuple[PlanEntry, Any]] = None
+
+    @property
+    def mean_cost(self) -> float:
+        return self.cost / self.pointer if self.pointer else 0.
+
+    def entries(self) -> List[PlanEntry]:
+        entries = []
+        history = self.history
+        while history is not None:
+            entry, history = history
+            entries.append(entry)
+        return entries[::-1]
+
+class BeamSelector:
+    """
+    Selects snippets by beam search over target pointers, instead of greedily
+    taking the best match at each pointer.
+
+    Each step from a pointer picks one of the windows, costs the distance of
+    its best match weighted by the number of target frames it covers, and
+    moves the pointer on by the window less the declick overlap. States are
+    expanded in pointer order and states reaching the same pointer are merged,
+    keeping the cheapest, so with a wide enough beam this is the exact
+    (Viterbi) minimum. Otherwise only the beam_width states with the lowest
+    cost per frame are kept. Once the time budget runs out the beam narrows
+    to one state, which finishes like greedy selection.
+    """
+    def __init__(
+        self,
+        mapper: AudioMapper,
+        beam_width: int = 8,
+        time_budget: Optional[float] = None
+    ):
+        self.mapper = mapper
+        self.beam_width = beam_width
+        self.time_budget = time_budget
+        self.n_queries = 0
+
+    def select(self) -> SelectionPlan:
+        mapper = self.mapper
+        if not mapper.indices.indices:
+            mapper.build_indices()
+
+        target = mapper.target
+        n_frames = target.n_samples()
+        overlap_frames = int((mapper.config.declick_ms / 1000) * target.sample_rate)
+        progress_callback = mapper.config.progress_callback
+        start_time = time.perf_counter()
+        beam_width = self.beam_width
+
+        if progress_callback:
+            progress_callback(CollageProgressState(
+                CollageProgressState.Task.SELECTING,
+                starting=True,
+                current_step=0,
+                total_steps=n_frames,
+                message=f"Selecting samples with a beam of {beam_width}"
+            ))
+
+        # Live states keyed by pointer, so states that meet are merged
+        frontier: Dict[int, BeamState] = {0: BeamState(pointer=0, cost=0.)}
+        min_advance = min(
+            int((window / 1000) * target.sample_rate) - overlap_frames
+            for window in mapper.indices.indices
+        )
+        if min_advance <= 0:
+            raise ValueError("Windows must be longer than the declick interval")
+        best_complete: Optional[BeamState] = None
+        pointer_done = 0
+
+        with telemetry.span('select', mode='beam', beam_width=self.beam_width) as select_span:
+            while frontier:
+                mapper._check_cancelled()
+                if self.time_budget is not None and beam_width > 1:
+                    if time.perf_counter() - start_time > self.time_budget:
+                        logger.info("Beam search ran out of time, finishing greedily")
+                        beam_width = 1
+                        frontier = self._prune(frontier, beam_width)
+
+                # Expand the states furthest behind together, as one batch of
+                # queries. None of their children can land on another of them, so
+                # every state is expanded only once all paths to it are merged.
+                pointers = sorted(frontier)
+                pointers = [p for p in pointers[:beam_width] if p < pointers[0] + min_advance]
+                states = [frontier.pop(pointer) for pointer in pointers]
+                queries = [
+                    AudioSegment(target.timeseries[pointer:], target.sample_rate, offset_frames=pointer)
+                    for pointer in pointers
+                ]
+                self.n_queries += len(queries)
+
+                for state, matches in zip(states, mapper.indices.search_windows(queries)):
+                    for snippet, dist, window_frames in matches.values():
+                        advance = window_frames - overlap_frames
+                        entry = PlanEntry(
+                            source_id=0,
+                            offset_frames=snippet.offset_frames or 0,
+                            n_frames=snippet.n_samples(),
+                            distance=float(dist),
+                            target_offset=state.pointer,
+                        )
+                        covered = min(advance, n_frames - state.pointer)
+                        child = BeamState(
+                            pointer=state.pointer + advance,
+                            cost=state.cost + float(dist) * covered,
+                            history=(entry, state.history),
+                        )
+                        if child.pointer >= n_frames:
+                            if best_complete is None or child.cost < best_complete.cost:
+                                best_complete = child
+                        elif child.pointer not in frontier or child.cost < frontier[child.pointer].cost:
+                            frontier[child.pointer] = child
+
+                frontier = self._prune(frontier, beam_width)
+
+                if progress_callback and pointers[-1] > pointer_done:
+                    progress_callback(CollageProgressState(
+                        CollageProgressState.Task.SELECTING,
+                        advance=pointers[-1] - pointer_done,
+                    ))
+                    pointer_done = pointers[-1]
+            select_span.items = len(best_complete.entries()) if best_complete else 0
+
+        if progress_callback:
+            progress_callback(CollageProgressState(
+                CollageProgressState.Task.SELECTING,
+                completed=True,
+                current_step=n_frames,
+            ))
+
+        return SelectionPlan(
+            sources=[mapper.source.path or ''],
+            sample_rate=mapper.source.sample_rate,
+            overlap_ms=mapper.config.declick_ms,
+            entries=best_complete.entries() if best_complete else [],
+        )
+
+    @staticmethod
+    def _prune(frontier: Dict[int, BeamState], beam_width: int) -> Dict[int, BeamState]:
+        if len(frontier) <= beam_width:
+            return frontier
+        kept = sorted(frontier.values(), key=lambda state: state.mean_cost)[:beam_width]
+        return {state.pointer: state for state in kept}
+
+def compare_with_greedy(mapper: AudioMapper, beam_width: int, time_budget: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Selects with both greedy and beam search selection, returning the frame
+    weighted mean distance and runtime of each, and the beam search plan.
+    The indices are built first, so that neither runtime includes building them.
+    """
+    if not mapper.indices.indices:
+        mapper.build_indices()
+
+    start = time.perf_counter()
+    greedy = mapper.select()
+    greedy_seconds = time.perf_counter() - start
+
+    selector = BeamSelector(mapper, beam_width=beam_width, time_budget=time_budget)
+    start = time.perf_counter()
+    beam = selector.select()
+    beam_seconds = time.perf_counter() - start
+
+    return {
+        'greedy': {'distance': greedy.mean_distance(), 'seconds': greedy_seconds},
+        'beam': {'distance': beam.mean_distance(), 'seconds': beam_seconds, 'queries': selector.n_queries},
+        'plan': beam,
+    }
@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import shutil
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from .audio_segment import AudioSegment
+from .collager import Collager
+from .collager_config import CollagerConfig
+from .result_cache import DEFAULT_MAX_BYTES, ResultCache
+from .search.index_collection import SearchIndexCollection
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+IndexEntry = Tuple[AudioSegment, SearchIndexCollection]
+
+class IndexCache:
+    """
+    Keeps sample audio and its indices in memory between jobs, evicting the
+    least recently used entries once the estimated size exceeds a budget.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Hashable, IndexEntry]" = OrderedDict()
+        self.sizes: Dict[Hashable, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+
+    def get_or_build(self, key: Hashable, build_fn: Callable[[], IndexEntry]) -> IndexEntry:
+        """
+        Returns the entry for the key, building it with build_fn on a miss.
+        Concurrent requests for the same key wait for a single build.
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self.entries:
+                    self.hits += 1
+                    self.entries.move_to_end(key)
+                    return self.entries[key]
+                self.misses += 1
+
+            entry = build_fn()
+            sample_audio, indices = entry
+            size = sample_audio.timeseries.nbytes + indices.nbytes()
+
+            with self._lock:
+                self.entries[key] = entry
+                self.sizes[key] = size
+                self._evict(keep=key)
+            return entry
+
+    def nbytes(self) -> int:
+        return sum(self.sizes.values())
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.nbytes(),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _evict(self, keep: Hashable) -> None:
+        while self.nbytes() > self.max_bytes and len(self.entries) > 1:
+            key = next(iter(self.entries))
+            if key == keep:
+                break
+            logger.info(f"Evicting indices for {key}")
+            self.entries.pop(key)
+            self.sizes.pop(key)
+            self._key_locks.pop(key, None)
+
+class CollageService:
+    """
+    Runs collage jobs against indices kept warm in an IndexCache, and
+    optionally serves repeated jobs from a ResultCache.
+    """
+    def __init__(
+        self,
+        max_bytes: int,
+        result_cache_dir: Optional[str] = None,
+        result_cache_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.index_cache = IndexCache(max_bytes)
+        self.result_cache: Optional[ResultCache] = None
+        if result_cache_dir:
+            self.result_cache = ResultCache(result_cache_dir, max_bytes=result_cache_bytes)
+        self._result_lock = threading.Lock()
+
+    def run_job(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Creates a collage from the given config parameters and writes it to the outpath.
+
+        Returns:
+            Dict[str, Any]: The output path, the time taken in seconds and
+                whether the result came from the result cache.
+        """
+        config = CollagerConfig.from_dict(params)
+        if not (config.sample_file and config.target_file and config.outpath):
+            raise ValueError("Jobs need a sample_file, target_file and outpath")
+
+        start = time.perf_counter()
+        key = None
+        if self.result_cache:
+            with self._result_lock:
+                key = self.result_cache.key(config)
+                cached_audio = self.result_cache.get_audio_path(key)
+            telemetry.count('result_cache_hits' if cached_audio else 'result_cache_misses')
+            if cached_audio:
+                shutil.copyfile(cached_audio, config.outpath)
+                return {
+                    'outpath': config.outpath,
+                    'seconds': time.perf_counter() - start,
+                    'cached': True,
+                }
+
+        sample_audio, indices = self.index_cache.get_or_build(
+            self._index_key(config),
+            lambda: self._build(config)
+        )
+
+        target_audio = AudioSegment.from_file(config.target_file)
+        if self.result_cache and key:
+            plan = Collager.create_plan(
+                target_audio=target_audio,
+                sample_audio=sample_audio,
+                config=config,
+                indices=indices
+            )
+            output_audio = Collager.render(
+                plan,
+                sample_audio,
+                declick_fn=config.declick_fn,
+                declick_ms=config.declick_ms
+            )
+            with self._result_lock:
+                self.result_cache.put(key, plan, output_audio)
+        else:
+            output_audio = Collager.create_collage(
+                target_audio=target_audio,
+                sample_audio=sample_audio,
+                config=config,
+                indices=indices
+            )
+        output_audio.to_file(config.outpath)
+
+        return {
+            'outpath': config.outpath,
+            'seconds': time.perf_counter() - start,
+            'cached': False,
+        }
+
+    def _index_key(self, config: CollagerConfig) -> Hashable:
+        # Rebuild if the sample file is replaced on disk
+        return (os.stat(config.sample_file).st_mtime_ns,) + config.index_key()
+
+    def _build(self, config: CollagerConfig) -> IndexEntry:
+        logger.info(f"Building indices for '{config.sample_file}'")
+        sample_audio = AudioSegment.from_file(config.sample_file)
+        return sample_audio, Collager.build_indices(sample_audio, config)
+
+class CollageRequestHandler(BaseHTTPRequestHandler):
+    """
+    Accepts jobs as JSON config parameters POSTed to /collage, and reports
+    index cache statistics on GET /status.
+    """
+    service: CollageService
+
+    def do_GET(self) -> None:
+        if self.path != '/status':
+            self._respond(404, {'error': f"Unknown path: {self.path}"})
+            return
+        self._respond(200, self.service.index_cache.stats())
+
+    def do_POST(self) -> None:
+        if self.path != '/collage':
+            self._respond(404, {'error': f"Unknown path: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length) or b'{}')
+            result = self.service.run_job(params)
+        except (ValueError, TypeError, OSError) as e:
+            self._respond(400, {'error': str(e)})
+            return
+        except Exception as e:
+            # Any other failure is the server's, and must not leave the client without a response
+            logger.exception("Collage job failed")
+            self._respond(500, {'error': f"Internal error: {e}"})
+            return
+        self._respond(200, result)
+
+    def _respond(self, status: int, body: Dict[str, Any]) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else 'local'
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format % args)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def create_server(
+    service: CollageService,
+    host: str = '127.0.0.1',
+    port: int = 8765,
+    socket_path: Optional[str] = None
+) -> socketserver.BaseServer:
+    """
+    Creates an HTTP server for the service, listening on a Unix socket if a
+    path is given and on host and port otherwise.
+    """
+    handler = type('Handler', (CollageRequestHandler,), {'service': service})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
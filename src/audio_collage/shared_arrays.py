@@ -0,0 +1,196 @@
+import contextlib
+import io
+import logging
+import multiprocessing
+import pickle
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from multiprocessing.context import BaseContext
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Arrays are placed at multiples of this many bytes in the block
+ALIGNMENT = 16
+
+# Blocks this process has loaded objects from, by name. They stay mapped until
+# the process exits, since loaded arrays may outlive the handle.
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+@dataclass
+class SharedHandle:
+    """
+    A lightweight handle on an object whose numpy arrays have been moved into
+    one shared memory block, such as a sample, its indices and their
+    segments. The handle holds the pickled object with its arrays replaced by
+    their place in the block, so passing it to worker processes copies only
+    the structure of the object, and every worker reads the same arrays.
+
+    Arrays loaded from the block are read-only, so that no worker can change
+    what the others see.
+
+    Forked workers need no block: a handle made with inherit holds the object
+    itself, which workers inherit copy-on-write along with the rest of the
+    parent's memory.
+    """
+    # Name of the shared memory block, or None if the arrays are pickled in the payload
+    name: Optional[str]
+    # Size of the block in bytes
+    nbytes: int
+    payload: bytes
+    _block: Optional[shared_memory.SharedMemory] = field(default=None, repr=False, compare=False)
+    # The object itself, for workers forked from this process
+    _obj: Any = field(default=None, repr=False, compare=False)
+
+    @staticmethod
+    def create(obj: Any) -> "SharedHandle":
+        """
+        Copies the arrays of the object into a new shared memory block. Views
+        of the same array share one copy of it. Falls back to pickling the
+        arrays in the handle where shared memory is unavailable.
+        """
+        roots: List[np.ndarray] = []
+        root_indices: Dict[int, int] = {}
+
+        def persistent_id(value: Any) -> Optional[Tuple]:
+            if not isinstance(value, np.ndarray) or value.dtype.hasobject or value.nbytes == 0:
+                return None
+            root, offset, strides = _root(value)
+            if id(root) not in root_indices:
+                root_indices[id(root)] = len(roots)
+                roots.append(root)
+            return ('ndarray', root_indices[id(root)], offset, value.shape, value.dtype.str, strides)
+
+        buffer = io.BytesIO()
+        pickler = pickle.Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = persistent_id  # type: ignore[method-assign]
+        pickler.dump(obj)
+
+        offsets = []
+        nbytes = 0
+        for root in roots:
+            offsets.append(nbytes)
+            nbytes += -(-root.nbytes // ALIGNMENT) * ALIGNMENT
+
+        try:
+            block = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+        except OSError as e:
+            logger.warning(f"Could not create shared memory, so workers will copy the arrays: {e}")
+            return SharedHandle(name=None, nbytes=0, payload=pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+        for root, offset in zip(roots, offsets):
+            np.ndarray(root.shape, root.dtype, buffer=block.buf, offset=offset, strides=root.strides)[...] = root
+        logger.info(f"Shared {len(roots)} arrays of {nbytes / 1024 / 1024:.1f}MB with worker processes")
+
+        # The offsets of the arrays in the block travel with the pickle, which refers to them by index
+        return SharedHandle(
+            name=block.name,
+            nbytes=nbytes,
+            payload=pickle.dumps((offsets, buffer.getvalue()), protocol=pickle.HIGHEST_PROTOCOL),
+            _block=block,
+        )
+
+    @staticmethod
+    def inherit(obj: Any) -> "SharedHandle":
+        """
+        Returns a handle holding the object, for workers forked from this
+        process. It can't be pickled.
+        """
+        return SharedHandle(name=None, nbytes=0, payload=b'', _obj=obj)
+
+    def load(self) -> Any:
+        """
+        Returns the object, with its arrays as read-only views of the block.
+        """
+        if self._obj is not None:
+            return self._obj
+        if self.name is None:
+            return pickle.loads(self.payload)
+        if self.name not in _attached:
+            _attached[self.name] = self._block or _attach(self.name)
+        offsets, data = pickle.loads(self.payload)
+        # Views of an array exporting the block's buffer keep the block mapped while they live
+        base = np.frombuffer(_attached[self.name].buf, dtype=np.uint8)
+
+        def persistent_load(pid: Tuple) -> np.ndarray:
+            _kind, root_index, offset, shape, dtype, strides = pid
+            array = np.ndarray(shape, np.dtype(dtype), buffer=base, offset=offsets[root_index] + offset, strides=strides)
+            array.flags.writeable = False
+            return array
+
+        unpickler = pickle.Unpickler(io.BytesIO(data))
+        unpickler.persistent_load = persistent_load  # type: ignore[method-assign]
+        return unpickler.load()
+
+    def unlink(self) -> None:
+        """
+        Frees the block once every process using it has finished. Only the
+        process that created the handle should call this. Objects loaded from
+        the block in this process stay readable.
+        """
+        if self._block is not None:
+            if _attached.get(self.name) is not self._block:
+                self._block.close()
+            self._block.unlink()
+            self._block = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        if self._obj is not None:
+            raise pickle.PicklingError("An inherited handle can only be passed to forked workers")
+        # The block is attached again by name in other processes
+        state = dict(self.__dict__)
+        state['_block'] = None
+        return state
+
+@contextlib.contextmanager
+def shared(obj: Any, mp_context: Optional[BaseContext] = None) -> Iterator[SharedHandle]:
+    """
+    Moves the arrays of the object into shared memory for the duration of
+    the context, yielding a handle to pass to worker processes started with
+    the given multiprocessing context.
+
+    Workers that are forked inherit the object instead. Their pages are
+    shared with this process until written to, and array data is never
+    written, so the workers read one copy of it without the second copy in
+    shared memory or the cost of unpickling the object in every worker.
+    """
+    start_method = mp_context.get_start_method() if mp_context else multiprocessing.get_start_method()
+    if start_method == 'fork':
+        yield SharedHandle.inherit(obj)
+        return
+    handle = SharedHandle.create(obj)
+    try:
+        yield handle
+    finally:
+        handle.unlink()
+
+def _root(array: np.ndarray) -> Tuple[np.ndarray, int, Tuple[int, ...]]:
+    """
+    Returns the contiguous array that owns the memory of a view, with the
+    byte offset and strides of the view in it, so that views of one array are
+    shared as one copy. Views that can't be placed in their owner are copied.
+    """
+    root = array
+    while isinstance(root.base, np.ndarray):
+        root = root.base
+    if root is not array and (root.flags.c_contiguous or root.flags.f_contiguous):
+        offset = array.__array_interface__['data'][0] - root.__array_interface__['data'][0]
+        # Bytes from the first to one past the last element of the view
+        span = sum((n - 1) * stride for n, stride in zip(array.shape, array.strides)) + array.itemsize
+        if all(stride >= 0 for stride in array.strides) and 0 <= offset and offset + span <= root.nbytes:
+            return root, offset, array.strides
+    if not (array.flags.c_contiguous or array.flags.f_contiguous):
+        array = np.ascontiguousarray(array)
+    return array, 0, array.strides
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        # Only the process that created the block should unlink it
+        return shared_memory.SharedMemory(name=name, track=False)  # type: ignore[call-arg]
+    except TypeError:
+        # Before Python 3.13 attaching always registers the block with the
+        # resource tracker, which workers share with the process that created
+        # it, so it is still unlinked only once
+        return shared_memory.SharedMemory(name=name)
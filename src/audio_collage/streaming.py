@@ -0,0 +1,208 @@
+import logging
+import time
+from typing import Any, BinaryIO, Iterator, List
+
+import numpy as np
+import soundfile as sf
+
+from .audio_segment import AudioSegment
+from .collager import Collager
+from .collager_config import CollagerConfig
+from .search.index_collection import SearchIndexCollection
+from .util import Util
+
+logger = logging.getLogger(__name__)
+
+class RingBuffer:
+    """
+    A fixed-capacity buffer of the most recent frames of a stream, addressed
+    by absolute frame number.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        # Total number of frames written
+        self.end = 0
+
+    @property
+    def start(self) -> int:
+        """
+        Returns the oldest frame still held.
+        """
+        return max(0, self.end - self.capacity)
+
+    def write(self, block: np.ndarray) -> None:
+        block = np.asarray(block, dtype=np.float32)
+        if block.size > self.capacity:
+            self.end += block.size - self.capacity
+            block = block[-self.capacity:]
+        position = self.end % self.capacity
+        first = min(block.size, self.capacity - position)
+        self.buffer[position:position + first] = block[:first]
+        self.buffer[:block.size - first] = block[first:]
+        self.end += block.size
+
+    def read(self, start: int, n_frames: int) -> np.ndarray:
+        """
+        Returns up to n_frames frames from the given absolute frame.
+        """
+        if start < self.start:
+            raise ValueError(f"Frame {start} has already left the buffer")
+        stop = min(start + n_frames, self.end)
+        indices = np.arange(start, stop) % self.capacity
+        return self.buffer[indices]
+
+class StreamingCollager:
+    """
+    Collages a target that arrives block by block, selecting snippets against
+    prebuilt indices as soon as enough of the target has arrived.
+
+    Selection at a pointer waits until the longest window plus the declick
+    interval of target audio past the pointer has arrived, which bounds the
+    latency of the output. Output is cross-faded as in offline collaging, and
+    released up to the start of the last cross-fade.
+    """
+    def __init__(
+        self,
+        sample_audio: AudioSegment,
+        indices: SearchIndexCollection,
+        config: CollagerConfig
+    ):
+        self.sample_rate = sample_audio.sample_rate
+        self.indices = indices
+        self.declick_fn = config.declick_fn
+        # Snippets overlap in the target by the configured declick interval,
+        # as in offline collaging, but are cross-faded over the resolved one
+        self.step_overlap_frames = int((config.declick_ms / 1000) * self.sample_rate)
+        self.declick_ms = Collager.resolve_declick_ms(config.declick_fn, config.declick_ms)
+        self.overlap_frames = int((self.declick_ms / 1000) * self.sample_rate)
+        self.max_window_frames = int((max(indices.indices) / 1000) * self.sample_rate)
+        self.latency_frames = self.max_window_frames + self.overlap_frames
+
+        self.ring = RingBuffer(self.latency_frames * 4)
+        self.pointer = 0
+        # Selected output not yet released, the tail of which is still to be cross-faded
+        self._pending = np.zeros(0, dtype=np.float32)
+        self.n_selections = 0
+        # Seconds by which processing has fallen behind the arriving audio
+        self.lag_seconds = 0.
+        self.max_lag_seconds = 0.
+        self._behind = False
+
+    @property
+    def latency_seconds(self) -> float:
+        return self.latency_frames / self.sample_rate
+
+    def push(self, block: np.ndarray) -> np.ndarray:
+        """
+        Adds a block of target audio and returns any output that is ready.
+        """
+        started = time.perf_counter()
+        # Write long blocks in parts, so that unselected audio never leaves the buffer
+        for part in range(0, len(block), self.latency_frames):
+            self.ring.write(block[part:part + self.latency_frames])
+            while self.pointer + self.latency_frames <= self.ring.end:
+                self._select()
+        output = self._release(final=False)
+        self._track_lag(time.perf_counter() - started, len(block) / self.sample_rate)
+        return output
+
+    def flush(self) -> np.ndarray:
+        """
+        Selects snippets for the rest of the target once the stream has ended,
+        and returns the remaining output.
+        """
+        while self.pointer < self.ring.end:
+            self._select()
+        return self._release(final=True)
+
+    def _select(self) -> None:
+        query = AudioSegment(
+            self.ring.read(self.pointer, self.max_window_frames),
+            self.sample_rate
+        )
+        snippet, _dist, n_frames = self.indices.find_best_match(query)
+        self._append(np.asarray(snippet.timeseries, dtype=np.float32))
+        self.pointer += max(1, n_frames - self.step_overlap_frames)
+        self.n_selections += 1
+
+    def _append(self, snippet: np.ndarray) -> None:
+        overlap_frames = min(self.overlap_frames, snippet.size, self._pending.size)
+        if self.declick_fn and overlap_frames:
+            self._pending = Util.declick_out(self._pending, n_frames=overlap_frames, declick_type=self.declick_fn)
+            snippet = Util.declick_in(snippet, n_frames=overlap_frames, declick_type=self.declick_fn)
+            self._pending[-overlap_frames:] += snippet[:overlap_frames]
+            snippet = snippet[overlap_frames:]
+        self._pending = np.concatenate([self._pending, snippet])
+
+    def _release(self, final: bool) -> np.ndarray:
+        keep = 0 if final else min(self.overlap_frames, self._pending.size)
+        output = self._pending[:self._pending.size - keep]
+        self._pending = self._pending[self._pending.size - keep:]
+        return output
+
+    def _track_lag(self, seconds: float, block_seconds: float) -> None:
+        self.lag_seconds = max(0., self.lag_seconds + seconds - block_seconds)
+        self.max_lag_seconds = max(self.max_lag_seconds, self.lag_seconds)
+        behind = self.lag_seconds > self.latency_seconds
+        if behind and not self._behind:
+            logger.warning(
+                f"Collaging is {self.lag_seconds:.3f}s behind real time, "
+                f"more than the {self.latency_seconds:.3f}s latency"
+            )
+        self._behind = behind
+
+def read_wav_blocks(path: str, block_frames: int, sample_rate: int) -> Iterator[np.ndarray]:
+    """
+    Reads a WAV file block by block, mixing it down to mono.
+    """
+    info = sf.info(path)
+    if info.samplerate != sample_rate:
+        raise ValueError(
+            f"Stream sample rate {info.samplerate} does not match sample audio sample rate {sample_rate}"
+        )
+    for block in sf.blocks(path, blocksize=block_frames, dtype='float32', always_2d=True):
+        yield block.mean(axis=1)
+
+def read_raw_blocks(stream: BinaryIO, block_frames: int) -> Iterator[np.ndarray]:
+    """
+    Reads raw mono 32-bit float PCM from a binary stream block by block.
+    """
+    block_bytes = block_frames * 4
+    remainder = b''
+    while True:
+        data = stream.read(block_bytes)
+        if not data:
+            break
+        data = remainder + data
+        n_whole = len(data) - len(data) % 4
+        remainder = data[n_whole:]
+        if n_whole:
+            yield np.frombuffer(data[:n_whole], dtype=np.float32)
+
+def run_stream(
+    collager: StreamingCollager,
+    blocks: Iterator[np.ndarray],
+    outputs: List[Any]
+) -> None:
+    """
+    Feeds blocks of target audio to the collager, writing output as it is
+    released to sound files or, as raw 32-bit float PCM, to binary streams.
+    """
+    def write(output: np.ndarray) -> None:
+        if output.size:
+            for out in outputs:
+                if isinstance(out, sf.SoundFile):
+                    out.write(output)
+                else:
+                    out.write(output.astype(np.float32).tobytes())
+                    out.flush()
+
+    for block in blocks:
+        write(collager.push(block))
+    write(collager.flush())
+
+    logger.info(
+        f"Made {collager.n_selections} selections with {collager.latency_seconds:.3f}s latency, "
+        f"at most {collager.max_lag_seconds:.3f}s behind real time"
+    )
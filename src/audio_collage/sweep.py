@@ -0,0 +1,274 @@
+import dataclasses
+import itertools
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .audio_dist import AudioDist
+from .audio_segment import AudioSegment
+from .collager import Collager
+from .collager_config import CollagerConfig
+from .features import FrameFeatures, IntegralFeatures
+from .search.brute import BruteForceIndex
+from .search.index import SearchIndex
+from .search.index_collection import AnyIndex, SearchIndexCollection
+from .search.reduction import FeatureReducer
+from .search.sliding import SlidingSearchIndex
+from .shared_arrays import SharedHandle, shared
+from .util import Util
+
+logger = logging.getLogger(__name__)
+
+# (window in ms including declick, step in frames, PCA components, integral mean MFCCs)
+ChopKey = Tuple[int, int, Optional[int], bool]
+# (search mode, window in ms including declick, step in frames, distance function, PCA components, integral mean MFCCs)
+IndexKey = Tuple[str, int, int, str, Optional[int], bool]
+
+@dataclass
+class SweepPlan:
+    """
+    The stages shared between the configs of a sweep: every config maps each
+    of its windows to an index, and indices with the same key are built once
+    from chops that are also cut once.
+    """
+    configs: List[CollagerConfig]
+    index_keys: List[Dict[int, IndexKey]] = field(default_factory=list)
+
+    @property
+    def unique_indices(self) -> List[IndexKey]:
+        return sorted({key for keys in self.index_keys for key in keys.values()}, key=str)
+
+    @property
+    def unique_chops(self) -> List[ChopKey]:
+        return sorted({
+            (window, step_frames, pca, integral)
+            for mode, window, step_frames, _distance_fn, pca, integral in self.unique_indices
+            if mode != CollagerConfig.SearchMode.sliding
+        }, key=str)
+
+def expand_grid(base_config: CollagerConfig, grid: Dict[str, List[Any]]) -> List[CollagerConfig]:
+    """
+    Returns a config for every combination of the parameter values in the grid,
+    with all other parameters taken from the base config.
+    """
+    names = list(grid)
+    base = {
+        f.name: getattr(base_config, f.name)
+        for f in dataclasses.fields(CollagerConfig)
+        if f.name not in names
+    }
+    return [
+        CollagerConfig.from_dict(dict(base, **dict(zip(names, values))))
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+def plan_sweep(configs: List[CollagerConfig], sample_rate: int) -> SweepPlan:
+    """
+    Works out which index each window of each config needs.
+    """
+    plan = SweepPlan(configs)
+    for config in configs:
+        keys: Dict[int, IndexKey] = {}
+        for window in config.windows:
+            window = window + config.declick_ms
+            step_frames = Util.step_frames(
+                window,
+                sample_rate,
+                step_ms=config.step_ms,
+                step_factor=config.step_factor
+            )
+            if config.search_mode == CollagerConfig.SearchMode.sliding:
+                # sliding indices ignore the step and distance function
+                key = (str(config.search_mode), window, 0, '', config.pca_components, False)
+            else:
+                key = (
+                    str(config.search_mode),
+                    window,
+                    step_frames,
+                    str(config.distance_fn),
+                    config.pca_components,
+                    config.integral_mfcc,
+                )
+            keys[window] = key
+        plan.index_keys.append(keys)
+    return plan
+
+class SweepIndexBuilder:
+    """
+    Builds the indices of a sweep plan, memoising the source features, PCA
+    reducers and chops that several indices have in common.
+    """
+    def __init__(self, sample_audio: AudioSegment):
+        self.sample_audio = sample_audio
+        self._source_mfcc: Optional[np.ndarray] = None
+        self._integral_mfcc: Optional[IntegralFeatures] = None
+        self.reducers: Dict[int, FeatureReducer] = {}
+        self._chops: Dict[ChopKey, List[AudioSegment]] = {}
+
+    def build(self, plan: SweepPlan) -> Dict[IndexKey, AnyIndex]:
+        indices: Dict[IndexKey, AnyIndex] = {}
+        for key in plan.unique_indices:
+            indices[key] = self._build_index(plan, key)
+        return indices
+
+    def _build_index(self, plan: SweepPlan, key: IndexKey) -> AnyIndex:
+        mode, window, step_frames, distance_fn, pca, integral = key
+        reducer = self._reducer(pca)
+
+        if mode == CollagerConfig.SearchMode.sliding:
+            index = SlidingSearchIndex(window, reducer=reducer)
+            index.build(self.sample_audio, source_mfcc=self.source_mfcc)
+            return index
+
+        fn = Collager.resolve_distance_fn(CollagerConfig.DistanceFn(distance_fn))
+        search_index: Union[SearchIndex, BruteForceIndex]
+        if mode == CollagerConfig.SearchMode.brute:
+            search_index = BruteForceIndex(window, fn)
+        else:
+            search_index = SearchIndex(window, fn)
+        mean_mfcc = distance_fn == CollagerConfig.DistanceFn.mean_mfcc
+        search_index.build(self._chop(window, step_frames, pca, integral, mean_mfcc))
+        return search_index
+
+    @property
+    def source_mfcc(self) -> np.ndarray:
+        if self._source_mfcc is None:
+            self._source_mfcc = FrameFeatures.mfcc(self.sample_audio)
+        return self._source_mfcc
+
+    def _reducer(self, pca: Optional[int]) -> Optional[FeatureReducer]:
+        if not pca:
+            return None
+        if pca not in self.reducers:
+            self.reducers[pca] = FeatureReducer.load_or_fit(
+                self.sample_audio,
+                pca,
+                source_mfcc=self.source_mfcc
+            )
+        return self.reducers[pca]
+
+    def _chop(
+        self,
+        window: int,
+        step_frames: int,
+        pca: Optional[int],
+        integral: bool,
+        mean_mfcc: bool
+    ) -> List[AudioSegment]:
+        key = (window, step_frames, pca, integral)
+        if key not in self._chops:
+            chops = Util.chop_audio_frames(self.sample_audio, window, step_frames)
+            reducer = self._reducer(pca)
+            if reducer:
+                reducer.reduce(chops)
+            elif integral:
+                if self._integral_mfcc is None:
+                    self._integral_mfcc = IntegralFeatures(self.source_mfcc)
+                self._integral_mfcc.fill_mfcc_means(chops)
+            self._chops[key] = chops
+
+        chops = self._chops[key]
+        if mean_mfcc and not (pca or integral):
+            # Chops shared with other distance functions may not have their means yet
+            FrameFeatures.fill_mfcc_means([chop for chop in chops if chop._mfcc_mean is None and chop._mfcc is None])
+        return chops
+
+def run_sweep(
+    sample_audio: AudioSegment,
+    target_audio: AudioSegment,
+    configs: List[CollagerConfig],
+    outpaths: List[str],
+    max_workers: Optional[int] = None
+) -> SweepPlan:
+    """
+    Creates a collage for every config, sharing chops, features and indices
+    between them, and renders the collages in a pool of worker processes.
+    The workers read one copy of the arrays of the audio and indices, which
+    they inherit when forked and otherwise find in shared memory.
+    """
+    plan = plan_sweep(configs, sample_audio.sample_rate)
+    logger.info(
+        f"Sweeping {len(configs)} configs with {len(plan.unique_indices)} unique indices "
+        f"over {len(plan.unique_chops)} unique chops"
+    )
+
+    builder = SweepIndexBuilder(sample_audio)
+    indices = builder.build(plan)
+    configs = [dataclasses.replace(config, progress_callback=None) for config in configs]
+    jobs = list(zip(configs, plan.index_keys, outpaths))
+
+    if max_workers == 1:
+        _init_sweep_worker(sample_audio, target_audio, indices, builder.reducers)
+        for job in jobs:
+            _render_sweep_config(*job)
+    else:
+        context = None
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        shared_state = (sample_audio, target_audio, indices, builder.reducers)
+        with shared(shared_state, context) as handle, ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_attach_sweep_worker,
+            initargs=(handle,)
+        ) as executor:
+            for future in [executor.submit(_render_sweep_config, *job) for job in jobs]:
+                future.result()
+
+    return plan
+
+_sweep_state: Optional[Dict[str, Any]] = None
+
+def _init_sweep_worker(
+    sample_audio: AudioSegment,
+    target_audio: AudioSegment,
+    indices: Dict[IndexKey, AnyIndex],
+    reducers: Dict[int, FeatureReducer]
+) -> None:
+    global _sweep_state
+    _sweep_state = {
+        'sample_audio': sample_audio,
+        'target_audio': target_audio,
+        'indices': indices,
+        'reducers': reducers,
+        # Target chunks and their features, per kind of search and PCA setting
+        'query_caches': {},
+    }
+
+def _attach_sweep_worker(handle: SharedHandle) -> None:
+    _init_sweep_worker(*handle.load())
+
+def _render_sweep_config(
+    config: CollagerConfig,
+    index_keys: Dict[int, IndexKey],
+    outpath: str
+) -> None:
+    if _sweep_state is None:
+        raise RuntimeError("Sweep worker has not been initialised")
+
+    distance_fn = AudioDist.mean_mfcc_dist
+    if config.search_mode != CollagerConfig.SearchMode.sliding:
+        distance_fn = Collager.resolve_distance_fn(config.distance_fn)
+    collection = SearchIndexCollection(
+        distance_fn,
+        reducer=_sweep_state['reducers'].get(config.pca_components)
+    )
+    for window, key in index_keys.items():
+        collection.indices[window] = _sweep_state['indices'][key]
+    # Sliding search queries the target's frame features, while other modes
+    # query chunks whose features are reduced, so they can't share chunks
+    query_key = (config.search_mode != CollagerConfig.SearchMode.sliding, config.pca_components)
+    collection.query_cache = _sweep_state['query_caches'].setdefault(query_key, {})
+
+    output_audio = Collager.create_collage(
+        target_audio=_sweep_state['target_audio'],
+        sample_audio=_sweep_state['sample_audio'],
+        config=config,
+        indices=collection
+    )
+    output_audio.to_file(outpath)
+    logger.info(f"Saved collage to '{outpath}'")
@@ -0,0 +1,240 @@
+import bisect
+import contextlib
+import contextvars
+import itertools
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Span:
+    """
+    A timed stage of a job, such as loading, chopping or selecting.
+    """
+    name: str
+    # Wall clock time the span started at, in seconds since the epoch
+    start: float
+    seconds: float = 0.
+    # Number of things the stage processed, such as frames or snippets
+    items: Optional[int] = None
+    # High-water mark of the process's resident memory when the span ended
+    peak_rss_bytes: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+# Upper bounds of the buckets values are counted in, as in Prometheus histograms
+HISTOGRAM_BOUNDS = [1, 10, 100, 1000, 10000, 100000, 1000000]
+
+@dataclass
+class Histogram:
+    """
+    The distribution of a value observed many times, such as the distance
+    evaluations of each query, counted in buckets.
+    """
+    bounds: List[float] = field(default_factory=lambda: list(HISTOGRAM_BOUNDS))
+    # Observations in each bucket, the last being those above every bound
+    counts: List[int] = field(default_factory=list)
+    count: int = 0
+    sum: float = 0.
+
+    def __post_init__(self) -> None:
+        if not self.counts:
+            self.counts = [0] * (len(self.bounds) + 1)
+
+    def observe(self, value: float, n: int = 1) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += n
+        self.count += n
+        self.sum += value * n
+
+    def cumulative_counts(self) -> List[int]:
+        return list(itertools.accumulate(self.counts))
+
+class Telemetry:
+    """
+    Records spans and counters of a job, for export as JSON lines or in the
+    Prometheus text format.
+
+    Code reports to the active telemetry through the module's span(),
+    count() and observe() functions, which do nothing when no telemetry is
+    active. Work done in worker processes is not recorded.
+    """
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.histograms: Dict[str, Histogram] = defaultdict(Histogram)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def activate(self) -> Iterator["Telemetry"]:
+        """
+        Makes this the telemetry that span(), count() and observe() report to.
+        """
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    @contextlib.contextmanager
+    def span(self, name: str, items: Optional[int] = None, **attributes: Any) -> Iterator[Span]:
+        """
+        Times the body as a span. Its items can be set on the span yielded.
+        """
+        span = Span(name=name, start=time.time(), items=items, attributes=attributes)
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - started
+            span.peak_rss_bytes = peak_rss_bytes()
+            with self._lock:
+                self.spans.append(span)
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name: str, value: float, n: int = 1) -> None:
+        """
+        Adds n observations of the value to a histogram.
+        """
+        with self._lock:
+            self.histograms[name].observe(value, n)
+
+    def records(self) -> List[Dict[str, Any]]:
+        """
+        Returns a record for each span, counter and histogram, then one for the process.
+        """
+        records: List[Dict[str, Any]] = [{'type': 'span', **asdict(span)} for span in self.spans]
+        records += [
+            {'type': 'counter', 'name': name, 'value': value}
+            for name, value in sorted(self.counters.items())
+        ]
+        records += [
+            {'type': 'histogram', 'name': name, **asdict(histogram)}
+            for name, histogram in sorted(self.histograms.items())
+        ]
+        records.append({'type': 'process', 'peak_rss_bytes': peak_rss_bytes()})
+        return records
+
+    def to_jsonl(self) -> str:
+        return ''.join(json.dumps(record, default=str) + '\n' for record in self.records())
+
+    def to_prometheus(self, prefix: str = 'audio_collage', labels: Optional[Dict[str, str]] = None) -> str:
+        """
+        Returns spans, summed by name, counters and histograms in the Prometheus text format.
+        """
+        labels = labels or {}
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Any]) -> None:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for sample_labels, value in samples:
+                lines.append(f"{prefix}_{name}{_labels({**labels, **sample_labels})} {value}")
+
+        totals: Dict[str, List[float]] = defaultdict(lambda: [0, 0., 0])
+        for span in self.spans:
+            total = totals[span.name]
+            total[0] += 1
+            total[1] += span.seconds
+            total[2] += span.items or 0
+        names = sorted(totals)
+        metric('span_count', 'counter', 'Number of times each stage ran.',
+               [({'span': name}, totals[name][0]) for name in names])
+        metric('span_seconds_total', 'counter', 'Time spent in each stage.',
+               [({'span': name}, totals[name][1]) for name in names])
+        metric('span_items_total', 'counter', 'Items processed by each stage.',
+               [({'span': name}, totals[name][2]) for name in names])
+        for name, value in sorted(self.counters.items()):
+            metric(f"{_metric_name(name)}_total", 'counter', f"Total {name.replace('_', ' ')}.", [({}, value)])
+        for name, histogram in sorted(self.histograms.items()):
+            name = _metric_name(name)
+            lines.append(f"# HELP {prefix}_{name} Distribution of {name.replace('_', ' ')}.")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            bounds = [str(bound) for bound in histogram.bounds] + ['+Inf']
+            for bound, count in zip(bounds, histogram.cumulative_counts()):
+                lines.append(f"{prefix}_{name}_bucket{_labels({**labels, 'le': bound})} {count}")
+            lines.append(f"{prefix}_{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{prefix}_{name}_count{_labels(labels)} {histogram.count}")
+        rss = peak_rss_bytes()
+        if rss is not None:
+            metric('peak_rss_bytes', 'gauge', 'Peak resident memory of the process.', [({}, rss)])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str, labels: Optional[Dict[str, str]] = None) -> None:
+        """
+        Writes the telemetry to a file, in the Prometheus text format if its
+        name ends in .prom and as JSON lines otherwise.
+        """
+        with open(path, 'w') as f:
+            if path.endswith('.prom'):
+                f.write(self.to_prometheus(labels=labels))
+            else:
+                f.write(self.to_jsonl())
+        logger.info(f"Saved telemetry to '{path}'")
+
+_active: contextvars.ContextVar[Optional[Telemetry]] = contextvars.ContextVar('telemetry', default=None)
+
+def active() -> Optional[Telemetry]:
+    return _active.get()
+
+@contextlib.contextmanager
+def span(name: str, items: Optional[int] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Times the body as a span of the active telemetry, if any.
+    """
+    telemetry = _active.get()
+    if telemetry is None:
+        yield Span(name=name, start=0., items=items, attributes=attributes)
+        return
+    with telemetry.span(name, items=items, **attributes) as current:
+        yield current
+
+def count(name: str, value: float = 1) -> None:
+    """
+    Adds to a counter of the active telemetry, if any.
+    """
+    telemetry = _active.get()
+    if telemetry is not None:
+        telemetry.count(name, value)
+
+def observe(name: str, value: float, n: int = 1) -> None:
+    """
+    Adds n observations of the value to a histogram of the active telemetry, if any.
+    """
+    telemetry = _active.get()
+    if telemetry is not None:
+        telemetry.observe(name, value, n)
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and kilobytes elsewhere
+    return int(peak if sys.platform == 'darwin' else peak * 1024)
+
+def _metric_name(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{_metric_name(key)}="{value}"')
+    return '{' + ','.join(pairs) + '}'
@@ -4,6 +4,7 @@ from typing import Callable, List, Optional
 
 from .audio_segment import AudioSegment
 from .collage_progress_state import CollageProgressState
+from . import telemetry
 
 class Util:
     class SampleRateMismatchError(Exception):
@@ -20,19 +21,31 @@ class Util:
         if step_ms is not None and step_factor is not None:
             raise ValueError("Cannot specify both step_ms and step_factor")
 
+        # TODO: warn if step_ms is too small or too largmport pdb; pdb.set_trace()  e
+        step_frames: int = Util.step_frames(
+            window_size_ms,
+            audio_segment.sample_rate,
+            step_ms=step_ms,
+            step_factor=step_factor
+        )
+        return Util.chop_audio_frames(audio_segment, window_size_ms, step_frames, progress_callback)
+
+    @staticmethod
+    def chop_audio_frames(
+        audio_segment: AudioSegment,
+        window_size_ms: int,
+        step_frames: int,
+        progress_callback: Optional[Callable] = None
+    ) -> List[AudioSegment]:
+        """
+        Chops audio into windows whose starts are step_frames apart.
+        """
+        if step_frames <= 0:
+            raise ValueError("Step must be at least one frame")
         timeseries: np.ndarray = audio_segment.timeseries
         sample_rate: int = audio_segment.sample_rate
-
         window_size_frames: int = int((window_size_ms / 1000) * sample_rate)
 
-        if step_factor:
-            step_ms = int(window_size_ms * step_factor)
-        # TODO: warn if step_ms is too small or too largmport pdb; pdb.set_trace()  e
-        if step_ms is None:
-            step_frames = window_size_frames
-        else:
-            step_frames = int((step_ms / 1000) * sample_rate)
-
         if progress_callback:
             state = CollageProgressState(
                 CollageProgressState.Task.CHOPPING,
@@ -43,27 +56,29 @@ class Util:
             )
             progress_callback(state)
 
-        slices: List[AudioSegment] = []
-        start_pointer, end_pointer = 0, window_size_frames
-        while start_pointer < timeseries.size:
-            slice_ts = timeseries[start_pointer:end_pointer]
-            slices.append(AudioSegment(
-                slice_ts,
-                sample_rate,
-                offset_frames=start_pointer
-            ))
-            start_pointer += step_frames
-            end_pointer += step_frames
-
-            if progress_callback:
-                state = CollageProgressState(
-                    CollageProgressState.Task.CHOPPING,
-                    current_step=start_pointer,
-                )
-                progress_callback(state)
-
-            if end_pointer > timeseries.size:
-                break
+        with telemetry.span('chop', window=window_size_ms) as chop_span:
+            slices: List[AudioSegment] = []
+            start_pointer, end_pointer = 0, window_size_frames
+            while start_pointer < timeseries.size:
+                slice_ts = timeseries[start_pointer:end_pointer]
+                slices.append(AudioSegment(
+                    slice_ts,
+                    sample_rate,
+                    offset_frames=start_pointer
+                ))
+                start_pointer += step_frames
+                end_pointer += step_frames
+
+                if progress_callback:
+                    state = CollageProgressState(
+                        CollageProgressState.Task.CHOPPING,
+                        current_step=start_pointer,
+                    )
+                    progress_callback(state)
+
+                if end_pointer > timeseries.size:
+                    break
+            chop_span.items = len(slices)
 
         if progress_callback:
             state = CollageProgressState(
@@ -74,6 +89,22 @@ class Util:
             progress_callback(state)
         return slices
 
+    @staticmethod
+    def step_frames(
+        window_size_ms: int,
+        sample_rate: int,
+        step_ms: Optional[int] = None,
+        step_factor: Optional[float] = None
+    ) -> int:
+        """
+        Returns the number of frames between the starts of consecutive chops.
+        """
+        if step_factor:
+            step_ms = int(window_size_ms * step_factor)
+        if step_ms is None:
+            return int((window_size_ms / 1000) * sample_rate)
+        return int((step_ms / 1000) * sample_rate)
+
     @staticmethod
     def concatenate_audio(
         audio_list: List[AudioSegment],
@@ -97,42 +128,51 @@ class Util:
             )
             progress_callback(state)
 
-        for i, snippet in enumerate(audio_list):
-            if snippet.sample_rate != sample_rate:
-                # TODO: maybe we can resample the snippets to the same sample rate?
-                raise Util.SampleRateMismatchError(f"Sample rates must match. Got {snippet.sample_rate} and {sample_rate}")
-
-            snippet_ts = snippet.timeseries
-
-            if declick_ms and len(output_timeseries):
-                overlap_frames = int((declick_ms * snippet.sample_rate) / 1000)
-                # Apply fade out to the end of the previous snippet
-                output_timeseries = Util.declick_out(
-                    output_timeseries,
-                    n_frames=overlap_frames,
-                    declick_type=declick_fn
-                )
-                # Apply fade in to the start of the current snippet
-                snippet_ts = Util.declick_in(
-                    snippet_ts,
-                    n_frames=overlap_frames,
-                    declick_type=declick_fn
-                )
-                # mix start of current snippet with end of the previous
-                output_timeseries[-overlap_frames:] += snippet_ts[:overlap_frames]
-                # Concatenate the rest of the snippet
-                output_timeseries = np.concatenate(
-                    [output_timeseries, snippet_ts[overlap_frames:]]
-                )
-            else:
-                 output_timeseries = np.concatenate([output_timeseries, snippet_ts])
-
-            if progress_callback is not None:
-                state = CollageProgressState(
-                    CollageProgressState.Task.CONCATENATING,
-                    current_step=i,
-                )
-                progress_callback(state)
+        with telemetry.span('render', items=len(audio_list)):
+            for i, snippet in enumerate(audio_list):
+                if snippet.sample_rate != sample_rate:
+                    # TODO: maybe we can resample the snippets to the same sample rate?
+                    raise Util.SampleRateMismatchError(f"Sample rates must match. Got {snippet.sample_rate} and {sample_rate}")
+
+                snippet_ts = snippet.timeseries
+
+                overlap_frames = 0
+                if declick_ms and len(output_timeseries):
+                    overlap_frames = int((declick_ms * snippet.sample_rate) / 1000)
+                    # Short snippets, such as those cut at partition boundaries,
+                    # overlap by no more than their own length
+                    overlap_frames = min(overlap_frames, snippet_ts.size, output_timeseries.size)
+
+                # A slice from -0 would cover the whole output, so snippets
+                # without any overlap are only concatenated
+                if overlap_frames > 0:
+                    # Apply fade out to the end of the previous snippet
+                    output_timeseries = Util.declick_out(
+                        output_timeseries,
+                        n_frames=overlap_frames,
+                        declick_type=declick_fn
+                    )
+                    # Apply fade in to the start of the current snippet
+                    snippet_ts = Util.declick_in(
+                        snippet_ts,
+                        n_frames=overlap_frames,
+                        declick_type=declick_fn
+                    )
+                    # mix start of current snippet with end of the previous
+                    output_timeseries[-overlap_frames:] += snippet_ts[:overlap_frames]
+                    # Concatenate the rest of the snippet
+                    output_timeseries = np.concatenate(
+                        [output_timeseries, snippet_ts[overlap_frames:]]
+                    )
+                else:
+                     output_timeseries = np.concatenate([output_timeseries, snippet_ts])
+
+                if progress_callback is not None:
+                    state = CollageProgressState(
+                        CollageProgressState.Task.CONCATENATING,
+                        current_step=i,
+                    )
+                    progress_callback(state)
 
         if progress_callback is not None:
             state = CollageProgressState(
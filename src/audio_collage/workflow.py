@@ -1,10 +1,31 @@
+import dataclasses
+import json
 import logging
+import multiprocessing
 import os
-from typing import Callable, List, Optional
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import soundfile as sf
 
 from .collager import Collager
 from .collager_config import CollagerConfig
 from .audio_segment import AudioSegment
+from .cache_manager import CacheManager, default_cache, using_cache
+from .benchmark.backends import compare_backends
+from .benchmark.recall import RecallResult, evaluate_recall
+from .job_queue import DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, JobQueue, QueueWorker
+from .library import SampleLibrary
+from .pcm_cache import PCMCache
+from .plan import SelectionPlan
+from .result_cache import ResultCache
+from .search.index_collection import SearchIndexCollection
+from .shared_arrays import SharedHandle, shared
+from .streaming import StreamingCollager, read_raw_blocks, read_wav_blocks, run_stream
+from .sweep import expand_grid, run_sweep
+from . import telemetry
 from .util import Util
 
 logger = logging.getLogger(__name__)
@@ -13,21 +34,505 @@ def create_collage_from_files(config: CollagerConfig) -> None:
     """
     Orchestrates creating a collage from file paths.
     """
+    job = CollageJob(config)
+    if not job.copy_cached():
+        sample_audio, target_audio = job.load()
+        job.save(job.collage(sample_audio, target_audio))
+    logger.info("Done!")
+
+class CollageJob:
+    """
+    The steps of creating a collage from the files in a config: reusing a
+    cached result, loading the audio, collaging it and saving the collage.
+    create_collage_from_files runs them in turn, and AsyncCollager runs them
+    in its executor, so that both apply every part of the config alike.
+    """
+    def __init__(self, config: CollagerConfig):
+        self.config = config
+        self.result_cache: Optional[ResultCache] = None
+        if config.result_cache_dir:
+            self.result_cache = ResultCache(config.result_cache_dir)
+        self._key: Optional[str] = None
+        self._cached_audio: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        # Hashing the input files is slow, so the key is computed once
+        if self._key is None:
+            if self.result_cache is None:
+                raise ValueError("Jobs without a result cache have no key")
+            self._key = self.result_cache.key(self.config)
+        return self._key
+
+    def copy_cached(self) -> bool:
+        """
+        Copies the cached collage of the same job to the outpath, returning
+        True if there was one. Jobs saving a plan are run to save it.
+        """
+        if self.result_cache is None:
+            return False
+        self._cached_audio = self.result_cache.get_audio_path(self.key)
+        if self._cached_audio:
+            telemetry.count('result_cache_hits')
+        if self._cached_audio and not self.config.plan_outpath:
+            logger.info(f"Copying cached collage to '{self.config.outpath}'")
+            shutil.copyfile(self._cached_audio, self.config.outpath)
+            return True
+        return False
+
+    def load(self) -> Tuple[AudioSegment, AudioSegment]:
+        """
+        Returns the sample and target audio.
+        """
+        config = self.config
+        if config.pcm_cache_dir:
+            logger.info(f"Loading sample and target audio via cache '{config.pcm_cache_dir}'")
+            sample_audio, target_audio = PCMCache(config.pcm_cache_dir).load_many(
+                [config.sample_file, config.target_file]
+            )
+            return sample_audio, target_audio
+
+        logger.info(f"Loading sample audio from '{config.sample_file}'")
+        sample_audio = AudioSegment.from_file(config.sample_file)
+
+        logger.info(f"Loading target audio from '{config.target_file}'")
+        target_audio = AudioSegment.from_file(config.target_file)
+        return sample_audio, target_audio
+
+    def collage(self, sample_audio: AudioSegment, target_audio: AudioSegment) -> AudioSegment:
+        """
+        Returns the collage, saving its plan and storing it in the result
+        cache if the config asks for them.
+        """
+        config = self.config
+        if not (config.plan_outpath or self.result_cache):
+            return Collager.create_collage(
+                target_audio=target_audio,
+                sample_audio=sample_audio,
+                config=config
+            )
+
+        plan = self.result_cache.get_plan(self.key) if self.result_cache else None
+        cached_plan = plan is not None
+        if self.result_cache and not self._cached_audio:
+            # A job with cached audio was counted as a hit when it looked the audio up
+            telemetry.count('result_cache_hits' if cached_plan else 'result_cache_misses')
+        if plan is None:
+            previous_plan = None
+            if config.incremental and config.plan_outpath and os.path.exists(config.plan_outpath):
+                logger.info(f"Updating selection plan '{config.plan_outpath}'")
+                previous_plan = SelectionPlan.from_file(config.plan_outpath)
+            plan = Collager.create_plan(
+                target_audio=target_audio,
+                sample_audio=sample_audio,
+                config=config,
+                previous_plan=previous_plan
+            )
+        if config.plan_outpath:
+            logger.info(f"Saving selection plan to '{config.plan_outpath}'")
+            plan.to_file(config.plan_outpath)
+        output_audio = Collager.render(
+            plan,
+            sample_audio,
+            declick_fn=config.declick_fn,
+            declick_ms=config.declick_ms,
+            progress_callback=config.progress_callback
+        )
+        if self.result_cache and not (cached_plan and self._cached_audio):
+            self.result_cache.put(self.key, plan, output_audio)
+        return output_audio
+
+    def save(self, output_audio: AudioSegment) -> None:
+        logger.info(f"Saving collage to '{self.config.outpath}'")
+        output_audio.to_file(self.config.outpath)
+
+def render_from_files(
+    plan_path: str,
+    outpath: str,
+    sample_file: Optional[str] = None,
+    declick_fn: Optional[CollagerConfig.DeclickFn] = CollagerConfig.DeclickFn.sigmoid,
+    declick_ms: int = 0,
+    sample_rate: Optional[int] = None,
+    pcm_cache_dir: Optional[str] = None
+) -> None:
+    """
+    Renders a saved selection plan to an audio file, without searching again.
+    The sample is read from the path recorded in the plan unless one is given.
+    """
+    plan = SelectionPlan.from_file(plan_path)
+    sample_file = sample_file or plan.sources[0]
+
+    logger.info(f"Loading sample audio from '{sample_file}'")
+    if pcm_cache_dir:
+        sample_audio = PCMCache(pcm_cache_dir, sample_rate=plan.sample_rate).load(sample_file)
+    else:
+        sample_audio = AudioSegment.from_file(sample_file)
+
+    output_audio = Collager.render(
+        plan,
+        sample_audio,
+        declick_fn=declick_fn,
+        declick_ms=declick_ms,
+        sample_rate=sample_rate
+    )
+    logger.info(f"Saving collage to '{outpath}'")
+    output_audio.to_file(outpath)
+    logger.info("Done!")
+
+def stream_from_files(
+    config: CollagerConfig,
+    input_path: str,
+    outpath: str,
+    block_ms: int = 50
+) -> None:
+    """
+    Collages a target as it streams in, writing output blocks as soon as they
+    are selected. An input or output path of '-' reads or writes raw mono
+    32-bit float PCM at the sample's sample rate on stdin or stdout.
+    """
     logger.info(f"Loading sample audio from '{config.sample_file}'")
-    sample_audio: AudioSegment = AudioSegment.from_file(config.sample_file)
-    
-    logger.info(f"Loading target audio from '{config.target_file}'")
-    target_audio: AudioSegment = AudioSegment.from_file(config.target_file)
+    sample_audio = _load_audio(config.sample_file, config)
+    indices = Collager.build_indices(sample_audio, config)
+
+    collager = StreamingCollager(sample_audio, indices, config)
+    sample_rate = sample_audio.sample_rate
+    block_frames = max(1, int((block_ms / 1000) * sample_rate))
+    logger.info(f"Streaming with {collager.latency_seconds:.3f}s latency")
 
-    output_audio: AudioSegment = Collager.create_collage(
+    if input_path == '-':
+        blocks = read_raw_blocks(sys.stdin.buffer, block_frames)
+    else:
+        blocks = read_wav_blocks(input_path, block_frames, sample_rate)
+
+    if outpath == '-':
+        run_stream(collager, blocks, [sys.stdout.buffer])
+    else:
+        with sf.SoundFile(outpath, 'w', samplerate=sample_rate, channels=1) as out:
+            run_stream(collager, blocks, [out])
+    logger.info("Done!")
+
+def create_collages_from_files(
+    config: CollagerConfig,
+    targets: List[Tuple[str, str]],
+    max_workers: Optional[int] = None
+) -> None:
+    """
+    Creates a collage for each of several targets from one sample file.
+
+    The sample is loaded, chopped and indexed once, and the targets are then
+    collaged in a pool of worker processes that share the indices. Workers
+    read one copy of the arrays of the sample and its indices, which they
+    inherit when forked and otherwise find in shared memory, rather than each
+    holding their own.
+
+    Args:
+        config (CollagerConfig): Collage parameters, including the sample file.
+            Its target file and outpath are ignored.
+        targets (List[Tuple[str, str]]): Pairs of target file and output path.
+        max_workers (int, optional): Number of worker processes. Targets are
+            collaged in this process if 1. Defaults to the number of CPUs.
+
+    Raises:
+        ValueError: If several targets would be written to the same path.
+    """
+    check_batch_outpaths(targets)
+    _make_output_dirs([outpath for _target_file, outpath in targets])
+
+    logger.info(f"Loading sample audio from '{config.sample_file}'")
+    sample_audio = _load_audio(config.sample_file, config)
+
+    logger.info(f"Indexing sample audio for {len(targets)} targets")
+    indices = Collager.build_indices(sample_audio, config)
+    # Progress callbacks can't be shared with worker processes
+    config = dataclasses.replace(config, progress_callback=None)
+
+    if max_workers == 1:
+        _init_batch_worker(sample_audio, indices, config)
+        for target_file, outpath in targets:
+            _collage_batch_target(target_file, outpath)
+    else:
+        context = None
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        with shared((sample_audio, indices), context) as handle, ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_attach_batch_worker,
+            initargs=(handle, config)
+        ) as executor:
+            futures = [
+                executor.submit(_collage_batch_target, target_file, outpath)
+                for target_file, outpath in targets
+            ]
+            for future in futures:
+                future.result()
+
+    logger.info("Done!")
+
+def sweep_from_files(
+    config: CollagerConfig,
+    grid: Dict[str, List[Any]],
+    outdir: str,
+    max_workers: Optional[int] = None
+) -> None:
+    """
+    Creates a collage for every combination of parameters in the grid, sharing
+    chopping, features and indices between them. Collages are written to the
+    output directory along with a sweep.json file listing the parameters of each.
+
+    Args:
+        config (CollagerConfig): The parameters shared by every collage.
+        grid (Dict[str, List[Any]]): Values to sweep over for each varied parameter.
+        outdir (str): Directory to write the collages to.
+        max_workers (int, optional): Number of worker processes rendering collages.
+    """
+    configs = expand_grid(config, grid)
+    outpaths = [os.path.join(outdir, f"sweep.{i:04}.wav") for i in range(len(configs))]
+
+    logger.info("Loading sample and target audio")
+    sample_audio = _load_audio(config.sample_file, config)
+    target_audio = _load_audio(config.target_file, config)
+
+    os.makedirs(outdir, exist_ok=True)
+    run_sweep(sample_audio, target_audio, configs, outpaths, max_workers=max_workers)
+
+    results = []
+    for outpath, swept in zip(outpaths, configs):
+        params = {name: getattr(swept, name) for name in grid}
+        results.append({'outpath': outpath, 'params': params})
+    with open(os.path.join(outdir, 'sweep.json'), 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    logger.info("Done!")
+
+def compare_backends_from_files(
+    config: CollagerConfig,
+    search_modes: List[CollagerConfig.SearchMode],
+    n_queries: int = 50,
+    outpath: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Compares the search modes on the config's sample and target files, logging
+    the distance evaluations and timings of each and optionally saving them
+    to a JSON file.
+    """
+    logger.info("Loading sample and target audio")
+    sample_audio = _load_audio(config.sample_file, config)
+    target_audio = _load_audio(config.target_file, config)
+
+    rows = compare_backends(sample_audio, target_audio, config, search_modes, n_queries=n_queries)
+    for row in rows:
+        logger.info(
+            f"{row['search_mode']} {row['window']}ms: "
+            f"build {row['build_evaluations']} evaluations in {row['mode_build_seconds']:.3f}s, "
+            f"{row['evaluations_per_query']:.1f} evaluations per query ({row['pruning_ratio']:.1%} of the index), "
+            f"{row['queries_per_second']:.1f} queries/s"
+        )
+    if outpath:
+        with open(outpath, 'w') as f:
+            json.dump(rows, f, indent=2)
+        logger.info(f"Saved comparison to '{outpath}'")
+    return rows
+
+def recall_from_files(
+    config: CollagerConfig,
+    grid: Optional[Dict[str, List[Any]]] = None,
+    n_queries: int = 50,
+    k: int = 10,
+    outpath: Optional[str] = None
+) -> List[RecallResult]:
+    """
+    Measures the recall and speed of each search configuration in the grid on
+    the config's sample and target files, optionally saving the results to a
+    JSON file.
+    """
+    logger.info("Loading sample and target audio")
+    sample_audio = _load_audio(config.sample_file, config)
+    target_audio = _load_audio(config.target_file, config)
+
+    results = evaluate_recall(sample_audio, target_audio, config, grid, n_queries=n_queries, k=k)
+    if outpath:
+        with open(outpath, 'w') as f:
+            json.dump([result.to_dict() for result in results], f, indent=2)
+        logger.info(f"Saved results to '{outpath}'")
+    return results
+
+def warm_cache_from_files(config: CollagerConfig, sample_files: List[str]) -> None:
+    """
+    Builds the indices of each sample file with the config, so that later
+    jobs load them from the cache instead of building them.
+    """
+    cache = default_cache()
+    for sample_file in sample_files:
+        logger.info(f"Indexing '{sample_file}'")
+        sample_audio = _load_audio(sample_file, config)
+        Collager.build_indices(sample_audio, config)
+    logger.info(f"Cache holds {cache.stats().nbytes / 1024 / 1024:.1f}MB")
+
+def submit_collages_to_queue(
+    config: CollagerConfig,
+    targets: List[Tuple[str, str]],
+    queue_dir: str
+) -> List[str]:
+    """
+    Adds a collage job for each target to a queue, for workers to run with
+    run_queue_workers. Paths are made absolute, so that workers on other
+    machines find the files where the queue's filesystem is mounted at the
+    same path.
+
+    Returns:
+        List[str]: IDs of the submitted jobs.
+
+    Raises:
+        ValueError: If several targets would be written to the same path.
+    """
+    check_batch_outpaths(targets)
+    _make_output_dirs([outpath for _target_file, outpath in targets])
+    queue = JobQueue(queue_dir)
+    config = dataclasses.replace(
+        config,
+        sample_file=os.path.abspath(config.sample_file),
+        progress_callback=None
+    )
+    job_ids = [
+        queue.submit(dataclasses.replace(
+            config,
+            target_file=os.path.abspath(target_file),
+            outpath=os.path.abspath(outpath)
+        ))
+        for target_file, outpath in targets
+    ]
+    logger.info(f"Submitted {len(job_ids)} jobs to '{queue_dir}'")
+    return job_ids
+
+def run_queue_workers(
+    queue_dir: str,
+    processes: int = 1,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    max_jobs: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    max_bytes: Optional[int] = None
+) -> int:
+    """
+    Runs workers that drain a job queue, in this process if processes is 1
+    and otherwise in a pool of worker processes. Workers on other machines
+    can drain the same queue at once.
+
+    Indices and feature reducers are shared through the cache, which should
+    be on the shared filesystem too, so that each is built only once. The
+    cache directory and budget default to those of the default cache, and
+    each worker process installs the cache itself, as spawned processes do
+    not inherit the default.
+
+    Returns:
+        int: The number of jobs completed.
+    """
+    cache = default_cache()
+    cache_dir = cache_dir or cache.cache_dir
+    max_bytes = max_bytes if max_bytes is not None else cache.max_bytes
+    logger.info(f"Draining queue '{queue_dir}' with the cache at '{cache_dir}'")
+    if processes == 1:
+        return _run_queue_worker(queue_dir, lease_seconds, max_attempts, max_jobs, cache_dir, max_bytes)
+
+    context = None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = [
+            executor.submit(
+                _run_queue_worker, queue_dir, lease_seconds, max_attempts, max_jobs, cache_dir, max_bytes
+            )
+            for _ in range(processes)
+        ]
+        return sum(future.result() for future in futures)
+
+def _run_queue_worker(
+    queue_dir: str,
+    lease_seconds: float,
+    max_attempts: int,
+    max_jobs: Optional[int],
+    cache_dir: str,
+    max_bytes: int
+) -> int:
+    queue = JobQueue(queue_dir, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    with using_cache(CacheManager(cache_dir, max_bytes=max_bytes)):
+        return QueueWorker(queue).run(max_jobs=max_jobs)
+
+def read_batch_manifest(manifest_path: str, outdir: str) -> List[Tuple[str, str]]:
+    """
+    Reads a batch manifest with one target file per line, optionally followed
+    by a comma and an output path. Targets without an output path are written
+    to the output directory under their own file name.
+    """
+    targets: List[Tuple[str, str]] = []
+    with open(manifest_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            target_file, _, outpath = (part.strip() for part in line.partition(','))
+            targets.append((target_file, outpath or batch_outpath(target_file, outdir)))
+    return targets
+
+def batch_outpath(target_file: str, outdir: str) -> str:
+    return os.path.join(outdir, os.path.basename(target_file))
+
+def check_batch_outpaths(targets: List[Tuple[str, str]]) -> None:
+    """
+    Raises ValueError if several targets would be written to the same output
+    path, such as targets of the same name in different directories written
+    to one output directory, since each collage would overwrite the last.
+    """
+    targets_by_outpath: Dict[str, str] = {}
+    for target_file, outpath in targets:
+        key = os.path.normcase(os.path.abspath(outpath))
+        if key in targets_by_outpath:
+            raise ValueError(
+                f"Targets '{targets_by_outpath[key]}' and '{target_file}' would both be written to '{outpath}'. "
+                "Give them output paths in a manifest."
+            )
+        targets_by_outpath[key] = target_file
+
+def _make_output_dirs(outpaths: List[str]) -> None:
+    for outdir in sorted({os.path.dirname(outpath) for outpath in outpaths}):
+        if outdir:
+            os.makedirs(outdir, exist_ok=True)
+
+_batch_state: Optional[Tuple[AudioSegment, SearchIndexCollection, CollagerConfig]] = None
+
+def _init_batch_worker(
+    sample_audio: AudioSegment,
+    indices: SearchIndexCollection,
+    config: CollagerConfig
+) -> None:
+    global _batch_state
+    _batch_state = (sample_audio, indices, config)
+
+def _attach_batch_worker(handle: SharedHandle, config: CollagerConfig) -> None:
+    sample_audio, indices = handle.load()
+    _init_batch_worker(sample_audio, indices, config)
+
+def _collage_batch_target(target_file: str, outpath: str) -> None:
+    if _batch_state is None:
+        raise RuntimeError("Batch worker has not been initialised")
+    sample_audio, indices, config = _batch_state
+    config = dataclasses.replace(config, target_file=target_file, outpath=outpath)
+
+    logger.info(f"Collaging '{target_file}'")
+    target_audio = _load_audio(target_file, config)
+    output_audio = Collager.create_collage(
         target_audio=target_audio,
         sample_audio=sample_audio,
-        config=config
+        config=config,
+        indices=indices
     )
-    
-    logger.info(f"Saving collage to '{config.outpath}'")
-    output_audio.to_file(config.outpath)
-    logger.info("Done!")
+    output_audio.to_file(outpath)
+    logger.info(f"Saved collage to '{outpath}'")
+
+def _load_audio(path: str, config: CollagerConfig) -> AudioSegment:
+    if config.pcm_cache_dir:
+        return PCMCache(config.pcm_cache_dir).load(path)
+    return AudioSegment.from_file(path)
 
 def chop_and_write_from_file(
     input_filepath: str,
@@ -58,3 +563,41 @@ def chop_and_write_from_file(
         audio_slice.to_file(outfile_path)
  
     logger.info("Done!")
+
+def ingest_sample_file(
+    sample_file: str,
+    library_path: str,
+    windows: List[int],
+    step_ms: Optional[int] = None,
+    step_factor: Optional[float] = None,
+    declick_ms: int = 0
+) -> None:
+    """
+    Chops a file for each window size and stores the chops in a sample library.
+
+    Collaging chops the sample into each window extended by the declick
+    interval, so the windows are extended by declick_ms here too, and
+    collages with the same declick interval find the chops in the library.
+    """
+    logger.info(f"Loading sample audio from '{sample_file}'")
+    sample_audio: AudioSegment = AudioSegment.from_file(sample_file)
+
+    library = SampleLibrary(library_path)
+    for window in [window + declick_ms for window in windows]:
+        step_frames = Util.step_frames(
+            window,
+            sample_audio.sample_rate,
+            step_ms=step_ms,
+            step_factor=step_factor
+        )
+        slices: List[AudioSegment] = Util.chop_audio(
+            sample_audio,
+            window,
+            step_ms=step_ms,
+            step_factor=step_factor
+        )
+        logger.info(f"Ingesting {len(slices)} {window}ms snippets into '{library_path}'")
+        library.ingest(sample_audio, window, step_frames, slices)
+    library.close()
+
+    logger.info("Done!")
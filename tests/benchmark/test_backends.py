@@ -0,0 +1,46 @@
+import os
+
+from audio_collage.cache_manager import CacheManager, using_cache
+from audio_collage.benchmark.backends import compare_backends, query_offsets
+from audio_collage.benchmark.corpus import synthetic_audio
+from audio_collage.collager_config import CollagerConfig
+
+def test_query_offsets():
+    """
+    Test that query offsets are spread evenly over the target.
+    """
+    target = synthetic_audio(1., sample_rate=1000)
+
+    assert query_offsets(target, 4) == [0, 250, 500, 750]
+
+def test_compare_backends(tmp_path, monkeypatch):
+    """
+    Test that each mode and window is compared, with the brute force backend
+    evaluating every chop and the VP-tree fewer, and nothing left in the cache
+    or the working directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    cache = CacheManager(str(tmp_path / 'cache'))
+    sample = synthetic_audio(2., seed=1)
+    target = synthetic_audio(1., seed=2)
+    config = CollagerConfig(windows=[200, 100], distance_fn=CollagerConfig.DistanceFn.fast_mfcc, step_factor=0.5)
+
+    with using_cache(cache):
+        rows = compare_backends(sample, target, config, n_queries=5)
+
+    assert {(row['search_mode'], row['window']) for row in rows} == {
+        (str(mode), window) for mode in CollagerConfig.SearchMode for window in [200, 100]
+    }
+    for row in rows:
+        assert row['queries'] == 5
+        assert row['mean_distance'] is not None
+    brute = {row['window']: row for row in rows if row['search_mode'] == 'brute'}
+    tree = {row['window']: row for row in rows if row['search_mode'] == 'index'}
+    for window in [200, 100]:
+        assert brute[window]['pruning_ratio'] == 1.
+        assert tree[window]['size'] == brute[window]['size']
+        assert tree[window]['query_evaluations'] <= brute[window]['query_evaluations']
+        # Both search every chop exactly, so find equally close matches
+        assert abs(tree[window]['mean_distance'] - brute[window]['mean_distance']) < 1e-6
+    assert cache.stats().n_entries == 0
+    assert os.listdir(tmp_path) in ([], ['cache'])
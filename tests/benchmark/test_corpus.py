@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from audio_collage.benchmark.corpus import SAMPLE_RATE, corpus, synthetic_audio
+
+def test_synthetic_audio_is_deterministic():
+    """
+    Test that the same seed gives the same audio, and other seeds other audio.
+    """
+    a = synthetic_audio(1.5, seed=3)
+    b = synthetic_audio(1.5, seed=3)
+    c = synthetic_audio(1.5, seed=4)
+
+    assert a.n_samples() == int(1.5 * SAMPLE_RATE)
+    np.testing.assert_array_equal(a.timeseries, b.timeseries)
+    assert not np.array_equal(a.timeseries, c.timeseries)
+    assert np.abs(a.timeseries).max() <= 1
+
+def test_corpus_rejects_unknown_size():
+    """
+    Test that corpus sizes are checked.
+    """
+    assert corpus('tiny').n_samples() == 2 * SAMPLE_RATE
+    with pytest.raises(ValueError):
+        corpus('huge')
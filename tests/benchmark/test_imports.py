@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from audio_collage.benchmark.imports import HEAVY_MODULES, ImportProfile, check_import_budget, profile_import
+
+def test_profile_import():
+    """
+    Test that import times are parsed for the module and its imports.
+    """
+    profile = profile_import('audio_collage.collager_config')
+
+    assert profile.module == 'audio_collage.collager_config'
+    assert profile.seconds > 0
+    assert 'strenum' in profile.modules
+    assert profile.seconds >= profile.modules['strenum']
+
+def test_heavy_modules():
+    """
+    Test that heavy dependencies are found by their top-level package.
+    """
+    profile = ImportProfile(module='m', seconds=1., modules={'numpy': 0.1, 'scipy.stats': 0.5, 'librosa': 0.9})
+
+    assert profile.heavy_modules() == ['librosa', 'scipy']
+    assert set(HEAVY_MODULES) >= {'librosa', 'numba', 'sklearn', 'dtw', 'vptree'}
+
+def test_cli_imports_no_heavy_modules():
+    """
+    Test that the CLI imports no heavy dependencies.
+    """
+    assert profile_import('audio_collage.cli').heavy_modules() == []
+
+# Import times depend on the machine and its load, so the budget is only
+# checked where asked for, such as on a quiet benchmarking machine
+@pytest.mark.skipif(not os.getenv('AUDIO_COLLAGE_TIME_IMPORTS'), reason="Set AUDIO_COLLAGE_TIME_IMPORTS to check the import time budget")
+def test_cli_import_budget():
+    """
+    Test that the CLI imports no heavy dependencies and stays within its
+    import time budget.
+    """
+    assert check_import_budget('audio_collage.cli') == []
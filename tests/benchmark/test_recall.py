@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.benchmark.corpus import synthetic_audio
+from audio_collage.benchmark.recall import GroundTruth, RecallResult, evaluate_recall
+from audio_collage.collager_config import CollagerConfig
+
+def _abs_dist(a: AudioSegment, b: AudioSegment) -> float:
+    return float(abs(a.timeseries[0] - b.timeseries[0]))
+
+def test_ground_truth():
+    """
+    Test that the ground truth ranks chops by exact distance and re-scores
+    matches that are not chops.
+    """
+    source = AudioSegment(np.arange(10, dtype=float), sample_rate=1000)
+    chops = [AudioSegment(source.timeseries[i:i + 2], 1000, offset_frames=i) for i in range(0, 8, 2)]
+    queries = [AudioSegment(np.array([3.2, 0.]), 1000)]
+
+    truth = GroundTruth(window=2, window_frames=2, chops=chops, queries=queries, distance_fn=_abs_dist)
+
+    assert truth.kth_distance(0, 1) == pytest.approx(0.8)
+    assert truth.kth_distance(0, 2) == pytest.approx(1.2)
+    assert truth.kth_distance(0, 10) == pytest.approx(3.2)
+    assert truth.distance(0, chops[2], source) == pytest.approx(0.8)
+    assert truth.distance(0, AudioSegment(np.array([3., 4.]), 1000, offset_frames=3), source) == pytest.approx(0.2)
+
+def test_evaluate_recall(tmp_path, monkeypatch):
+    """
+    Test that exact searches have full recall and a distance ratio of one,
+    with a result for every configuration and window.
+    """
+    monkeypatch.chdir(tmp_path)
+    sample = synthetic_audio(2., seed=1)
+    target = synthetic_audio(1., seed=2)
+    config = CollagerConfig(windows=[200, 100], distance_fn=CollagerConfig.DistanceFn.fast_mfcc, step_factor=0.5)
+
+    results = evaluate_recall(
+        sample,
+        target,
+        config,
+        {'search_mode': ['index', 'brute'], 'pca_components': [None, 4]},
+        n_queries=6,
+        k=3
+    )
+
+    assert len(results) == 8
+    for result in results:
+        assert result.queries == 6
+        assert 0 <= result.recall_at_1 <= result.recall_at_k <= 1
+        if result.params['pca_components'] is None:
+            assert result.recall_at_1 == 1.
+            assert result.distance_ratio == pytest.approx(1.)
+        else:
+            assert result.distance_ratio >= 1.
+    assert RecallResult(**results[0].to_dict()) == results[0]
+
+def test_evaluate_recall_rejects_short_target():
+    """
+    Test that the target must fit the longest window.
+    """
+    with pytest.raises(ValueError):
+        evaluate_recall(
+            synthetic_audio(1.),
+            synthetic_audio(0.1),
+            CollagerConfig(windows=[200]),
+        )
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from audio_collage.benchmark.runner import BenchmarkReport, BenchmarkRunner, StageResult, measure
+from audio_collage.cache_manager import CacheManager, default_cache, using_cache
+from audio_collage.collager_config import CollagerConfig
+
+def _result(seconds: float, peak_bytes: int = 1000) -> StageResult:
+    return StageResult(
+        stage='chop',
+        params={'source': 'tiny', 'window': 100},
+        seconds=seconds,
+        mean_seconds=seconds,
+        peak_bytes=peak_bytes,
+        repeats=3
+    )
+
+def test_measure():
+    """
+    Test that measure times every repeat and traces the memory allocated.
+    """
+    calls = []
+    seconds, mean_seconds, peak_bytes = measure(lambda: calls.append(bytearray(1 << 20)), repeats=2)
+
+    assert len(calls) == 4
+    assert 0 <= seconds <= mean_seconds
+    assert peak_bytes >= 1 << 20
+
+def test_runner_runs_each_stage(tmp_path):
+    """
+    Test that every stage is benchmarked, with indices built in a cache of
+    their own rather than the default one.
+    """
+    cwd = os.getcwd()
+    cache = CacheManager(str(tmp_path / 'cache'))
+    runner = BenchmarkRunner(sizes=['tiny'], windows=[100, 50], repeats=1, n_queries=2, distance_calls=1)
+    with using_cache(cache):
+        report = runner.run()
+        assert default_cache() is cache
+
+    assert os.getcwd() == cwd
+    assert cache.stats().n_entries == 0
+    assert {result.stage for result in report.results} == set(BenchmarkRunner.STAGES)
+    index_results = [result for result in report.results if result.stage == 'index']
+    assert {(r.params['n_windows'], r.params['search_mode']) for r in index_results} == {
+        (n, str(mode)) for n in [1, 2] for mode in CollagerConfig.SearchMode
+    }
+
+    path = str(tmp_path / 'results.json')
+    report.to_file(path)
+    assert BenchmarkReport.from_file(path).results == report.results
+
+def test_runner_rejects_unknown_stage():
+    """
+    Test that stage names are checked.
+    """
+    with pytest.raises(ValueError):
+        BenchmarkRunner(stages=['mixing'])
+
+def test_compare_finds_regressions():
+    """
+    Test that only stages slower or bigger than the tolerance are regressions.
+    """
+    baseline = BenchmarkReport(results=[_result(0.1)])
+
+    assert BenchmarkReport(results=[_result(0.12)]).compare(baseline, tolerance=0.25) == []
+    regressions = BenchmarkReport(results=[_result(0.2, peak_bytes=2000)]).compare(baseline, tolerance=0.25)
+    assert [r.metric for r in regressions] == ['seconds', 'peak_bytes']
+    assert regressions[0].ratio == pytest.approx(2)
+
+def test_compare_ignores_noise():
+    """
+    Test that timings too short to be reliable aren't compared.
+    """
+    baseline = BenchmarkReport(results=[_result(0.0001)])
+
+    assert BenchmarkReport(results=[_result(0.0005)]).compare(baseline, min_seconds=0.001) == []
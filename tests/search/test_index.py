@@ -1,6 +1,10 @@
 from audio_collage.search.index import SearchIndex
 from audio_collage.audio_dist import AudioDist
 from audio_collage.audio_segment import AudioSegment
+from audio_collage.cache_manager import CacheManager
+
+import os
+import pickle
 
 import numpy as np
 import pytest
@@ -16,148 +20,114 @@ def test_init():
     assert index.distance_fn == AudioDist.mfcc_dist
     assert index.tree is None
 
-def test_build(mocker):
-    """
-    Test that the VP-tree is built from the audio segments.
-    """
-    mocker.patch('os.path.exists', return_value=False)
-    mocker.patch('pickle.dump')
-    mocker.patch('builtins.open', mocker.mock_open())
-    mocker.patch('os.makedirs')
-
-    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist)
-    segments = [
+def _segments():
+    return [
         AudioSegment(timeseries=np.arange(0, 10, dtype=float), sample_rate=1000),
         AudioSegment(timeseries=np.arange(10, 20, dtype=float), sample_rate=1000) ,
     ]
 
-    index.build(segments)
+def _cache_path(cache: CacheManager, index: SearchIndex) -> str:
+    # Segments are hashed before building caches their features
+    return cache.path(index._cache_key(index.audio_segments_hash(_segments())))
+
+def test_build(tmp_path):
+    """
+    Test that the VP-tree is built from the audio segments.
+    """
+    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist, cache=CacheManager(str(tmp_path)))
+
+    index.build(_segments())
 
     assert isinstance(index.tree, VPTree)
 
-def test_build_loads_from_cache_if_exists(mocker):
+def test_build_loads_from_cache_if_exists(mocker, tmp_path):
     """
     1. Tests that the VPTree is loaded from an existing cache. 
     """
-    mocker.patch('os.path.exists', return_value=True)
-    mock_vptree = mocker.MagicMock(spec=VPTree)
-    mock_pickle_load = mocker.patch('pickle.load', return_value=mock_vptree)
-    mocker.patch('builtins.open', mocker.mock_open(read_data=b'fake_data'))
-    
-    # Mock the VPTree constructor to ensure it's NOT called
-    mock_vptree_constructor = mocker.patch('vptree.VPTree')
+    cache = CacheManager(str(tmp_path))
+    SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist, cache=cache).build(_segments())
 
-    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist)
-    segments = [
-        AudioSegment(timeseries=np.arange(0, 10, dtype=float), sample_rate=1000),
-        AudioSegment(timeseries=np.arange(10, 20, dtype=float), sample_rate=1000) ,
-    ]
+    # Spy on saving to ensure no new tree is built
+    save_to_cache = mocker.spy(SearchIndex, '_save_to_cache')
+    mock_pickle_load = mocker.spy(pickle, 'load')
 
-    index.build(segments)
+    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist, cache=cache)
+    index.build(_segments())
 
     mock_pickle_load.assert_called_once()
-    mock_vptree_constructor.assert_not_called()
-    assert index.tree is mock_vptree
+    save_to_cache.assert_not_called()
+    assert index.tree is mock_pickle_load.spy_return
 
-def test_clears_cache_if_format_invalid(mocker):
+def test_clears_cache_if_format_invalid(tmp_path):
     """
     Test that the cache is cleared if loading fails.
     """
-    mocker.patch('os.path.exists', return_value=True)
-    mocker.patch('builtins.open', mocker.mock_open(read_data=b'fake_data'))
-    mocker.patch('pickle.load', side_effect=EOFError)
-    mocked_cache_remove = mocker.patch('os.remove')
-
-    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist)
-    segments = [
-        AudioSegment(timeseries=np.arange(10, dtype=float), sample_rate=1000),
-        AudioSegment(timeseries=np.arange(20, dtype=float), sample_rate=1000),
-    ]
+    cache = CacheManager(str(tmp_path))
+    segments = _segments()
+    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist, cache=cache)
+    os.makedirs(cache.entries_dir)
+    with open(_cache_path(cache, index), 'wb') as f:
+        f.write(b'fake_data')
 
     index.build(segments)
 
-    mocked_cache_remove.assert_called_once()
+    assert isinstance(index.tree, VPTree)
+    with open(_cache_path(cache, index), 'rb') as f:
+        assert isinstance(pickle.load(f), VPTree)
 
-def test_clears_cache_if_not_vptree(mocker):
+def test_clears_cache_if_not_vptree(tmp_path):
     """
     Test that the cache is cleared if the loaded object is not a VPTree.
     """
-    mocker.patch('os.path.exists', return_value=True)
-    mocker.patch('builtins.open', mocker.mock_open(read_data=b'fake_data'))
-    mocker.patch('pickle.load', return_value=123)
-    mocked_cache_remove = mocker.patch('os.remove')
-
-    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist)
-    segments = [
-        AudioSegment(timeseries=np.arange(10, dtype=float), sample_rate=1000),
-        AudioSegment(timeseries=np.arange(20, dtype=float), sample_rate=1000),
-    ]
+    cache = CacheManager(str(tmp_path))
+    segments = _segments()
+    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist, cache=cache)
+    os.makedirs(cache.entries_dir)
+    with open(_cache_path(cache, index), 'wb') as f:
+        pickle.dump(123, f)
 
     index.build(segments)
 
-    mocked_cache_remove.assert_called_once()
+    assert isinstance(index.tree, VPTree)
+    with open(_cache_path(cache, index), 'rb') as f:
+        assert isinstance(pickle.load(f), VPTree)
 
-def test_build_creates_new_index_if_no_cache(mocker):
+def test_build_creates_new_index_if_no_cache(mocker, tmp_path):
     """
     2. Tests that a new VPTree is built if no cache is found.
     """
-    mocker.patch('os.path.exists', return_value=False)
-    mocker.patch('pickle.dump')
-    mocker.patch('builtins.open', mocker.mock_open())
-    mocker.patch('os.makedirs') # Prevent trying to create .cache dir
+    save_to_cache = mocker.spy(SearchIndex, '_save_to_cache')
 
-    # Mock the VPTree constructor to ensure it's called
-    mock_vptree = mocker.MagicMock(spec=VPTree)
-    mock_vptree_constructor = mocker.patch('vptree.VPTree', return_value=mock_vptree)
+    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist, cache=CacheManager(str(tmp_path)))
+    index.build(_segments())
 
-    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist)
-    segments = [
-        AudioSegment(timeseries=np.arange(0, 10, dtype=float), sample_rate=1000),
-        AudioSegment(timeseries=np.arange(10, 20, dtype=float), sample_rate=1000) ,
-    ]
-
-    index.build(segments)
-
-    mock_vptree_constructor.assert_called_once()
+    save_to_cache.assert_called_once()
+    assert index.stats.build_evaluations > 0
     assert isinstance(index.tree, VPTree)
 
-def test_build_writes_to_cache_after_creation(mocker):
+def test_build_writes_to_cache_after_creation(mocker, tmp_path):
     """
     3. Tests that a cache file is written after a new VPTree is built.
     """
-    mocker.patch('os.path.exists', return_value=False)
-    mock_pickle_dump = mocker.patch('pickle.dump')
-    mock_open = mocker.patch('builtins.open', mocker.mock_open())
-    mocker.patch('os.makedirs')
-
-    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist)
-    segments = [
-        AudioSegment(timeseries=np.arange(0, 10, dtype=float), sample_rate=1000),
-        AudioSegment(timeseries=np.arange(10, 20, dtype=float), sample_rate=1000) ,
-    ]
+    cache = CacheManager(str(tmp_path))
+    mock_pickle_dump = mocker.spy(pickle, 'dump')
+    segments = _segments()
 
+    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist, cache=cache)
     index.build(segments)
 
-    mock_open.assert_called_once_with(mocker.ANY, 'wb') # Check it was opened for writing
     mock_pickle_dump.assert_called_once() # Check that we tried to save
     assert mock_pickle_dump.call_args[0][0] is index.tree # Check we saved the correct object
+    assert os.path.exists(_cache_path(cache, index))
+    # Written to a temporary file and renamed, so nothing else is left behind
+    assert os.listdir(cache.entries_dir) == [os.path.basename(_cache_path(cache, index))]
 
-def test_search(mocker):
+def test_search(tmp_path):
     """
     Test that the nearest neighbor is found from the VP-tree.
     """
-    mocker.patch('os.path.exists', return_value=False)
-    mocker.patch('pickle.dump')
-    mocker.patch('builtins.open', mocker.mock_open())
-    mocker.patch('os.makedirs')
-
-    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist)
-    segments = [
-        AudioSegment(timeseries=np.arange(0, 10, dtype=float), sample_rate=1000),
-        AudioSegment(timeseries=np.arange(10, 20, dtype=float), sample_rate=1000) ,
-    ]
-
-    index.build(segments)
+    index = SearchIndex(window_size=1000, distance_fn=AudioDist.mfcc_dist, cache=CacheManager(str(tmp_path)))
+    index.build(_segments())
 
     query_segment = AudioSegment(timeseries=np.arange(0, 1000, dtype=float), sample_rate=1000)
 
@@ -72,3 +72,29 @@ def test_find_best_match(mocker):
     assert isinstance(match_3, AudioSegment)
     assert dist_3 == 1
     assert isinstance(window_3, int)
+
+def test_find_best_matches(mocker):
+    """
+    Test that a batch of queries gives the same results as finding matches one at a time.
+    """
+    mocker.patch.object(SearchIndex, 'build')
+    mocker.patch.object(SearchIndex, 'search', side_effect=mock_search_index)
+
+    index_collection = SearchIndexCollection(AudioDist.mfcc_dist)
+    for window in [1, 2, 3]:
+        index_collection.add_index([], window=window)
+
+    queries = [
+        AudioSegment(timeseries=np.array([1]), sample_rate=1000),
+        AudioSegment(timeseries=np.array([2, 3]), sample_rate=1000),
+        AudioSegment(timeseries=np.array([3, 4, 5, 6]), sample_rate=1000),
+    ]
+
+    results = index_collection.find_best_matches(queries)
+
+    assert len(results) == len(queries)
+    for query, (match, dist, window) in zip(queries, results):
+        expected_match, expected_dist, expected_window = index_collection.find_best_match(query)
+        assert np.array_equal(match.timeseries, expected_match.timeseries)
+        assert dist == expected_dist
+        assert window == expected_window
@@ -0,0 +1,84 @@
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.cache_manager import default_cache
+from audio_collage.search.reduction import FeatureReducer
+
+import numpy as np
+import os
+import pytest
+
+def _source() -> AudioSegment:
+    rng = np.random.default_rng(0)
+    return AudioSegment(
+        timeseries=rng.uniform(-1, 1, 22050).astype(np.float32),
+        sample_rate=22050
+    )
+
+def test_fit_and_transform():
+    """
+    Test that features are projected onto the requested number of components.
+    """
+    rng = np.random.default_rng(1)
+    frames = rng.normal(size=(20, 200))
+    reducer = FeatureReducer(n_components=5)
+
+    reducer.fit(frames)
+    reduced = reducer.transform(frames[:, :30])
+
+    assert reduced.shape == (5, 30)
+    assert 0 < reducer.explained_variance <= 1
+
+def test_transform_raises_error_if_not_fitted():
+    """
+    Test that an error is raised if the reducer is not fitted.
+    """
+    with pytest.raises(RuntimeError):
+        FeatureReducer(n_components=5).transform(np.zeros((20, 3)))
+
+def test_reduce_segment():
+    """
+    Test that a segment's MFCCs are replaced by their projection.
+    """
+    source = _source()
+    reducer = FeatureReducer(n_components=4)
+    reducer.fit(source.mfcc)
+    segment = AudioSegment(source.timeseries[:4410], source.sample_rate)
+
+    reducer.reduce_segment(segment)
+
+    assert segment.mfcc.shape[0] == 4
+    assert segment.mfcc_mean.shape == (4,)
+
+def test_reduce_segment_with_mean_only():
+    """
+    Test that a precomputed mean MFCC is projected without computing the MFCCs.
+    """
+    rng = np.random.default_rng(1)
+    frames = rng.normal(size=(20, 200))
+    reducer = FeatureReducer(n_components=3)
+    reducer.fit(frames)
+    segment = AudioSegment(np.zeros(10), 22050)
+    segment._mfcc_mean = frames[:, :10].mean(axis=1)
+
+    reducer.reduce_segment(segment)
+
+    assert segment._mfcc is None
+    assert np.allclose(segment.mfcc_mean, reducer.transform(frames[:, :10]).mean(axis=1))
+
+def test_load_or_fit_caches_reducer(tmp_path, monkeypatch, mocker):
+    """
+    Test that the fitted reducer is persisted and reloaded from the cache.
+    """
+    monkeypatch.chdir(tmp_path)
+    source = _source()
+
+    first = FeatureReducer.load_or_fit(source, 4)
+    assert os.path.exists(default_cache().path(f"{source.hash()}.4.pca"))
+
+    fit = mocker.spy(FeatureReducer, 'fit')
+    second = FeatureReducer.load_or_fit(source, 4)
+
+    fit.assert_not_called()
+    assert np.allclose(
+        first.transform(source.mfcc),
+        second.transform(source.mfcc)
+    )
@@ -0,0 +1,92 @@
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.features import FrameFeatures, HOP_LENGTH
+from audio_collage.search.sliding import SlidingSearchIndex
+
+import numpy as np
+import pytest
+
+def _source(n_samples: int = 22050 * 2) -> AudioSegment:
+    rng = np.random.default_rng(0)
+    return AudioSegment(
+        timeseries=rng.uniform(-1, 1, n_samples).astype(np.float32),
+        sample_rate=22050
+    )
+
+def test_distances_match_brute_force():
+    """
+    Test that the FFT expansion matches the direct distance at every offset.
+    """
+    rng = np.random.default_rng(1)
+    source_mfcc = rng.normal(size=(20, FrameFeatures.n_frames(22050 * 2)))
+    index = SlidingSearchIndex(window_size=200)
+    index.build(_source(), source_mfcc=source_mfcc)
+    query = rng.normal(size=(20, index.n_query_frames))
+
+    distances = index.distances(query)
+
+    m = index.n_query_frames
+    expected = [
+        np.linalg.norm(source_mfcc[:, t:t + m] - query)
+        for t in range(index.n_offsets)
+    ]
+    assert np.allclose(distances, expected)
+
+def test_search_finds_offset_of_query():
+    """
+    Test that a query cut from the source is matched at its own offset.
+    """
+    source = _source()
+    index = SlidingSearchIndex(window_size=200)
+    index.build(source)
+    offset = 30 * HOP_LENGTH
+    query = AudioSegment(
+        source.timeseries[offset:offset + index.window_frames],
+        source.sample_rate
+    )
+
+    dist, snippet = index.search(query)
+
+    assert snippet.offset_frames == offset
+    assert snippet.n_samples() == index.window_frames
+    assert np.array_equal(snippet.timeseries, query.timeseries)
+    assert dist >= 0
+
+def test_candidates_fit_in_source():
+    """
+    Test that only offsets where a whole window fits are considered.
+    """
+    source = _source()
+    index = SlidingSearchIndex(window_size=500)
+    index.build(source)
+
+    last_offset = (index.n_offsets - 1) * HOP_LENGTH
+    assert last_offset + index.window_frames <= source.n_samples()
+    assert last_offset + HOP_LENGTH + index.window_frames > source.n_samples()
+
+def test_search_raises_error_if_not_built():
+    """
+    Test that an error is raised if the index is not built.
+    """
+    index = SlidingSearchIndex(window_size=200)
+
+    with pytest.raises(RuntimeError):
+        index.search(_source(100))
+
+def test_search_batch_matches_search():
+    """
+    Test that a batch of queries gives the same results as searching one at a time.
+    """
+    source = _source()
+    index = SlidingSearchIndex(window_size=100)
+    index.build(source)
+    queries = [
+        AudioSegment(source.timeseries[offset:offset + index.window_frames], 22050)
+        for offset in [0, 1000, 7000, 20000]
+    ]
+
+    batch = index.search_batch(queries)
+
+    for query, (dist, snippet) in zip(queries, batch):
+        expected_dist, expected_snippet = index.search(query)
+        assert dist == pytest.approx(expected_dist, abs=1e-6)
+        assert snippet.offset_frames == expected_snippet.offset_frames
@@ -0,0 +1,132 @@
+import pickle
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.search.brute import BruteForceIndex
+from audio_collage.search.index import SearchIndex
+from audio_collage.search.sliding import SlidingSearchIndex
+from audio_collage.search.stats import CountingDistance, IndexStats
+
+def _abs_dist(a: AudioSegment, b: AudioSegment) -> float:
+    return float(abs(a.timeseries[0] - b.timeseries[0]))
+
+def _slow_dist(a: AudioSegment, b: AudioSegment) -> float:
+    # Yields to other threads, as a slow distance function would
+    time.sleep(0.0001)
+    return _abs_dist(a, b)
+
+def _segments(n: int):
+    return [AudioSegment(np.full(4, float(i)), sample_rate=1000, offset_frames=i) for i in range(n)]
+
+def test_counting_distance():
+    """
+    Test that calls to the wrapped distance function are counted until reset.
+    """
+    counter = CountingDistance(_abs_dist)
+    segments = _segments(2)
+
+    assert counter(segments[0], segments[1]) == 1.
+    assert counter.calls == 1
+    counter.reset()
+    assert counter.calls == 0 and counter.seconds == 0.
+
+def test_counting_distance_counts_per_thread():
+    """
+    Test that each thread counts only its own calls, and that pickled
+    counters start from zero.
+    """
+    counter = CountingDistance(_abs_dist)
+    segments = _segments(2)
+    counter(segments[0], segments[1])
+
+    thread_calls = []
+    thread = threading.Thread(target=lambda: thread_calls.append((counter(*segments), counter.calls)))
+    thread.start()
+    thread.join()
+
+    assert thread_calls == [(1., 1)]
+    assert counter.calls == 1
+    assert pickle.loads(pickle.dumps(counter)).calls == 0
+
+def test_index_stats_pruning_ratio():
+    """
+    Test that the pruning ratio is the evaluations per query over the index size.
+    """
+    stats = IndexStats(window=100, size=50, queries=4, query_evaluations=40)
+
+    assert stats.evaluations_per_query == 10
+    assert stats.pruning_ratio == pytest.approx(0.2)
+    assert stats.to_dict()['pruning_ratio'] == pytest.approx(0.2)
+    assert IndexStats(window=100).pruning_ratio == 0.
+
+def test_brute_force_index_evaluates_every_chop():
+    """
+    Test that the brute force index finds the nearest chop with one distance
+    evaluation per chop.
+    """
+    index = BruteForceIndex(window_size=4, distance_fn=_abs_dist)
+    index.build(_segments(20))
+
+    dist, match = index.search(AudioSegment(np.full(4, 7.2), sample_rate=1000))
+
+    assert match.offset_frames == 7
+    assert dist == pytest.approx(0.2)
+    assert index.stats.query_evaluations == 20
+    assert index.stats.pruning_ratio == 1.
+
+def test_brute_force_index_counts_concurrent_searches():
+    """
+    Test that searches of a shared index from several threads are all counted
+    in full.
+    """
+    index = BruteForceIndex(window_size=4, distance_fn=_slow_dist)
+    index.build(_segments(20))
+    query = AudioSegment(np.full(4, 7.2), sample_rate=1000)
+
+    def search():
+        for _ in range(5):
+            index.search(query)
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert index.stats.queries == 20
+    assert index.stats.query_evaluations == 20 * 20
+
+def test_vptree_index_counts_evaluations(tmp_path, monkeypatch):
+    """
+    Test that the VP-tree index counts its build evaluations and fewer query
+    evaluations than a linear scan.
+    """
+    monkeypatch.chdir(tmp_path)
+    index = SearchIndex(window_size=4, distance_fn=_abs_dist)
+    index.build(_segments(200))
+
+    assert index.stats.size == 200
+    assert index.stats.build_evaluations > 0
+    for value in [3.1, 50.4, 120.9, 199.]:
+        index.search(AudioSegment(np.full(4, value), sample_rate=1000))
+
+    assert index.stats.queries == 4
+    assert 0 < index.stats.pruning_ratio < 1
+
+def test_sliding_index_counts_offsets():
+    """
+    Test that the sliding index counts a distance for every offset of each query.
+    """
+    index = SlidingSearchIndex(window_size=100)
+    index.build(AudioSegment(np.random.default_rng(0).standard_normal(22050), sample_rate=22050))
+
+    index.search_batch([AudioSegment(np.ones(2205), sample_rate=22050)] * 3)
+
+    assert index.stats.queries == 3
+    assert index.stats.size == index.n_offsets
+    assert index.stats.query_evaluations == 3 * index.n_offsets
+    assert index.stats.pruning_ratio == 1.
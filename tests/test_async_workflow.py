@@ -0,0 +1,149 @@
+from audio_collage.async_workflow import AsyncCollager, acreate_collage
+from audio_collage.audio_mapper import AudioMapper
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.collager_config import CollagerConfig
+from audio_collage.plan import SelectionPlan
+
+import asyncio
+import dataclasses
+import numpy as np
+import pytest
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+CONFIG = CollagerConfig(
+    target_file="target.wav",
+    sample_file="sample.wav",
+    outpath="output.wav"
+)
+
+@patch('audio_collage.workflow.AudioSegment.from_file')
+@patch('audio_collage.workflow.Collager.create_collage')
+def test_acreate_collage(mock_create_collage, mock_from_file):
+    """
+    Test that the async API loads, collages and saves like the blocking workflow.
+    """
+    asyncio.run(acreate_collage(CONFIG))
+
+    mock_from_file.assert_any_call("sample.wav")
+    mock_from_file.assert_any_call("target.wav")
+    mock_create_collage.assert_called_once()
+    config = mock_create_collage.call_args.kwargs['config']
+    assert config.cancel_event is not None
+    assert config.outpath == "output.wav"
+    mock_create_collage.return_value.to_file.assert_called_once_with("output.wav")
+
+@patch('audio_collage.workflow.AudioSegment.from_file')
+@patch('audio_collage.workflow.Collager.create_collage')
+def test_timeout_cancels_job(mock_create_collage, mock_from_file):
+    """
+    Test that a job that times out is told to stop and is waited for.
+    """
+    stopped = threading.Event()
+
+    def slow_collage(target_audio, sample_audio, config):
+        config.cancel_event.wait(5)
+        stopped.set()
+        raise AudioMapper.CancelledError()
+    mock_create_collage.side_effect = slow_collage
+
+    start = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(AsyncCollager().create_collage_from_files(CONFIG, timeout=0.1))
+
+    assert stopped.is_set()
+    assert time.perf_counter() - start < 5
+
+@patch('audio_collage.workflow.AudioSegment.from_file')
+@patch('audio_collage.workflow.Collager.create_collage')
+def test_concurrency_limit(mock_create_collage, mock_from_file):
+    """
+    Test that no more CPU stages run at once than the concurrency limit.
+    """
+    lock = threading.Lock()
+    running = []
+    max_running = []
+
+    def collage(target_audio, sample_audio, config):
+        with lock:
+            running.append(1)
+            max_running.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return MagicMock()
+    mock_create_collage.side_effect = collage
+
+    async def run_jobs():
+        collager = AsyncCollager(max_concurrency=2)
+        await asyncio.gather(*[collager.create_collage_from_files(CONFIG) for _ in range(6)])
+    asyncio.run(run_jobs())
+
+    assert mock_create_collage.call_count == 6
+    assert max(max_running) == 2
+
+@patch('audio_collage.workflow.PCMCache')
+@patch('audio_collage.workflow.AudioSegment.from_file')
+@patch('audio_collage.workflow.Collager.create_collage')
+def test_acreate_collage_loads_via_pcm_cache(mock_create_collage, mock_from_file, mock_pcm_cache):
+    """
+    Test that the async API loads audio through the PCM cache like the blocking workflow.
+    """
+    sample_audio, target_audio = MagicMock(), MagicMock()
+    mock_pcm_cache.return_value.load_many.return_value = [sample_audio, target_audio]
+
+    asyncio.run(acreate_collage(dataclasses.replace(CONFIG, pcm_cache_dir="pcm")))
+
+    mock_from_file.assert_not_called()
+    mock_pcm_cache.return_value.load_many.assert_called_once_with(["sample.wav", "target.wav"])
+    assert mock_create_collage.call_args.kwargs['sample_audio'] is sample_audio
+    assert mock_create_collage.call_args.kwargs['target_audio'] is target_audio
+
+@patch('audio_collage.workflow.Collager.render')
+@patch('audio_collage.workflow.Collager.create_plan')
+def test_acreate_collage_uses_result_cache_and_plan(mock_create_plan, mock_render, tmp_path):
+    """
+    Test that the async API saves plans and reuses cached results like the blocking workflow.
+    """
+    mock_create_plan.return_value = SelectionPlan(sources=['sample.wav'], sample_rate=1000)
+    mock_render.return_value = AudioSegment(np.zeros(100, dtype=np.float32), 1000)
+    config = CollagerConfig(
+        target_file='tests/data/test.wav',
+        sample_file='tests/data/test.wav',
+        outpath=str(tmp_path / 'first.wav'),
+        plan_outpath=str(tmp_path / 'plan.json'),
+        result_cache_dir=str(tmp_path / 'results')
+    )
+
+    async def run_jobs():
+        async with AsyncCollager() as collager:
+            await collager.create_collage_from_files(config)
+            await collager.create_collage_from_files(
+                dataclasses.replace(config, outpath=str(tmp_path / 'second.wav'), plan_outpath=None)
+            )
+    asyncio.run(run_jobs())
+
+    mock_create_plan.assert_called_once()
+    mock_render.assert_called_once()
+    assert SelectionPlan.from_file(str(tmp_path / 'plan.json')) == mock_create_plan.return_value
+    with open(tmp_path / 'first.wav', 'rb') as first, open(tmp_path / 'second.wav', 'rb') as second:
+        assert first.read() == second.read()
+
+def test_close_shuts_down_own_executor_only():
+    """
+    Test that closing shuts down an executor the collager created, but not one passed in.
+    """
+    own = AsyncCollager()
+    executor = MagicMock()
+    given = AsyncCollager(executor=executor)
+
+    async def close():
+        async with own:
+            pass
+    asyncio.run(close())
+    given.close()
+
+    with pytest.raises(RuntimeError):
+        own.executor.submit(print)
+    executor.shutdown.assert_not_called()
@@ -1,12 +1,17 @@
+import dataclasses
 from audio_collage.audio_dist import AudioDist
 from audio_collage.audio_mapper import AudioMapper
 from audio_collage.audio_segment import AudioSegment
 from audio_collage.collager import CollagerConfig
 from audio_collage.collage_progress_state import CollageProgressState
+from audio_collage.features import FrameFeatures
+from audio_collage.library import SampleLibrary
 from audio_collage.search.index_collection import SearchIndexCollection
 from audio_collage.util import Util
 
 import numpy as np
+import pytest
+import threading
 
 def test_init():
     """
@@ -25,7 +30,7 @@ def test_map_audio(mocker):
     """
     Test that the audio is mapped correctly.
     """
-    mocker.patch.object(SearchIndexCollection, 'find_best_match', return_value=(111, 22, 3))
+    mocker.patch.object(SearchIndexCollection, 'find_best_match', return_value=(AudioSegment(np.arange(3), 1000, offset_frames=5), 22, 3))
     chop_fn = mocker.spy(Util, 'chop_audio')
     
     config = CollagerConfig(
@@ -98,6 +103,15 @@ def test_map_audio_with_callback(mocker):
         completed=True,
         current_step=2,
     ))
+    callback.assert_any_call(CollageProgressState(
+        task=CollageProgressState.Task.INDEXING,
+        current_step=1,
+    ))
+    callback.assert_any_call(CollageProgressState(
+        task=CollageProgressState.Task.INDEXING,
+        completed=True,
+        current_step=2,
+    ))
     callback.assert_any_call(CollageProgressState(
         task=CollageProgressState.Task.SELECTING,
         starting=True,
@@ -105,3 +119,227 @@ def test_map_audio_with_callback(mocker):
         total_steps=10,
         message="Selecting samples"
     ))
+
+def test_map_audio_with_library(mocker, tmp_path):
+    """
+    Test that chops are ingested into the library once and then reused.
+    """
+    mocker.patch.object(SearchIndexCollection, 'find_best_match', return_value=(AudioSegment(np.arange(3), 1000, offset_frames=5), 22, 3))
+    chop_fn = mocker.spy(Util, 'chop_audio')
+    mocker.patch.object(SearchIndexCollection, 'add_index')
+
+    config = CollagerConfig(
+        windows=[100, 200],
+        library_path=str(tmp_path / 'library.db')
+    )
+    source = AudioSegment(
+        timeseries=np.random.default_rng(0).uniform(-1, 1, 4410).astype(np.float32),
+        sample_rate=22050
+    )
+    target = AudioSegment(timeseries=np.arange(0, 10), sample_rate=1000)
+
+    AudioMapper(source, target, config=config).map_audio()
+    assert chop_fn.call_count == 2
+
+    AudioMapper(source, target, config=config).map_audio()
+    assert chop_fn.call_count == 2
+
+def test_build_indices_closes_library_on_error(mocker, tmp_path):
+    """
+    Test that the sample library is closed when indexing fails.
+    """
+    close = mocker.spy(SampleLibrary, 'close')
+    cancel_event = threading.Event()
+    cancel_event.set()
+    config = CollagerConfig(
+        windows=[100],
+        library_path=str(tmp_path / 'library.db'),
+        cancel_event=cancel_event
+    )
+    source = AudioSegment(np.zeros(4410, dtype=np.float32), sample_rate=22050)
+    target = AudioSegment(np.array([]), sample_rate=22050)
+
+    with pytest.raises(AudioMapper.CancelledError):
+        AudioMapper(source, target, config=config).build_indices()
+    close.assert_called_once()
+
+def test_map_audio_sliding(mocker):
+    """
+    Test that sliding search mode indexes the source without chopping it.
+    """
+    chop_fn = mocker.spy(Util, 'chop_audio')
+    add_sliding_index = mocker.spy(SearchIndexCollection, 'add_sliding_index')
+
+    config = CollagerConfig(
+        windows=[100, 50],
+        search_mode=CollagerConfig.SearchMode.sliding
+    )
+    rng = np.random.default_rng(0)
+    source = AudioSegment(rng.uniform(-1, 1, 22050).astype(np.float32), sample_rate=22050)
+    target = AudioSegment(rng.uniform(-1, 1, 4410).astype(np.float32), sample_rate=22050)
+    mapper = AudioMapper(source, target, config=config)
+
+    selected_snippets = mapper.map_audio()
+
+    chop_fn.assert_not_called()
+    assert add_sliding_index.call_count == 2
+    assert sum(s.n_samples() for s in selected_snippets) >= target.n_samples()
+
+def test_map_audio_mean_mfcc_uses_integral_features(mocker):
+    """
+    Test that with integral_mfcc, mean MFCCs for every window come from one
+    pass over the source.
+    """
+    mocker.patch.object(SearchIndexCollection, 'find_best_match', return_value=(AudioSegment(np.arange(3), 1000, offset_frames=5), 22, 3))
+    mocker.patch.object(SearchIndexCollection, 'add_index')
+    frame_mfcc = mocker.spy(FrameFeatures, 'mfcc')
+
+    config = CollagerConfig(windows=[100, 50], integral_mfcc=True)
+    source = AudioSegment(
+        timeseries=np.random.default_rng(0).uniform(-1, 1, 4410).astype(np.float32),
+        sample_rate=22050
+    )
+    target = AudioSegment(timeseries=np.arange(0, 10), sample_rate=1000)
+    mapper = AudioMapper(source, target, distance_fn=AudioDist.mean_mfcc_dist, config=config)
+
+    mapper.map_audio()
+
+    frame_mfcc.assert_called_once_with(source)
+    for call in SearchIndexCollection.add_index.call_args_list:
+        segments = call.args[0]
+        assert all(segment._mfcc_mean is not None for segment in segments)
+
+@pytest.mark.parametrize('search_mode', [CollagerConfig.SearchMode.index, CollagerConfig.SearchMode.brute])
+def test_mean_mfcc_chops_match_query_features(mocker, search_mode):
+    """
+    Test that by default indexed chops have the mean MFCCs a query of the
+    same audio has, so that each chop is its own nearest neighbour.
+    """
+    mocker.patch('audio_collage.search.index.SearchIndex._save_to_cache')
+    mocker.patch('audio_collage.search.index.SearchIndex._load_from_cache', return_value=False)
+    frame_mfcc = mocker.spy(FrameFeatures, 'mfcc')
+
+    config = CollagerConfig(windows=[100], declick_ms=0, search_mode=search_mode)
+    source = AudioSegment(np.random.default_rng(0).uniform(-1, 1, 11025).astype(np.float32), sample_rate=22050)
+    mapper = AudioMapper(source, source, distance_fn=AudioDist.mean_mfcc_dist, config=config)
+
+    mapper.build_indices()
+
+    frame_mfcc.assert_not_called()
+    chops = Util.chop_audio(source, 100, step_factor=config.step_factor)
+    for chop in chops:
+        query = AudioSegment(chop.timeseries.copy(), chop.sample_rate)
+        match, distance, window = mapper.indices.find_best_match(query)
+        assert np.allclose(match.mfcc_mean, query.mfcc_mean, atol=1e-3)
+        assert match.offset_frames == chop.offset_frames
+        assert distance == pytest.approx(0, abs=1e-3)
+
+def test_map_audio_with_pca(mocker):
+    """
+    Test that indexed chops and queries are searched in the reduced feature space.
+    """
+    mocker.patch('audio_collage.search.index.SearchIndex._save_to_cache')
+    mocker.patch('audio_collage.search.index.SearchIndex._load_from_cache', return_value=False)
+    load_or_fit = mocker.patch('audio_collage.audio_mapper.FeatureReducer.load_or_fit')
+    reducer = load_or_fit.return_value
+    reducer.reduce_segment.side_effect = lambda segment: setattr(
+        segment, '_mfcc', segment.mfcc[:3]
+    )
+    reducer.reduce.side_effect = lambda segments: [
+        reducer.reduce_segment(segment) for segment in segments
+    ]
+
+    config = CollagerConfig(windows=[100], pca_components=3)
+    rng = np.random.default_rng(0)
+    source = AudioSegment(rng.uniform(-1, 1, 11025).astype(np.float32), sample_rate=22050)
+    target = AudioSegment(rng.uniform(-1, 1, 4410).astype(np.float32), sample_rate=22050)
+    mapper = AudioMapper(source, target, distance_fn=AudioDist.fast_mfcc_dist, config=config)
+
+    selected_snippets = mapper.map_audio()
+
+    assert mapper.indices.reducer is reducer
+    assert len(selected_snippets) == 2
+    index = mapper.indices.indices[100]
+    assert index.tree.vp.mfcc.shape[0] == 3
+    assert reducer.reduce_segment.call_count > len(selected_snippets)
+
+def test_map_audio_cancelled(mocker):
+    """
+    Test that mapping stops when the cancel event is set.
+    """
+    mocker.patch.object(SearchIndexCollection, 'add_index')
+    find_best_match = mocker.patch.object(SearchIndexCollection, 'find_best_match', return_value=(AudioSegment(np.arange(3), 1000, offset_frames=5), 22, 3))
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    config = CollagerConfig(windows=[100], cancel_event=cancel_event)
+    source = AudioSegment(timeseries=np.arange(0, 10), sample_rate=1000)
+    target = AudioSegment(timeseries=np.arange(0, 10), sample_rate=1000)
+    mapper = AudioMapper(source, target, distance_fn=AudioDist.fast_mfcc_dist, config=config)
+
+    with pytest.raises(AudioMapper.CancelledError):
+        mapper.map_audio()
+    find_best_match.assert_not_called()
+
+def test_select(mocker):
+    """
+    Test that selection is recorded as a plan.
+    """
+    mocker.patch.object(SearchIndexCollection, 'add_index')
+    mocker.patch.object(
+        SearchIndexCollection,
+        'find_best_match',
+        return_value=(AudioSegment(np.arange(4), 1000, offset_frames=7), 0.5, 4)
+    )
+    config = CollagerConfig(windows=[100])
+    source = AudioSegment(timeseries=np.arange(0, 10), sample_rate=1000, path='sample.wav')
+    target = AudioSegment(timeseries=np.arange(0, 10), sample_rate=1000)
+    mapper = AudioMapper(source, target, distance_fn=AudioDist.fast_mfcc_dist, config=config)
+
+    plan = mapper.select()
+
+    assert plan.sources == ['sample.wav']
+    assert plan.sample_rate == 1000
+    assert [entry.target_offset for entry in plan.entries] == [0, 4, 8]
+    assert all(entry.offset_frames == 7 and entry.n_frames == 4 for entry in plan.entries)
+    assert all(entry.distance == 0.5 for entry in plan.entries)
+
+def test_map_audio_with_lookahead(mocker):
+    """
+    Test that searching ahead in batches selects the same snippets in fewer searches.
+    """
+    rng = np.random.default_rng(0)
+    source = AudioSegment(rng.uniform(-1, 1, 22050).astype(np.float32), 22050)
+    target = AudioSegment(rng.uniform(-1, 1, 22050).astype(np.float32), 22050)
+    config = CollagerConfig(
+        windows=[100, 50],
+        declick_ms=10,
+        search_mode=CollagerConfig.SearchMode.sliding
+    )
+    serial = AudioMapper(source, target, config=config).select()
+
+    find_best_matches = mocker.spy(SearchIndexCollection, 'find_best_matches')
+    mapper = AudioMapper(source, target, config=dataclasses.replace(config, lookahead=3))
+    plan = mapper.select()
+
+    assert [(e.offset_frames, e.n_frames, e.target_offset) for e in plan.entries] == \
+        [(e.offset_frames, e.n_frames, e.target_offset) for e in serial.entries]
+    assert [e.distance for e in plan.entries] == pytest.approx([e.distance for e in serial.entries])
+    assert find_best_matches.call_count < len(plan.entries) / 2
+
+def test_lookahead_pointers_are_capped_at_beam_width():
+    """
+    Test that searching ahead keeps at most beam_width pointers at each step,
+    without repeating any.
+    """
+    source = AudioSegment(np.zeros(1000, dtype=np.float32), 1000)
+    target = AudioSegment(np.zeros(100000, dtype=np.float32), 1000)
+    config = CollagerConfig(windows=[10, 11, 12, 13], lookahead=20, beam_width=3)
+    mapper = AudioMapper(source, target, config=config)
+    mapper.indices.indices = {window: None for window in config.windows}
+
+    pointers = mapper._lookahead_pointers(0, target.n_samples(), overlap_frames=0)
+
+    assert len(pointers) == len(set(pointers))
+    assert len(pointers) <= 1 + config.lookahead * config.beam_width
+    assert pointers[:4] == [0, 10, 11, 12]
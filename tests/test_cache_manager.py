@@ -0,0 +1,158 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from audio_collage.cache_manager import CACHE_VERSION, CacheManager, default_cache, set_default_cache, using_cache
+
+def _write(data: bytes):
+    def write(path: str) -> None:
+        with open(path, 'wb') as f:
+            f.write(data)
+    return write
+
+def _read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_put_and_get(tmp_path):
+    """
+    Test that entries are written atomically under the cache version and read back.
+    """
+    cache = CacheManager(str(tmp_path))
+
+    assert cache.get('a.vptree', _read) is None
+    assert cache.put('a.vptree', _write(b'abc')) == 3
+    assert cache.get('a.vptree', _read) == b'abc'
+    assert os.path.dirname(cache.path('a.vptree')) == os.path.join(str(tmp_path), f"v{CACHE_VERSION}")
+    assert os.listdir(cache.entries_dir) == ['a.vptree']
+
+def test_failed_write_leaves_nothing(tmp_path):
+    """
+    Test that a writer failing part way leaves neither an entry nor a temporary file.
+    """
+    cache = CacheManager(str(tmp_path))
+
+    def write(path: str) -> None:
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+        raise RuntimeError("disk full")
+
+    with pytest.raises(RuntimeError):
+        cache.put('a.vptree', write)
+    assert os.listdir(cache.entries_dir) == []
+
+def test_unreadable_entry_is_removed(tmp_path):
+    """
+    Test that an entry that fails to load is removed.
+    """
+    cache = CacheManager(str(tmp_path))
+    cache.put('a.pca', _write(b'abc'))
+
+    def fail(path: str) -> bytes:
+        raise EOFError()
+
+    assert cache.get('a.pca', fail) is None
+    assert not os.path.exists(cache.path('a.pca'))
+
+def test_evicts_least_recently_used(tmp_path):
+    """
+    Test that the least recently used entries are evicted once over budget,
+    but never the entry just written.
+    """
+    cache = CacheManager(str(tmp_path), max_bytes=25)
+    cache.put('a.vptree', _write(b'a' * 10))
+    cache.put('b.vptree', _write(b'b' * 10))
+    os.utime(cache.path('a.vptree'), (0, 0))
+    os.utime(cache.path('b.vptree'), (1, 1))
+    # Reading a makes b the least recently used
+    cache.get('a.vptree', _read)
+
+    cache.put('c.vptree', _write(b'c' * 10))
+
+    assert sorted(os.listdir(cache.entries_dir)) == ['a.vptree', 'c.vptree']
+    cache.put('d.vptree', _write(b'd' * 30))
+    assert os.listdir(cache.entries_dir) == ['d.vptree']
+
+def test_prune_removes_stale_entries(tmp_path):
+    """
+    Test that entries of other versions, unversioned index files and
+    abandoned temporary files are pruned, while unrelated files are kept.
+    """
+    cache = CacheManager(str(tmp_path))
+    cache.put('a.vptree', _write(b'abc'))
+    old_dir = os.path.join(str(tmp_path), 'v0')
+    os.makedirs(old_dir)
+    _write(b'old')(os.path.join(old_dir, 'b.vptree'))
+    _write(b'legacy')(os.path.join(str(tmp_path), 'c.vptree'))
+    _write(b'keep')(os.path.join(str(tmp_path), 'notes.txt'))
+    tmp_file = os.path.join(cache.entries_dir, 'x.tmp')
+    _write(b'tmp')(tmp_file)
+    os.utime(tmp_file, (0, 0))
+
+    stats = cache.stats()
+    assert (stats.n_entries, stats.nbytes, stats.n_stale) == (1, 3, 3)
+    assert stats.kinds == {'.vptree': (1, 3)}
+
+    removed = cache.prune()
+
+    assert len(removed) == 3
+    assert sorted(os.listdir(str(tmp_path))) == ['notes.txt', 'v0', f"v{CACHE_VERSION}"]
+    assert os.listdir(cache.entries_dir) == ['a.vptree']
+
+def test_configured_by_environment(monkeypatch, tmp_path):
+    """
+    Test that the cache directory and budget default to environment variables.
+    """
+    monkeypatch.setenv('AUDIO_COLLAGE_CACHE_DIR', str(tmp_path))
+    monkeypatch.setenv('AUDIO_COLLAGE_CACHE_MB', '2')
+    set_default_cache(None)
+    try:
+        cache = default_cache()
+        assert cache.cache_dir == str(tmp_path)
+        assert cache.max_bytes == 2 * 1024 * 1024
+        assert default_cache() is cache
+    finally:
+        set_default_cache(None)
+
+def _build_once(cache_dir: str, builds_dir: str) -> bytes:
+    cache = CacheManager(cache_dir)
+    with cache.lock('shared.vptree'):
+        value = cache.get('shared.vptree', _read)
+        if value is None:
+            # Record the build, and take long enough for the other process to wait
+            _write(b'')(os.path.join(builds_dir, str(os.getpid())))
+            time.sleep(0.5)
+            value = b'built'
+            cache.put('shared.vptree', _write(value))
+    return value
+
+def test_using_cache_restores_the_default(tmp_path):
+    """
+    Test that a cache is the default only for the duration of the context.
+    """
+    previous = CacheManager(str(tmp_path / 'previous'))
+    cache = CacheManager(str(tmp_path / 'cache'))
+    set_default_cache(previous)
+    try:
+        with pytest.raises(RuntimeError):
+            with using_cache(cache):
+                assert default_cache() is cache
+                raise RuntimeError()
+        assert default_cache() is previous
+    finally:
+        set_default_cache(None)
+
+def test_lock_makes_concurrent_builders_wait(tmp_path):
+    """
+    Test that processes building the same entry at once build it only once.
+    """
+    builds_dir = tmp_path / 'builds'
+    builds_dir.mkdir()
+    context = multiprocessing.get_context('fork')
+    with context.Pool(2) as pool:
+        results = pool.starmap(_build_once, [(str(tmp_path / 'cache'), str(builds_dir))] * 2)
+
+    assert results == [b'built', b'built']
+    assert len(os.listdir(builds_dir)) == 1
@@ -1,7 +1,11 @@
 from typer.testing import CliRunner
 from unittest.mock import patch
+from audio_collage.benchmark.recall import RecallResult
+from audio_collage.cache_manager import CacheManager, default_cache, set_default_cache
 from audio_collage.cli import app
 from audio_collage.collager import CollagerConfig
+from audio_collage.collage_progress_state import CollageProgressState
+from audio_collage.job_queue import JobQueue
 
 runner = CliRunner()
 
@@ -44,12 +48,26 @@ def test_collage_command(
         target_file=target_file,
         sample_file=sample_file,
         outpath=outpath,
+        plan_outpath=None,
+        incremental=False,
         declick_fn=CollagerConfig.DeclickFn[declick_fn],
         declick_ms=int(declick_ms),
         distance_fn=CollagerConfig.DistanceFn[distance_fn],
+        integral_mfcc=False,
         step_ms=None,
         step_factor=float(step_factor),
         windows=[100, 200, 300],
+        search_mode=CollagerConfig.SearchMode.index,
+        pca_components=None,
+        library_path=None,
+        selection_mode=CollagerConfig.SelectionMode.greedy,
+        beam_width=8,
+        time_budget=None,
+        compare_greedy=False,
+        n_partitions=1,
+        lookahead=0,
+        pcm_cache_dir=None,
+        result_cache_dir=None,
         progress_callback=mock_cli_progress.return_value.update
     )
 
@@ -120,3 +138,385 @@ def test_example_command(
     mock_create_collage_from_files.assert_called_once_with(
         mock_config_init.return_value
     )
+
+@patch('audio_collage.cli.workflow.ingest_sample_file')
+def test_ingest_command(mock_ingest_sample_file):
+    """
+    Test that the ingest command invokes workflow with the correct arguments.
+    """
+    result = runner.invoke(app, [
+        "ingest",
+        "--sample", "sample.wav",
+        "--library", "library.db",
+        "--windows", "100,200",
+        "--step-factor", "0.5",
+        "--declick-ms", "10"
+    ])
+
+    assert result.exit_code == 0
+    mock_ingest_sample_file.assert_called_once_with(
+        "sample.wav",
+        "library.db",
+        [100, 200],
+        step_ms=None,
+        step_factor=0.5,
+        declick_ms=10
+    )
+
+@patch('audio_collage.cli.workflow.create_collages_from_files')
+def test_batch_command(mock_create_collages_from_files, tmp_path):
+    """
+    Test that the batch command collects targets from options and a manifest.
+    """
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("b.wav,out/b_collage.wav\n\n# comment\nc.wav\n")
+
+    result = runner.invoke(app, [
+        "batch",
+        "--sample", "sample.wav",
+        "--target", "a.wav",
+        "--manifest", str(manifest),
+        "--outdir", "out",
+        "--declick-fn", "linear",
+        "--windows", "100,50",
+        "--workers", "4"
+    ])
+
+    assert result.exit_code == 0
+    config, targets = mock_create_collages_from_files.call_args.args
+    assert targets == [
+        ("a.wav", "out/a.wav"),
+        ("b.wav", "out/b_collage.wav"),
+        ("c.wav", "out/c.wav"),
+    ]
+    assert config.sample_file == "sample.wav"
+    assert config.windows == [100, 50]
+    assert config.declick_fn == CollagerConfig.DeclickFn.linear
+    assert mock_create_collages_from_files.call_args.kwargs == {'max_workers': 4}
+
+@patch('audio_collage.cli.workflow.create_collages_from_files')
+def test_batch_command_rejects_shared_outpaths(mock_create_collages_from_files):
+    """
+    Test that the batch command fails if two targets would be written to the same file.
+    """
+    result = runner.invoke(app, [
+        "batch",
+        "--sample", "sample.wav",
+        "--target", "one/a.wav",
+        "--target", "two/a.wav",
+        "--outdir", "out",
+    ])
+
+    assert result.exit_code != 0
+    mock_create_collages_from_files.assert_not_called()
+
+def test_batch_command_requires_targets():
+    """
+    Test that the batch command fails without any targets.
+    """
+    result = runner.invoke(app, ["batch", "--sample", "sample.wav", "--declick-fn", "linear"])
+
+    assert result.exit_code != 0
+
+@patch('audio_collage.cli.workflow.sweep_from_files')
+def test_sweep_command(mock_sweep_from_files, tmp_path):
+    """
+    Test that the sweep command reads the grid and invokes workflow.
+    """
+    grid = tmp_path / "grid.json"
+    grid.write_text('{"windows": ["100,50", "200"], "step_factor": [0.5, 0.25]}')
+
+    result = runner.invoke(app, [
+        "sweep",
+        "--target", "target.wav",
+        "--sample", "sample.wav",
+        "--grid", str(grid),
+        "--outdir", "out"
+    ])
+
+    assert result.exit_code == 0
+    config, grid_arg, outdir = mock_sweep_from_files.call_args.args
+    assert config.target_file == "target.wav"
+    assert config.sample_file == "sample.wav"
+    assert grid_arg == {"windows": ["100,50", "200"], "step_factor": [0.5, 0.25]}
+    assert outdir == "out"
+
+@patch('audio_collage.cli.workflow.render_from_files')
+def test_render_command(mock_render_from_files):
+    """
+    Test that the render command invokes workflow with the correct arguments.
+    """
+    result = runner.invoke(app, [
+        "render",
+        "--plan", "plan.json",
+        "--outpath", "output.wav",
+        "--declick-fn", "linear",
+        "--sample-rate", "44100"
+    ])
+
+    assert result.exit_code == 0
+    mock_render_from_files.assert_called_once_with(
+        "plan.json",
+        "output.wav",
+        sample_file=None,
+        declick_fn=CollagerConfig.DeclickFn.linear,
+        declick_ms=0,
+        sample_rate=44100,
+        pcm_cache_dir=None
+    )
+
+@patch('audio_collage.cli.workflow.stream_from_files')
+def test_stream_command(mock_stream_from_files):
+    """
+    Test that the stream command invokes workflow with the correct arguments.
+    """
+    result = runner.invoke(app, [
+        "stream",
+        "--sample", "sample.wav",
+        "--input", "target.wav",
+        "--block-ms", "20",
+        "--windows", "100,50"
+    ])
+
+    assert result.exit_code == 0
+    config, input_path, outpath = mock_stream_from_files.call_args.args
+    assert config.sample_file == "sample.wav"
+    assert config.windows == [100, 50]
+    assert input_path == "target.wav"
+    assert outpath == "-"
+    assert mock_stream_from_files.call_args.kwargs == {'block_ms': 20}
+
+@patch('audio_collage.cli.BenchmarkReport.from_file')
+@patch('audio_collage.cli.BenchmarkRunner')
+def test_benchmark_command_fails_on_regression(mock_runner, mock_from_file):
+    """
+    Test that the benchmark command exits with an error on a regression.
+    """
+    mock_runner.return_value.run.return_value.results = []
+    mock_runner.return_value.run.return_value.compare.return_value = ["chop: slower"]
+
+    result = runner.invoke(app, [
+        "benchmark",
+        "--sizes", "tiny",
+        "--stages", "chop,search",
+        "--step-factors", "0.5,0.25",
+        "--baseline", "baseline.json"
+    ])
+
+    assert result.exit_code == 1
+    kwargs = mock_runner.call_args.kwargs
+    assert kwargs['sizes'] == ['tiny']
+    assert kwargs['stages'] == ['chop', 'search']
+    assert kwargs['step_factors'] == [0.5, 0.25]
+    mock_from_file.assert_called_once_with("baseline.json")
+
+@patch('audio_collage.cli.CLIProgress')
+@patch('audio_collage.cli.workflow.chop_and_write_from_file')
+def test_chop_command_with_profile(mock_workflow, mock_cli_progress, tmp_path):
+    """
+    Test that the chop command profiles the job when asked to.
+    """
+    def chop(*args, progress_callback, **kwargs):
+        progress_callback(CollageProgressState(CollageProgressState.Task.CHOPPING, starting=True))
+        progress_callback(CollageProgressState(CollageProgressState.Task.CHOPPING, completed=True))
+
+    mock_workflow.side_effect = chop
+    outpath = tmp_path / "chop.prof"
+    result = runner.invoke(app, [
+        "chop",
+        "--file", "input.wav",
+        "--outdir", "output_dir",
+        "--profile", str(outpath),
+        "--profile-stage", "chopping"
+    ])
+
+    assert result.exit_code == 0
+    assert outpath.exists()
+    assert mock_cli_progress.return_value.update.call_count == 2
+
+@patch('audio_collage.cli.CLIProgress')
+@patch('audio_collage.cli.workflow.create_collage_from_files')
+def test_collage_command_with_telemetry(mock_create_collage_from_files, mock_cli_progress, tmp_path):
+    """
+    Test that the collage command saves telemetry when asked to.
+    """
+    outpath = tmp_path / "telemetry.prom"
+    result = runner.invoke(app, [
+        "collage",
+        "--target", "target.wav",
+        "--sample", "sample.wav",
+        "--declick-fn", "sigmoid",
+        "--telemetry", str(outpath),
+        "--telemetry-label", "job=nightly"
+    ])
+
+    assert result.exit_code == 0
+    assert 'audio_collage_peak_rss_bytes{job="nightly"}' in outpath.read_text()
+
+@patch('audio_collage.cli.workflow.compare_backends_from_files')
+def test_compare_backends_command(mock_compare):
+    """
+    Test that the compare-backends command compares the chosen search modes.
+    """
+    result = runner.invoke(app, [
+        "compare-backends",
+        "-t", "target.wav",
+        "-s", "sample.wav",
+        "-w", "200,100",
+        "--modes", "index,brute",
+        "--queries", "10",
+        "-o", "backends.json"
+    ])
+
+    assert result.exit_code == 0
+    config, modes = mock_compare.call_args.args
+    assert config.windows == [200, 100]
+    assert config.sample_file == "sample.wav"
+    assert modes == [CollagerConfig.SearchMode.index, CollagerConfig.SearchMode.brute]
+    assert mock_compare.call_args.kwargs == {'n_queries': 10, 'outpath': "backends.json"}
+
+@patch('audio_collage.cli.workflow.recall_from_files')
+def test_recall_command(mock_recall, tmp_path):
+    """
+    Test that the recall command compares the configurations of the grid and
+    prints a table of the results.
+    """
+    grid_path = tmp_path / "grid.json"
+    grid_path.write_text('{"search_mode": ["index", "sliding"]}')
+    mock_recall.return_value = [
+        RecallResult(
+            params={'search_mode': 'sliding'},
+            window=100,
+            queries=10,
+            k=5,
+            recall_at_1=0.5,
+            recall_at_k=0.9,
+            distance_ratio=1.25,
+            queries_per_second=1000.,
+            build_seconds=0.1
+        )
+    ]
+
+    result = runner.invoke(app, [
+        "recall",
+        "-t", "target.wav",
+        "-s", "sample.wav",
+        "-w", "100",
+        "-g", str(grid_path),
+        "-k", "5"
+    ])
+
+    assert result.exit_code == 0
+    config, grid = mock_recall.call_args.args
+    assert config.windows == [100]
+    assert grid == {"search_mode": ["index", "sliding"]}
+    assert mock_recall.call_args.kwargs == {'n_queries': 50, 'k': 5, 'outpath': None}
+    assert "100ms" in result.output
+    assert "0.900" in result.output
+
+def test_cache_commands(tmp_path):
+    """
+    Test that the cache commands report on and prune the given cache directory.
+    """
+    cache_dir = str(tmp_path / "cache")
+    CacheManager(cache_dir).put("a.vptree", lambda path: open(path, 'wb').write(b'x' * 2048))
+
+    result = runner.invoke(app, ["cache", "stats", "--cache-dir", cache_dir])
+    assert result.exit_code == 0
+    assert "1 entries" in result.output
+    assert ".vptree" in result.output
+
+    result = runner.invoke(app, ["cache", "prune", "--cache-dir", cache_dir, "--max-mb", "0.001"])
+    assert result.exit_code == 0
+    assert CacheManager(cache_dir).stats().n_entries == 0
+
+@patch('audio_collage.cli.workflow.warm_cache_from_files')
+def test_cache_warm_command(mock_warm, tmp_path):
+    """
+    Test that the cache warm command indexes each sample into the given cache.
+    """
+    result = runner.invoke(app, [
+        "cache", "warm",
+        "-s", "a.wav",
+        "-s", "b.wav",
+        "-w", "200,100",
+        "--step-factor", "0.5",
+        "--cache-dir", str(tmp_path)
+    ])
+
+    try:
+        assert result.exit_code == 0
+        config, sample_files = mock_warm.call_args.args
+        assert sample_files == ["a.wav", "b.wav"]
+        assert config.windows == [200, 100]
+        assert config.step_factor == 0.5
+        assert default_cache().cache_dir == str(tmp_path)
+    finally:
+        set_default_cache(None)
+
+@patch('audio_collage.cli.workflow.submit_collages_to_queue')
+def test_queue_submit_command(mock_submit, tmp_path):
+    """
+    Test that the queue submit command queues a job per target.
+    """
+    result = runner.invoke(app, [
+        "queue", "submit",
+        "--queue", str(tmp_path),
+        "--sample", "sample.wav",
+        "--target", "a.wav",
+        "--target", "b.wav",
+        "--outdir", "out",
+        "--declick-fn", "linear",
+        "--windows", "100,50"
+    ])
+
+    assert result.exit_code == 0
+    config, targets, queue_dir = mock_submit.call_args.args
+    assert targets == [("a.wav", "out/a.wav"), ("b.wav", "out/b.wav")]
+    assert queue_dir == str(tmp_path)
+    assert config.sample_file == "sample.wav"
+    assert config.windows == [100, 50]
+
+def test_queue_status_command(tmp_path):
+    """
+    Test that the queue status command counts jobs and lists failures.
+    """
+    queue = JobQueue(str(tmp_path), max_attempts=1)
+    queue.submit(CollagerConfig(sample_file="sample.wav", target_file="a.wav", outpath="a_out.wav"))
+    queue.submit(CollagerConfig(sample_file="sample.wav", target_file="b.wav", outpath="b_out.wav"))
+    queue.fail(queue.claim("w1"), "w1", "Broken file")
+
+    result = runner.invoke(app, ["queue", "status", "--queue", str(tmp_path), "--failed"])
+
+    assert result.exit_code == 0
+    assert "1 pending, 0 running, 0 done, 1 failed" in result.output
+    assert "a.wav: Broken file" in result.output
+
+@patch('audio_collage.cli.workflow.run_queue_workers', return_value=2)
+def test_worker_command(mock_run_queue_workers, tmp_path):
+    """
+    Test that the worker command drains the queue with the given cache.
+    """
+    result = runner.invoke(app, [
+        "worker",
+        "--queue", str(tmp_path / "queue"),
+        "-j", "3",
+        "--lease-seconds", "30",
+        "--cache-dir", str(tmp_path / "cache"),
+        "--max-mb", "8"
+    ])
+
+    try:
+        assert result.exit_code == 0
+        mock_run_queue_workers.assert_called_once_with(
+            str(tmp_path / "queue"),
+            processes=3,
+            lease_seconds=30.,
+            max_attempts=3,
+            max_jobs=None,
+            cache_dir=str(tmp_path / "cache"),
+            max_bytes=8 * 1024 * 1024
+        )
+        assert default_cache().cache_dir == str(tmp_path / "cache")
+    finally:
+        set_default_cache(None)
@@ -1,7 +1,9 @@
 import pytest
+import numpy as np
 from unittest.mock import MagicMock, patch, ANY
 from audio_collage.collager import Collager
 from audio_collage.audio_segment import AudioSegment
+from audio_collage.plan import PlanEntry, SelectionPlan
 from audio_collage.collager_config import CollagerConfig
 
 @patch('audio_collage.collager.Util.concatenate_audio')
@@ -101,3 +103,91 @@ def test_create_collage_invalid_distance_fn():
             sample_audio,
             config
         )
+
+@patch('audio_collage.collager.Util.concatenate_audio')
+@patch('audio_collage.collager.AudioMapper')
+def test_create_collage_with_prebuilt_indices(mock_audio_mapper, mock_concatenate_audio):
+    """
+    Test that prebuilt indices are handed to the mapper
+    """
+    sample_audio = MagicMock(spec=AudioSegment, sample_rate=44100)
+    indices = MagicMock()
+
+    Collager.create_collage(MagicMock(), sample_audio, CollagerConfig(), indices=indices)
+
+    assert mock_audio_mapper.return_value.indices is indices
+    mock_audio_mapper.return_value.map_audio.assert_called_once()
+
+@patch('audio_collage.collager.AudioMapper')
+def test_build_indices(mock_audio_mapper):
+    """
+    Test that indices are built from the sample audio alone
+    """
+    sample_audio = MagicMock(spec=AudioSegment, sample_rate=44100)
+    config = CollagerConfig(distance_fn=CollagerConfig.DistanceFn.mean_mfcc)
+
+    indices = Collager.build_indices(sample_audio, config)
+
+    assert mock_audio_mapper.call_args.args[0] is sample_audio
+    assert mock_audio_mapper.call_args.kwargs['config'] is config
+    assert indices is mock_audio_mapper.return_value.build_indices.return_value
+
+def test_create_plan():
+    """
+    Test that a plan records where each selected snippet came from
+    """
+    rng = np.random.default_rng(0)
+    sample_audio = AudioSegment(rng.uniform(-1, 1, 22050), 22050)
+    target_audio = AudioSegment(sample_audio.timeseries[2048:2048 + 4410].copy(), 22050)
+    config = CollagerConfig(
+        windows=[100],
+        declick_fn=None,
+        search_mode=CollagerConfig.SearchMode.sliding
+    )
+
+    plan = Collager.create_plan(target_audio, sample_audio, config)
+
+    assert plan.source_hashes == [sample_audio.hash()]
+    assert [entry.target_offset for entry in plan.entries] == [0, 2205]
+    assert [entry.n_frames for entry in plan.entries] == [2205, 2205]
+    assert all(0 <= entry.offset_frames <= 22050 - 2205 for entry in plan.entries)
+    # rendering without declicking gives back the selected snippets
+    output = Collager.render(plan, sample_audio, declick_fn=None)
+    entry = plan.entries[1]
+    np.testing.assert_array_equal(
+        output.timeseries[2205:],
+        sample_audio.timeseries[entry.offset_frames:entry.offset_frames + 2205]
+    )
+
+def test_render():
+    """
+    Test that rendering a plan concatenates the planned spans of the sample
+    """
+    sample_audio = AudioSegment(np.arange(100, dtype=float), 100)
+    plan = SelectionPlan(sources=['sample.wav'], sample_rate=100, entries=[
+        PlanEntry(source_id=0, offset_frames=50, n_frames=10, distance=0.0, target_offset=0),
+        PlanEntry(source_id=0, offset_frames=0, n_frames=5, distance=0.0, target_offset=10),
+    ])
+
+    output = Collager.render(plan, sample_audio, declick_fn=None)
+
+    assert output.sample_rate == 100
+    np.testing.assert_array_equal(
+        output.timeseries,
+        np.concatenate([np.arange(50, 60), np.arange(0, 5)])
+    )
+
+def test_render_resampled():
+    """
+    Test that rendering at another sample rate scales the planned spans
+    """
+    sample_audio = AudioSegment(np.sin(np.linspace(0, 20, 1000)), 1000)
+    plan = SelectionPlan(sources=['sample.wav'], sample_rate=1000, entries=[
+        PlanEntry(source_id=0, offset_frames=100, n_frames=200, distance=0.0, target_offset=0),
+        PlanEntry(source_id=0, offset_frames=500, n_frames=100, distance=0.0, target_offset=200),
+    ])
+
+    output = Collager.render(plan, sample_audio, declick_fn=None, sample_rate=2000)
+
+    assert output.sample_rate == 2000
+    assert output.n_samples() == 600
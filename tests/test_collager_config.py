@@ -1,3 +1,6 @@
+import dataclasses
+import json
+
 from audio_collage.collager_config import CollagerConfig
 import pytest
 
@@ -34,3 +37,60 @@ def test_collage_config_errors():
             step_ms=100,
             step_factor=0.5
         )
+    # PCA can keep at most the 20 MFCC coefficients
+    for pca_components in [0, -1, 21]:
+        with pytest.raises(ValueError, match='pca_components'):
+            CollagerConfig(pca_components=pca_components)
+    assert CollagerConfig(pca_components=20).pca_components == 20
+
+def test_from_dict():
+    config = CollagerConfig.from_dict({
+        'windows': '100,50',
+        'distance_fn': 'fast_mfcc',
+        'declick_fn': 'linear',
+        'search_mode': 'sliding',
+        'step_factor': 0.5,
+    })
+
+    assert config.windows == [100, 50]
+    assert config.distance_fn == CollagerConfig.DistanceFn.fast_mfcc
+    assert config.declick_fn == CollagerConfig.DeclickFn.linear
+    assert config.search_mode == CollagerConfig.SearchMode.sliding
+    assert config.step_factor == 0.5
+
+def test_to_dict_round_trip():
+    config = CollagerConfig(
+        target_file='target.wav',
+        sample_file='sample.wav',
+        windows=[100, 50],
+        distance_fn=CollagerConfig.DistanceFn.fast_mfcc,
+        declick_fn=None,
+        progress_callback=print
+    )
+    params = config.to_dict()
+
+    assert 'progress_callback' not in params
+    assert params['distance_fn'] == 'fast_mfcc'
+    assert CollagerConfig.from_dict(json.loads(json.dumps(params))) == dataclasses.replace(config, progress_callback=None)
+
+def test_from_dict_errors():
+    with pytest.raises(ValueError):
+        CollagerConfig.from_dict({'window': [100]})
+    with pytest.raises(ValueError):
+        CollagerConfig.from_dict({'distance_fn': 'nope'})
+
+def test_index_key():
+    config = CollagerConfig(sample_file='sample.wav', windows=[100, 50])
+
+    assert config.index_key() == CollagerConfig(sample_file='sample.wav', windows=[100, 50], outpath='out.wav').index_key()
+    assert config.index_key() != CollagerConfig(sample_file='sample.wav', windows=[100]).index_key()
+
+def test_pickle():
+    import pickle
+    config = CollagerConfig(
+        distance_fn=CollagerConfig.DistanceFn.fast_mfcc,
+        declick_fn=CollagerConfig.DeclickFn.linear,
+        search_mode=CollagerConfig.SearchMode.sliding
+    )
+
+    assert pickle.loads(pickle.dumps(config)) == config
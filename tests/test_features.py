@@ -0,0 +1,89 @@
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.features import FrameFeatures, IntegralFeatures, HOP_LENGTH
+from audio_collage.util import Util
+
+import numpy as np
+
+def _source() -> AudioSegment:
+    rng = np.random.default_rng(0)
+    return AudioSegment(
+        timeseries=rng.uniform(-1, 1, 22050).astype(np.float32),
+        sample_rate=22050
+    )
+
+def test_frame_mfcc_shape():
+    """
+    Test that frame-level MFCCs are computed on the fixed hop.
+    """
+    source = _source()
+    mfcc = FrameFeatures.mfcc(source)
+
+    assert mfcc.shape == (20, FrameFeatures.n_frames(source.n_samples()))
+
+def test_frame_features_accept_integer_audio():
+    """
+    Test that integer timeseries are converted before feature extraction.
+    """
+    audio = AudioSegment(timeseries=np.arange(4096), sample_rate=22050)
+
+    assert FrameFeatures.mfcc(audio).shape[1] == FrameFeatures.n_frames(4096)
+
+def test_means_match_direct_mean():
+    """
+    Test that span means from the cumulative sums equal the mean of the frames.
+    """
+    rng = np.random.default_rng(1)
+    frames = rng.normal(size=(12, 50))
+    integral = IntegralFeatures(frames)
+    n_samples = 10 * HOP_LENGTH
+    n_span_frames = FrameFeatures.n_frames(n_samples)
+
+    means = integral.means(np.array([0, 5 * HOP_LENGTH, 20 * HOP_LENGTH]), n_samples)
+
+    assert means.shape == (3, 12)
+    for row, start in zip(means, [0, 5, 20]):
+        assert np.allclose(row, frames[:, start:start + n_span_frames].mean(axis=1))
+    assert np.allclose(integral.mean(5 * HOP_LENGTH, n_samples), means[1])
+
+def test_means_clip_to_source():
+    """
+    Test that spans running off the end of the source use the frames available.
+    """
+    frames = np.arange(20, dtype=float).reshape(2, 10)
+    integral = IntegralFeatures(frames)
+
+    mean = integral.mean(8 * HOP_LENGTH, 5 * HOP_LENGTH)
+
+    assert np.allclose(mean, frames[:, 8:].mean(axis=1))
+
+def test_fill_mfcc_means():
+    """
+    Test that chops get their mean MFCC without computing their own MFCC.
+    """
+    source = _source()
+    integral = IntegralFeatures.from_mfcc(source)
+    chops = Util.chop_audio(source, 100, step_ms=50)
+
+    integral.fill_mfcc_means(chops)
+
+    for chop in chops:
+        assert chop._mfcc is None
+        assert np.allclose(
+            chop.mfcc_mean,
+            integral.mean(chop.offset_frames, chop.n_samples())
+        )
+
+def test_frame_fill_mfcc_means_match_segment_means():
+    """
+    Test that batched mean MFCCs equal those each chop computes alone,
+    including chops shorter than the FFT window.
+    """
+    source = _source()
+    chops = Util.chop_audio(source, 100, step_ms=50) + Util.chop_audio(source, 50, step_ms=50)
+
+    FrameFeatures.fill_mfcc_means(chops, batch_size=4)
+
+    for chop in chops:
+        assert chop._mfcc is None
+        alone = AudioSegment(chop.timeseries.copy(), chop.sample_rate)
+        assert np.allclose(chop.mfcc_mean, alone.mfcc_mean, atol=1e-3)
@@ -0,0 +1,100 @@
+from audio_collage.audio_mapper import AudioMapper
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.collager import Collager
+from audio_collage.collager_config import CollagerConfig
+from audio_collage.incremental import BLOCK_FRAMES, TargetAnalysis
+
+import numpy as np
+
+SAMPLE_RATE = 22050
+
+def _audio(seed: int, n_frames: int) -> AudioSegment:
+    return AudioSegment(
+        np.random.default_rng(seed).uniform(-1, 1, n_frames).astype(np.float32),
+        SAMPLE_RATE
+    )
+
+def _config() -> CollagerConfig:
+    return CollagerConfig(
+        windows=[100, 50],
+        declick_fn=None,
+        search_mode=CollagerConfig.SearchMode.sliding
+    )
+
+def test_unchanged_frames_edit_in_middle():
+    """
+    Test that an edit in the middle leaves the blocks either side unchanged.
+    """
+    target = _audio(0, BLOCK_FRAMES * 10)
+    edited = AudioSegment(target.timeseries.copy(), SAMPLE_RATE)
+    edited.timeseries[BLOCK_FRAMES * 4 + 10] = 0
+
+    head, tail = TargetAnalysis.analyse(target).unchanged_frames(TargetAnalysis.analyse(edited))
+
+    assert head == BLOCK_FRAMES * 4
+    assert tail == BLOCK_FRAMES * 5
+
+def test_unchanged_frames_trimmed_intro():
+    """
+    Test that trimming the start of the target keeps its end unchanged.
+    """
+    target = _audio(0, BLOCK_FRAMES * 10)
+    trimmed = AudioSegment(target.timeseries[1000:], SAMPLE_RATE)
+
+    head, tail = TargetAnalysis.analyse(target).unchanged_frames(TargetAnalysis.analyse(trimmed))
+
+    assert head == 0
+    assert tail == BLOCK_FRAMES * 9
+
+def test_create_plan_reuses_unchanged_target(mocker):
+    """
+    Test that an unchanged target reuses the whole previous plan.
+    """
+    sample = _audio(1, SAMPLE_RATE * 2)
+    target = _audio(2, SAMPLE_RATE * 2)
+    previous = Collager.create_plan(target, sample, _config())
+    select = mocker.spy(AudioMapper, 'select')
+
+    plan = Collager.create_plan(target, sample, _config(), previous_plan=previous)
+
+    select.assert_not_called()
+    assert plan.entries == previous.entries
+
+def test_create_plan_maps_only_changed_span(mocker):
+    """
+    Test that only the edited part of the target is mapped again, and that
+    the plan still covers the target without gaps.
+    """
+    sample = _audio(1, SAMPLE_RATE * 2)
+    target = _audio(2, SAMPLE_RATE * 4)
+    previous = Collager.create_plan(target, sample, _config())
+
+    edited = AudioSegment(target.timeseries.copy(), SAMPLE_RATE)
+    edited.timeseries[SAMPLE_RATE * 2:SAMPLE_RATE * 2 + 500] = 0
+    select = mocker.spy(AudioMapper, 'select')
+
+    plan = Collager.create_plan(edited, sample, _config(), previous_plan=previous)
+
+    select.assert_called_once()
+    _mapper, start, end = select.call_args.args
+    assert 0 < start < SAMPLE_RATE * 2
+    assert SAMPLE_RATE * 2 < end < SAMPLE_RATE * 4
+    assert plan.entries[0] == previous.entries[0]
+    assert plan.entries[-1] == previous.entries[-1]
+    for entry, next_entry in zip(plan.entries, plan.entries[1:]):
+        assert next_entry.target_offset == entry.target_offset + entry.n_frames
+    assert plan.entries[-1].target_offset + plan.entries[-1].n_frames == edited.n_samples()
+
+def test_create_plan_ignores_plan_for_other_config(mocker):
+    """
+    Test that a plan made with other parameters is not reused.
+    """
+    sample = _audio(1, SAMPLE_RATE)
+    target = _audio(2, SAMPLE_RATE)
+    previous = Collager.create_plan(target, sample, _config())
+    select = mocker.spy(AudioMapper, 'select')
+
+    config = CollagerConfig(windows=[200], declick_fn=None, search_mode=CollagerConfig.SearchMode.sliding)
+    Collager.create_plan(target, sample, config, previous_plan=previous)
+
+    select.assert_called_once_with(mocker.ANY)
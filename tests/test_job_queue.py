@@ -0,0 +1,248 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.cache_manager import CacheManager, default_cache, set_default_cache
+from audio_collage.collager_config import CollagerConfig
+from audio_collage.job_queue import JobQueue, QueueWorker
+from audio_collage.workflow import run_queue_workers, submit_collages_to_queue
+
+def _config(name: str, tmp_path) -> CollagerConfig:
+    return CollagerConfig(
+        sample_file='sample.wav',
+        target_file=f'{name}.wav',
+        outpath=str(tmp_path / f'{name}_out.txt'),
+        windows=[100]
+    )
+
+def _expire_lease(queue: JobQueue, job_id: str) -> None:
+    past = time.time() - 10 * queue.lease_seconds
+    os.utime(queue.lease_path(job_id), (past, past))
+
+def test_submit_claim_complete(tmp_path):
+    """
+    Test that jobs are claimed in submission order, once each, and completed.
+    """
+    queue = JobQueue(str(tmp_path / 'queue'))
+    job_ids = [queue.submit(_config(name, tmp_path)) for name in ['a', 'b']]
+
+    first = queue.claim('w1')
+    second = queue.claim('w2')
+    assert queue.claim('w3') is None
+    assert [first.job_id, second.job_id] == job_ids
+    assert first.config == _config('a', tmp_path)
+    assert queue.status().running == 2
+
+    assert queue.complete(first, 'w1')
+    assert not queue.complete(second, 'w1')
+    status = queue.status()
+    assert (status.pending, status.running, status.done, status.failed) == (0, 1, 1, 0)
+    assert queue.jobs(JobQueue.State.done)[0].worker == 'w1'
+    assert not os.path.exists(queue.lease_path(first.job_id))
+
+def test_submit_requires_paths(tmp_path):
+    queue = JobQueue(str(tmp_path))
+    with pytest.raises(ValueError):
+        queue.submit(CollagerConfig(sample_file='sample.wav'))
+
+def test_failed_jobs_are_retried_then_failed(tmp_path):
+    """
+    Test that a failing job is returned to the queue until it runs out of attempts.
+    """
+    queue = JobQueue(str(tmp_path), max_attempts=2)
+    job_id = queue.submit(_config('a', tmp_path))
+
+    queue.fail(queue.claim('w1'), 'w1', 'first error')
+    assert queue.status().pending == 1
+    queue.fail(queue.claim('w1'), 'w1', 'second error')
+
+    assert queue.status().failed == 1
+    job = queue.jobs(JobQueue.State.failed)[0]
+    assert job.job_id == job_id
+    assert job.attempts == 2
+    assert job.errors == ['first error', 'second error']
+
+def test_expired_leases_are_reaped(tmp_path):
+    """
+    Test that a job whose lease expired goes back to the queue, and that its
+    old worker can no longer renew or complete it.
+    """
+    queue = JobQueue(str(tmp_path), lease_seconds=5)
+    job_id = queue.submit(_config('a', tmp_path))
+    job = queue.claim('w1')
+
+    assert queue.reap() == []
+    assert queue.heartbeat(job_id, 'w1')
+    _expire_lease(queue, job_id)
+    assert queue.reap() == [job_id]
+
+    assert not queue.heartbeat(job_id, 'w1')
+    retried = queue.claim('w2')
+    assert retried.attempts == 1
+    assert retried.errors[0].startswith('Lease expired')
+    assert not queue.complete(job, 'w1')
+    assert queue.complete(retried, 'w2')
+
+def test_complete_leaves_job_reclaimed_after_lease_check(tmp_path, mocker):
+    """
+    Test that a worker whose job is reaped and claimed by another worker just
+    after its lease is checked does not complete the other worker's run.
+    """
+    queue = JobQueue(str(tmp_path), lease_seconds=5)
+    job_id = queue.submit(_config('a', tmp_path))
+    job = queue.claim('w1')
+    holds_lease = queue._holds_lease
+    claimed = []
+
+    def reclaim_after_check(checked_job_id: str, worker_id: str) -> bool:
+        held = holds_lease(checked_job_id, worker_id)
+        if worker_id == 'w1' and not claimed:
+            _expire_lease(queue, job_id)
+            queue.reap()
+            claimed.append(queue.claim('w2'))
+        return held
+
+    mocker.patch.object(queue, '_holds_lease', side_effect=reclaim_after_check)
+
+    assert not queue.complete(job, 'w1')
+    assert queue.status().running == 1
+    assert queue.heartbeat(job_id, 'w2')
+    assert queue.complete(claimed[0], 'w2')
+    assert queue.jobs(JobQueue.State.done)[0].worker == 'w2'
+
+def test_worker_abandons_job_after_losing_lease(tmp_path):
+    """
+    Test that a worker cancels a job whose lease it loses, without marking it failed.
+    """
+    queue = JobQueue(str(tmp_path), lease_seconds=0.2)
+    job_id = queue.submit(_config('a', tmp_path))
+    started = threading.Event()
+
+    def run_fn(config: CollagerConfig) -> None:
+        started.set()
+        if not config.cancel_event.wait(5):
+            raise AssertionError("Job was not cancelled")
+        raise RuntimeError("Cancelled")
+
+    worker = QueueWorker(queue, run_fn=run_fn, worker_id='w1')
+    job = queue.claim('w1')
+    thread = threading.Thread(target=lambda: setattr(worker, 'result', worker.run_job(job)))
+    thread.start()
+    started.wait(5)
+    # Keep the lease alive a while, then lose it
+    time.sleep(0.3)
+    assert queue.status().running == 1
+    os.remove(queue.lease_path(job_id))
+    thread.join(5)
+
+    assert worker.result is False
+    assert queue.status().failed == 0
+    assert queue.jobs(JobQueue.State.running)[0].attempts == 0
+
+def _write_output(config: CollagerConfig) -> None:
+    # Dies part way through the first run of job 'b', as if its machine went down
+    if config.target_file == 'b.wav' and not os.path.exists(config.outpath + '.crashed'):
+        open(config.outpath + '.crashed', 'w').close()
+        os._exit(1)
+    time.sleep(0.05)
+    with open(config.outpath, 'a') as f:
+        f.write(f'{os.getpid()}\n')
+
+def _drain(queue_dir: str) -> int:
+    queue = JobQueue(queue_dir, lease_seconds=0.5)
+    return QueueWorker(queue, run_fn=_write_output, poll_seconds=0.05).run()
+
+def test_workers_in_several_processes_drain_the_queue(tmp_path):
+    """
+    Test that workers in separate processes run every job once, and that a
+    job whose worker died is run again by another.
+    """
+    queue_dir = str(tmp_path / 'queue')
+    queue = JobQueue(queue_dir, lease_seconds=0.5)
+    names = [chr(ord('a') + i) for i in range(12)]
+    for name in names:
+        queue.submit(_config(name, tmp_path))
+
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_drain, args=(queue_dir,)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+
+    status = queue.status()
+    assert (status.pending, status.running, status.done, status.failed) == (0, 0, 12, 0)
+    for name in names:
+        with open(tmp_path / f'{name}_out.txt') as f:
+            assert len(f.read().split()) == 1
+    assert [job.attempts for job in queue.jobs(JobQueue.State.done) if job.params['target_file'] == 'b.wav'] == [1]
+    assert sorted(process.exitcode for process in processes) == [0, 0, 1]
+
+def test_run_queue_workers_makes_collages(tmp_path):
+    """
+    Test that submitted collage jobs are run by worker processes sharing a cache.
+    """
+    sample = AudioSegment(np.random.default_rng(0).uniform(-1, 1, 11025).astype(np.float32), sample_rate=22050)
+    sample.to_file(str(tmp_path / 'sample.wav'))
+    targets = []
+    for name in ['a', 'b', 'c']:
+        target = AudioSegment(np.random.default_rng(1).uniform(-1, 1, 4410).astype(np.float32), sample_rate=22050)
+        target.to_file(str(tmp_path / f'{name}.wav'))
+        targets.append((str(tmp_path / f'{name}.wav'), str(tmp_path / f'{name}_out.wav')))
+    config = CollagerConfig(sample_file=str(tmp_path / 'sample.wav'), windows=[100])
+    queue_dir = str(tmp_path / 'queue')
+
+    assert len(submit_collages_to_queue(config, targets, queue_dir)) == 3
+    cache = CacheManager(str(tmp_path / 'cache'))
+    set_default_cache(cache)
+    try:
+        assert run_queue_workers(queue_dir, processes=2) == 3
+    finally:
+        set_default_cache(None)
+
+    assert JobQueue(queue_dir).status().done == 3
+    for _target_file, outpath in targets:
+        assert AudioSegment.from_file(outpath).n_samples() > 0
+    assert [name for name in os.listdir(tmp_path) if '.tmp' in name] == []
+    assert cache.stats().kinds['.vptree'][0] == 1
+
+def test_run_queue_workers_install_given_cache(tmp_path):
+    """
+    Test that worker processes build indices in the given cache rather than
+    the default one.
+    """
+    sample = AudioSegment(np.random.default_rng(0).uniform(-1, 1, 11025).astype(np.float32), sample_rate=22050)
+    sample.to_file(str(tmp_path / 'sample.wav'))
+    targets = []
+    for name in ['a', 'b']:
+        target = AudioSegment(np.random.default_rng(1).uniform(-1, 1, 4410).astype(np.float32), sample_rate=22050)
+        target.to_file(str(tmp_path / f'{name}.wav'))
+        targets.append((str(tmp_path / f'{name}.wav'), str(tmp_path / f'{name}_out.wav')))
+    config = CollagerConfig(sample_file=str(tmp_path / 'sample.wav'), windows=[100])
+    queue_dir = str(tmp_path / 'queue')
+    submit_collages_to_queue(config, targets, queue_dir)
+    set_default_cache(CacheManager(str(tmp_path / 'default')))
+    try:
+        assert run_queue_workers(queue_dir, processes=2, cache_dir=str(tmp_path / 'cache')) == 2
+        assert default_cache().cache_dir == str(tmp_path / 'default')
+    finally:
+        set_default_cache(None)
+
+    assert CacheManager(str(tmp_path / 'cache')).stats().kinds['.vptree'][0] == 1
+    assert not os.path.exists(tmp_path / 'default')
+
+def test_submit_collages_rejects_shared_outpaths(tmp_path):
+    """
+    Test that no jobs are queued if two targets would be written to the same file.
+    """
+    config = CollagerConfig(sample_file='sample.wav', windows=[100])
+    targets = [('one/a.wav', str(tmp_path / 'a.wav')), ('two/a.wav', str(tmp_path / 'a.wav'))]
+
+    with pytest.raises(ValueError):
+        submit_collages_to_queue(config, targets, str(tmp_path / 'queue'))
+    assert not os.path.exists(tmp_path / 'queue')
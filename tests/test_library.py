@@ -0,0 +1,96 @@
+from audio_collage.audio_segment import AudioSegment
+from audio_collage import library
+from audio_collage.library import SampleLibrary
+from audio_collage.util import Util
+
+import numpy as np
+import os
+import sqlite3
+
+def _source() -> AudioSegment:
+    rng = np.random.default_rng(0)
+    return AudioSegment(
+        timeseries=rng.uniform(-1, 1, 22050).astype(np.float32),
+        sample_rate=22050,
+        path='source.wav'
+    )
+
+def test_init_migrates_database(tmp_path):
+    """
+    Test that opening a library creates the samples table in WAL mode.
+    """
+    db_path = str(tmp_path / 'library.db')
+    library = SampleLibrary(db_path)
+
+    connection = sqlite3.connect(db_path)
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(samples)')]
+    indexes = [row[1] for row in connection.execute('PRAGMA index_list(samples)')]
+    journal_mode = library.connection.execute('PRAGMA journal_mode').fetchone()[0]
+
+    assert 'features' in columns
+    assert 'source_hash' in columns
+    assert 'offset_frames' in columns
+    assert 'samples_source_hash_window' in indexes
+    assert journal_mode == 'wal'
+
+def test_migrations_ship_with_the_package():
+    """
+    Test that the migrations are found inside the package, not the source tree around it.
+    """
+    package_dir = os.path.dirname(os.path.abspath(library.__file__))
+
+    assert os.path.dirname(os.path.abspath(library.MIGRATIONS_DIR)) == package_dir
+    assert any(name.endswith('_create_samples_table.py') for name in os.listdir(library.MIGRATIONS_DIR))
+
+def test_ingest_and_load_features(tmp_path):
+    """
+    Test that ingested chops can be read back with their features intact.
+    """
+    library = SampleLibrary(str(tmp_path / 'library.db'))
+    source = _source()
+    chops = Util.chop_audio(source, 100)
+
+    assert not library.has_chops(source.hash(), 100, 2205)
+    library.ingest(source, 100, 2205, chops)
+    assert library.has_chops(source.hash(), 100, 2205)
+
+    offsets, lengths, features = library.load_features(source.hash(), 100, 2205)
+
+    assert list(offsets) == [chop.offset_frames for chop in chops]
+    assert list(lengths) == [chop.n_samples() for chop in chops]
+    for chop, feature in zip(chops, features):
+        assert feature.dtype == np.float32
+        assert np.allclose(feature, chop.mfcc)
+
+def test_ingest_replaces_existing_chops(tmp_path):
+    """
+    Test that re-ingesting a window does not duplicate its chops.
+    """
+    library = SampleLibrary(str(tmp_path / 'library.db'))
+    source = _source()
+    chops = Util.chop_audio(source, 100)
+
+    library.ingest(source, 100, 2205, chops)
+    library.ingest(source, 100, 2205, chops)
+
+    offsets, _lengths, _features = library.load_features(source.hash(), 100, 2205)
+    assert len(offsets) == len(chops)
+
+def test_load_segments(tmp_path, mocker):
+    """
+    Test that loaded segments are views on the source with stored features.
+    """
+    library = SampleLibrary(str(tmp_path / 'library.db'))
+    source = _source()
+    chops = Util.chop_audio(source, 100)
+    library.ingest(source, 100, 2205, chops)
+
+    mfcc_fn = mocker.patch('librosa.feature.mfcc')
+    segments = library.load_segments(source, 100, 2205)
+
+    assert len(segments) == len(chops)
+    for chop, segment in zip(chops, segments):
+        assert segment.offset_frames == chop.offset_frames
+        assert np.array_equal(segment.timeseries, chop.timeseries)
+        assert np.allclose(segment.mfcc, chop.mfcc)
+    mfcc_fn.assert_not_called()
@@ -0,0 +1,85 @@
+import dataclasses
+from audio_collage.audio_mapper import AudioMapper
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.collager import Collager
+from audio_collage.collager_config import CollagerConfig
+from audio_collage.features import HOP_LENGTH
+from audio_collage.partition import map_partitioned, split_points
+
+import numpy as np
+
+SAMPLE_RATE = 22050
+
+def _audio(seed: int, n_frames: int) -> AudioSegment:
+    return AudioSegment(
+        np.random.default_rng(seed).uniform(-1, 1, n_frames).astype(np.float32),
+        SAMPLE_RATE
+    )
+
+def _mapper(target: AudioSegment) -> AudioMapper:
+    config = CollagerConfig(
+        windows=[100, 50],
+        declick_ms=10,
+        search_mode=CollagerConfig.SearchMode.sliding
+    )
+    return AudioMapper(_audio(1, SAMPLE_RATE), target, config=config)
+
+def test_split_points_prefers_quiet_frames():
+    """
+    Test that splits move to the quietest point near an equal split.
+    """
+    target = _audio(0, HOP_LENGTH * 100)
+    target.timeseries[HOP_LENGTH * 55:HOP_LENGTH * 56] = 0
+
+    assert split_points(target, 2, search_frames=HOP_LENGTH * 10) == [HOP_LENGTH * 55]
+
+def test_split_points_single_partition():
+    """
+    Test that a single partition has no splits.
+    """
+    assert split_points(_audio(0, HOP_LENGTH * 100), 1, search_frames=HOP_LENGTH) == []
+
+def test_map_partitioned_matches_serial_at_selection_boundaries():
+    """
+    Test that splitting where serial mapping starts snippets gives the same plan.
+    """
+    target = _audio(2, SAMPLE_RATE)
+    serial = _mapper(target).select()
+    offsets = [entry.target_offset for entry in serial.entries]
+    boundaries = [offsets[len(offsets) // 3], offsets[2 * len(offsets) // 3]]
+
+    plan = map_partitioned(_mapper(target), boundaries, max_workers=3)
+
+    assert plan.entries == serial.entries
+
+def test_map_partitioned_stitches_at_any_boundary():
+    """
+    Test that partitions split at arbitrary frames still join up without gaps.
+    """
+    target = _audio(2, SAMPLE_RATE)
+    mapper = _mapper(target)
+    overlap_frames = int(0.01 * SAMPLE_RATE)
+
+    plan = map_partitioned(mapper, [7001, 15013], max_workers=1)
+
+    for entry, next_entry in zip(plan.entries, plan.entries[1:]):
+        assert next_entry.target_offset == entry.target_offset + entry.n_frames - overlap_frames
+    assert 7001 in [entry.target_offset for entry in plan.entries]
+    assert 15013 in [entry.target_offset for entry in plan.entries]
+
+def test_create_collage_with_partitions():
+    """
+    Test that a partitioned collage renders to the length of a serial one.
+    """
+    target = _audio(2, SAMPLE_RATE)
+    sample = _audio(1, SAMPLE_RATE)
+    config = CollagerConfig(
+        windows=[100],
+        declick_ms=20,
+        search_mode=CollagerConfig.SearchMode.sliding
+    )
+
+    serial = Collager.create_collage(target, sample, config)
+    partitioned = Collager.create_collage(target, sample, dataclasses.replace(config, n_partitions=2))
+
+    assert partitioned.n_samples() == serial.n_samples()
@@ -0,0 +1,65 @@
+from audio_collage.pcm_cache import PCMCache
+
+import numpy as np
+import os
+import shutil
+
+TEST_FILE = 'tests/data/test.wav'
+
+def test_load_decodes_and_caches(tmp_path):
+    """
+    Test that a decoded file is written to the cache and memory-mapped.
+    """
+    cache = PCMCache(str(tmp_path / 'pcm'))
+
+    audio = cache.load(TEST_FILE)
+
+    assert isinstance(audio.timeseries, np.memmap)
+    assert audio.sample_rate == 22050
+    assert audio.path == TEST_FILE
+    assert os.path.exists(cache.cache_path(TEST_FILE))
+
+def test_load_skips_decoding_when_cached(tmp_path, mocker):
+    """
+    Test that a warm cache does not decode the file again.
+    """
+    cache = PCMCache(str(tmp_path / 'pcm'))
+    first = cache.load(TEST_FILE)
+
+    mock_load = mocker.patch('librosa.load')
+    second = cache.load(TEST_FILE)
+
+    mock_load.assert_not_called()
+    assert np.array_equal(first.timeseries, second.timeseries)
+
+def test_key_depends_on_content_mtime_and_sample_rate(tmp_path):
+    """
+    Test that the cache key changes with the file contents, mtime or sample rate.
+    """
+    path = str(tmp_path / 'test.wav')
+    shutil.copyfile(TEST_FILE, path)
+    key = PCMCache(str(tmp_path)).key(path)
+
+    assert PCMCache(str(tmp_path), sample_rate=11025).key(path) != key
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert PCMCache(str(tmp_path)).key(path) != key
+
+    with open(path, 'ab') as f:
+        f.write(b'\0')
+    assert PCMCache(str(tmp_path)).key(path) != key
+
+def test_load_many(tmp_path):
+    """
+    Test that several files are loaded in order through the worker pool.
+    """
+    other = str(tmp_path / 'other.wav')
+    shutil.copyfile(TEST_FILE, other)
+    cache = PCMCache(str(tmp_path / 'pcm'), sample_rate=11025)
+
+    loaded = cache.load_many([TEST_FILE, other], max_workers=2)
+
+    assert [audio.path for audio in loaded] == [TEST_FILE, other]
+    assert all(audio.sample_rate == 11025 for audio in loaded)
+    assert np.array_equal(loaded[0].timeseries, loaded[1].timeseries)
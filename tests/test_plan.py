@@ -0,0 +1,42 @@
+import pytest
+
+from audio_collage.plan import PlanEntry, SelectionPlan
+
+def make_plan():
+    return SelectionPlan(
+        sources=['sample.wav'],
+        source_hashes=['abc'],
+        sample_rate=22050,
+        overlap_ms=20,
+        entries=[
+            PlanEntry(source_id=0, offset_frames=1024, n_frames=4410, distance=0.5, target_offset=0),
+            PlanEntry(source_id=0, offset_frames=0, n_frames=2205, distance=1.25, target_offset=3969),
+        ]
+    )
+
+def test_to_file_and_from_file(tmp_path):
+    """
+    Test that a plan survives a round trip through a file
+    """
+    plan = make_plan()
+    path = str(tmp_path / 'plan.json')
+
+    plan.to_file(path)
+
+    assert SelectionPlan.from_file(path) == plan
+
+def test_total_distance():
+    """
+    Test that the total distance sums over entries
+    """
+    assert make_plan().total_distance() == 1.75
+
+def test_from_dict_unsupported_version():
+    """
+    Test that plans written by an unknown version are rejected
+    """
+    data = make_plan().to_dict()
+    data['version'] = 99
+
+    with pytest.raises(ValueError):
+        SelectionPlan.from_dict(data)
@@ -0,0 +1,87 @@
+import logging
+import pstats
+import sys
+import types
+
+from audio_collage.collage_progress_state import CollageProgressState
+from audio_collage.profiling import Profiler, profile_job
+
+Task = CollageProgressState.Task
+
+def _chop() -> int:
+    return sum(range(1000))
+
+def _select() -> int:
+    return sum(range(1000))
+
+def _profiled_functions(path: str) -> set:
+    return {name for _file, _line, name in pstats.Stats(path).stats}
+
+def test_profile_whole_job(tmp_path, capsys):
+    """
+    Test that a job is profiled and its hotspots printed.
+    """
+    outpath = str(tmp_path / 'job.prof')
+    with profile_job(outpath):
+        _chop()
+
+    assert '_chop' in _profiled_functions(outpath)
+    assert 'tottime' in capsys.readouterr().out
+
+def test_profile_one_stage(tmp_path):
+    """
+    Test that only the chosen stage is profiled, and that states are passed on.
+    """
+    outpath = str(tmp_path / 'job.prof')
+    states = []
+    with profile_job(outpath, Profiler.Stage.selecting, states.append) as progress_callback:
+        progress_callback(CollageProgressState(Task.CHOPPING, starting=True))
+        _chop()
+        progress_callback(CollageProgressState(Task.SELECTING, starting=True))
+        _select()
+        progress_callback(CollageProgressState(Task.SELECTING, completed=True))
+        _chop()
+
+    functions = _profiled_functions(outpath)
+    assert '_select' in functions
+    assert '_chop' not in functions
+    assert len(states) == 3
+
+def test_profile_stage_that_never_ran(tmp_path, caplog):
+    """
+    Test that nothing is saved if the chosen stage never ran.
+    """
+    outpath = tmp_path / 'job.prof'
+    with caplog.at_level(logging.WARNING, logger='audio_collage.profiling'):
+        with profile_job(str(outpath), Profiler.Stage.indexing):
+            _chop()
+
+    assert not outpath.exists()
+    assert 'never ran' in caplog.text
+
+def test_empty_whole_job_profile(tmp_path, caplog):
+    """
+    Test that an empty profile of the whole job is reported without saving anything.
+    """
+    outpath = tmp_path / 'job.prof'
+    with caplog.at_level(logging.WARNING, logger='audio_collage.profiling'):
+        # Never entered, so nothing is profiled
+        Profiler(str(outpath)).__exit__(None, None, None)
+
+    assert not outpath.exists()
+    assert 'Nothing was profiled' in caplog.text
+
+def test_profile_saves_callgrind(tmp_path, monkeypatch):
+    """
+    Test that a callgrind file is saved when pyprof2calltree is installed.
+    """
+    def convert(stats, path):
+        with open(path, 'w') as f:
+            f.write('events: Ticks\n')
+
+    monkeypatch.setitem(sys.modules, 'pyprof2calltree', types.SimpleNamespace(convert=convert))
+    with Profiler(str(tmp_path / 'job.prof')) as profiler:
+        _chop()
+
+    assert profiler.callgrind_path == str(tmp_path / 'job.callgrind')
+    assert (tmp_path / 'job.callgrind').exists()
@@ -0,0 +1,99 @@
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.collager_config import CollagerConfig
+from audio_collage.plan import PlanEntry, SelectionPlan
+from audio_collage.result_cache import ResultCache
+
+import numpy as np
+import os
+import shutil
+
+TEST_FILE = 'tests/data/test.wav'
+
+def _config(tmp_path, **kwargs):
+    target_file = str(tmp_path / 'target.wav')
+    sample_file = str(tmp_path / 'sample.wav')
+    for path in (target_file, sample_file):
+        if not os.path.exists(path):
+            shutil.copyfile(TEST_FILE, path)
+    return CollagerConfig(target_file=target_file, sample_file=sample_file, **kwargs)
+
+def _plan(n_entries: int = 1):
+    return SelectionPlan(sources=['sample.wav'], sample_rate=1000, entries=[
+        PlanEntry(source_id=0, offset_frames=i, n_frames=10, distance=0.0, target_offset=i)
+        for i in range(n_entries)
+    ])
+
+def test_key_ignores_runtime_params(tmp_path):
+    """
+    Test that outputs, caches and callbacks do not change the key.
+    """
+    cache = ResultCache(str(tmp_path / 'results'))
+    config = _config(tmp_path)
+
+    other = _config(
+        tmp_path,
+        outpath='other.wav',
+        pcm_cache_dir='pcm',
+        progress_callback=lambda state: None
+    )
+
+    assert cache.key(config) == cache.key(other)
+
+def test_key_depends_on_params_and_content(tmp_path):
+    """
+    Test that the key changes with collage parameters and file contents.
+    """
+    cache = ResultCache(str(tmp_path / 'results'))
+    config = _config(tmp_path)
+    key = cache.key(config)
+
+    assert cache.key(_config(tmp_path, windows=[100])) != key
+
+    with open(config.target_file, 'ab') as f:
+        f.write(b'\0')
+    assert cache.key(config) != key
+
+def test_put_and_get(tmp_path):
+    """
+    Test that a stored plan and its audio are returned on a hit.
+    """
+    cache = ResultCache(str(tmp_path / 'results'))
+    plan = _plan()
+    audio = AudioSegment(np.zeros(100, dtype=np.float32), 1000)
+
+    assert cache.get_plan('abc') is None
+    assert cache.get_audio_path('abc') is None
+
+    cache.put('abc', plan, audio)
+
+    assert cache.get_plan('abc') == plan
+    assert AudioSegment.from_file(cache.get_audio_path('abc')).n_samples() > 0
+
+def test_put_without_audio(tmp_path):
+    """
+    Test that audio is not stored when the cache only keeps plans.
+    """
+    cache = ResultCache(str(tmp_path / 'results'), store_audio=False)
+
+    cache.put('abc', _plan(), AudioSegment(np.zeros(100, dtype=np.float32), 1000))
+
+    assert cache.get_plan('abc') is not None
+    assert cache.get_audio_path('abc') is None
+
+def test_evicts_least_recently_used(tmp_path):
+    """
+    Test that the least recently used entries are evicted once over budget.
+    """
+    cache = ResultCache(str(tmp_path / 'results'))
+    cache.put('a', _plan(50))
+    cache.max_bytes = cache.nbytes() * 2 + 1
+    cache.put('b', _plan(50))
+    os.utime(cache.plan_path('a'), ns=(1, 1))
+    os.utime(cache.plan_path('b'), ns=(2, 2))
+
+    cache.get_plan('a')
+    cache.put('c', _plan(50))
+
+    assert cache.get_plan('a') is not None
+    assert cache.get_plan('b') is None
+    assert cache.get_plan('c') is not None
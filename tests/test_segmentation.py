@@ -0,0 +1,90 @@
+from audio_collage.audio_mapper import AudioMapper
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.collager import Collager
+from audio_collage.collager_config import CollagerConfig
+from audio_collage.segmentation import BeamSelector, compare_with_greedy
+
+import numpy as np
+import pytest
+
+SAMPLE_RATE = 22050
+
+def _audio(seed: int, n_frames: int) -> AudioSegment:
+    return AudioSegment(
+        np.random.default_rng(seed).uniform(-1, 1, n_frames).astype(np.float32),
+        SAMPLE_RATE
+    )
+
+def _mapper(n_frames: int = SAMPLE_RATE) -> AudioMapper:
+    config = CollagerConfig(
+        windows=[100, 60],
+        declick_ms=10,
+        search_mode=CollagerConfig.SearchMode.sliding
+    )
+    return AudioMapper(_audio(1, SAMPLE_RATE), _audio(2, n_frames), config=config)
+
+def test_select_covers_target():
+    """
+    Test that the selection joins up and covers the whole target.
+    """
+    mapper = _mapper()
+    overlap_frames = int(0.01 * SAMPLE_RATE)
+
+    plan = BeamSelector(mapper, beam_width=4).select()
+
+    assert plan.entries[0].target_offset == 0
+    for entry, next_entry in zip(plan.entries, plan.entries[1:]):
+        assert next_entry.target_offset == entry.target_offset + entry.n_frames - overlap_frames
+    last = plan.entries[-1]
+    assert last.target_offset + last.n_frames == SAMPLE_RATE
+
+def test_wide_beam_is_no_worse_than_greedy():
+    """
+    Test that a beam wide enough to be exact matches at least as well as greedy selection.
+    """
+    comparison = compare_with_greedy(_mapper(), beam_width=1000)
+
+    assert comparison['beam']['distance'] <= comparison['greedy']['distance'] + 1e-9
+    assert comparison['beam']['queries'] > 0
+
+def test_comparison_times_selection_only(mocker):
+    """
+    Test that the indices are built before either selection is timed.
+    """
+    mapper = _mapper()
+    events = []
+    build_indices = mapper.build_indices
+    mocker.patch.object(mapper, 'build_indices', side_effect=lambda: events.append('build') or build_indices())
+    mocker.patch('audio_collage.segmentation.time.perf_counter', side_effect=lambda: events.append('clock') or 0.)
+
+    compare_with_greedy(mapper, beam_width=4)
+
+    assert events.index('build') < events.index('clock')
+    assert events.count('build') == 1
+
+def test_time_budget_finishes_greedily():
+    """
+    Test that running out of time still completes the selection.
+    """
+    plan = BeamSelector(_mapper(), beam_width=16, time_budget=0).select()
+
+    last = plan.entries[-1]
+    assert last.target_offset + last.n_frames == SAMPLE_RATE
+
+def test_create_plan_with_beam_selection():
+    """
+    Test that beam selection records its comparison with greedy selection.
+    """
+    config = CollagerConfig(
+        windows=[100, 60],
+        declick_ms=10,
+        search_mode=CollagerConfig.SearchMode.sliding,
+        selection_mode=CollagerConfig.SelectionMode.beam,
+        beam_width=4,
+        compare_greedy=True
+    )
+
+    plan = Collager.create_plan(_audio(2, SAMPLE_RATE // 2), _audio(1, SAMPLE_RATE), config)
+
+    assert set(plan.metadata['comparison']) == {'greedy', 'beam'}
+    assert plan.metadata['comparison']['beam']['distance'] == pytest.approx(plan.mean_distance())
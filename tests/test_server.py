@@ -0,0 +1,168 @@
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.collager_config import CollagerConfig
+from audio_collage.plan import SelectionPlan
+from audio_collage.server import CollageService, IndexCache, create_server
+
+import json
+import numpy as np
+import pytest
+import threading
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock, patch
+
+def _entry(n_bytes: int):
+    indices = MagicMock()
+    indices.nbytes.return_value = 0
+    return AudioSegment(np.zeros(n_bytes, dtype=np.uint8), 1000), indices
+
+def test_get_or_build_builds_once():
+    """
+    Test that an entry is built on the first request and reused afterwards.
+    """
+    cache = IndexCache(max_bytes=1000)
+    build_fn = MagicMock(return_value=_entry(10))
+
+    first = cache.get_or_build('a', build_fn)
+    second = cache.get_or_build('a', build_fn)
+
+    build_fn.assert_called_once()
+    assert first is second
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_evicts_least_recently_used():
+    """
+    Test that the least recently used entry is evicted when over budget.
+    """
+    cache = IndexCache(max_bytes=250)
+    cache.get_or_build('a', lambda: _entry(100))
+    cache.get_or_build('b', lambda: _entry(100))
+    cache.get_or_build('a', lambda: _entry(100))
+    cache.get_or_build('c', lambda: _entry(100))
+
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.nbytes() == 200
+
+def test_keeps_single_entry_over_budget():
+    """
+    Test that an entry larger than the budget is still kept for the current job.
+    """
+    cache = IndexCache(max_bytes=50)
+    cache.get_or_build('a', lambda: _entry(100))
+
+    assert list(cache.entries) == ['a']
+
+@patch('audio_collage.server.os.stat')
+@patch('audio_collage.server.Collager')
+@patch('audio_collage.server.AudioSegment.from_file')
+def test_run_job_reuses_indices(mock_from_file, mock_collager, mock_stat):
+    """
+    Test that a second job with the same sample and config reuses its indices.
+    """
+    mock_stat.return_value.st_mtime_ns = 1
+    mock_from_file.return_value = AudioSegment(np.zeros(10), 1000)
+    mock_collager.build_indices.return_value.nbytes.return_value = 0
+    service = CollageService(max_bytes=1000)
+    params = {
+        'sample_file': 'sample.wav',
+        'target_file': 'target.wav',
+        'outpath': 'out.wav',
+        'windows': '100,50',
+        'distance_fn': 'fast_mfcc',
+    }
+
+    service.run_job(params)
+    result = service.run_job(dict(params, target_file='other.wav'))
+
+    mock_collager.build_indices.assert_called_once()
+    assert mock_collager.create_collage.call_count == 2
+    kwargs = mock_collager.create_collage.call_args.kwargs
+    assert kwargs['indices'] is mock_collager.build_indices.return_value
+    assert kwargs['config'].distance_fn == CollagerConfig.DistanceFn.fast_mfcc
+    assert result['outpath'] == 'out.wav'
+
+def test_run_job_requires_files():
+    """
+    Test that jobs without input and output files are rejected.
+    """
+    with pytest.raises(ValueError):
+        CollageService(max_bytes=1000).run_job({'sample_file': 'sample.wav'})
+
+def test_http_server():
+    """
+    Test that jobs and status requests are served over HTTP.
+    """
+    service = MagicMock()
+    service.run_job.return_value = {'outpath': 'out.wav', 'seconds': 1.0}
+    service.index_cache.stats.return_value = {'entries': 0}
+    server = create_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        request = urllib.request.Request(
+            f"{url}/collage",
+            data=json.dumps({'outpath': 'out.wav'}).encode(),
+            method='POST'
+        )
+        with urllib.request.urlopen(request) as response:
+            assert json.loads(response.read())['outpath'] == 'out.wav'
+        with urllib.request.urlopen(f"{url}/status") as response:
+            assert json.loads(response.read()) == {'entries': 0}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    service.run_job.assert_called_once_with({'outpath': 'out.wav'})
+
+@pytest.mark.parametrize('error, status', [(ValueError("Bad params"), 400), (RuntimeError("Boom"), 500)])
+def test_http_server_reports_errors(error, status, caplog):
+    """
+    Test that failed jobs get a JSON error, with unexpected failures logged as server errors.
+    """
+    service = MagicMock()
+    service.run_job.side_effect = error
+    server = create_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_address[1]}/collage",
+            data=b'{}',
+            method='POST'
+        )
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(request)
+        assert e.value.code == status
+        assert str(error) in json.loads(e.value.read())['error']
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert any(record.levelname == 'ERROR' for record in caplog.records) == (status == 500)
+
+@patch('audio_collage.server.Collager')
+def test_run_job_serves_repeated_jobs_from_result_cache(mock_collager, tmp_path):
+    """
+    Test that an identical job is served from the result cache.
+    """
+    mock_collager.create_plan.return_value = SelectionPlan(sources=['test.wav'], sample_rate=1000)
+    mock_collager.render.return_value = AudioSegment(np.zeros(100, dtype=np.float32), 1000)
+    mock_collager.build_indices.return_value.nbytes.return_value = 0
+    service = CollageService(max_bytes=1 << 30, result_cache_dir=str(tmp_path / 'results'))
+    params = {
+        'sample_file': 'tests/data/test.wav',
+        'target_file': 'tests/data/test.wav',
+        'outpath': str(tmp_path / 'out.wav'),
+    }
+
+    first = service.run_job(params)
+    second = service.run_job(dict(params, outpath=str(tmp_path / 'again.wav')))
+
+    assert not first['cached']
+    assert second['cached']
+    mock_collager.create_plan.assert_called_once()
+    assert (tmp_path / 'again.wav').exists()
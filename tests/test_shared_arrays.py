@@ -0,0 +1,163 @@
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from audio_collage import shared_arrays, workflow
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.collager import Collager
+from audio_collage.collager_config import CollagerConfig
+from audio_collage.shared_arrays import ALIGNMENT, SharedHandle, shared
+from audio_collage.util import Util
+
+# Workers that are not forked load the handle from the block
+SPAWN = multiprocessing.get_context('spawn')
+FORK = multiprocessing.get_context('fork')
+
+def _sample() -> AudioSegment:
+    rng = np.random.default_rng(0)
+    return AudioSegment(rng.uniform(-1, 1, 22050).astype(np.float32), 22050)
+
+def _block_address(handle: SharedHandle) -> int:
+    return np.frombuffer(handle._block.buf, dtype=np.uint8).__array_interface__['data'][0]
+
+def test_round_trip():
+    """
+    Test that an object is loaded back with equal arrays, which are read-only views of the block.
+    """
+    sample = _sample()
+    chops = Util.chop_audio(sample, 200, step_ms=100)
+    with shared((sample, chops, {'names': ['a', 'b']}), SPAWN) as handle:
+        loaded_sample, loaded_chops, extra = pickle.loads(pickle.dumps(handle)).load()
+
+        assert extra == {'names': ['a', 'b']}
+        np.testing.assert_array_equal(loaded_sample.timeseries, sample.timeseries)
+        assert [chop.offset_frames for chop in loaded_chops] == [chop.offset_frames for chop in chops]
+        for chop, loaded in zip(chops, loaded_chops):
+            np.testing.assert_array_equal(loaded.timeseries, chop.timeseries)
+        assert not loaded_sample.timeseries.flags.writeable
+        with pytest.raises(ValueError):
+            loaded_sample.timeseries[0] = 0.
+
+def test_views_share_one_copy():
+    """
+    Test that chops, which are views of the sample, take no space of their own in the block.
+    """
+    sample = _sample()
+    chops = Util.chop_audio(sample, 100, step_ms=100)
+    with shared((sample, chops), SPAWN) as handle:
+        assert sample.timeseries.nbytes <= handle.nbytes < sample.timeseries.nbytes + ALIGNMENT
+        # Only the structure of the object is pickled, not its arrays
+        assert len(handle.payload) < sample.timeseries.nbytes / 4
+
+        loaded_sample, loaded_chops = handle.load()
+        start = _block_address(handle)
+        addresses = [chop.timeseries.__array_interface__['data'][0] for chop in loaded_chops]
+        assert loaded_sample.timeseries.__array_interface__['data'][0] == start
+        assert addresses[1] - addresses[0] == 2205 * sample.timeseries.itemsize
+
+def test_non_contiguous_and_empty_arrays():
+    """
+    Test that strided views, empty arrays and object arrays survive the round trip.
+    """
+    matrix = np.arange(24, dtype=np.float64).reshape(4, 6)
+    obj = {
+        'columns': matrix[:, ::2],
+        'transposed': matrix.T,
+        'reversed': matrix[::-1],
+        'empty': np.zeros(0),
+        'objects': np.array([{'a': 1}, None], dtype=object),
+    }
+    with shared(obj, SPAWN) as handle:
+        loaded = handle.load()
+
+    for key in ('columns', 'transposed', 'reversed', 'empty'):
+        np.testing.assert_array_equal(loaded[key], obj[key])
+    assert list(loaded['objects']) == [{'a': 1}, None]
+
+def test_falls_back_to_pickling(mocker):
+    """
+    Test that the arrays are pickled in the handle if shared memory can't be created.
+    """
+    mocker.patch('audio_collage.shared_arrays.shared_memory.SharedMemory', side_effect=OSError("no /dev/shm"))
+    sample = _sample()
+    with shared(sample, SPAWN) as handle:
+        assert handle.name is None
+        np.testing.assert_array_equal(handle.load().timeseries, sample.timeseries)
+
+def _sum(sample: AudioSegment, chops) -> float:
+    return float(sample.timeseries.sum() + sum(chop.timeseries.sum() for chop in chops))
+
+def _sum_in_worker(handle: SharedHandle) -> float:
+    return _sum(*handle.load())
+
+def test_workers_read_the_block():
+    """
+    Test that worker processes load the handle, and that the block outlives them.
+    """
+    sample = _sample()
+    chops = Util.chop_audio(sample, 200, step_ms=100)
+    expected = _sum(sample, chops)
+
+    with shared((sample, chops), SPAWN) as handle:
+        with SPAWN.Pool(2) as pool:
+            results = pool.map(_sum_in_worker, [handle] * 4)
+        assert results == pytest.approx([expected] * 4)
+        # Workers exiting must not free the block
+        assert _sum_in_worker(handle) == pytest.approx(expected)
+
+def _address(array: np.ndarray) -> int:
+    return array.__array_interface__['data'][0]
+
+def _batch_worker_views() -> list:
+    sample_audio, indices, _config = workflow._batch_state
+    (block,) = shared_arrays._attached.values()
+    start = _address(np.frombuffer(block.buf, dtype=np.uint8))
+    arrays = [sample_audio.timeseries] + [segment.timeseries for segment in indices.indices[100].segments]
+    return [start <= _address(array) < start + block.size and not array.flags.writeable for array in arrays]
+
+def test_spawned_batch_workers_read_views_of_the_block():
+    """
+    Test that spawned batch workers hold the sample and indexed chops as views
+    of the shared block, not copies of their own.
+    """
+    sample = _sample()
+    config = CollagerConfig(windows=[100], declick_ms=0, search_mode=CollagerConfig.SearchMode.brute)
+    indices = Collager.build_indices(sample, config)
+
+    with shared((sample, indices), SPAWN) as handle, ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=SPAWN,
+        initializer=workflow._attach_batch_worker,
+        initargs=(handle, config)
+    ) as executor:
+        assert handle.name is not None
+        views = executor.submit(_batch_worker_views).result()
+
+    assert len(views) == 1 + len(indices.indices[100].segments)
+    assert all(views)
+
+_inherited = None
+
+def _inherit(handle: SharedHandle) -> None:
+    global _inherited
+    _inherited = handle.load()
+
+def _inherited_address() -> int:
+    return _address(_inherited.timeseries)
+
+def test_forked_workers_inherit_the_object():
+    """
+    Test that forked workers are handed the object itself, whose arrays they
+    share with this process, rather than a copy in shared memory.
+    """
+    sample = _sample()
+    with shared(sample, FORK) as handle:
+        assert handle.name is None
+        assert handle.load() is sample
+        with pytest.raises(pickle.PicklingError):
+            pickle.dumps(handle)
+        with ProcessPoolExecutor(max_workers=1, mp_context=FORK, initializer=_inherit, initargs=(handle,)) as executor:
+            assert executor.submit(_inherited_address).result() == _address(sample.timeseries)
@@ -0,0 +1,99 @@
+import dataclasses
+import io
+import logging
+
+import numpy as np
+import pytest
+
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.collager import Collager
+from audio_collage.collager_config import CollagerConfig
+from audio_collage.streaming import RingBuffer, StreamingCollager, read_raw_blocks
+
+SAMPLE_RATE = 22050
+
+def _audio(seed: int, n_frames: int) -> AudioSegment:
+    return AudioSegment(
+        np.random.default_rng(seed).uniform(-1, 1, n_frames).astype(np.float32),
+        SAMPLE_RATE
+    )
+
+CONFIG = CollagerConfig(
+    windows=[100, 50],
+    declick_fn=CollagerConfig.DeclickFn.sigmoid,
+    declick_ms=10,
+    search_mode=CollagerConfig.SearchMode.sliding
+)
+
+def test_ring_buffer_wraps_around():
+    """
+    Test that reads address absolute frames across the end of the buffer.
+    """
+    ring = RingBuffer(8)
+    ring.write(np.arange(6))
+    ring.write(np.arange(6, 12))
+
+    assert ring.start == 4
+    assert ring.end == 12
+    np.testing.assert_array_equal(ring.read(5, 5), np.arange(5, 10))
+    np.testing.assert_array_equal(ring.read(10, 5), [10, 11])
+    with pytest.raises(ValueError):
+        ring.read(3, 1)
+
+@pytest.mark.parametrize('declick_ms', [0, 10])
+def test_streaming_matches_offline_collage(declick_ms):
+    """
+    Test that streaming a target block by block gives the offline collage,
+    including when the cross-fade takes the declick function's default.
+    """
+    config = dataclasses.replace(CONFIG, declick_ms=declick_ms)
+    sample = _audio(1, SAMPLE_RATE)
+    target = _audio(0, SAMPLE_RATE)
+    indices = Collager.build_indices(sample, config)
+    offline = Collager.create_collage(target, sample, config, indices=indices)
+
+    collager = StreamingCollager(sample, indices, config)
+    outputs = [collager.push(target.timeseries[i:i + 1000]) for i in range(0, target.n_samples(), 1000)]
+    outputs.append(collager.flush())
+
+    np.testing.assert_allclose(np.concatenate(outputs), offline.timeseries, atol=1e-6)
+
+def test_streaming_latency_is_bounded():
+    """
+    Test that output trails the input by no more than the latency.
+    """
+    sample = _audio(1, SAMPLE_RATE)
+    target = _audio(0, SAMPLE_RATE)
+    collager = StreamingCollager(sample, Collager.build_indices(sample, CONFIG), CONFIG)
+
+    assert collager.latency_frames == int(0.11 * SAMPLE_RATE) + int(0.01 * SAMPLE_RATE)
+    n_in = n_out = 0
+    for i in range(0, target.n_samples(), 500):
+        block = target.timeseries[i:i + 500]
+        n_in += block.size
+        n_out += collager.push(block).size
+        assert n_in - n_out <= collager.latency_frames + 500
+
+def test_streaming_warns_when_behind(caplog):
+    """
+    Test that falling behind real time by more than the latency is reported.
+    """
+    sample = _audio(1, SAMPLE_RATE)
+    collager = StreamingCollager(sample, Collager.build_indices(sample, CONFIG), CONFIG)
+
+    with caplog.at_level(logging.WARNING, logger='audio_collage.streaming'):
+        collager._track_lag(1.0, 0.01)
+        collager._track_lag(1.0, 0.01)
+
+    assert collager.max_lag_seconds == pytest.approx(1.98)
+    assert len([r for r in caplog.records if 'behind real time' in r.message]) == 1
+
+def test_read_raw_blocks():
+    """
+    Test that raw float PCM is read in blocks, whatever the read sizes.
+    """
+    data = np.arange(10, dtype=np.float32)
+    blocks = list(read_raw_blocks(io.BytesIO(data.tobytes()), 4))
+
+    assert [block.size for block in blocks] == [4, 4, 2]
+    np.testing.assert_array_equal(np.concatenate(blocks), data)
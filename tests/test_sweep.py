@@ -0,0 +1,112 @@
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.collager_config import CollagerConfig
+from audio_collage.search.index import SearchIndex
+from audio_collage.sweep import SweepIndexBuilder, expand_grid, plan_sweep, run_sweep
+from audio_collage.util import Util
+
+import numpy as np
+import os
+
+def _audio(seed: int, n_samples: int) -> AudioSegment:
+    return AudioSegment(
+        np.random.default_rng(seed).uniform(-1, 1, n_samples).astype(np.float32),
+        sample_rate=22050
+    )
+
+def test_expand_grid():
+    """
+    Test that every combination of grid values becomes a config.
+    """
+    base = CollagerConfig(sample_file='sample.wav', declick_ms=10)
+    configs = expand_grid(base, {
+        'windows': ['100,50', [200]],
+        'distance_fn': ['mfcc', 'fast_mfcc', 'mean_mfcc'],
+    })
+
+    assert len(configs) == 6
+    assert configs[0].windows == [100, 50]
+    assert configs[0].distance_fn == CollagerConfig.DistanceFn.mfcc
+    assert configs[5].windows == [200]
+    assert configs[5].distance_fn == CollagerConfig.DistanceFn.mean_mfcc
+    assert all(config.sample_file == 'sample.wav' for config in configs)
+    assert all(config.declick_ms == 10 for config in configs)
+
+def test_plan_sweep_shares_indices_and_chops():
+    """
+    Test that configs which need the same index are planned to share it.
+    """
+    configs = expand_grid(CollagerConfig(), {
+        'windows': ['100,50', '100'],
+        'distance_fn': ['mfcc', 'fast_mfcc'],
+        'declick_fn': ['sigmoid', 'linear'],
+    })
+
+    plan = plan_sweep(configs, 22050)
+
+    assert len(configs) == 8
+    assert len(plan.unique_indices) == 4
+    assert len(plan.unique_chops) == 2
+
+def test_run_sweep_builds_each_index_once(mocker, tmp_path):
+    """
+    Test that a sweep chops and indexes once per unique key and renders every config.
+    """
+    mocker.patch.object(SearchIndex, '_save_to_cache')
+    mocker.patch.object(SearchIndex, '_load_from_cache', return_value=False)
+    build = mocker.spy(SearchIndex, 'build')
+    chop = mocker.spy(Util, 'chop_audio_frames')
+
+    configs = expand_grid(CollagerConfig(), {
+        'windows': ['100,50', '100'],
+        'distance_fn': ['fast_mfcc', 'mean_mfcc'],
+        'declick_ms': [0, 10],
+    })
+    outpaths = [str(tmp_path / f"{i}.wav") for i in range(len(configs))]
+
+    plan = run_sweep(_audio(0, 11025), _audio(1, 4410), configs, outpaths, max_workers=1)
+
+    assert build.call_count == len(plan.unique_indices) == 8
+    assert chop.call_count == len(plan.unique_chops) == 4
+    assert all(os.path.exists(outpath) for outpath in outpaths)
+
+def test_run_sweep_in_worker_processes(tmp_path):
+    """
+    Test that configs are rendered in worker processes.
+    """
+    configs = expand_grid(CollagerConfig(search_mode=CollagerConfig.SearchMode.sliding), {
+        'windows': ['100,50', '100'],
+    })
+    outpaths = [str(tmp_path / f"{i}.wav") for i in range(len(configs))]
+
+    run_sweep(_audio(0, 11025), _audio(1, 4410), configs, outpaths, max_workers=2)
+
+    assert all(os.path.exists(outpath) for outpath in outpaths)
+
+def test_run_sweep_with_sliding_and_index_search_and_pca(tmp_path):
+    """
+    Test that sliding and index configs with the same PCA don't share target chunks.
+    """
+    base = CollagerConfig(windows=[200], pca_components=4, distance_fn=CollagerConfig.DistanceFn.mean_mfcc)
+    configs = expand_grid(base, {'search_mode': ['sliding', 'index']})
+    outpaths = [str(tmp_path / f"{i}.wav") for i in range(len(configs))]
+
+    run_sweep(_audio(0, 11025), _audio(1, 4410), configs, outpaths, max_workers=1)
+
+    assert all(os.path.exists(outpath) for outpath in outpaths)
+
+def test_sweep_chops_with_each_configs_step():
+    """
+    Test that configs whose steps are the same number of frames at different
+    windows are chopped as they would be on their own.
+    """
+    sample = _audio(0, 22050)
+    configs = [
+        CollagerConfig(windows=[100], step_factor=0.5, search_mode=CollagerConfig.SearchMode.brute),
+        CollagerConfig(windows=[200], step_ms=50, search_mode=CollagerConfig.SearchMode.brute),
+    ]
+    plan = plan_sweep(configs, sample.sample_rate)
+
+    indices = SweepIndexBuilder(sample).build(plan)
+
+    assert len(indices[plan.index_keys[0][100]].segments) == len(Util.chop_audio(sample, 100, step_factor=0.5))
+    assert len(indices[plan.index_keys[1][200]].segments) == len(Util.chop_audio(sample, 200, step_ms=50))
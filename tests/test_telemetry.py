@@ -0,0 +1,145 @@
+import json
+
+import numpy as np
+
+from audio_collage import telemetry
+from audio_collage.audio_segment import AudioSegment
+from audio_collage.collager import Collager
+from audio_collage.collager_config import CollagerConfig
+from audio_collage.telemetry import Telemetry
+
+SAMPLE_RATE = 22050
+
+def _audio(seed: int, n_frames: int) -> AudioSegment:
+    return AudioSegment(
+        np.random.default_rng(seed).uniform(-1, 1, n_frames).astype(np.float32),
+        SAMPLE_RATE
+    )
+
+def test_span_and_count():
+    """
+    Test that spans and counters are recorded by the active telemetry.
+    """
+    recorder = Telemetry()
+    with recorder.activate():
+        with telemetry.span('chop', window=100) as span:
+            span.items = 3
+        telemetry.count('bytes_read', 10)
+        telemetry.count('bytes_read', 5)
+
+    assert [(s.name, s.items, s.attributes) for s in recorder.spans] == [('chop', 3, {'window': 100})]
+    assert recorder.spans[0].seconds >= 0
+    assert recorder.counters == {'bytes_read': 15}
+
+def test_nothing_recorded_when_inactive():
+    """
+    Test that reporting without active telemetry does nothing.
+    """
+    recorder = Telemetry()
+    with telemetry.span('chop'):
+        telemetry.count('bytes_read')
+
+    assert recorder.spans == []
+    assert telemetry.active() is None
+
+def test_to_jsonl():
+    """
+    Test that spans, counters and the process peak memory are exported as JSON lines.
+    """
+    recorder = Telemetry()
+    with recorder.span('select', items=2):
+        pass
+    recorder.count('search_queries', 2)
+
+    records = [json.loads(line) for line in recorder.to_jsonl().splitlines()]
+
+    assert [record['type'] for record in records] == ['span', 'counter', 'process']
+    assert records[0]['name'] == 'select'
+    assert records[1] == {'type': 'counter', 'name': 'search_queries', 'value': 2}
+
+def test_to_prometheus():
+    """
+    Test that spans are summed by name and counters exported with labels.
+    """
+    recorder = Telemetry()
+    for items in [2, 3]:
+        with recorder.span('chop', items=items):
+            pass
+    recorder.count('index_cache_hits')
+
+    text = recorder.to_prometheus(labels={'job': 'a "b"'})
+
+    assert 'audio_collage_span_count{job="a \\"b\\"",span="chop"} 2' in text
+    assert 'audio_collage_span_items_total{job="a \\"b\\"",span="chop"} 5' in text
+    assert 'audio_collage_index_cache_hits_total{job="a \\"b\\""} 1' in text
+    assert '# TYPE audio_collage_span_seconds_total counter' in text
+
+def test_observe_histogram():
+    """
+    Test that observations are counted in buckets and exported as a
+    Prometheus histogram and a JSON line.
+    """
+    recorder = Telemetry()
+    with recorder.activate():
+        telemetry.observe('distance_calls_per_query', 10)
+        telemetry.observe('distance_calls_per_query', 50, n=2)
+        telemetry.observe('distance_calls_per_query', 5000000)
+
+    histogram = recorder.histograms['distance_calls_per_query']
+    assert histogram.count == 4
+    assert histogram.sum == 5000110
+    assert histogram.cumulative_counts() == [0, 1, 3, 3, 3, 3, 3, 4]
+
+    text = recorder.to_prometheus()
+    assert '# TYPE audio_collage_distance_calls_per_query histogram' in text
+    assert 'audio_collage_distance_calls_per_query_bucket{le="100"} 3' in text
+    assert 'audio_collage_distance_calls_per_query_bucket{le="+Inf"} 4' in text
+    assert 'audio_collage_distance_calls_per_query_count 4' in text
+    records = [json.loads(line) for line in recorder.to_jsonl().splitlines()]
+    assert records[0]['type'] == 'histogram'
+    assert records[0]['count'] == 4
+
+def test_collage_is_instrumented():
+    """
+    Test that a collage reports its index builds, selection and rendering.
+    """
+    sample = _audio(1, SAMPLE_RATE)
+    target = _audio(0, SAMPLE_RATE // 2)
+    config = CollagerConfig(windows=[100, 50], search_mode=CollagerConfig.SearchMode.sliding)
+
+    recorder = Telemetry()
+    with recorder.activate():
+        Collager.create_collage(target, sample, config)
+
+    names = [span.name for span in recorder.spans]
+    assert names.count('index_build') == 2
+    assert {'featurise', 'select', 'render'} <= set(names)
+    select = next(span for span in recorder.spans if span.name == 'select')
+    assert select.items > 0
+    assert recorder.counters['search_queries'] == select.items
+    assert recorder.counters['distance_calls'] > recorder.counters['search_queries']
+
+def test_index_search_is_instrumented():
+    """
+    Test that chops and queries are featurised in spans and that the distance
+    evaluations of each query are observed.
+    """
+    sample = _audio(1, SAMPLE_RATE)
+    target = _audio(0, SAMPLE_RATE // 2)
+    config = CollagerConfig(
+        windows=[100, 50],
+        distance_fn=CollagerConfig.DistanceFn.mean_mfcc,
+        search_mode=CollagerConfig.SearchMode.brute
+    )
+
+    recorder = Telemetry()
+    with recorder.activate():
+        Collager.create_collage(target, sample, config)
+
+    featurise = [span for span in recorder.spans if span.name == 'featurise']
+    assert {span.attributes['window'] for span in featurise} == {100, 50}
+    # One span for the chops of each window, and more for the queries
+    assert len(featurise) > 2
+    histogram = recorder.histograms['distance_calls_per_query']
+    assert histogram.count == 2 * recorder.counters['search_queries']
+    assert histogram.sum == recorder.counters['distance_calls']
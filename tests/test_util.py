@@ -47,6 +47,17 @@ def test_chop_audio_with_step_factor():
     assert np.array_equal(chopped[2].timeseries, np.arange(20, 40))
     assert np.array_equal(chopped[3].timeseries, np.arange(30, 50))
 
+def test_chop_audio_frames():
+    audio = AudioSegment(np.arange(22050, dtype=np.float32), sample_rate=22050)
+
+    chops = Util.chop_audio_frames(audio, 200, 1102)
+
+    assert [chop.offset_frames for chop in chops[:3]] == [0, 1102, 2204]
+    assert all(chop.n_samples() == 4410 for chop in chops)
+    assert len(chops) == len(Util.chop_audio(audio, 200, step_ms=50))
+    with pytest.raises(ValueError):
+        Util.chop_audio_frames(audio, 200, 0)
+
 def test_chop_audio_with_step_factor_and_fixed_step():
     """
     Test chopping audio segments with a step factor and a fixed step
@@ -159,6 +170,18 @@ def test_concatenate_audio_with_declick():
     assert actual_length == expected_length, \
         f"Concatenated audio has incorrect length! Expected {expected_length}, but got {actual_length}"
 
+def test_concatenate_audio_without_overlap_frames():
+    """
+    Test that snippets declicked over less than a frame, or empty snippets,
+    are concatenated without changing the audio before them.
+    """
+    sr = 500
+    segments = [AudioSegment(np.ones(10), sr), AudioSegment(np.array([]), sr), AudioSegment(np.full(10, 2.), sr)]
+
+    result_segment = Util.concatenate_audio(segments, declick_fn='linear', declick_ms=1, sample_rate=sr)
+
+    assert np.array_equal(result_segment.timeseries, np.concatenate([np.ones(10), np.full(10, 2.)]))
+
 def test_concatenate_audio_with_empty_list():
     """
     Test concatenating an empty list of audio segments
@@ -322,3 +345,11 @@ def test_declick_with_invalid_declick_type():
         Util.declick_in(timeseries, 5, 'invalid_declick_type')
     with pytest.raises(ValueError):
         Util.declick_out(timeseries, 5, 'invalid_declick_type')
+
+def test_step_frames():
+    """
+    Test computing the number of frames between chops
+    """
+    assert Util.step_frames(500, 100) == 50
+    assert Util.step_frames(500, 100, step_ms=250) == 25
+    assert Util.step_frames(200, 100, step_factor=0.5) == 10
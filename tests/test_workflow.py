@@ -1,6 +1,17 @@
+import dataclasses
+import os
 from unittest.mock import patch, MagicMock
-from audio_collage.workflow import create_collage_from_files, chop_and_write_from_file
+from audio_collage.workflow import batch_outpath, create_collage_from_files, create_collages_from_files, chop_and_write_from_file, ingest_sample_file, render_from_files, stream_from_files, warm_cache_from_files
+from audio_collage.plan import PlanEntry, SelectionPlan
+from audio_collage.audio_mapper import AudioMapper
+from audio_collage.audio_segment import AudioSegment
+import numpy as np
+import pytest
+from audio_collage.cache_manager import CacheManager, set_default_cache
+from audio_collage.collager import Collager
 from audio_collage.collager_config import CollagerConfig
+from audio_collage.util import Util
+from audio_collage import telemetry
 
 @patch('audio_collage.cli_progress.CLIProgress')
 @patch('audio_collage.workflow.AudioSegment.from_file')
@@ -85,3 +96,277 @@ def test_chop_and_write_from_file(
     for i, mock_slice in enumerate(mock_slices):
         mock_slice.to_file.assert_called_once_with(f"{outdir}/{chop_length}ms.{i:04}.wav")
 
+
+@patch('audio_collage.workflow.SampleLibrary')
+@patch('audio_collage.workflow.AudioSegment.from_file')
+def test_ingest_sample_file(mock_from_file, mock_library):
+    """
+    Test that each window is chopped and ingested into the library.
+    """
+    mock_from_file.return_value = AudioSegment(np.zeros(100), sample_rate=100)
+
+    ingest_sample_file("sample.wav", "library.db", [500, 200], step_factor=0.5)
+
+    library = mock_library.return_value
+    mock_library.assert_called_once_with("library.db")
+    assert library.ingest.call_count == 2
+    window_args = [c.args[1:3] for c in library.ingest.call_args_list]
+    assert window_args == [(500, 25), (200, 10)]
+    library.close.assert_called_once()
+
+def test_collage_finds_chops_ingested_with_declick(tmp_path, mocker):
+    """
+    Test that chops ingested with a declick interval are the ones a collage
+    with the same interval looks up, so the sample is not chopped again.
+    """
+    sample_file = str(tmp_path / 'sample.wav')
+    library_path = str(tmp_path / 'library.db')
+    sample = AudioSegment(np.random.default_rng(0).uniform(-1, 1, 11025).astype(np.float32), 22050)
+    sample.to_file(sample_file)
+    ingest_sample_file(sample_file, library_path, [100, 50], step_factor=0.5, declick_ms=10)
+
+    chop_audio = mocker.spy(Util, 'chop_audio')
+    config = CollagerConfig(windows=[100, 50], declick_ms=10, step_factor=0.5, library_path=library_path)
+    mapper = AudioMapper(AudioSegment.from_file(sample_file), sample, config=config)
+    mapper.build_indices()
+
+    chop_audio.assert_not_called()
+    assert sorted(mapper.indices.indices) == [60, 110]
+
+@patch('audio_collage.workflow.PCMCache')
+@patch('audio_collage.workflow.AudioSegment.from_file')
+@patch('audio_collage.workflow.Collager.create_collage')
+def test_create_collage_from_files_with_pcm_cache(
+    mock_create_collage,
+    mock_from_file,
+    mock_pcm_cache
+):
+    """
+    Test that audio is loaded through the PCM cache when one is configured.
+    """
+    config = CollagerConfig(
+        target_file="target.wav",
+        sample_file="sample.wav",
+        outpath="output.wav",
+        pcm_cache_dir="pcm"
+    )
+    sample_audio, target_audio = MagicMock(), MagicMock()
+    mock_pcm_cache.return_value.load_many.return_value = [sample_audio, target_audio]
+
+    create_collage_from_files(config)
+
+    mock_from_file.assert_not_called()
+    mock_pcm_cache.assert_called_once_with("pcm")
+    mock_pcm_cache.return_value.load_many.assert_called_once_with(["sample.wav", "target.wav"])
+    mock_create_collage.assert_called_once_with(
+        target_audio=target_audio,
+        sample_audio=sample_audio,
+        config=config
+    )
+
+@patch('audio_collage.workflow.AudioSegment.from_file')
+@patch('audio_collage.workflow.Collager')
+def test_create_collages_from_files(mock_collager, mock_from_file, tmp_path, monkeypatch):
+    """
+    Test that the sample is indexed once and shared by every target, and that
+    the output directory is created.
+    """
+    monkeypatch.chdir(tmp_path)
+    config = CollagerConfig(sample_file="sample.wav", progress_callback=MagicMock())
+    targets = [("a.wav", "out/a.wav"), ("b.wav", "out/b.wav")]
+
+    create_collages_from_files(config, targets, max_workers=1)
+
+    mock_collager.build_indices.assert_called_once_with(mock_from_file.return_value, config)
+    assert mock_collager.create_collage.call_count == 2
+    for call, (target_file, outpath) in zip(mock_collager.create_collage.call_args_list, targets):
+        assert call.kwargs['indices'] is mock_collager.build_indices.return_value
+        assert call.kwargs['config'].target_file == target_file
+        assert call.kwargs['config'].outpath == outpath
+        assert call.kwargs['config'].progress_callback is None
+    output_audio = mock_collager.create_collage.return_value
+    output_audio.to_file.assert_any_call("out/a.wav")
+    output_audio.to_file.assert_any_call("out/b.wav")
+    assert os.path.isdir(tmp_path / "out")
+
+@patch('audio_collage.workflow.Collager')
+def test_create_collages_from_files_rejects_shared_outpaths(mock_collager, tmp_path):
+    """
+    Test that targets which would overwrite each other's output are rejected
+    before any work is done.
+    """
+    config = CollagerConfig(sample_file="sample.wav")
+    outdir = str(tmp_path / "out")
+    targets = [(t, batch_outpath(t, outdir)) for t in ["one/a.wav", "two/a.wav"]]
+
+    with pytest.raises(ValueError, match="one/a.wav"):
+        create_collages_from_files(config, targets, max_workers=1)
+
+    mock_collager.build_indices.assert_not_called()
+    assert not os.path.exists(outdir)
+
+def test_create_collages_from_files_in_worker_processes(tmp_path):
+    """
+    Test that targets are collaged in worker processes sharing one index.
+    """
+    sample = AudioSegment(
+        np.random.default_rng(0).uniform(-1, 1, 11025).astype(np.float32),
+        sample_rate=22050
+    )
+    sample.to_file(str(tmp_path / "sample.wav"))
+    targets = []
+    for name in ["a", "b"]:
+        target = AudioSegment(
+            np.random.default_rng(1).uniform(-1, 1, 4410).astype(np.float32),
+            sample_rate=22050
+        )
+        target.to_file(str(tmp_path / f"{name}.wav"))
+        targets.append((str(tmp_path / f"{name}.wav"), str(tmp_path / f"{name}_out.wav")))
+    config = CollagerConfig(
+        sample_file=str(tmp_path / "sample.wav"),
+        windows=[100],
+        search_mode=CollagerConfig.SearchMode.sliding
+    )
+
+    create_collages_from_files(config, targets, max_workers=2)
+
+    for _target_file, outpath in targets:
+        assert AudioSegment.from_file(outpath).n_samples() > 0
+
+@patch('audio_collage.workflow.AudioSegment.from_file')
+@patch('audio_collage.workflow.Collager.render')
+@patch('audio_collage.workflow.Collager.create_plan')
+def test_create_collage_from_files_with_plan_outpath(mock_create_plan, mock_render, mock_from_file):
+    """
+    Test that the plan is saved and rendered when a plan path is given.
+    """
+    config = CollagerConfig(
+        target_file="target.wav",
+        sample_file="sample.wav",
+        outpath="output.wav",
+        plan_outpath="plan.json"
+    )
+
+    create_collage_from_files(config)
+
+    mock_create_plan.return_value.to_file.assert_called_once_with("plan.json")
+    mock_render.assert_called_once_with(
+        mock_create_plan.return_value,
+        mock_from_file.return_value,
+        declick_fn=config.declick_fn,
+        declick_ms=config.declick_ms,
+        progress_callback=None
+    )
+    mock_render.return_value.to_file.assert_called_once_with("output.wav")
+
+def test_render_from_files(tmp_path):
+    """
+    Test that a saved plan is rendered from the sample file it records.
+    """
+    sample_file = str(tmp_path / 'sample.wav')
+    AudioSegment(np.linspace(-0.5, 0.5, 1000).astype(np.float32), 22050).to_file(sample_file)
+    plan_path = str(tmp_path / 'plan.json')
+    SelectionPlan(sources=[sample_file], sample_rate=22050, entries=[
+        PlanEntry(source_id=0, offset_frames=100, n_frames=300, distance=0.0, target_offset=0),
+        PlanEntry(source_id=0, offset_frames=600, n_frames=200, distance=0.0, target_offset=300),
+    ]).to_file(plan_path)
+    outpath = str(tmp_path / 'output.wav')
+
+    render_from_files(plan_path, outpath, declick_fn=None)
+
+    output = AudioSegment.from_file(outpath)
+    assert output.n_samples() == 500
+
+@patch('audio_collage.workflow.AudioSegment.from_file')
+@patch('audio_collage.workflow.Collager.render')
+@patch('audio_collage.workflow.Collager.create_plan')
+def test_create_collage_from_files_with_result_cache(mock_create_plan, mock_render, mock_from_file, tmp_path):
+    """
+    Test that repeating a job copies the cached collage instead of collaging again.
+    """
+    mock_create_plan.return_value = SelectionPlan(sources=['sample.wav'], sample_rate=1000)
+    mock_render.return_value = AudioSegment(np.zeros(100, dtype=np.float32), 1000)
+    config = CollagerConfig(
+        target_file='tests/data/test.wav',
+        sample_file='tests/data/test.wav',
+        outpath=str(tmp_path / 'first.wav'),
+        result_cache_dir=str(tmp_path / 'results')
+    )
+
+    create_collage_from_files(config)
+    create_collage_from_files(dataclasses.replace(config, outpath=str(tmp_path / 'second.wav')))
+
+    mock_create_plan.assert_called_once()
+    mock_render.assert_called_once()
+    with open(tmp_path / 'first.wav', 'rb') as first, open(tmp_path / 'second.wav', 'rb') as second:
+        assert first.read() == second.read()
+
+@patch('audio_collage.workflow.AudioSegment.from_file')
+@patch('audio_collage.workflow.Collager.render')
+@patch('audio_collage.workflow.Collager.create_plan')
+def test_result_cache_counts_one_lookup_per_job(mock_create_plan, mock_render, mock_from_file, tmp_path):
+    """
+    Test that each job counts a single result cache hit or miss, even when it
+    looks up both the cached audio and the cached plan.
+    """
+    mock_create_plan.return_value = SelectionPlan(sources=['sample.wav'], sample_rate=1000)
+    mock_render.return_value = AudioSegment(np.zeros(100, dtype=np.float32), 1000)
+    config = CollagerConfig(
+        target_file='tests/data/test.wav',
+        sample_file='tests/data/test.wav',
+        outpath=str(tmp_path / 'first.wav'),
+        result_cache_dir=str(tmp_path / 'results')
+    )
+
+    with telemetry.Telemetry().activate() as recorder:
+        create_collage_from_files(config)
+    assert recorder.counters['result_cache_misses'] == 1
+    assert 'result_cache_hits' not in recorder.counters
+
+    with telemetry.Telemetry().activate() as recorder:
+        create_collage_from_files(dataclasses.replace(config, plan_outpath=str(tmp_path / 'plan.json')))
+    assert recorder.counters['result_cache_hits'] == 1
+    assert 'result_cache_misses' not in recorder.counters
+
+def test_stream_from_files(tmp_path):
+    """
+    Test that a streamed target is written to an output file matching the
+    offline collage of the target.
+    """
+    rng = np.random.default_rng(0)
+    sample_file = str(tmp_path / 'sample.wav')
+    target_file = str(tmp_path / 'target.wav')
+    outpath = str(tmp_path / 'output.wav')
+    AudioSegment(rng.uniform(-1, 1, 22050).astype(np.float32), 22050).to_file(sample_file)
+    AudioSegment(rng.uniform(-1, 1, 11025).astype(np.float32), 22050).to_file(target_file)
+    config = CollagerConfig(
+        sample_file=sample_file,
+        windows=[100, 50],
+        declick_fn=CollagerConfig.DeclickFn.sigmoid,
+        search_mode=CollagerConfig.SearchMode.sliding
+    )
+
+    stream_from_files(config, target_file, outpath, block_ms=20)
+
+    sample = AudioSegment.from_file(sample_file)
+    offline = Collager.create_collage(AudioSegment.from_file(target_file), sample, config)
+    assert AudioSegment.from_file(outpath).n_samples() == offline.n_samples()
+
+def test_warm_cache_from_files(tmp_path):
+    """
+    Test that warming the cache stores an index for each window, which later
+    builds load instead of building.
+    """
+    cache = CacheManager(str(tmp_path))
+    set_default_cache(cache)
+    try:
+        config = CollagerConfig(windows=[200, 100], distance_fn=CollagerConfig.DistanceFn.fast_mfcc, step_factor=0.5)
+        warm_cache_from_files(config, ['tests/data/test.wav'])
+        assert cache.stats().kinds['.vptree'][0] == 2
+
+        with telemetry.Telemetry().activate() as recorder:
+            Collager.build_indices(AudioSegment.from_file('tests/data/test.wav'), config)
+        assert recorder.counters['index_cache_hits'] == 2
+        assert 'index_cache_misses' not in recorder.counters
+    finally:
+        set_default_cache(None)